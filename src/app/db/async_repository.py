@@ -0,0 +1,231 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable
+
+from .repository import RepositoryDB
+
+if TYPE_CHECKING:
+    from .repository import RepositoryUsage
+
+
+class AsyncRepositoryDB:
+    """
+    Асинхронный репозиторий поверх RepositoryDB.
+
+    Чтения выполняются в ограниченном пуле потоков, у каждого потока свое
+    подключение. Записи идут через очередь в единственный поток-писатель:
+    он забирает из очереди всё, что накопилось, и фиксирует пакет одной
+    транзакцией. Запись завершается только после фиксации, поэтому
+    следующее чтение её видит, как и в синхронном репозитории.
+    """
+
+    def __init__(
+        self,
+        repository: RepositoryDB,
+        readers: int = 4,
+        batch_size: int = 100,
+    ) -> None:
+        """
+        Асинхронный репозиторий.
+
+        Параметры:
+            repository синхронный репозиторий, который выполняет запросы;
+            readers количество потоков для чтения;
+            batch_size наибольшее количество записей в одной транзакции.
+        """
+        self.repository = repository
+        self.batch_size = batch_size
+        self._readers = ThreadPoolExecutor(readers, 'db-read')
+        self._writer = ThreadPoolExecutor(1, 'db-write')
+        self._queue: asyncio.Queue | None = None
+        self._writer_task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> 'AsyncRepositoryDB':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Дождется незаписанных изменений и остановит потоки."""
+        if self._queue is not None:
+            await self._queue.join()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        self._queue = None
+        self._readers.shutdown()
+        self._writer.shutdown()
+
+    async def get_all(self) -> list[tuple[int, str, str, str, str]]:
+        """Вернет все записи из таблицы базы данных."""
+        return await self._read(self.repository.get_all)
+
+    async def get(self, id: int):
+        """Вернет запись по id."""
+        return await self._read(self.repository.get, id)
+
+    async def get_many(
+        self, ids: list[int]
+    ) -> list[tuple[int, str, str, str, str]]:
+        """Вернет записи по списку id."""
+        return await self._read(self.repository.get_many, ids)
+
+    async def search(self, text: str) -> list[tuple[int, str, str, str, str]]:
+        """Вернет записи, в названии которых встречается текст."""
+        return await self._read(self.repository.search, text)
+
+    async def find_duplicate(
+        self, name: str
+    ) -> tuple[int, str, str, str, str] | None:
+        """Вернет запись с тем же нормализованным названием."""
+        return await self._read(self.repository.find_duplicate, name)
+
+    async def find_similar(
+        self, name: str
+    ) -> list[tuple[int, str, str, str, str, float]]:
+        """Вернет записи с похожими названиями."""
+        return await self._read(self.repository.find_similar, name)
+
+    async def get_version(self) -> int:
+        """Вернет версию каталога."""
+        return await self._read(self.repository.get_version)
+
+    async def flush(self) -> None:
+        """
+        Запишет изменения, ждущие в очереди отложенной записи синхронного
+        репозитория, если она у него есть.
+        """
+        await self._read(self.repository.flush)
+
+    async def create(
+        self,
+        name: str,
+        price: str,
+        dimension: str,
+        description: str = '',
+    ) -> None:
+        """Создаст запись в таблице базы данных."""
+        await self._write(
+            self.repository.create, name, price, dimension, description
+        )
+
+    async def update(
+        self,
+        id: int,
+        name: str,
+        price: str,
+        dimension: str,
+        description: str,
+    ) -> bool:
+        """
+        Изменит запись в базе данных по id. Вернет False, если записи с
+        таким id нет.
+        """
+        return await self._write(
+            self.repository.update, id, name, price, dimension, description
+        )
+
+    async def delete(self, id: int) -> bool:
+        """
+        Удалит запись из таблицы по id. Вернет False, если записи с таким
+        id нет.
+        """
+        return await self._write(self.repository.delete, id)
+
+    async def delete_many(self, ids: list[int]) -> None:
+        """Удалит записи по списку id."""
+        await self._write(self.repository.delete_many, ids)
+
+    async def update_many(self, changes: list[tuple[int, str, str]]) -> None:
+        """Изменит цену и размерность у нескольких записей."""
+        await self._write(self.repository.update_many, changes)
+
+    async def merge(
+        self,
+        groups: list[tuple[int, list[int]]],
+        usage: 'RepositoryUsage | None' = None,
+    ) -> None:
+        """
+        Объединит записи одной транзакцией, сложив частоту их выбора,
+        если задан репозиторий usage.
+        """
+        await self._write(self._merge, groups, usage)
+
+    def _merge(
+        self,
+        groups: list[tuple[int, list[int]]],
+        usage: 'RepositoryUsage | None',
+    ) -> None:
+        """Объединит записи в потоке-писателе."""
+        if usage is not None:
+            usage.merge(groups)
+        self.repository.merge(groups)
+
+    async def call(self, func: Callable, *args) -> Any:
+        """
+        Выполнит блокирующую функцию, которая читает базу, например
+        обновление оповещений после записи, в потоке-писателе: цикл
+        событий не ждет её, а вызовы не идут параллельно друг другу.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(func, *args))
+
+    async def _read(self, func: Callable, *args) -> Any:
+        """Выполнит чтение в пуле потоков."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args))
+
+    async def _write(self, func: Callable, *args) -> Any:
+        """Поставит запись в очередь и дождется её фиксации."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._write_loop())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((partial(func, *args), future))
+        return await future
+
+    async def _write_loop(self) -> None:
+        """Забирает записи из очереди и выполняет их пакетами."""
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while queue is not None:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            results = await loop.run_in_executor(
+                self._writer,
+                self._run_batch,
+                [operation for operation, _ in batch],
+            )
+            for (_, future), (error, result) in zip(batch, results):
+                if future.cancelled():
+                    pass
+                elif error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+                queue.task_done()
+
+    def _run_batch(
+        self, operations: list[Callable]
+    ) -> list[tuple[Exception | None, Any]]:
+        """
+        Выполнит пакет записей одной транзакцией. Если одна из них упала,
+        транзакция откатывается и записи выполняются по одной, чтобы
+        ошибку получила только своя запись.
+        """
+        try:
+            with self.repository.connector:
+                return [(None, operation()) for operation in operations]
+        except Exception:
+            pass
+
+        results: list[tuple[Exception | None, Any]] = []
+        for operation in operations:
+            try:
+                results.append((None, operation()))
+            except Exception as error:
+                results.append((error, None))
+        return results
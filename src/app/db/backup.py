@@ -0,0 +1,283 @@
+import gzip
+import os
+import threading
+import zlib
+from datetime import datetime
+from sqlite3 import DatabaseError, connect
+from typing import Callable
+
+from app.profiler import profiler
+
+# Резервная копия: сжатый gzip файл БД.
+SUFFIX = '.db.gz'
+# Доля хода копирования в общем ходе, остальное - сжатие или распаковка.
+COPY_SHARE = 0.5
+# Размер блока при сжатии и распаковке.
+BLOCK_SIZE = 1 << 20
+
+Progress = Callable[[float], None]
+
+
+class BackupCancelled(Exception):
+    """Копирование или восстановление отменено."""
+
+
+class CatalogBackup:
+    """
+    Резервные копии файла БД каталога.
+
+    Копия снимается через sqlite3 online backup API отдельным подключением
+    порциями по pages страниц: общая блокировка базы держится только на
+    время одной порции, поэтому чтения не ждут, а запись ждет не дольше
+    порции. Если базу за это время изменит другое подключение, SQLite сам
+    начнет копирование заново, и копия все равно будет целостной.
+
+    Восстановление распаковывает копию во временный файл, проверяет его
+    PRAGMA integrity_check и так же порциями переписывает рабочую базу
+    в одной транзакции: до конца копирования или при отмене база остается
+    прежней.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        directory: str,
+        keep: int = 10,
+        pages: int = 1024,
+        compression: int = 6,
+    ) -> None:
+        """
+        Резервные копии файла БД.
+
+        Параметры:
+            path файл с БД каталога;
+            directory папка для копий;
+            keep сколько последних копий хранить, старые удаляются;
+            pages сколько страниц копировать за один шаг;
+            compression уровень сжатия gzip от 1 до 9.
+        """
+        self.path = path
+        self.directory = directory
+        self.keep = keep
+        self.pages = pages
+        self.compression = compression
+        self.stem = os.path.splitext(os.path.basename(path))[0]
+
+    def get_backups(self) -> list[str]:
+        """Вернет файлы копий этого каталога, от новых к старым."""
+        if not os.path.isdir(self.directory):
+            return []
+        prefix = f'{self.stem}-'
+        names = [
+            name
+            for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(SUFFIX)
+        ]
+        # В имени время снятия копии, поэтому порядок имен - порядок копий.
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(names, reverse=True)
+        ]
+
+    @profiler.timed('CatalogBackup.backup')
+    def backup(self, progress: Progress | None = None) -> str:
+        """
+        Снимет копию базы, удалит лишние старые копии и вернет файл новой.
+
+        Параметры:
+            progress функция, которой передается доля выполненной работы
+                от 0 до 1; исключение из нее прерывает копирование.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        path = os.path.join(self.directory, f'{self.stem}-{stamp}{SUFFIX}')
+        copy_path = f'{path}.tmp.db'
+        tmp_path = f'{path}.tmp'
+        try:
+            _copy(self.path, copy_path, self.pages, progress, 0)
+            _compress(copy_path, tmp_path, self.compression, progress)
+            os.replace(tmp_path, path)
+        finally:
+            _remove(copy_path, tmp_path)
+        self._prune()
+        return path
+
+    @profiler.timed('CatalogBackup.restore')
+    def restore(self, backup: str, progress: Progress | None = None) -> None:
+        """
+        Заменит содержимое базы копией backup.
+
+        Поврежденная копия (сжатие, формат или integrity_check) не
+        восстанавливается: будет ValueError, а база останется прежней.
+
+        Параметры:
+            backup файл копии;
+            progress функция, которой передается доля выполненной работы
+                от 0 до 1; исключение из нее прерывает восстановление.
+        """
+        copy_path = f'{self.path}.restore'
+        try:
+            try:
+                _decompress(backup, copy_path, progress)
+            except (gzip.BadGzipFile, EOFError, zlib.error) as error:
+                raise ValueError(
+                    f'Резервная копия {backup} повреждена: {error}'
+                ) from error
+            problem = _check(copy_path)
+            if problem is not None:
+                raise ValueError(
+                    f'Резервная копия {backup} повреждена: {problem}'
+                )
+            _copy(copy_path, self.path, self.pages, progress, COPY_SHARE)
+        finally:
+            _remove(copy_path)
+
+    def _prune(self) -> None:
+        """Удалит копии сверх keep последних."""
+        for path in self.get_backups()[self.keep :]:
+            _remove(path)
+
+
+class BackupTask:
+    """
+    Копирование или восстановление в фоновом потоке. Окно следит за ним
+    по progress и done, не блокируясь, и может отменить его.
+    """
+
+    def __init__(self, func: Callable[[Progress], object]) -> None:
+        """
+        Запустит работу в фоновом потоке.
+
+        Параметры:
+            func работа: CatalogBackup.backup или restore, принимающая
+                функцию хода выполнения.
+        """
+        self.progress = 0.0
+        self.result = None
+        self.error: Exception | None = None
+        self._func = func
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='db-backup', daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def done(self) -> bool:
+        """Работа закончена: успешно, с ошибкой или отменена."""
+        return not self._thread.is_alive()
+
+    @property
+    def cancelled(self) -> bool:
+        """Работа отменена."""
+        return isinstance(self.error, BackupCancelled)
+
+    def cancel(self) -> None:
+        """Попросит прервать работу на ближайшем шаге."""
+        self._cancelled.set()
+
+    def wait(self, timeout: float | None = None) -> object:
+        """Дождется окончания и вернет результат или поднимет ошибку."""
+        self._thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _report(self, fraction: float) -> None:
+        """Запомнит ход выполнения или прервет работу после отмены."""
+        if self._cancelled.is_set():
+            raise BackupCancelled('Отменено')
+        self.progress = fraction
+
+    def _run(self) -> None:
+        """Выполнит работу, сохранив результат или ошибку."""
+        try:
+            self.result = self._func(self._report)
+        except Exception as error:
+            self.error = error
+
+
+def _copy(
+    source_path: str,
+    target_path: str,
+    pages: int,
+    progress: Progress | None,
+    start: float,
+) -> None:
+    """
+    Скопирует базу source_path в target_path через backup API порциями
+    по pages страниц. Ход выполнения - от start до start + COPY_SHARE.
+    """
+
+    def step(status: int, remaining: int, total: int) -> None:
+        if progress is not None and total:
+            progress(start + COPY_SHARE * (total - remaining) / total)
+
+    source = connect(source_path)
+    try:
+        target = connect(target_path)
+        try:
+            source.backup(target, pages=pages, progress=step)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def _compress(
+    source_path: str,
+    target_path: str,
+    compression: int,
+    progress: Progress | None,
+) -> None:
+    """Сожмет файл и сбросит его на диск."""
+    size = os.path.getsize(source_path) or 1
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as file:
+        with gzip.GzipFile(
+            fileobj=file, mode='wb', compresslevel=compression
+        ) as target:
+            while block := source.read(BLOCK_SIZE):
+                target.write(block)
+                if progress is not None:
+                    progress(
+                        COPY_SHARE + (1 - COPY_SHARE) * source.tell() / size
+                    )
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _decompress(
+    source_path: str, target_path: str, progress: Progress | None
+) -> None:
+    """Распакует копию; ход выполнения - от 0 до COPY_SHARE."""
+    size = os.path.getsize(source_path) or 1
+    with open(source_path, 'rb') as file, open(target_path, 'wb') as target:
+        with gzip.GzipFile(fileobj=file, mode='rb') as source:
+            while block := source.read(BLOCK_SIZE):
+                target.write(block)
+                if progress is not None:
+                    progress(COPY_SHARE * file.tell() / size)
+
+
+def _check(path: str) -> str | None:
+    """Вернет первую ошибку PRAGMA integrity_check или None."""
+    try:
+        connection = connect(path)
+        try:
+            rows = connection.execute('PRAGMA integrity_check').fetchall()
+        finally:
+            connection.close()
+    except DatabaseError as error:
+        return str(error)
+    if rows != [('ok',)]:
+        return rows[0][0]
+    return None
+
+
+def _remove(*paths: str) -> None:
+    """Удалит файлы, если они есть."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,76 @@
+"""
+Поиск и объединение дубликатов в каталоге.
+
+Запуск из папки src:
+    python -m app.db.dedupe            показать дубликаты
+    python -m app.db.dedupe --apply    объединить их
+    python -m app.db.dedupe --similar 0.6
+"""
+
+from argparse import ArgumentParser
+
+from app.settings import NAME_DB
+
+from .manager import Connector
+from .repository import RepositoryDB, RepositoryStart, RepositoryUsage
+
+
+def dedupe(repository: RepositoryDB, apply: bool = False) -> int:
+    """
+    Найдет записи с одинаковым нормализованным названием и, если apply,
+    объединит каждую группу в запись с наименьшим id одной транзакцией,
+    сложив частоту выбора, после чего создаст уникальный индекс. Вернет
+    количество групп.
+    """
+    groups = repository.get_duplicate_groups()
+    for ids in groups:
+        rows = repository.get_many(ids)
+        print(' = '.join(f'{name} (id {id})' for id, name, *_ in rows))
+    if apply and groups:
+        merged = [(ids[0], ids[1:]) for ids in groups]
+        with repository.connector:
+            RepositoryUsage(repository.connector).merge(merged)
+            repository.merge(merged)
+        RepositoryStart(repository.connector).create_name_index()
+        print(f'Объединено групп: {len(groups)}')
+    return len(groups)
+
+
+def show_similar(repository: RepositoryDB, threshold: float) -> None:
+    """Покажет пары записей с похожими названиями. Объединять их вручную."""
+    for id, name, *_ in repository.get_all():
+        for other_id, other_name, *_, score in repository.find_similar(
+            name, threshold
+        ):
+            if other_id > id:
+                print(
+                    f'{name} (id {id}) ~ {other_name} (id {other_id}): '
+                    f'{score:.2f}'
+                )
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='python -m app.db.dedupe')
+    parser.add_argument('--db', default=NAME_DB, help='файл с БД')
+    parser.add_argument(
+        '--apply', action='store_true', help='объединить дубликаты'
+    )
+    parser.add_argument(
+        '--similar',
+        type=float,
+        metavar='SCORE',
+        help='показать похожие названия со сходством не ниже SCORE',
+    )
+    args = parser.parse_args()
+
+    connector = Connector(args.db, persistent=True)
+    RepositoryStart(connector).create_table()
+    repository = RepositoryDB(connector)
+    if not dedupe(repository, args.apply):
+        print('Дубликатов нет')
+    if args.similar is not None:
+        show_similar(repository, args.similar)
+
+
+if __name__ == '__main__':
+    main()
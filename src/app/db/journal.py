@@ -0,0 +1,254 @@
+import os
+import struct
+import zlib
+from typing import Iterable, Iterator
+
+MAGIC = b'ESTJ'
+FORMAT = 1
+# Заголовок файла: метка и версия формата.
+HEADER = struct.Struct('<4sI')
+# Рамка записи: длина тела и его CRC32. Тело - вид изменения и данные.
+FRAME = struct.Struct('<II')
+KIND = struct.Struct('<B')
+# Строка сметы: id, количество, стоимость, длины названия и размерности
+# в байтах; за ними сами название и размерность в UTF-8.
+ROW = struct.Struct('<qddHH')
+# Длины пишутся в два байта: более длинные название и размерность (в
+# каталоге их ничто не ограничивает) обрезаются по границе символа.
+MAX_TEXT = (1 << 16) - 1
+INDEX = struct.Struct('<Q')
+RANGE = struct.Struct('<QQ')
+
+ADD = 1
+UPDATE = 2
+DELETE = 3
+# Запись длиннее не пишется, поэтому большая длина - признак мусора.
+MAX_RECORD = 1 << 20
+
+Row = tuple[int, str, float, str, float]
+
+
+class EstimateJournal:
+    """
+    Журнал изменений рабочей сметы для восстановления после сбоя.
+
+    Каждое изменение дописывается в конец файла записью с длиной и CRC32,
+    поэтому его стоимость - одна короткая запись, а не перезапись всей
+    сметы. Недописанная при сбое запись не проходит проверку длины или
+    CRC и отбрасывается при чтении вместе со всем, что за ней.
+
+    Когда записей становится заметно больше, чем строк в смете, журнал
+    уплотняется: текущие строки пишутся во временный файл, который
+    подменяет журнал целиком.
+    """
+
+    def __init__(
+        self, path: str, sync: bool = True, compact_min: int = 1000
+    ) -> None:
+        """
+        Журнал изменений рабочей сметы.
+
+        Параметры:
+            path файл журнала;
+            sync сбрасывать каждую запись на диск (os.fsync), а не только
+                в буфер ОС: запись переживет не только падение программы,
+                но и отключение питания;
+            compact_min сколько записей допускать без уплотнения, даже если
+                смета меньше.
+        """
+        self.path = path
+        self.sync = sync
+        self.compact_min = compact_min
+        # Сколько записей в файле журнала.
+        self.records = 0
+        self._file = None
+
+    def replay(self) -> Iterator[tuple[int, tuple]]:
+        """
+        Вернет записанные изменения по порядку: (ADD, (строка,)),
+        (UPDATE, (номер, строка)) или (DELETE, (первый, последний)).
+        Недописанный хвост файла обрезается, после чего журнал открыт
+        для записи.
+        """
+        self.close()
+        self.records = 0
+        end = HEADER.size
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            file = None
+        if file is not None:
+            with file:
+                header = file.read(HEADER.size)
+                if header == HEADER.pack(MAGIC, FORMAT):
+                    for body, end in _frames(file, end):
+                        self.records += 1
+                        yield _decode(body)
+        self._open(end)
+
+    def add(self, row: Row) -> None:
+        """Запишет добавление строки в конец сметы."""
+        self._append(KIND.pack(ADD) + _encode_row(row))
+
+    def update(self, index: int, row: Row) -> None:
+        """Запишет замену строки с номером index."""
+        self._append(KIND.pack(UPDATE) + INDEX.pack(index) + _encode_row(row))
+
+    def delete(self, first: int, last: int) -> None:
+        """Запишет удаление строк с first по last включительно."""
+        self._append(KIND.pack(DELETE) + RANGE.pack(first, last))
+
+    def should_compact(self, rows: int) -> bool:
+        """
+        Вернет True, если журнал пора уплотнить: записей больше, чем
+        вдвое от числа строк сметы rows, и больше compact_min.
+        """
+        return self.records > max(self.compact_min, 2 * rows)
+
+    def compact(self, rows: Iterable[Row]) -> None:
+        """
+        Заменит журнал записями добавления строк rows. Новый файл
+        пишется рядом и подменяет старый целиком, поэтому при сбое
+        остается либо старый журнал, либо новый.
+        """
+        self.close()
+        tmp_path = f'{self.path}.tmp'
+        records = 0
+        with open(tmp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT))
+            buffer = bytearray()
+            kind = KIND.pack(ADD)
+            for row in rows:
+                _frame(buffer, kind + _encode_row(row))
+                records += 1
+                if len(buffer) >= 1 << 16:
+                    file.write(buffer)
+                    buffer.clear()
+            file.write(buffer)
+            file.flush()
+            if self.sync:
+                os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        if self.sync:
+            _sync_directory(self.path)
+        self.records = records
+        self._open(None)
+
+    def close(self) -> None:
+        """Закроет файл журнала."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self, end: int | None) -> None:
+        """
+        Откроет журнал для дописывания. Если end задан, отрежет всё после
+        него, а пустой или чужой файл начнет заново с заголовка.
+        """
+        file = open(self.path, 'ab')
+        if end is not None:
+            if end <= HEADER.size:
+                file.truncate(0)
+                file.write(HEADER.pack(MAGIC, FORMAT))
+            else:
+                file.truncate(end)
+            file.flush()
+            if self.sync:
+                os.fsync(file.fileno())
+        self._file = file
+
+    def _append(self, body: bytes) -> None:
+        """Допишет запись одной операцией записи."""
+        if self._file is None:
+            for _ in self.replay():
+                pass
+        buffer = bytearray()
+        _frame(buffer, body)
+        self._file.write(buffer)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        self.records += 1
+
+
+def _frame(buffer: bytearray, body: bytes) -> None:
+    """Допишет в buffer запись с длиной и CRC32 тела."""
+    buffer += FRAME.pack(len(body), zlib.crc32(body))
+    buffer += body
+
+
+def _frames(file, offset: int) -> Iterator[tuple[bytes, int]]:
+    """
+    Вернет тела целых записей файла и смещение конца каждой. Остановится
+    на первой недописанной или испорченной записи.
+    """
+    while True:
+        frame = file.read(FRAME.size)
+        if len(frame) < FRAME.size:
+            return
+        length, crc = FRAME.unpack(frame)
+        if not KIND.size <= length <= MAX_RECORD:
+            return
+        body = file.read(length)
+        if len(body) < length or zlib.crc32(body) != crc:
+            return
+        offset += FRAME.size + length
+        yield body, offset
+
+
+def _encode_row(row: Row) -> bytes:
+    """Вернет строку сметы в виде байтов."""
+    id, name, quantity, dimension, price = row
+    name_data = _encode_text(name)
+    dimension_data = _encode_text(dimension)
+    return (
+        ROW.pack(id, quantity, price, len(name_data), len(dimension_data))
+        + name_data
+        + dimension_data
+    )
+
+
+def _encode_text(text: str) -> bytes:
+    """Вернет текст в UTF-8, обрезанный до MAX_TEXT байт."""
+    data = text.encode('utf-8')
+    if len(data) > MAX_TEXT:
+        data = data[:MAX_TEXT].decode('utf-8', 'ignore').encode('utf-8')
+    return data
+
+
+def _decode_row(body: bytes, offset: int) -> Row:
+    """Вернет строку сметы из байтов, начиная со смещения offset."""
+    id, quantity, price, name_size, dimension_size = ROW.unpack_from(
+        body, offset
+    )
+    offset += ROW.size
+    name = body[offset : offset + name_size].decode('utf-8')
+    offset += name_size
+    dimension = body[offset : offset + dimension_size].decode('utf-8')
+    return id, name, quantity, dimension, price
+
+
+def _decode(body: bytes) -> tuple[int, tuple]:
+    """Вернет вид изменения и его данные."""
+    (kind,) = KIND.unpack_from(body)
+    if kind == ADD:
+        return kind, (_decode_row(body, KIND.size),)
+    if kind == UPDATE:
+        (index,) = INDEX.unpack_from(body, KIND.size)
+        return kind, (index, _decode_row(body, KIND.size + INDEX.size))
+    if kind == DELETE:
+        return kind, RANGE.unpack_from(body, KIND.size)
+    raise ValueError(f'Неизвестная запись журнала: {kind}')
+
+
+def _sync_directory(path: str) -> None:
+    """Сбросит на диск каталог файла, чтобы переименование пережило сбой."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    descriptor = os.open(
+        os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY
+    )
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
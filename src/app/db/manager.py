@@ -1,31 +1,181 @@
-from sqlite3 import Cursor, connect
+import threading
+from sqlite3 import Connection, Cursor, connect
+from time import perf_counter
+from typing import Iterable
+
+from app.profiler import profiler
+from app.settings import CACHED_STATEMENTS
+
+from .statements import CachedCursor, StatementCache
+from .trace import QueryLog, TracedCursor
 
 
 class Connector:
     """Контекстный менеджер подключения к базе данных."""
 
-    def __init__(self, name_db: str) -> None:
+    def __init__(
+        self,
+        name_db: str,
+        query_log: QueryLog | None = None,
+        persistent: bool = False,
+        cached_statements: int = CACHED_STATEMENTS,
+        attached: dict[str, str] | None = None,
+    ) -> None:
         """
         Контекстный менеджер подключения к базе данных.
 
+        Вложенные входы в одном потоке выполняются в одной транзакции,
+        которая фиксируется при выходе из внешнего.
+
         Параметры:
-            name_db имя файла с БД.
+            name_db имя файла с БД;
+            query_log журнал медленных инструкций, если их нужно замерять;
+            persistent держать подключение открытым между вызовами
+                (свое для каждого потока), чтобы работал кэш
+                подготовленных инструкций sqlite3;
+            cached_statements размер этого кэша;
+            attached базы данных, которые присоединяются к каждому
+                подключению через ATTACH DATABASE: имя схемы -> файл.
         """
         self.name_db: str = name_db
+        self.query_log = query_log
+        self.persistent = persistent
+        self.cached_statements = cached_statements
+        self.attached = attached or {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Постоянные подключения всех потоков и кэши их инструкций.
+        self._connections: dict[Connection, StatementCache] = {}
+        # Статистика кэшей уже закрытых подключений.
+        self._released = StatementCache(cached_statements)
+
+    @property
+    def connection(self) -> Connection:
+        """Подключение текущего потока."""
+        return self._local.connection
+
+    @property
+    def active(self) -> bool:
+        """Текущий поток уже внутри with этого подключения."""
+        return bool(getattr(self._local, 'cursors', None))
+
+    @property
+    def statement_cache(self) -> StatementCache:
+        """Суммарная статистика кэша инструкций по всем подключениям."""
+        total = StatementCache(self.cached_statements)
+        with self._lock:
+            for cache in [self._released, *self._connections.values()]:
+                total.hits += cache.hits
+                total.misses += cache.misses
+        return total
+
+    def _connect(self) -> Connection:
+        """Откроет подключение к БД."""
+        # Постоянное подключение закрывает close() из любого потока.
+        connection = connect(
+            self.name_db,
+            cached_statements=self.cached_statements,
+            check_same_thread=not self.persistent,
+        )
+        profiler.count('db.connections')
+        for schema, name_db in self.attached.items():
+            connection.execute(f'ATTACH DATABASE ? AS "{schema}"', (name_db,))
+        if profiler.enabled or self.query_log is not None:
+            connection.set_trace_callback(self._trace)
+        return connection
 
     def __enter__(self) -> Cursor:
-        self.connection = connect(self.name_db)
-        return self.connection.cursor()
+        local = self._local
+        cursors = getattr(local, 'cursors', None)
+        if cursors is None:
+            cursors = local.cursors = []
+        # Вложенный вход работает в подключении и транзакции внешнего.
+        if not cursors and not self.persistent:
+            local.connection = self._connect()
+            local.cache = None
+        elif (
+            not cursors
+            and getattr(local, 'connection', None) not in self._connections
+        ):
+            # Подключения еще нет или его закрыл close() другого потока.
+            local.connection = self._connect()
+            local.cache = StatementCache(self.cached_statements)
+            with self._lock:
+                self._connections[local.connection] = local.cache
+
+        if self.query_log is not None:
+            cursor = local.connection.cursor(TracedCursor)
+            cursor.query_log = self.query_log
+        elif self.persistent:
+            cursor = local.connection.cursor(CachedCursor)
+        else:
+            cursor = local.connection.cursor()
+        if isinstance(cursor, CachedCursor):
+            cursor.statement_cache = local.cache
+        cursors.append(cursor)
+        return cursor
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
+        local = self._local
+        connection = local.connection
+        cursor = local.cursors.pop()
+        if isinstance(cursor, TracedCursor):
+            cursor.finish()
+        if local.cursors:
+            # Фиксирует или откатывает транзакцию только внешний выход.
+            cursor.close()
+            return
         if exc_type is not None:
-            self.connection.rollback()
+            connection.rollback()
+        start = perf_counter()
         try:
-            self.connection.commit()
+            connection.commit()
         except Exception:
-            self.connection.rollback()
+            connection.rollback()
         finally:
-            self.connection.close()
+            cursor.close()
+            if not self.persistent:
+                connection.close()
+            elapsed = perf_counter() - start
+            profiler.record('db.commit', elapsed)
+            if self.query_log is not None:
+                self.query_log.record(connection, 'COMMIT', (), elapsed)
+
+    def close(self) -> None:
+        """
+        Закроет постоянные подключения всех потоков, оставив статистику
+        их кэшей. Вызывается, когда другие потоки уже не работают с базой;
+        обратившись к ней снова, поток откроет новое подключение.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, {}
+            self._forget(connections.values())
+        for connection in connections:
+            connection.close()
+
+    def release(self) -> None:
+        """
+        Закроет постоянное подключение текущего потока, оставив
+        статистику его кэша. Вызывается перед завершением потока, иначе
+        подключение и кэш останутся после него до close().
+        """
+        connection = getattr(self._local, 'connection', None)
+        with self._lock:
+            cache = self._connections.pop(connection, None)
+            if cache is None:
+                return
+            self._forget([cache])
+        connection.close()
+        self._local.connection = None
 
+    def _forget(self, caches: Iterable[StatementCache]) -> None:
+        """Перенесет статистику кэшей закрываемых подключений."""
+        for cache in caches:
+            self._released.hits += cache.hits
+            self._released.misses += cache.misses
 
-connector = Connector('save.db')
+    def _trace(self, statement: str) -> None:
+        """Посчитает выполненную SQL-инструкцию."""
+        profiler.count('db.queries')
+        if self.query_log is not None:
+            self.query_log.trace(statement)
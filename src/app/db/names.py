@@ -0,0 +1,20 @@
+def normalize_name(name: str) -> str:
+    """
+    Вернет название в виде для сравнения: без регистра, с одиночными
+    пробелами и "е" вместо "ё".
+    """
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+
+def trigrams(normalized: str) -> set[str]:
+    """
+    Вернет триграммы нормализованного названия. Каждое слово дополняется
+    пробелами, чтобы начало и конец слова давали свои триграммы.
+    """
+    result = set()
+    for word in normalized.split():
+        padded = f'  {word} '
+        result.update(
+            padded[index : index + 3] for index in range(len(padded) - 2)
+        )
+    return result
@@ -1,10 +1,33 @@
-from .manager import Connector, connector
+import json
+import math
+import time
+from sqlite3 import Cursor, IntegrityError
+from typing import Iterable, Iterator
+
+from app.profiler import profiler
+from app.settings import USAGE_HALF_LIFE_DAYS
+
+from .manager import Connector
+from .names import normalize_name, trigrams
 
 NAME_TABLE = 'ingredient'
 NAME = 'name'
 DESCRIPTION = 'description'
 PRICE = 'price'
 DIMENSION = 'dimension'
+NAME_NORMALIZED = 'name_normalized'
+NAME_TABLE_ESTIMATE = 'estimate'
+NAME_TABLE_LINE = 'estimate_line'
+NAME_TABLE_VERSION = 'catalog_version'
+NAME_TABLE_TRIGRAM = 'ingredient_trigram'
+NAME_TABLE_USAGE = 'ingredient_usage'
+NAME_TABLE_PRICE_RULE = 'price_rule'
+NAME_TABLE_BUDGET_RULE = 'budget_rule'
+# Стоимость строки сметы в копейках и цена записи каталога числом.
+# Индексы построены по этим выражениям и покрывают отчеты RepositoryReport,
+# поэтому в запросах они должны быть записаны точно так же.
+LINE_CENTS = f'CAST(round({PRICE} * 100) AS INTEGER)'
+UNIT_PRICE = f'CAST({PRICE} AS REAL)'
 
 
 class RepositoryBase:
@@ -15,6 +38,51 @@ class RepositoryBase:
         self.field_description = DESCRIPTION
         self.field_price = PRICE
         self.field_dimension = DIMENSION
+        self.name_table_estimate = NAME_TABLE_ESTIMATE
+        self.name_table_line = NAME_TABLE_LINE
+        self.name_table_version = NAME_TABLE_VERSION
+        self.field_name_normalized = NAME_NORMALIZED
+        self.name_table_trigram = NAME_TABLE_TRIGRAM
+        self.name_table_usage = NAME_TABLE_USAGE
+        self.name_table_price_rule = NAME_TABLE_PRICE_RULE
+        self.name_table_budget_rule = NAME_TABLE_BUDGET_RULE
+        self.sql_delete_trigrams = f"""
+            DELETE FROM {self.name_table_trigram}
+            WHERE ingredient_id IN (SELECT value FROM json_each(?))
+            """
+        self.sql_create_trigram = f"""
+            INSERT INTO {self.name_table_trigram} (trigram, ingredient_id)
+            VALUES (?, ?)
+            """
+
+    def _index_names(
+        self,
+        cursor: Cursor,
+        names: Iterable[tuple[int, str]],
+        new: bool = False,
+    ) -> None:
+        """
+        Перестроит триграммы записей.
+
+        Параметры:
+            cursor курсор открытой транзакции;
+            names список вида (id, нормализованное название);
+            new записи только что созданы, старых триграмм у них нет.
+        """
+        names = list(names)
+        if not new:
+            cursor.execute(
+                self.sql_delete_trigrams,
+                (json.dumps([id for id, _ in names]),),
+            )
+        cursor.executemany(
+            self.sql_create_trigram,
+            (
+                (trigram, id)
+                for id, normalized in names
+                for trigram in trigrams(normalized)
+            ),
+        )
 
 
 class RepositoryStart(RepositoryBase):
@@ -30,45 +98,543 @@ class RepositoryStart(RepositoryBase):
             {self.field_dimension} TEXT NOT NULL
             )
             """)
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.name_table_estimate} (
+            id INTEGER PRIMARY KEY,
+            {self.field_name} TEXT NOT NULL,
+            total TEXT NOT NULL DEFAULT '0.00'
+            )
+            """)
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.name_table_line} (
+            id INTEGER PRIMARY KEY,
+            estimate_id INTEGER NOT NULL,
+            ingredient_id INTEGER NOT NULL,
+            {self.field_name} TEXT NOT NULL,
+            quantity TEXT NOT NULL,
+            {self.field_dimension} TEXT NOT NULL,
+            {self.field_price} TEXT NOT NULL
+            )
+            """)
+            cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self.name_table_line}_estimate
+            ON {self.name_table_line} (estimate_id)
+            """)
+            # Индексы по стоимости в копейках заменяют индекс по
+            # ingredient_id и покрывают отчеты: суммы считаются по индексу,
+            # без чтения строк таблицы.
+            cursor.execute(f"""
+            DROP INDEX IF EXISTS {self.name_table_line}_ingredient
+            """)
+            for field in ('ingredient_id', self.field_dimension):
+                cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {self.name_table_line}_{field}_cost
+                ON {self.name_table_line} ({field}, {LINE_CENTS})
+                """)
+            # Индекс по названию отдает записи в порядке get_all без
+            # сортировки и позволяет читать их страницами (get_page).
+            cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self.name_table}_{self.field_name}
+            ON {self.name_table} ({self.field_name})
+            """)
+            cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self.name_table}_unit_price
+            ON {self.name_table}
+            ({self.field_dimension}, {UNIT_PRICE}, {self.field_price})
+            """)
+            # Версия каталога растет с каждым изменением таблицы
+            # ингредиентов. В отличие от PRAGMA data_version, она хранится
+            # в файле и одинакова для всех подключений. Поднимает её
+            # RepositoryDB один раз на изменение: триггер FOR EACH ROW
+            # писал бы её на каждую строку.
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.name_table_version} (
+            version INTEGER NOT NULL
+            )
+            """)
+            cursor.execute(f"""
+            INSERT INTO {self.name_table_version} (version)
+            SELECT 0
+            WHERE NOT EXISTS (SELECT 1 FROM {self.name_table_version})
+            """)
+            for event in ('insert', 'update', 'delete'):
+                cursor.execute(f"""
+                DROP TRIGGER IF EXISTS {self.name_table}_version_{event}
+                """)
+            # Нормализованное название ищет дубликаты по индексу,
+            # триграммы - похожие названия.
+            columns = [
+                column[1]
+                for column in cursor.execute(
+                    f'PRAGMA table_info({self.name_table})'
+                )
+            ]
+            if self.field_name_normalized not in columns:
+                cursor.execute(f"""
+                ALTER TABLE {self.name_table}
+                ADD COLUMN {self.field_name_normalized} TEXT
+                """)
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.name_table_trigram} (
+            trigram TEXT NOT NULL,
+            ingredient_id INTEGER NOT NULL,
+            PRIMARY KEY (trigram, ingredient_id)
+            ) WITHOUT ROWID
+            """)
+            cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self.name_table_trigram}_ingredient
+            ON {self.name_table_trigram} (ingredient_id)
+            """)
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.name_table}_trigram_delete
+            AFTER DELETE ON {self.name_table}
+            FOR EACH ROW
+            BEGIN
+            DELETE FROM {self.name_table_trigram}
+            WHERE ingredient_id = old.id;
+            END
+            """)
+            # Частота выбора ингредиентов для окна выбора, см.
+            # RepositoryUsage. Таблица отдельная, чтобы выбор не менял
+            # версию каталога.
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.name_table_usage} (
+            ingredient_id INTEGER PRIMARY KEY,
+            score REAL NOT NULL,
+            last_used REAL NOT NULL,
+            uses INTEGER NOT NULL
+            )
+            """)
+            for field in ('score', 'last_used'):
+                cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {self.name_table_usage}_{field}
+                ON {self.name_table_usage} ({field})
+                """)
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.name_table}_usage_delete
+            AFTER DELETE ON {self.name_table}
+            FOR EACH ROW
+            BEGIN
+            DELETE FROM {self.name_table_usage}
+            WHERE ingredient_id = old.id;
+            END
+            """)
+            # Правила оповещений, см. RepositoryRules. Правило удаляется
+            # вместе с ингредиентом или сметой, за которыми следит.
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.name_table_price_rule} (
+            ingredient_id INTEGER PRIMARY KEY,
+            percent TEXT NOT NULL,
+            base_price TEXT NOT NULL,
+            base_dimension TEXT NOT NULL
+            )
+            """)
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.name_table_budget_rule} (
+            estimate_id INTEGER PRIMARY KEY,
+            budget TEXT NOT NULL
+            )
+            """)
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.name_table}_price_rule_delete
+            AFTER DELETE ON {self.name_table}
+            FOR EACH ROW
+            BEGIN
+            DELETE FROM {self.name_table_price_rule}
+            WHERE ingredient_id = old.id;
+            END
+            """)
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS
+            {self.name_table_estimate}_budget_rule_delete
+            AFTER DELETE ON {self.name_table_estimate}
+            FOR EACH ROW
+            BEGIN
+            DELETE FROM {self.name_table_budget_rule}
+            WHERE estimate_id = old.id;
+            END
+            """)
+        self.normalize_names()
+        self.create_name_index()
+
+    def normalize_names(self) -> int:
+        """
+        Заполнит нормализованные названия и триграммы у записей, где их
+        нет: в старой базе или добавленных в обход репозитория. Вернет
+        количество таких записей.
+        """
+        with self.connector as cursor:
+            rows = cursor.execute(f"""
+            SELECT id, {self.field_name} FROM {self.name_table}
+            WHERE {self.field_name_normalized} IS NULL
+            """).fetchall()
+            names = [(id, normalize_name(name)) for id, name in rows]
+            cursor.executemany(
+                f"""
+                UPDATE {self.name_table}
+                SET {self.field_name_normalized} = ?
+                WHERE id = ?
+                """,
+                ((normalized, id) for id, normalized in names),
+            )
+            self._index_names(cursor, names)
+        return len(rows)
+
+    def create_name_index(self) -> bool:
+        """
+        Создаст уникальный индекс по нормализованному названию. Если в
+        каталоге уже есть дубликаты, создаст обычный индекс и вернет False:
+        их нужно объединить (python -m app.db.dedupe).
+        """
+        with self.connector as cursor:
+            try:
+                cursor.execute(f"""
+                CREATE UNIQUE INDEX IF NOT EXISTS
+                {self.name_table}_{self.field_name_normalized}
+                ON {self.name_table} ({self.field_name_normalized})
+                """)
+            except IntegrityError:
+                cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS
+                {self.name_table}_{self.field_name_normalized}_duplicates
+                ON {self.name_table} ({self.field_name_normalized})
+                """)
+                return False
+            cursor.execute(f"""
+            DROP INDEX IF EXISTS
+            {self.name_table}_{self.field_name_normalized}_duplicates
+            """)
+        return True
 
 
 class RepositoryDB(RepositoryBase):
     """Репозиторий для CRUD-операций с базой данных."""
 
+    def __init__(self, connector: Connector):
+        super().__init__(connector)
+        # Тексты инструкций собираются один раз, чтобы sqlite3 находил их
+        # в кэше подготовленных инструкций постоянного подключения.
+        self.sql_get_all = f"""
+            SELECT
+                id,
+                {self.field_name},
+                {self.field_description},
+                {self.field_dimension},
+                {self.field_price}
+            FROM {self.name_table}
+            ORDER BY name, id
+            """
+        self.sql_get_page = f"""
+            SELECT
+                id,
+                {self.field_name},
+                {self.field_description},
+                {self.field_dimension},
+                {self.field_price}
+            FROM {self.name_table}
+            WHERE ({self.field_name}, id) > (?, ?)
+            ORDER BY name, id
+            LIMIT ?
+            """
+        self.sql_get = f"""
+            SELECT
+                id,
+                {self.field_name},
+                {self.field_description},
+                {self.field_dimension},
+                {self.field_price}
+            FROM {self.name_table}
+            WHERE id = ?
+            """
+        self.sql_create = f"""
+            INSERT INTO {self.name_table} (
+                {self.field_name},
+                {self.field_name_normalized},
+                {self.field_description},
+                {self.field_price},
+                {self.field_dimension}
+            )
+            VALUES (?, ?, ?, ?, ?)
+            """
+        self.sql_update = f"""
+            UPDATE {self.name_table}
+            SET
+                {self.field_name} = ?,
+                {self.field_name_normalized} = ?,
+                {self.field_description} = ?,
+                {self.field_price} = ?,
+                {self.field_dimension} = ?
+            WHERE id = ?
+            """
+        self.sql_delete = f"""
+            DELETE FROM {self.name_table}
+            WHERE id = ?
+            """
+        self.sql_get_many = f"""
+            SELECT
+                id,
+                {self.field_name},
+                {self.field_description},
+                {self.field_dimension},
+                {self.field_price}
+            FROM {self.name_table}
+            WHERE id IN (SELECT value FROM json_each(?))
+            """
+        self.sql_search = f"""
+            SELECT
+                id,
+                {self.field_name},
+                {self.field_description},
+                {self.field_dimension},
+                {self.field_price}
+            FROM {self.name_table}
+            WHERE {self.field_name_normalized} LIKE ?
+            ORDER BY name, id
+            """
+        self.sql_find_duplicate = f"""
+            SELECT
+                id,
+                {self.field_name},
+                {self.field_description},
+                {self.field_dimension},
+                {self.field_price}
+            FROM {self.name_table}
+            WHERE {self.field_name_normalized} = ?
+            """
+        # Сходство - доля общих триграмм (коэффициент Жаккара). Кандидаты
+        # берутся из индекса триграмм; у записи со сходством не ниже порога
+        # общих триграмм не меньше порога, умноженного на их число в запросе.
+        self.sql_find_similar = f"""
+            WITH hits AS (
+                SELECT ingredient_id, count(*) AS common
+                FROM {self.name_table_trigram}
+                WHERE trigram IN (SELECT value FROM json_each(?1))
+                GROUP BY ingredient_id
+                HAVING count(*) >= ?2 * ?3
+            ),
+            scored AS (
+                SELECT
+                    ingredient_id,
+                    common * 1.0 / (
+                        ?2
+                        + (
+                            SELECT count(*)
+                            FROM {self.name_table_trigram} AS own
+                            WHERE own.ingredient_id = hits.ingredient_id
+                        )
+                        - common
+                    ) AS score
+                FROM hits
+            )
+            SELECT
+                item.id,
+                item.{self.field_name},
+                item.{self.field_description},
+                item.{self.field_dimension},
+                item.{self.field_price},
+                scored.score
+            FROM scored
+            JOIN {self.name_table} AS item ON item.id = scored.ingredient_id
+            WHERE scored.score >= ?3
+            ORDER BY scored.score DESC, item.{self.field_name}, item.id
+            LIMIT ?4
+            """
+        self.sql_duplicate_groups = f"""
+            SELECT json_group_array(id)
+            FROM (
+                SELECT id, {self.field_name_normalized}
+                FROM {self.name_table}
+                ORDER BY id
+            )
+            GROUP BY {self.field_name_normalized}
+            HAVING count(*) > 1
+            """
+        self.sql_move_lines = f"""
+            UPDATE {self.name_table_line}
+            SET ingredient_id = ?
+            WHERE ingredient_id IN (SELECT value FROM json_each(?))
+            """
+        self.sql_get_version = f"""
+            SELECT version FROM {self.name_table_version}
+            """
+        self.sql_advance_version = f"""
+            UPDATE {self.name_table_version} SET version = max(version, ?)
+            """
+        self.sql_bump_version = f"""
+            UPDATE {self.name_table_version} SET version = version + 1
+            """
+        self.sql_delete_many = f"""
+            DELETE FROM {self.name_table}
+            WHERE id IN (SELECT value FROM json_each(?))
+            """
+        self.sql_update_many = f"""
+            UPDATE {self.name_table}
+            SET
+                {self.field_price} = json_extract(changes.value, '$[1]'),
+                {self.field_dimension} = json_extract(changes.value, '$[2]')
+            FROM json_each(?) AS changes
+            WHERE {self.name_table}.id = json_extract(changes.value, '$[0]')
+            """
+
+    @property
+    def pending(self) -> int:
+        """Количество изменений, еще не записанных в базу."""
+        return 0
+
+    def flush(self) -> None:
+        """Запишет отложенные изменения. Здесь все записи сразу идут в базу."""
+
+    def take_rejected(self) -> list[tuple[str, tuple, str]]:
+        """
+        Вернет отложенные изменения, которым база отказала. Здесь отказ
+        сразу приходит исключением, поэтому таких нет.
+        """
+        return []
+
     def get_all(self) -> list[tuple[int, str, str, str, str]]:
         """Вернет все записи из таблицы базы данных."""
         with self.connector as cursor:
-            all_rows = cursor.execute(
-                f"""
-                SELECT
-                    id,
-                    {self.field_name},
-                    {self.field_description},
-                    {self.field_dimension},
-                    {self.field_price}
-                FROM {self.name_table}
-                ORDER BY name, id
-                """,
-            ).fetchall()
+            all_rows = cursor.execute(self.sql_get_all).fetchall()
+        profiler.count('db.rows', len(all_rows))
         return all_rows
 
     def get(self, id: int):
         with self.connector as cursor:
-            row = cursor.execute(
-                f"""
-                SELECT
-                    id,
-                    {self.field_name},
-                    {self.field_description},
-                    {self.field_dimension},
-                    {self.field_price}
-                FROM {self.name_table}
-                WHERE id = ?
-                """,
-                (id,),
-            ).fetchone()
+            row = cursor.execute(self.sql_get, (id,)).fetchone()
+        profiler.count('db.rows', row is not None)
         return row
 
+    def get_many(self, ids: list[int]) -> list[tuple[int, str, str, str, str]]:
+        """Вернет записи по списку id одним запросом."""
+        with self.connector as cursor:
+            rows = cursor.execute(
+                self.sql_get_many, (json.dumps(ids),)
+            ).fetchall()
+        profiler.count('db.rows', len(rows))
+        return rows
+
+    def iter_all(
+        self, size: int = 1000
+    ) -> Iterator[list[tuple[int, str, str, str, str]]]:
+        """Вернет все записи порциями, не загружая таблицу целиком."""
+        with self.connector as cursor:
+            cursor.execute(self.sql_get_all)
+            while rows := cursor.fetchmany(size):
+                profiler.count('db.rows', len(rows))
+                yield rows
+
+    def get_page(
+        self, after: tuple[str, int] | None = None, size: int = 1000
+    ) -> list[tuple[int, str, str, str, str]]:
+        """
+        Вернет до size записей в порядке get_all, следующих за записью
+        с (названием, id) after, или первые записи. Каждая страница -
+        отдельный запрос, между страницами база не заблокирована.
+        """
+        name, id = after if after is not None else ('', 0)
+        with self.connector as cursor:
+            rows = cursor.execute(
+                self.sql_get_page, (name, id, size)
+            ).fetchall()
+        profiler.count('db.rows', len(rows))
+        return rows
+
+    def search(self, text: str) -> list[tuple[int, str, str, str, str]]:
+        """
+        Вернет записи, в названии которых встречается текст, без учета
+        регистра, лишних пробелов и разницы между "е" и "ё".
+        """
+        with self.connector as cursor:
+            rows = cursor.execute(
+                self.sql_search, (f'%{normalize_name(text)}%',)
+            ).fetchall()
+        profiler.count('db.rows', len(rows))
+        return rows
+
+    def find_duplicate(
+        self, name: str
+    ) -> tuple[int, str, str, str, str] | None:
+        """Вернет запись с тем же нормализованным названием."""
+        with self.connector as cursor:
+            return cursor.execute(
+                self.sql_find_duplicate, (normalize_name(name),)
+            ).fetchone()
+
+    def find_similar(
+        self, name: str, threshold: float = 0.3, limit: int = 5
+    ) -> list[tuple[int, str, str, str, str, float]]:
+        """
+        Вернет записи с похожими названиями, самые похожие первыми.
+        Последнее поле - сходство от 0 до 1.
+
+        Параметры:
+            name название;
+            threshold наименьшее сходство;
+            limit наибольшее количество записей.
+        """
+        name_trigrams = sorted(trigrams(normalize_name(name)))
+        if not name_trigrams:
+            return []
+        with self.connector as cursor:
+            rows = cursor.execute(
+                self.sql_find_similar,
+                (
+                    json.dumps(name_trigrams, ensure_ascii=False),
+                    len(name_trigrams),
+                    threshold,
+                    limit,
+                ),
+            ).fetchall()
+        profiler.count('db.rows', len(rows))
+        return rows
+
+    def get_duplicate_groups(self) -> list[list[int]]:
+        """
+        Вернет группы id записей с одинаковым нормализованным названием,
+        каждая по возрастанию id.
+        """
+        with self.connector as cursor:
+            return [
+                json.loads(ids)
+                for (ids,) in cursor.execute(self.sql_duplicate_groups)
+            ]
+
+    def merge(self, groups: list[tuple[int, list[int]]]) -> None:
+        """
+        Объединит записи одной транзакцией: строки смет переводятся на
+        оставшуюся запись, остальные удаляются.
+
+        Параметры:
+            groups список вида (id оставшейся записи, id удаляемых).
+        """
+        with self.connector as cursor:
+            for target_id, source_ids in groups:
+                sources = json.dumps(source_ids)
+                cursor.execute(self.sql_move_lines, (target_id, sources))
+                cursor.execute(self.sql_delete_many, (sources,))
+            self._bump_version(cursor)
+
+    def get_version(self) -> int:
+        """Вернет версию каталога, которая растет с каждым изменением."""
+        with self.connector as cursor:
+            return cursor.execute(self.sql_get_version).fetchone()[0]
+
+    def advance_version(self, version: int) -> None:
+        """
+        Поднимет версию каталога не ниже version. Нужна после
+        восстановления из копии: версия копии может совпасть с версией
+        снимка, записанного по базе до восстановления.
+        """
+        with self.connector as cursor:
+            cursor.execute(self.sql_advance_version, (version,))
+
+    def _bump_version(self, cursor: Cursor) -> None:
+        """
+        Поднимет версию каталога в транзакции изменения: один раз на
+        вызов, сколько бы строк он ни затронул.
+        """
+        cursor.execute(self.sql_bump_version)
+
     def create(
         self,
         name: str,
@@ -77,19 +643,36 @@ class RepositoryDB(RepositoryBase):
         description: str = '',
     ) -> None:
         """Создаст запись в таблице базы данных."""
+        normalized = normalize_name(name)
         with self.connector as cursor:
             cursor.execute(
-                f"""
-                INSERT INTO {self.name_table} (
-                    {self.field_name},
-                    {self.field_description},
-                    {self.field_price},
-                    {self.field_dimension}
-                )
-                VALUES (?, ?, ?, ?)
-                """,
-                (name, description, price, dimension),
+                self.sql_create,
+                (name, normalized, description, price, dimension),
+            )
+            self._index_names(
+                cursor, [(cursor.lastrowid, normalized)], new=True
             )
+            self._bump_version(cursor)
+
+    def create_many(self, rows: Iterable[tuple[str, str, str, str]]) -> None:
+        """
+        Создаст записи одной транзакцией.
+
+        Параметры:
+            rows строки вида (название, цена, размерность, описание).
+        """
+        with self.connector as cursor:
+            names = []
+            for name, price, dimension, description in rows:
+                normalized = normalize_name(name)
+                cursor.execute(
+                    self.sql_create,
+                    (name, normalized, description, price, dimension),
+                )
+                names.append((cursor.lastrowid, normalized))
+            self._index_names(cursor, names, new=True)
+            if names:
+                self._bump_version(cursor)
 
     def update(
         self,
@@ -98,33 +681,690 @@ class RepositoryDB(RepositoryBase):
         price: str,
         dimension: str,
         description: str,
-    ) -> None:
-        """Изменит запись в базе данных по id."""
+    ) -> bool:
+        """
+        Изменит запись в базе данных по id. Вернет False, если записи с
+        таким id нет.
+        """
+        normalized = normalize_name(name)
         with self.connector as cursor:
             cursor.execute(
-                f"""
-                UPDATE {self.name_table}
-                SET
-                    {self.field_name} = ?,
-                    {self.field_description} = ?,
-                    {self.field_price} = ?,
-                    {self.field_dimension} = ?
-                WHERE id = ?
-                """,
-                (name, description, price, dimension, id),
+                self.sql_update,
+                (name, normalized, description, price, dimension, id),
+            )
+            if not cursor.rowcount:
+                return False
+            self._index_names(cursor, [(id, normalized)])
+            self._bump_version(cursor)
+            return True
+
+    def delete(self, id: int) -> bool:
+        """
+        Удалит запись из таблице по id. Вернет False, если записи с таким
+        id нет.
+        """
+        with self.connector as cursor:
+            cursor.execute(self.sql_delete, (id,))
+            if not cursor.rowcount:
+                return False
+            self._bump_version(cursor)
+            return True
+
+    def delete_many(self, ids: list[int]) -> None:
+        """Удалит записи по списку id одной инструкцией."""
+        with self.connector as cursor:
+            cursor.execute(self.sql_delete_many, (json.dumps(ids),))
+            if cursor.rowcount:
+                self._bump_version(cursor)
+
+    def update_many(self, changes: list[tuple[int, str, str]]) -> None:
+        """
+        Изменит цену и размерность у нескольких записей одной инструкцией.
+
+        Параметры:
+            changes список вида (id, цена, размерность).
+        """
+        with self.connector as cursor:
+            cursor.execute(
+                self.sql_update_many,
+                (json.dumps(changes, ensure_ascii=False),),
             )
+            if cursor.rowcount:
+                self._bump_version(cursor)
+
+
+class RepositoryUsage(RepositoryBase):
+    """
+    Репозиторий частоты выбора ингредиентов.
+
+    Вес ингредиента - сумма exp(-rate * (t - t_i)) по моментам выбора t_i:
+    каждый выбор со временем весит меньше, вдвое за half_life дней.
+    Хранится логарифм суммы exp(rate * t_i), от текущего времени он не
+    зависит, поэтому порядок по нему не меняется со временем и берется
+    из индекса.
+    """
+
+    def __init__(
+        self, connector: Connector, half_life: float = USAGE_HALF_LIFE_DAYS
+    ):
+        """
+        Репозиторий частоты выбора ингредиентов.
+
+        Параметры:
+            connector подключение к базе данных;
+            half_life за сколько дней вес выбора уменьшается вдвое.
+        """
+        super().__init__(connector)
+        self.rate = math.log(2) / (half_life * 24 * 60 * 60)
+        self.sql_get = f"""
+            SELECT ingredient_id, score, last_used, uses
+            FROM {self.name_table_usage}
+            WHERE ingredient_id IN (SELECT value FROM json_each(?))
+            """
+        self.sql_save = f"""
+            INSERT INTO {self.name_table_usage} (
+                ingredient_id, score, last_used, uses
+            )
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (ingredient_id) DO UPDATE SET
+                score = excluded.score,
+                last_used = excluded.last_used,
+                uses = excluded.uses
+            """
+        self.sql_get_favorites = f"""
+            SELECT
+                item.id,
+                item.{self.field_name},
+                item.{self.field_description},
+                item.{self.field_dimension},
+                item.{self.field_price}
+            FROM (
+                SELECT ingredient_id FROM (
+                    SELECT ingredient_id FROM {self.name_table_usage}
+                    ORDER BY last_used DESC
+                    LIMIT ?
+                )
+                UNION
+                SELECT ingredient_id FROM (
+                    SELECT ingredient_id FROM {self.name_table_usage}
+                    ORDER BY score DESC
+                    LIMIT ?
+                )
+            ) AS top
+            JOIN {self.name_table} AS item ON item.id = top.ingredient_id
+            JOIN {self.name_table_usage} AS usage
+                ON usage.ingredient_id = top.ingredient_id
+            ORDER BY usage.score DESC
+            """
+
+    def register(self, id: int, at: float | None = None) -> None:
+        """
+        Учтет выбор ингредиента.
+
+        Параметры:
+            id id ингредиента;
+            at время выбора в секундах от эпохи, по умолчанию текущее.
+        """
+        if at is None:
+            at = time.time()
+        with self.connector as cursor:
+            row = cursor.execute(self.sql_get, (json.dumps([id]),)).fetchone()
+            score, last_used, uses = self.rate * at, at, 1
+            if row is not None:
+                score = _log_add(row[1], score)
+                last_used = max(row[2], at)
+                uses += row[3]
+            cursor.execute(self.sql_save, (id, score, last_used, uses))
+
+    def get_favorites(
+        self, recent: int = 10, frequent: int = 20
+    ) -> list[tuple[int, str, str, str, str]]:
+        """
+        Вернет недавно и часто выбираемые ингредиенты, по убыванию веса.
+
+        Параметры:
+            recent сколько последних выбранных;
+            frequent сколько самых часто выбираемых.
+        """
+        with self.connector as cursor:
+            rows = cursor.execute(
+                self.sql_get_favorites, (recent, frequent)
+            ).fetchall()
+        profiler.count('db.rows', len(rows))
+        return rows
+
+    def merge(self, groups: list[tuple[int, list[int]]]) -> None:
+        """
+        Сложит частоту выбора объединяемых записей в оставшуюся.
+
+        Параметры:
+            groups список вида (id оставшейся записи, id удаляемых).
+        """
+        with self.connector as cursor:
+            for target_id, source_ids in groups:
+                rows = cursor.execute(
+                    self.sql_get, (json.dumps([target_id, *source_ids]),)
+                ).fetchall()
+                if not rows:
+                    continue
+                score = rows[0][1]
+                for row in rows[1:]:
+                    score = _log_add(score, row[1])
+                cursor.execute(
+                    self.sql_save,
+                    (
+                        target_id,
+                        score,
+                        max(row[2] for row in rows),
+                        sum(row[3] for row in rows),
+                    ),
+                )
+
+
+def _log_add(first: float, second: float) -> float:
+    """Вернет log(exp(first) + exp(second)) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+class RepositoryEstimate(RepositoryBase):
+    """Репозиторий сохраненных смет."""
+
+    def __init__(self, connector: Connector):
+        super().__init__(connector)
+        self.sql_create = f"""
+            INSERT INTO {self.name_table_estimate} ({self.field_name}, total)
+            VALUES (?, ?)
+            """
+        self.sql_create_line = f"""
+            INSERT INTO {self.name_table_line} (
+                estimate_id,
+                ingredient_id,
+                {self.field_name},
+                quantity,
+                {self.field_dimension},
+                {self.field_price}
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+            """
+        self.sql_get_all = f"""
+            SELECT id, {self.field_name}, total
+            FROM {self.name_table_estimate}
+            ORDER BY id
+            """
+        self.sql_get_lines = f"""
+            SELECT
+                id,
+                estimate_id,
+                ingredient_id,
+                {self.field_name},
+                quantity,
+                {self.field_dimension},
+                {self.field_price}
+            FROM {self.name_table_line}
+            WHERE estimate_id BETWEEN ? AND ?
+            ORDER BY estimate_id, id
+            """
+        self.sql_bounds = f"""
+            SELECT min(id), max(id) FROM {self.name_table_estimate}
+            """
+        self.sql_update_line_price = f"""
+            UPDATE {self.name_table_line}
+            SET {self.field_price} = ?
+            WHERE id = ?
+            """
+        self.sql_update_total = f"""
+            UPDATE {self.name_table_estimate}
+            SET total = ?
+            WHERE id = ?
+            """
+        self.sql_delete = f"""
+            DELETE FROM {self.name_table_estimate}
+            WHERE id = ?
+            """
+        self.sql_delete_lines = f"""
+            DELETE FROM {self.name_table_line}
+            WHERE estimate_id = ?
+            """
+
+    def get_all(self) -> list[tuple[int, str, str]]:
+        """Вернет все сметы: id, название и итог."""
+        with self.connector as cursor:
+            return cursor.execute(self.sql_get_all).fetchall()
+
+    def get_lines(
+        self, first_id: int, last_id: int | None = None
+    ) -> list[tuple[int, int, int, str, str, str, str]]:
+        """
+        Вернет строки смет с id от first_id до last_id включительно:
+        id, id сметы, id ингредиента, название, количество, размерность,
+        стоимость.
+        """
+        if last_id is None:
+            last_id = first_id
+        with self.connector as cursor:
+            lines = cursor.execute(
+                self.sql_get_lines, (first_id, last_id)
+            ).fetchall()
+        profiler.count('db.rows', len(lines))
+        return lines
+
+    def get_bounds(self) -> tuple[int | None, int | None]:
+        """Вернет наименьший и наибольший id сметы."""
+        with self.connector as cursor:
+            return cursor.execute(self.sql_bounds).fetchone()
+
+    def create(
+        self,
+        name: str,
+        total: str,
+        lines: list[tuple[int, str, str, str, str]],
+    ) -> int:
+        """
+        Сохранит смету со строками вида
+        (id ингредиента, название, количество, размерность, стоимость)
+        и вернет её id.
+        """
+        with self.connector as cursor:
+            cursor.execute(self.sql_create, (name, total))
+            estimate_id = cursor.lastrowid
+            cursor.executemany(
+                self.sql_create_line,
+                ((estimate_id, *line) for line in lines),
+            )
+        return estimate_id
+
+    def update_prices(
+        self,
+        line_prices: list[tuple[str, int]],
+        totals: list[tuple[str, int]],
+    ) -> None:
+        """
+        Запишет новые стоимости строк и итоги смет одной транзакцией.
+
+        Параметры:
+            line_prices список вида (стоимость, id строки);
+            totals список вида (итог, id сметы).
+        """
+        with self.connector as cursor:
+            cursor.executemany(self.sql_update_line_price, line_prices)
+            cursor.executemany(self.sql_update_total, totals)
 
     def delete(self, id: int) -> None:
-        """Удалит запись из таблице по id."""
+        """Удалит смету вместе со строками."""
+        with self.connector as cursor:
+            cursor.execute(self.sql_delete_lines, (id,))
+            cursor.execute(self.sql_delete, (id,))
+
+
+class RepositoryRules(RepositoryBase):
+    """
+    Репозиторий правил оповещений: порог изменения цены ингредиента
+    (в процентах от цены на момент создания правила) и бюджет сметы.
+    """
+
+    def __init__(self, connector: Connector):
+        super().__init__(connector)
+        self.sql_get_price_rules = f"""
+            SELECT ingredient_id, percent, base_price, base_dimension
+            FROM {self.name_table_price_rule}
+            """
+        self.sql_save_price_rule = f"""
+            INSERT INTO {self.name_table_price_rule} (
+                ingredient_id, percent, base_price, base_dimension
+            )
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (ingredient_id) DO UPDATE SET
+                percent = excluded.percent,
+                base_price = excluded.base_price,
+                base_dimension = excluded.base_dimension
+            """
+        self.sql_delete_price_rule = f"""
+            DELETE FROM {self.name_table_price_rule}
+            WHERE ingredient_id = ?
+            """
+        self.sql_get_budget_rules = f"""
+            SELECT rule.estimate_id, rule.budget, estimate.{self.field_name}
+            FROM {self.name_table_budget_rule} AS rule
+            JOIN {self.name_table_estimate} AS estimate
+                ON estimate.id = rule.estimate_id
+            """
+        self.sql_save_budget_rule = f"""
+            INSERT INTO {self.name_table_budget_rule} (estimate_id, budget)
+            VALUES (?, ?)
+            ON CONFLICT (estimate_id) DO UPDATE SET budget = excluded.budget
+            """
+        self.sql_delete_budget_rule = f"""
+            DELETE FROM {self.name_table_budget_rule}
+            WHERE estimate_id = ?
+            """
+        self.sql_get_budget_lines = f"""
+            SELECT
+                line.estimate_id,
+                line.ingredient_id,
+                line.quantity,
+                line.{self.field_dimension},
+                line.{self.field_price}
+            FROM {self.name_table_budget_rule} AS rule
+            JOIN {self.name_table_line} AS line
+                ON line.estimate_id = rule.estimate_id
+            WHERE ?1 IS NULL OR rule.estimate_id = ?1
+            """
+
+    def get_price_rules(self) -> list[tuple[int, str, str, str]]:
+        """
+        Вернет правила цены: id ингредиента, порог в процентах, исходные
+        цена и размерность.
+        """
+        with self.connector as cursor:
+            return cursor.execute(self.sql_get_price_rules).fetchall()
+
+    def save_price_rule(
+        self,
+        ingredient_id: int,
+        percent: str,
+        base_price: str,
+        base_dimension: str,
+    ) -> None:
+        """Создаст или заменит правило цены ингредиента."""
         with self.connector as cursor:
             cursor.execute(
-                f"""
-                DELETE FROM {self.name_table}
-                WHERE id = ?
-                """,
-                (id,),
+                self.sql_save_price_rule,
+                (ingredient_id, percent, base_price, base_dimension),
+            )
+
+    def delete_price_rule(self, ingredient_id: int) -> None:
+        """Удалит правило цены ингредиента."""
+        with self.connector as cursor:
+            cursor.execute(self.sql_delete_price_rule, (ingredient_id,))
+
+    def get_budget_rules(self) -> list[tuple[int, str, str]]:
+        """Вернет бюджеты смет: id сметы, бюджет и название сметы."""
+        with self.connector as cursor:
+            return cursor.execute(self.sql_get_budget_rules).fetchall()
+
+    def save_budget_rule(self, estimate_id: int, budget: str) -> None:
+        """Создаст или заменит бюджет сметы."""
+        with self.connector as cursor:
+            cursor.execute(self.sql_save_budget_rule, (estimate_id, budget))
+
+    def delete_budget_rule(self, estimate_id: int) -> None:
+        """Удалит бюджет сметы."""
+        with self.connector as cursor:
+            cursor.execute(self.sql_delete_budget_rule, (estimate_id,))
+
+    def get_budget_lines(
+        self, estimate_id: int | None = None
+    ) -> list[tuple[int, int, str, str, str]]:
+        """
+        Вернет строки смет с бюджетом: id сметы, id ингредиента,
+        количество, размерность и сохраненную стоимость.
+
+        Параметры:
+            estimate_id только эта смета, None - все сметы с бюджетом.
+        """
+        with self.connector as cursor:
+            lines = cursor.execute(
+                self.sql_get_budget_lines, (estimate_id,)
+            ).fetchall()
+        profiler.count('db.rows', len(lines))
+        return lines
+
+
+class RepositoryReport(RepositoryBase):
+    """
+    Отчеты по сохраненным сметам и каталогу.
+
+    Всё считается агрегатами и оконными функциями SQL по индексам
+    RepositoryStart: суммы - целыми копейками, доли и места - оконными
+    функциями, медиана - выборкой из середины упорядоченного по цене
+    индекса.
+    """
+
+    def __init__(self, connector: Connector):
+        super().__init__(connector)
+        # По всем сметам и по одной: с условием по смете строки читаются
+        # по индексу estimate_id, без него суммы считаются по индексам
+        # стоимости.
+        self.sql_cost_by_category = self._sql_cost_by_category(False)
+        self.sql_cost_by_category_estimate = self._sql_cost_by_category(True)
+        self.sql_top_ingredients = self._sql_top_ingredients(False)
+        self.sql_top_ingredients_estimate = self._sql_top_ingredients(True)
+        self.sql_unit_price_stats = f"""
+            SELECT
+                {self.field_dimension},
+                count(*),
+                avg({UNIT_PRICE}),
+                min({UNIT_PRICE}),
+                max({UNIT_PRICE})
+            FROM {self.name_table}
+            GROUP BY {self.field_dimension}
+            ORDER BY {self.field_dimension}
+            """
+        # Медиана - среднее одной или двух средних по цене записей:
+        # индекс уже упорядочен по цене, OFFSET только пропускает записи.
+        self.sql_median_price = f"""
+            SELECT avg(price)
+            FROM (
+                SELECT {UNIT_PRICE} AS price
+                FROM {self.name_table}
+                WHERE {self.field_dimension} = ?
+                ORDER BY {UNIT_PRICE}
+                LIMIT ? OFFSET ?
             )
+            """
+
+    def _sql_costs(self, field: str, estimate: bool) -> str:
+        """
+        Вернет запрос стоимости строк смет в копейках и числа строк,
+        сгруппированных по field. Смета, если нужна, - параметр ?2.
+        """
+        where = 'WHERE estimate_id = ?2' if estimate else ''
+        return f"""
+            SELECT
+                {field},
+                sum({LINE_CENTS}) AS cents,
+                count(*) AS lines
+            FROM {self.name_table_line}
+            {where}
+            GROUP BY {field}
+            """
+
+    def _sql_cost_by_category(self, estimate: bool) -> str:
+        """
+        Вернет запрос стоимости по категориям: стоимость по размерностям
+        сводится в категории по соответствию из параметра ?1.
+        """
+        return f"""
+            WITH categories AS (
+                SELECT key AS {self.field_dimension}, value AS category
+                FROM json_each(?1)
+            ),
+            costs AS ({self._sql_costs(self.field_dimension, estimate)})
+            SELECT
+                coalesce(categories.category, costs.{self.field_dimension})
+                AS category,
+                sum(costs.cents) AS cents,
+                sum(costs.lines),
+                sum(costs.cents) * 1.0 / sum(sum(costs.cents)) OVER ()
+            FROM costs
+            LEFT JOIN categories USING ({self.field_dimension})
+            GROUP BY 1
+            ORDER BY cents DESC, category
+            """
+
+    def _sql_top_ingredients(self, estimate: bool) -> str:
+        """
+        Вернет запрос самых дорогих ингредиентов: место и доля считаются
+        оконными функциями, число ингредиентов - параметр ?1.
+        """
+        return f"""
+            WITH costs AS ({self._sql_costs('ingredient_id', estimate)}),
+            ranked AS (
+                SELECT
+                    rank() OVER (ORDER BY cents DESC) AS place,
+                    ingredient_id,
+                    cents,
+                    lines,
+                    cents * 1.0 / sum(cents) OVER () AS share
+                FROM costs
+            )
+            SELECT
+                ranked.place,
+                ranked.ingredient_id,
+                coalesce(
+                    item.{self.field_name},
+                    (
+                        SELECT line.{self.field_name}
+                        FROM {self.name_table_line} AS line
+                        WHERE line.ingredient_id = ranked.ingredient_id
+                        LIMIT 1
+                    )
+                ),
+                ranked.cents,
+                ranked.lines,
+                ranked.share
+            FROM ranked
+            LEFT JOIN {self.name_table} AS item
+            ON item.id = ranked.ingredient_id
+            ORDER BY ranked.place, ranked.ingredient_id
+            LIMIT ?1
+            """
+
+    @profiler.timed('RepositoryReport.cost_by_category')
+    def cost_by_category(
+        self, categories: dict[str, str], estimate_id: int | None = None
+    ) -> list[tuple[str, int, int, float]]:
+        """
+        Вернет стоимость строк смет по категориям, самые дорогие первыми:
+        (категория, копейки, строк, доля от общей стоимости).
+
+        Параметры:
+            categories соответствие размерности и её категории; строки
+                с неизвестной размерностью попадут в категорию с её именем;
+            estimate_id только эта смета, None - все сохраненные сметы.
+        """
+        params = [json.dumps(categories, ensure_ascii=False)]
+        sql = self.sql_cost_by_category
+        if estimate_id is not None:
+            params.append(estimate_id)
+            sql = self.sql_cost_by_category_estimate
+        with self.connector as cursor:
+            return cursor.execute(sql, params).fetchall()
 
+    @profiler.timed('RepositoryReport.top_ingredients')
+    def top_ingredients(
+        self, limit: int = 10, estimate_id: int | None = None
+    ) -> list[tuple[int, int, str, int, int, float]]:
+        """
+        Вернет ингредиенты, на которые в сметах ушло больше всего денег:
+        (место, id, название, копейки, строк, доля от общей стоимости).
 
-start = RepositoryStart(connector)
-repository = RepositoryDB(connector)
+        Параметры:
+            limit сколько ингредиентов вернуть;
+            estimate_id только эта смета, None - все сохраненные сметы.
+        """
+        params = [limit]
+        sql = self.sql_top_ingredients
+        if estimate_id is not None:
+            params.append(estimate_id)
+            sql = self.sql_top_ingredients_estimate
+        with self.connector as cursor:
+            return cursor.execute(sql, params).fetchall()
+
+    @profiler.timed('RepositoryReport.unit_price_stats')
+    def unit_price_stats(
+        self,
+    ) -> list[tuple[str, int, float, float, float, float]]:
+        """
+        Вернет статистику цены за единицу в каталоге по размерностям:
+        (размерность, записей, средняя, медиана, минимум, максимум).
+        """
+        with self.connector as cursor:
+            stats = cursor.execute(self.sql_unit_price_stats).fetchall()
+            return [
+                (
+                    dimension,
+                    count,
+                    average,
+                    cursor.execute(
+                        self.sql_median_price,
+                        (dimension, 2 - count % 2, (count - 1) // 2),
+                    ).fetchone()[0],
+                    low,
+                    high,
+                )
+                for dimension, count, average, low, high in stats
+            ]
+
+
+class RepositoryCompare(RepositoryBase):
+    """
+    Сравнение цен между каталогами, присоединенными к одному подключению
+    (см. параметр attached у Connector). Записи сопоставляются по
+    нормализованному названию одним запросом, соединение идет по
+    уникальному индексу названия каждого каталога.
+    """
+
+    def __init__(self, connector: Connector):
+        super().__init__(connector)
+        # Запрос зависит от набора схем, поэтому строится один раз на набор.
+        self._sql_compare: dict[tuple[tuple[str, ...], bool], str] = {}
+
+    def _sql_compare_prices(
+        self, schemas: tuple[str, ...], only_common: bool
+    ) -> str:
+        """
+        Вернет запрос цен записей первой схемы и записей с тем же
+        нормализованным названием в остальных схемах.
+        """
+        base, *others = schemas
+        columns = ''.join(
+            f', c{number}.{self.field_dimension}, c{number}.{self.field_price}'
+            for number in range(len(others))
+        )
+        joins = ''.join(
+            f"""
+            LEFT JOIN "{schema}".{self.name_table} AS c{number}
+                ON c{number}.{self.field_name_normalized}
+                = base.{self.field_name_normalized}"""
+            for number, schema in enumerate(others)
+        )
+        where = (
+            'WHERE '
+            + ' OR '.join(
+                f'c{number}.id IS NOT NULL' for number in range(len(others))
+            )
+            if only_common and others
+            else ''
+        )
+        return f"""
+            SELECT
+                base.{self.field_name},
+                base.{self.field_dimension},
+                base.{self.field_price}{columns}
+            FROM "{base}".{self.name_table} AS base{joins}
+            {where}
+            ORDER BY base.{self.field_name_normalized}
+            """
+
+    @profiler.timed('RepositoryCompare.compare_prices')
+    def compare_prices(
+        self, schemas: list[str], only_common: bool = True
+    ) -> list[tuple]:
+        """
+        Вернет строки вида (название, размерность, цена, затем размерность
+        и цена в каждой следующей схеме или None, если записи там нет).
+
+        Параметры:
+            schemas схемы каталогов, первая - с которой сравниваются
+                остальные;
+            only_common только записи, которые есть хотя бы в одной из
+                остальных схем.
+        """
+        key = (tuple(schemas), only_common)
+        sql = self._sql_compare.get(key)
+        if sql is None:
+            sql = self._sql_compare[key] = self._sql_compare_prices(*key)
+        with self.connector as cursor:
+            return cursor.execute(sql).fetchall()
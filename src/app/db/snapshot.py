@@ -0,0 +1,130 @@
+import mmap
+import os
+import struct
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from app.models import RowViewOnDBTable
+
+MAGIC = b'CATS'
+FORMAT = 1
+# Заголовок: метка, версия формата, версия каталога, число записей,
+# смещение таблицы строк.
+HEADER = struct.Struct('<4sIqQQ')
+# Запись: id и пары (смещение, длина) для названия, описания,
+# размерности и цены в таблице строк.
+RECORD = struct.Struct('<q8I')
+# Смещение, обозначающее отсутствующее значение (описание None).
+NULL = 0xFFFFFFFF
+
+
+def write_snapshot(
+    path: str,
+    version: int,
+    rows: Iterable[tuple[int, str, str | None, str, str]],
+) -> None:
+    """
+    Запишет снимок каталога: записи фиксированной длины и таблицу строк.
+
+    Файл пишется рядом и подменяется целиком, поэтому читатель никогда
+    не увидит недописанный снимок.
+
+    Параметры:
+        path путь к файлу снимка;
+        version версия каталога, с которой снят снимок;
+        rows строки каталога (id, название, описание, размерность, цена).
+    """
+    records = bytearray()
+    strings = bytearray()
+    count = 0
+
+    def put(value: str | None) -> tuple[int, int]:
+        if value is None:
+            return NULL, 0
+        data = value.encode('utf-8')
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    for id, name, description, dimension, price in rows:
+        records.extend(
+            RECORD.pack(
+                id,
+                *put(name),
+                *put(description),
+                *put(dimension),
+                *put(price),
+            )
+        )
+        count += 1
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(
+            HEADER.pack(
+                MAGIC, FORMAT, version, count, HEADER.size + len(records)
+            )
+        )
+        file.write(records)
+        file.write(strings)
+    os.replace(tmp_path, path)
+
+
+class CatalogSnapshot:
+    """
+    Снимок каталога, открытый через mmap только для чтения.
+
+    Строки не загружаются целиком: объект-строка собирается из буфера
+    при обращении по индексу, поэтому открытие не зависит от размера
+    каталога, а в памяти остаются только просмотренные страницы файла.
+    """
+
+    def __init__(self, path: str, row_view: type['RowViewOnDBTable']) -> None:
+        """
+        Снимок каталога, открытый только для чтения.
+
+        Параметры:
+            path путь к файлу снимка;
+            row_view класс объекта-строки.
+        """
+        self.row_view = row_view
+        with open(path, 'rb') as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format, self.version, self._count, self._strings = (
+            HEADER.unpack_from(self._buffer)
+        )
+        if magic != MAGIC or format != FORMAT:
+            self.close()
+            raise ValueError(f'{path} не является снимком каталога')
+        self._cached_row = lru_cache(maxsize=512)(self._get_row)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> 'RowViewOnDBTable':
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._cached_row(index)
+
+    def _get_row(self, index: int) -> 'RowViewOnDBTable':
+        """Соберет объект-строку из записи снимка."""
+        id, *fields = RECORD.unpack_from(
+            self._buffer, HEADER.size + index * RECORD.size
+        )
+        name, description, dimension, price = (
+            self._string(offset, length)
+            for offset, length in zip(fields[::2], fields[1::2])
+        )
+        return self.row_view(id, name, description, dimension, price)
+
+    def _string(self, offset: int, length: int) -> str | None:
+        """Прочитает строку из таблицы строк."""
+        if offset == NULL:
+            return None
+        start = self._strings + offset
+        return str(self._buffer[start : start + length], 'utf-8')
+
+    def close(self) -> None:
+        """Закроет файл снимка."""
+        self._buffer.close()
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from sqlite3 import Cursor
+
+
+class StatementCache:
+    """
+    Статистика кэша подготовленных инструкций одного подключения.
+
+    sqlite3 не сообщает о попаданиях в свой кэш, поэтому здесь ведется
+    такой же LRU-список текстов SQL того же размера: инструкция, текст
+    которой уже есть в списке, взята из кэша подключения без разбора.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._statements: OrderedDict[str, None] = OrderedDict()
+
+    def lookup(self, sql: str) -> None:
+        """Учтет выполнение инструкции."""
+        if sql in self._statements:
+            self._statements.move_to_end(sql)
+            self.hits += 1
+            return
+        self.misses += 1
+        self._statements[sql] = None
+        if len(self._statements) > self.size:
+            self._statements.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля инструкций, взятых из кэша."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class CachedCursor(Cursor):
+    """Курсор, учитывающий попадания в кэш подготовленных инструкций."""
+
+    statement_cache: StatementCache | None = None
+
+    def execute(self, sql, parameters=(), /):
+        if self.statement_cache is not None:
+            self.statement_cache.lookup(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        if self.statement_cache is not None:
+            self.statement_cache.lookup(sql)
+        return super().executemany(sql, seq_of_parameters)
@@ -0,0 +1,233 @@
+import logging
+import re
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from sqlite3 import Connection, Error
+from time import perf_counter
+
+from app.settings import (
+    SLOW_QUERY_BACKUPS,
+    SLOW_QUERY_LOG,
+    SLOW_QUERY_MAX_BYTES,
+    SLOW_QUERY_MS,
+)
+
+from .statements import CachedCursor
+
+# Инструкции, для которых SQLite умеет показать план выполнения.
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+
+class QueryStats:
+    """Накопленная статистика по одному отпечатку SQL-инструкции."""
+
+    __slots__ = ('count', 'total', 'max', 'slow')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+
+
+class QueryLog:
+    """
+    Журнал медленных SQL-инструкций.
+
+    Инструкции дольше порога пишутся в ротируемый файл вместе с планом
+    выполнения (EXPLAIN QUERY PLAN) и формой переданных параметров.
+    Все инструкции агрегируются по отпечатку: тексту SQL без литералов.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        threshold: float,
+        max_bytes: int = 1_000_000,
+        backup_count: int = 3,
+    ) -> None:
+        """
+        Журнал медленных SQL-инструкций.
+
+        Параметры:
+            path файл журнала;
+            threshold порог в секундах, с которого инструкция медленная;
+            max_bytes размер файла, после которого он ротируется;
+            backup_count сколько старых файлов журнала хранить.
+        """
+        self.threshold = threshold
+        self.stats: dict[str, QueryStats] = {}
+        self.executed: Counter[str] = Counter()
+        self.logger = logging.getLogger(f'{__name__}.{path}')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=max_bytes,
+                backupCount=backup_count,
+                encoding='utf-8',
+                delay=True,
+            )
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.logger.addHandler(handler)
+
+    @staticmethod
+    def fingerprint(sql: str) -> str:
+        """Вернет текст SQL без литералов и лишних пробелов."""
+        sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+        sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+        sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?+)', sql)
+        return ' '.join(sql.split())
+
+    @staticmethod
+    def shape(params) -> str:
+        """Вернет форму параметров: типы значений, без самих значений."""
+        if isinstance(params, dict):
+            return '{%s}' % ', '.join(
+                f'{key}: {type(value).__name__}'
+                for key, value in params.items()
+            )
+        return '(%s)' % ', '.join(type(value).__name__ for value in params)
+
+    def trace(self, statement: str) -> None:
+        """
+        Обратный вызов для set_trace_callback: посчитает каждую инструкцию,
+        которую выполнил SQLite, включая неявные BEGIN и инструкции триггеров.
+        """
+        self.executed[self.fingerprint(statement)] += 1
+
+    def record(
+        self,
+        connection: Connection,
+        sql: str,
+        params,
+        seconds: float,
+    ) -> None:
+        """Учтет инструкцию и запишет её в журнал, если она медленная."""
+        key = self.fingerprint(sql)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = QueryStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.max = max(stats.max, seconds)
+
+        if seconds < self.threshold:
+            return
+
+        stats.slow += 1
+        self.logger.info(
+            '%.1f мс | %s | параметры %s\n%s',
+            seconds * 1000,
+            key,
+            self.shape(params),
+            self.explain(connection, sql, params),
+        )
+
+    def explain(self, connection: Connection, sql: str, params) -> str:
+        """Вернет план выполнения инструкции в виде дерева."""
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return '    (план недоступен)'
+        try:
+            rows = connection.execute(
+                f'EXPLAIN QUERY PLAN {sql}', params
+            ).fetchall()
+        except Error as error:
+            return f'    (план недоступен: {error})'
+        depth = {0: 0}
+        lines = []
+        for id, parent, _, detail in rows:
+            depth[id] = depth.get(parent, 0) + 1
+            lines.append(f'{"    " * depth[id]}{detail}')
+        return '\n'.join(lines)
+
+    def report(self) -> list[tuple[str, QueryStats]]:
+        """Вернет статистику по отпечаткам, самые затратные первыми."""
+        return sorted(
+            self.stats.items(), key=lambda item: item[1].total, reverse=True
+        )
+
+    def write_report(self, limit: int = 20) -> None:
+        """Запишет в журнал сводку по самым затратным отпечаткам."""
+        for key, stats in self.report()[:limit]:
+            self.logger.info(
+                'итого %d раз, %.1f мс, макс %.1f мс, медленных %d | %s',
+                stats.count,
+                stats.total * 1000,
+                stats.max * 1000,
+                stats.slow,
+                key,
+            )
+        for key, count in self.executed.most_common(limit):
+            self.logger.info('выполнено SQLite %d раз | %s', count, key)
+
+
+class TracedCursor(CachedCursor):
+    """
+    Курсор, замеряющий время инструкций вместе с выборкой строк.
+
+    Обратный вызов set_trace_callback срабатывает только перед началом
+    инструкции, поэтому время измеряется здесь: от execute до конца
+    выборки результата или до следующей инструкции.
+    """
+
+    query_log: QueryLog
+    _statement: tuple[str, object, float] | None = None
+
+    def execute(self, sql, parameters=(), /):
+        self.finish()
+        start = perf_counter()
+        result = super().execute(sql, parameters)
+        self._statement = (sql, parameters, perf_counter() - start)
+        return result
+
+    def executemany(self, sql, seq_of_parameters, /):
+        self.finish()
+        seq_of_parameters = list(seq_of_parameters)
+        start = perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        params = seq_of_parameters[0] if seq_of_parameters else ()
+        self._statement = (sql, params, perf_counter() - start)
+        return result
+
+    def fetchone(self):
+        return self._fetch(super().fetchone, False)
+
+    def fetchmany(self, size=1):
+        return self._fetch(
+            lambda: super(TracedCursor, self).fetchmany(size), False
+        )
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def _fetch(self, fetch, finish: bool = True):
+        start = perf_counter()
+        result = fetch()
+        if self._statement is not None:
+            sql, params, elapsed = self._statement
+            self._statement = (sql, params, elapsed + perf_counter() - start)
+            if finish:
+                self.finish()
+        return result
+
+    def finish(self) -> None:
+        """Передаст замер последней инструкции в журнал."""
+        if self._statement is None:
+            return
+        sql, params, elapsed = self._statement
+        self._statement = None
+        self.query_log.record(self.connection, sql, params, elapsed)
+
+
+query_log = (
+    QueryLog(
+        SLOW_QUERY_LOG,
+        SLOW_QUERY_MS / 1000,
+        SLOW_QUERY_MAX_BYTES,
+        SLOW_QUERY_BACKUPS,
+    )
+    if SLOW_QUERY_MS is not None
+    else None
+)
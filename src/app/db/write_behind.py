@@ -0,0 +1,495 @@
+import atexit
+import heapq
+import json
+import threading
+from operator import itemgetter
+from sqlite3 import IntegrityError
+from time import monotonic
+from typing import Iterable, Iterator
+
+from app.profiler import profiler
+
+from .manager import Connector
+from .names import normalize_name
+from .repository import RepositoryDB
+
+Row = tuple[int, str, str, str, str]
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+DELETE_MANY = 'delete_many'
+UPDATE_MANY = 'update_many'
+
+
+class WriteBehindRepositoryDB(RepositoryDB):
+    """
+    Репозиторий с отложенной записью.
+
+    create, update и delete не идут в базу сразу, а копятся в очереди и
+    сбрасываются одной транзакцией, когда накопится size изменений или
+    пройдет delay секунд с первого из них, а также по flush() и при
+    завершении программы. Пока изменения в очереди, get, get_many и
+    get_all видят их через наложение поверх базы; остальные чтения и
+    get_version сначала сбрасывают очередь.
+
+    Изменения, еще не сброшенные из очереди (до size штук за последние
+    delay секунд), живут только в памяти: при аварийном завершении
+    процесса они теряются, atexit и flush() спасают их лишь при обычном
+    выходе. Поэтому окно каталога сбрасывает очередь при своем закрытии и
+    при закрытии главного окна.
+
+    Id новым записям выдаются заранее, следующими за наибольшим id в базе.
+    Если до сброса в каталог успел добавить записи кто-то другой (сервер,
+    сверка прайс-листа, другой процесс), при сбросе новые записи получают
+    следующие свободные id, а ссылки на них в очереди переписываются.
+    Повтор нормализованного названия проверяется сразу при постановке в
+    очередь; если его все же внес другой писатель, при сбросе откажет
+    только это изменение: остальные записываются, а отказанные попадают в
+    rejected, откуда их забирает take_rejected().
+    """
+
+    def __init__(
+        self,
+        connector: Connector,
+        size: int = 500,
+        delay: float = 1.0,
+    ) -> None:
+        """
+        Репозиторий с отложенной записью.
+
+        Параметры:
+            connector подключение к базе данных;
+            size после скольких изменений сбрасывать очередь;
+            delay через сколько секунд после первого изменения сбрасывать
+                очередь, None - только по размеру и flush().
+        """
+        super().__init__(connector)
+        self.size = size
+        self.delay = delay
+        self.sql_create_with_id = f"""
+            INSERT INTO {self.name_table} (
+                id,
+                {self.field_name},
+                {self.field_name_normalized},
+                {self.field_description},
+                {self.field_price},
+                {self.field_dimension}
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+            """
+        self.sql_max_id = f'SELECT max(id) FROM {self.name_table}'
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._operations: list[tuple[str, tuple]] = []
+        # id -> новая строка или None, если запись удалена.
+        self._overlay: dict[int, Row | None] = {}
+        # Нормализованное название -> id для строк наложения.
+        self._names: dict[str, int] = {}
+        self._next_id: int | None = None
+        self._first_at: float | None = None
+        self._flusher: threading.Thread | None = None
+        self._closed = False
+        # Изменения, отказанные базой при сбросе: вид, параметры, ошибка.
+        self.rejected: list[tuple[str, tuple, str]] = []
+        atexit.register(self.flush)
+
+    @property
+    def pending(self) -> int:
+        """Количество изменений, еще не записанных в базу."""
+        return len(self._operations)
+
+    @profiler.timed('WriteBehindRepositoryDB.flush')
+    def flush(self) -> None:
+        """
+        Запишет накопленные изменения одной транзакцией. После возврата
+        они зафиксированы, если только flush не вызван внутри чужой
+        транзакции: тогда их фиксирует внешний выход из connector. Если
+        база отказала отдельным изменениям, остальные записываются, а
+        отказанные переносятся в rejected. При прочих ошибках очередь
+        остается нетронутой.
+        """
+        with self._lock:
+            if not self._operations:
+                self._first_at = None
+                return
+            outer = self.connector.active
+            with self.connector as cursor:
+                if not cursor.connection.in_transaction:
+                    # Новые id выбираются по max(id) в этой же транзакции.
+                    cursor.execute('BEGIN IMMEDIATE')
+                operations = self._renumber(cursor, self._operations)
+                cursor.execute('SAVEPOINT write_behind')
+                try:
+                    for kind, params in _runs(operations):
+                        self._execute(cursor, kind, params)
+                    rejected = []
+                except IntegrityError:
+                    cursor.execute('ROLLBACK TO write_behind')
+                    rejected = self._execute_each(cursor, operations)
+                cursor.execute('RELEASE write_behind')
+                self._bump_version(cursor)
+                if not outer:
+                    # Фиксация явная: Connector при выходе гасит ошибку
+                    # фиксации, а очередь можно очистить только после неё.
+                    cursor.connection.commit()
+            profiler.count('db.write_behind.flushed', len(operations))
+            profiler.count('db.write_behind.rejected', len(rejected))
+            self.rejected.extend(rejected)
+            self._operations = []
+            self._overlay = {}
+            self._names = {}
+            self._next_id = None
+            self._first_at = None
+
+    def take_rejected(self) -> list[tuple[str, tuple, str]]:
+        """Вернет и забудет изменения, отказанные базой при сбросе."""
+        with self._lock:
+            rejected, self.rejected = self.rejected, []
+            return rejected
+
+    def close(self) -> None:
+        """
+        Запишет очередь и перестанет сбрасывать её по времени и при
+        завершении программы. Вызывается перед закрытием подключения.
+        """
+        with self._lock:
+            self.flush()
+            atexit.unregister(self.flush)
+            self._closed = True
+            self._wakeup.notify_all()
+
+    def _renumber(
+        self, cursor, operations: list[tuple[str, tuple]]
+    ) -> list[tuple[str, tuple]]:
+        """
+        Вернет очередь, где новые записи получили id после наибольшего id
+        в базе, если выданные заранее уже заняты другим писателем.
+        """
+        created = [params[0] for kind, params in operations if kind == CREATE]
+        if not created:
+            return operations
+        max_id = cursor.execute(self.sql_max_id).fetchone()[0] or 0
+        if max_id < min(created):
+            return operations
+        ids = {id: new for new, id in enumerate(created, max_id + 1)}
+        profiler.count('db.write_behind.renumbered', len(ids))
+        return [
+            (kind, _renumbered(kind, params, ids))
+            for kind, params in operations
+        ]
+
+    def _execute_each(
+        self, cursor, operations: list[tuple[str, tuple]]
+    ) -> list[tuple[str, tuple, str]]:
+        """
+        Выполнит изменения по одному и вернет те, которым база отказала,
+        вместе с ошибкой.
+        """
+        rejected = []
+        for kind, params in operations:
+            cursor.execute('SAVEPOINT write_behind_one')
+            try:
+                self._execute(cursor, kind, [params])
+            except IntegrityError as error:
+                cursor.execute('ROLLBACK TO write_behind_one')
+                rejected.append((kind, params, str(error)))
+            cursor.execute('RELEASE write_behind_one')
+        return rejected
+
+    def _execute(self, cursor, kind: str, params: list[tuple]) -> None:
+        """Выполнит подряд идущие изменения одного вида."""
+        if kind == CREATE:
+            cursor.executemany(self.sql_create_with_id, params)
+            self._index_names(
+                cursor,
+                [(id, normalized) for id, _, normalized, *_ in params],
+                new=True,
+            )
+        elif kind == UPDATE:
+            cursor.executemany(self.sql_update, params)
+            self._index_names(
+                cursor,
+                [
+                    (id, normalized)
+                    for _, normalized, *_, id in params
+                    if cursor.execute(self.sql_get, (id,)).fetchone()
+                ],
+            )
+        elif kind == DELETE:
+            cursor.executemany(self.sql_delete, params)
+        elif kind == DELETE_MANY:
+            ids = [id for (batch,) in params for id in batch]
+            cursor.execute(self.sql_delete_many, (json.dumps(ids),))
+        else:
+            changes = [change for (batch,) in params for change in batch]
+            cursor.execute(
+                self.sql_update_many,
+                (json.dumps(changes, ensure_ascii=False),),
+            )
+
+    def get_all(self) -> list[Row]:
+        """Вернет все записи с учетом незаписанных изменений."""
+        with self._lock:
+            rows = super().get_all()
+            if not self._overlay:
+                return rows
+            overlay = self._overlay
+            return list(
+                heapq.merge(
+                    (row for row in rows if row[0] not in overlay),
+                    sorted(
+                        (row for row in overlay.values() if row is not None),
+                        key=itemgetter(1, 0),
+                    ),
+                    key=itemgetter(1, 0),
+                )
+            )
+
+    def get(self, id: int) -> Row | None:
+        """Вернет запись по id с учетом незаписанных изменений."""
+        with self._lock:
+            if id in self._overlay:
+                return self._overlay[id]
+            return super().get(id)
+
+    def get_many(self, ids: list[int]) -> list[Row]:
+        """Вернет записи по списку id с учетом незаписанных изменений."""
+        with self._lock:
+            overlay = self._overlay
+            rows = super().get_many([id for id in ids if id not in overlay])
+            rows.extend(
+                overlay[id]
+                for id in dict.fromkeys(ids)
+                if overlay.get(id) is not None
+            )
+            return rows
+
+    def iter_all(self, size: int = 1000) -> Iterator[list[Row]]:
+        """Сбросит очередь и вернет все записи порциями."""
+        self.flush()
+        return super().iter_all(size)
+
+    def get_page(
+        self, after: tuple[str, int] | None = None, size: int = 1000
+    ) -> list[Row]:
+        """Сбросит очередь и вернет страницу записей."""
+        self.flush()
+        return super().get_page(after, size)
+
+    def search(self, text: str) -> list[Row]:
+        """Сбросит очередь и вернет записи, где встречается текст."""
+        self.flush()
+        return super().search(text)
+
+    def get_version(self) -> int:
+        """Сбросит очередь и вернет версию каталога."""
+        self.flush()
+        return super().get_version()
+
+    def find_duplicate(self, name: str) -> Row | None:
+        """Сбросит очередь и вернет запись с тем же названием."""
+        self.flush()
+        return super().find_duplicate(name)
+
+    def find_similar(
+        self, name: str, threshold: float = 0.3, limit: int = 5
+    ) -> list[tuple[int, str, str, str, str, float]]:
+        """Сбросит очередь и вернет записи с похожими названиями."""
+        self.flush()
+        return super().find_similar(name, threshold, limit)
+
+    def get_duplicate_groups(self) -> list[list[int]]:
+        """Сбросит очередь и вернет группы записей-дубликатов."""
+        self.flush()
+        return super().get_duplicate_groups()
+
+    def merge(self, groups: list[tuple[int, list[int]]]) -> None:
+        """Сбросит очередь и объединит записи одной транзакцией."""
+        with self._lock:
+            self.flush()
+            super().merge(groups)
+
+    def create(
+        self,
+        name: str,
+        price: str,
+        dimension: str,
+        description: str = '',
+    ) -> None:
+        """Поставит в очередь создание записи."""
+        with self._lock:
+            if self._next_id is None:
+                with self.connector as cursor:
+                    max_id = cursor.execute(self.sql_max_id).fetchone()[0]
+                self._next_id = (max_id or 0) + 1
+            normalized = normalize_name(name)
+            self._check_name(normalized)
+            id = self._next_id
+            self._next_id += 1
+            self._rename(id, normalized)
+            self._overlay[id] = (id, name, description, dimension, price)
+            self._enqueue(
+                CREATE, (id, name, normalized, description, price, dimension)
+            )
+
+    def create_many(self, rows: Iterable[tuple[str, str, str, str]]) -> None:
+        """Поставит в очередь создание записей."""
+        with self._lock:
+            for name, price, dimension, description in rows:
+                self.create(name, price, dimension, description)
+
+    def update(
+        self,
+        id: int,
+        name: str,
+        price: str,
+        dimension: str,
+        description: str,
+    ) -> bool:
+        """
+        Поставит в очередь изменение записи. Вернет False, если записи с
+        таким id нет.
+        """
+        with self._lock:
+            normalized = normalize_name(name)
+            exists = self.get(id) is not None
+            if exists:
+                self._check_name(normalized, id)
+                self._rename(id, normalized)
+                self._overlay[id] = (id, name, description, dimension, price)
+            self._enqueue(
+                UPDATE, (name, normalized, description, price, dimension, id)
+            )
+            return exists
+
+    def delete(self, id: int) -> bool:
+        """
+        Поставит в очередь удаление записи. Вернет False, если записи с
+        таким id нет.
+        """
+        with self._lock:
+            exists = self.get(id) is not None
+            self._rename(id, None)
+            self._overlay[id] = None
+            self._enqueue(DELETE, (id,))
+            return exists
+
+    def delete_many(self, ids: list[int]) -> None:
+        """Поставит в очередь удаление записей по списку id."""
+        with self._lock:
+            for id in ids:
+                self._rename(id, None)
+            self._overlay.update(dict.fromkeys(ids))
+            self._enqueue(DELETE_MANY, (list(ids),))
+
+    def update_many(self, changes: list[tuple[int, str, str]]) -> None:
+        """Поставит в очередь изменение цены и размерности у записей."""
+        with self._lock:
+            rows = {
+                row[0]: row
+                for row in self.get_many([id for id, _, _ in changes])
+            }
+            for id, price, dimension in changes:
+                if id in rows:
+                    id, name, description, _, _ = rows[id]
+                    rows[id] = (id, name, description, dimension, price)
+                    self._overlay[id] = rows[id]
+            self._enqueue(UPDATE_MANY, (list(changes),))
+
+    def _check_name(self, normalized: str, id: int | None = None) -> None:
+        """
+        Проверит, что нормализованное название не занято другой записью
+        ни в очереди, ни в базе.
+        """
+        owner = self._names.get(normalized)
+        if owner is None:
+            row = super().find_duplicate(normalized)
+            if row is not None and row[0] not in self._overlay:
+                owner = row[0]
+        if owner is not None and owner != id:
+            raise IntegrityError(
+                'UNIQUE constraint failed: '
+                f'{self.name_table}.{self.field_name_normalized}'
+            )
+
+    def _rename(self, id: int, normalized: str | None) -> None:
+        """Запомнит новое нормализованное название записи в наложении."""
+        row = self._overlay.get(id)
+        if row is not None:
+            old = normalize_name(row[1])
+            if self._names.get(old) == id:
+                del self._names[old]
+        if normalized is not None:
+            self._names[normalized] = id
+
+    def _enqueue(self, kind: str, params: tuple) -> None:
+        """Добавит изменение в очередь и сбросит её, если она заполнена."""
+        self._operations.append((kind, params))
+        profiler.count('db.write_behind.queued')
+        if len(self._operations) >= self.size:
+            self.flush()
+            return
+        if self._first_at is None:
+            self._first_at = monotonic()
+            if self.delay is not None:
+                self._start_flusher()
+                self._wakeup.notify()
+
+    def _start_flusher(self) -> None:
+        """Запустит поток, который сбрасывает очередь по времени."""
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name='db-write-behind', daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        """Сбрасывает очередь, когда первое изменение в ней устарело."""
+        with self._lock:
+            while not self._closed:
+                if self._first_at is None:
+                    self._wakeup.wait()
+                    continue
+                left = self._first_at + self.delay - monotonic()
+                if left > 0:
+                    self._wakeup.wait(left)
+                    continue
+                try:
+                    self.flush()
+                except Exception:
+                    # База занята или недоступна: очередь сохранена,
+                    # следующая попытка через delay.
+                    self._first_at = monotonic()
+
+
+def _renumbered(kind: str, params: tuple, ids: dict[int, int]) -> tuple:
+    """Вернет параметры изменения с новыми id записей из ids."""
+    if kind == CREATE:
+        id, *rest = params
+        return (ids[id], *rest)
+    if kind == UPDATE:
+        *rest, id = params
+        return (*rest, ids.get(id, id))
+    if kind == DELETE:
+        return (ids.get(params[0], params[0]),)
+    (batch,) = params
+    if kind == DELETE_MANY:
+        return ([ids.get(id, id) for id in batch],)
+    return ([(ids.get(id, id), *change) for id, *change in batch],)
+
+
+def _runs(
+    operations: list[tuple[str, tuple]],
+) -> Iterator[tuple[str, list[tuple]]]:
+    """Разобьет изменения на подряд идущие группы одного вида."""
+    kind = None
+    params: list[tuple] = []
+    for operation_kind, operation_params in operations:
+        if operation_kind != kind and params:
+            yield kind, params
+            params = []
+        kind = operation_kind
+        params.append(operation_params)
+    if params:
+        yield kind, params
@@ -1,51 +1,446 @@
-from decimal import ROUND_HALF_UP, Decimal
-from typing import TYPE_CHECKING
+from decimal import Decimal
+from fractions import Fraction
+from time import perf_counter
+from typing import TYPE_CHECKING, Iterable, Iterator
 
-from app.db.repository import repository
+from app.db import write_behind
+from app.db.journal import ADD, DELETE, UPDATE
+from app.db.repository import RepositoryDB
+from app.db.snapshot import CatalogSnapshot, write_snapshot
 from app.logic.dimension import DimensionConverter
+from app.logic.estimate_store import EstimateRows
+from app.logic.price_list import PriceListReconciler, read_price_list
+from app.logic.pricing import PricingEngine
 from app.models import RowViewOnDBTable
+from app.profiler import profiler
+from app.settings import CONSOLIDATE, WARM_UP_CHUNK
+
+# Размер блока при чтении файлов каталога для прогрева кэша ОС.
+WARM_UP_BLOCK = 1 << 20
 
 if TYPE_CHECKING:
-    from app.db.repository import RepositoryDB
+    from app.db.journal import EstimateJournal, Row
+    from app.db.repository import RepositoryUsage
+    from app.logic.alerts import Alert, AlertEngine
     from app.models import RowViewOnMainTable
 
 
 class LogicMainWindow:
-    """Логика работы главного окна."""
+    """
+    Логика работы главного окна.
+
+    Итог хранится и меняется вместе со строками, а не пересчитывается
+    по всей смете. Он хранится точно, целым числом долей копейки, и
+    округляется по правилу PricingEngine логики базы данных. Строки
+    лежат в EstimateRows: большая смета занимает ограниченный объем
+    памяти, а удаление из середины не сдвигает весь список. Если задан
+    журнал, каждое изменение дописывается в него, и после сбоя смета
+    восстанавливается методом restore.
+
+    В режиме объединения (consolidate) ингредиент, который уже есть в
+    смете, не добавляется новой строкой, а прибавляется к своей строке
+    с размерностью той же категории: количество переводится в ее
+    размерность. Строка ищется по индексу (id, категория) -> номер
+    строки, а не перебором сметы, по тому же ключу, что и в
+    consolidate_all.
+    """
+
+    def __init__(
+        self,
+        logic_for_db: 'LogicDBWindow | None' = None,
+        journal: 'EstimateJournal | None' = None,
+        consolidate: bool = CONSOLIDATE,
+    ):
+        """
+        Логика работы главного окна.
 
-    def __init__(self):
-        self.data = []
+        Параметры:
+            logic_for_db логика базы данных, из которой масштабирование
+                берет цены за единицу; без неё цена за единицу выводится
+                из стоимости и количества строки;
+            journal журнал автосохранения сметы;
+            consolidate объединять строки одного ингредиента при
+                добавлении.
+        """
+        self.data = EstimateRows()
+        self.logic_for_db = logic_for_db
+        self.journal = journal
+        self.consolidate = consolidate
+        self.dimension = (
+            logic_for_db.dimension
+            if logic_for_db is not None
+            else DimensionConverter
+        )
+        self.pricing = (
+            logic_for_db.pricing
+            if logic_for_db is not None
+            else PricingEngine()
+        )
+        self._total = 0
+        self._reset_dimension()
+        # (id ингредиента, категория размерности) -> номер первой такой
+        # строки. Добавление в конец дополняет индекс; удаление и замена
+        # другим ингредиентом или размерностью другой категории сдвигают
+        # номера, тогда индекс сбрасывается в None и строится заново
+        # при следующем объединении.
+        self._lines: dict[tuple[int, str], int] | None = {}
 
-    def get_all(self) -> list['RowViewOnMainTable']:
-        """Вернет список объектов-строк обрабатываемых в логике."""
+    def get_all(self) -> EstimateRows:
+        """Вернет хранилище объектов-строк обрабатываемых в логике."""
         return self.data
 
     def get(self, index: int) -> 'RowViewOnMainTable':
         """Вернет строку по индексу."""
         return self.data[index]
 
-    def add(self, item: 'RowViewOnMainTable') -> None:
-        """Добавит для обработки в логике объект-строку."""
+    @profiler.timed('LogicMainWindow.add')
+    def add(self, item: 'RowViewOnMainTable') -> int:
+        """
+        Добавит для обработки в логике объект-строку. В режиме объединения
+        прибавит ее к строке того же ингредиента, если количество можно
+        перевести в размерность той строки. Вернет номер строки.
+        """
+        if self.consolidate:
+            index = self._get_lines().get(self._key(item))
+            if index is not None:
+                merged = self._merge(self.data[index], [item])
+                if merged is not None:
+                    self.update(index, merged)
+                    return index
+        index = len(self.data)
         self.data.append(item)
+        self._total += self.pricing.units(item.price)
+        if self._lines is not None:
+            self._lines.setdefault(self._key(item), index)
+        self._log('add', _record(item))
+        return index
+
+    @profiler.timed('LogicMainWindow.consolidate_all')
+    def consolidate_all(self) -> int:
+        """
+        Объединит все строки одного ингредиента за один проход по смете:
+        каждая строка прибавляется к первой строке того же ингредиента
+        с размерностью той же категории. Вернет количество убранных строк.
+        """
+        groups: dict[tuple, list] = {}
+        for row in self.data:
+            groups.setdefault(self._key(row), []).append(row)
+        removed = len(self.data) - len(groups)
+        if not removed:
+            return 0
 
+        merged_ids = [rows[0].id for rows in groups.values() if len(rows) > 1]
+        catalog = {}
+        if self.logic_for_db is not None:
+            catalog = self.logic_for_db.get_many(merged_ids)
+        rows = []
+        for group in groups.values():
+            if len(group) == 1:
+                rows.append(group[0])
+            else:
+                rows.append(self._merge(group[0], group[1:], catalog))
+        self.data[:] = rows
+        self._total = sum(self.pricing.units(row.price) for row in rows)
+        self._lines = None
+        if self.journal is not None:
+            # Строк стало меньше: журнал переписывается целиком.
+            self.journal.compact(map(_record, rows))
+        return removed
+
+    @profiler.timed('LogicMainWindow.delete')
     def delete(self, index: int) -> None:
         """Удалит из обработки в логике объект-строку."""
+        self._total -= self.pricing.units(self.data[index].price)
         del self.data[index]
+        self._lines = None
+        self._log('delete', index, index)
+
+    @profiler.timed('LogicMainWindow.delete_range')
+    def delete_range(self, first: int, last: int) -> None:
+        """Удалит из обработки объекты-строки с first по last включительно."""
+        self._total -= sum(
+            self.pricing.units(row.price)
+            for row in self.data[first : last + 1]
+        )
+        del self.data[first : last + 1]
+        self._lines = None
+        self._log('delete', first, last)
 
+    @profiler.timed('LogicMainWindow.update')
     def update(self, index: int, new: 'RowViewOnMainTable') -> None:
         """Заменит объект-строку в логике."""
+        old = self.data[index]
+        self._total += self.pricing.units(new.price) - self.pricing.units(
+            old.price
+        )
         self.data[index] = new
+        if self._lines is not None and self._key(old) != self._key(new):
+            self._lines = None
+        self._log('update', index, _record(new))
 
+    @profiler.timed('LogicMainWindow.clear')
     def clear(self) -> None:
         """Очистит логику от объектов-строк."""
-        self.data = []
+        self.data.clear()
+        self._total = 0
+        self._lines = {}
+        if self.journal is not None:
+            self.journal.compact([])
 
+    @profiler.timed('LogicMainWindow.restore')
+    def restore(self) -> None:
+        """
+        Восстановит смету из журнала автосохранения: повторит записанные
+        изменения, не записывая их заново.
+        """
+        if self.journal is None:
+            return
+        self.data.clear()
+        row_view = self.data.row_view
+        for kind, args in self.journal.replay():
+            if kind == ADD:
+                self.data.append(row_view(*args[0]))
+            elif kind == UPDATE:
+                index, row = args
+                self.data[index] = row_view(*row)
+            elif kind == DELETE:
+                first, last = args
+                del self.data[first : last + 1]
+        self._total = sum(self.pricing.units(row.price) for row in self.data)
+        self._lines = None
+        if self.journal.should_compact(len(self.data)):
+            self.journal.compact(map(_record, self.data))
+
+    def set_logic_for_db(self, logic_for_db: 'LogicDBWindow') -> None:
+        """
+        Переключит смету на другой каталог. Строки сметы ссылаются на id
+        записей прежнего каталога, поэтому смета очищается.
+        """
+        self.clear()
+        self.logic_for_db = logic_for_db
+        self.dimension = logic_for_db.dimension
+        self.pricing = logic_for_db.pricing
+        self._reset_dimension()
+
+    @profiler.timed('LogicMainWindow.scale')
+    def scale(self, factor: float) -> list['RowViewOnMainTable']:
+        """
+        Умножит количество во всех строках на factor и пересчитает их
+        стоимость. Вернет новые объекты-строки.
+        """
+        factor = Decimal(str(factor))
+        return self._rescale(
+            [
+                (float(Decimal(str(row.quantity)) * factor), row.dimension)
+                for row in self.data
+            ]
+        )
+
+    @profiler.timed('LogicMainWindow.convert_units')
+    def convert_units(self, units: list[str]) -> list['RowViewOnMainTable']:
+        """
+        Переведет количество в строках в единицы из units той же категории
+        (например, г в кг). Строки, для категории которых единицы нет,
+        не меняются. Вернет новые объекты-строки.
+        """
+        targets: dict[str, tuple[str, Decimal]] = {}
+        changes = []
+        for row in self.data:
+            if row.dimension not in targets:
+                same = self.dimension.get_dimensions_same_category(
+                    row.dimension
+                )
+                unit = next(
+                    (unit for unit in units if unit in (same or ())),
+                    row.dimension,
+                )
+                targets[row.dimension] = (
+                    unit,
+                    self.dimension.get_ratio(row.dimension, unit),
+                )
+            unit, ratio = targets[row.dimension]
+            changes.append((float(Decimal(str(row.quantity)) * ratio), unit))
+        return self._rescale(changes)
+
+    def _rescale(
+        self, changes: list[tuple[float, str]]
+    ) -> list['RowViewOnMainTable']:
+        """
+        Заменит количество и размерность строк одним проходом: цены за
+        единицу всех ингредиентов читаются одним запросом, коэффициенты
+        перевода считаются один раз на пару размерностей.
+
+        Параметры:
+            changes список вида (новое количество, новая размерность),
+                по строке на каждую строку сметы.
+        """
+        catalog = {}
+        if self.logic_for_db is not None:
+            catalog = self.logic_for_db.get_many(
+                list({row.id for row in self.data})
+            )
+
+        pricing = self.pricing
+        rows = []
+        total = 0
+        for row, (quantity, dimension) in zip(self.data, changes):
+            unit_price, unit = self._unit_price(row, catalog)
+            price = self._line(unit_price, unit, quantity, dimension)
+            total += price
+            rows.append(
+                row.__class__(
+                    id=row.id,
+                    name=row.name,
+                    quantity=quantity,
+                    dimension=dimension,
+                    price=pricing.price(price),
+                )
+            )
+        # Строки заменяются на месте: их же показывает модель таблицы.
+        self.data[:] = rows
+        self._total = total
+        if self.journal is not None:
+            # Изменились все строки: журнал переписывается целиком.
+            self.journal.compact(map(_record, rows))
+        return rows
+
+    def _merge(
+        self,
+        row: 'RowViewOnMainTable',
+        others: list['RowViewOnMainTable'],
+        catalog: dict[int, RowViewOnDBTable] | None = None,
+    ) -> 'RowViewOnMainTable | None':
+        """
+        Вернет строку row, к количеству которой прибавлены количества строк
+        others, переведенные в размерность row, со стоимостью, посчитанной
+        заново по цене за единицу. Вернет None, если размерности разных
+        категорий.
+
+        Параметры:
+            row строка, к которой прибавляются остальные;
+            others строки того же ингредиента;
+            catalog записи каталога по id, None - прочитать запись row.
+        """
+        categories = self._categories
+        category = categories.get(row.dimension, row.dimension)
+        quantity = Decimal(str(row.quantity))
+        for other in others:
+            if categories.get(other.dimension, other.dimension) != category:
+                return None
+            quantity += Decimal(str(other.quantity)) * self._ratio(
+                other.dimension, row.dimension
+            )
+        if catalog is None:
+            # Одна запись: чтение по ключу дешевле get_many.
+            item = (
+                self.logic_for_db.get(row.id)
+                if self.logic_for_db is not None
+                else None
+            )
+            catalog = {} if item is None else {row.id: item}
+        unit_price, unit = self._unit_price(row, catalog)
+        quantity = float(quantity)
+        price = self._line(unit_price, unit, quantity, row.dimension)
+        return row.__class__(
+            id=row.id,
+            name=row.name,
+            quantity=quantity,
+            dimension=row.dimension,
+            price=self.pricing.price(price),
+        )
+
+    def _unit_price(
+        self,
+        row: 'RowViewOnMainTable',
+        catalog: dict[int, RowViewOnDBTable],
+    ) -> tuple[str | Fraction | int, str]:
+        """
+        Вернет цену за единицу ингредиента строки и эту единицу: из
+        каталога или, если ингредиента уже нет в базе, из стоимости и
+        количества самой строки.
+        """
+        if row.id in catalog:
+            item = catalog[row.id]
+            return item.price, item.dimension
+        if row.quantity:
+            pricing = self.pricing
+            return (
+                pricing.exact(row.price) / pricing.exact(row.quantity),
+                row.dimension,
+            )
+        return 0, row.dimension
+
+    def _line(
+        self,
+        unit_price: str | Fraction | int,
+        unit: str,
+        quantity: float,
+        dimension: str,
+    ) -> int:
+        """
+        Вернет стоимость строки в долях копейки тем же расчетом, что и
+        LogicDBWindow.calculation.
+        """
+        key = (dimension, unit)
+        ratio = self._exact_ratios.get(key)
+        if ratio is None:
+            ratio = self._exact_ratios[key] = self.pricing.exact(
+                self._ratio(dimension, unit)
+            )
+        return self.pricing.line(unit_price, quantity, ratio)
+
+    def _ratio(self, dimension: str, unit: str) -> Decimal:
+        """Вернет коэффициент перевода dimension в unit, запомнив его."""
+        key = (dimension, unit)
+        ratio = self._ratios.get(key)
+        if ratio is None:
+            ratio = self._ratios[key] = self.dimension.get_ratio(*key)
+        return ratio
+
+    def _reset_dimension(self) -> None:
+        """
+        Сбросит запомненные категории и коэффициенты перевода размерностей
+        после смены конвертера или правил расчета.
+        """
+        self._categories = self.dimension.get_categories()
+        self._ratios: dict[tuple[str, str], Decimal] = {}
+        self._exact_ratios: dict[tuple[str, str], Fraction] = {}
+
+    def _get_lines(self) -> dict[tuple[int, str], int]:
+        """
+        Вернет индекс (id, категория) -> номер первой строки, построив
+        его заново.
+        """
+        if self._lines is None:
+            lines: dict[tuple[int, str], int] = {}
+            for index, row in enumerate(self.data):
+                lines.setdefault(self._key(row), index)
+            self._lines = lines
+        return self._lines
+
+    def _key(self, row: 'RowViewOnMainTable') -> tuple[int, str]:
+        """
+        Вернет ключ объединения строки: id ингредиента и категория
+        размерности.
+        """
+        return row.id, self._categories.get(row.dimension, row.dimension)
+
+    def _log(self, method: str, *args) -> None:
+        """
+        Запишет изменение в журнал автосохранения и уплотнит журнал, если
+        записей в нем стало заметно больше, чем строк в смете.
+        """
+        journal = self.journal
+        if journal is None:
+            return
+        getattr(journal, method)(*args)
+        if journal.should_compact(len(self.data)):
+            journal.compact(map(_record, self.data))
+
+    @profiler.timed('LogicMainWindow.calculation')
     def calculation(self) -> str:
         """Вернет строку для поля "Итого"."""
-        sum_data = round(sum(self.data), 2)
-        rubles = int(sum_data // 1)
-        kopecks = int(sum_data * 100 % 100)
-        return f'Итого: {rubles} руб. {kopecks} коп.'
+        return self.pricing.format_total(self._total)
 
 
 class LogicDBWindow:
@@ -56,19 +451,118 @@ class LogicDBWindow:
         repository: 'RepositoryDB',
         dimension: type[DimensionConverter],
         row_view: type[RowViewOnDBTable],
+        snapshot_path: str | None = None,
+        usage: 'RepositoryUsage | None' = None,
+        pricing: PricingEngine | None = None,
+        alerts: 'AlertEngine | None' = None,
     ) -> None:
         self.repository = repository
         self.dimension = dimension
         self.row_view = row_view
+        self.snapshot_path = snapshot_path
+        self.usage = usage
+        self.pricing = pricing or PricingEngine()
+        self.alerts = alerts
+        self._snapshot: CatalogSnapshot | None = None
+        # Коэффициенты перевода по парам размерностей.
+        self._ratios: dict[tuple[str, str], Fraction] = {}
+        self._categories = dimension.get_categories()
+        # Объекты-строки каталога и версия, с которой они прочитаны.
+        self._rows: tuple[int, list[RowViewOnDBTable]] | None = None
 
+    @profiler.timed('LogicDBWindow.get_all')
     def get_all(self) -> list[RowViewOnDBTable]:
-        """Вернет список объектов-строк."""
+        """
+        Вернет список объектов-строк. Строки запоминаются до изменения
+        версии каталога; пока изменения ждут в очереди отложенной записи,
+        строки читаются заново, чтобы не сбрасывать очередь ради версии.
+        """
+        if self.repository.pending:
+            return self._build(self.repository.get_all())
+        # Версия читается до строк: если каталог изменится между
+        # запросами, строки запомнятся со старой версией и будут
+        # прочитаны заново при следующем вызове.
+        version = self.repository.get_version()
+        if self._rows is not None and self._rows[0] == version:
+            profiler.count('LogicDBWindow.get_all.cached')
+        else:
+            self._rows = (version, self._build(self.repository.get_all()))
+        # Модель окна удаляет и заменяет строки в переданном списке.
+        return list(self._rows[1])
+
+    def clear_cache(self) -> None:
+        """Забудет запомненные строки каталога, освободив память."""
+        self._rows = None
+
+    def warm_up(self, size: int = WARM_UP_CHUNK) -> Iterator[str]:
+        """
+        Прогреет каталог короткими шагами, чтобы первое открытие окна
+        базы данных и окна выбора было таким же быстрым, как следующие.
+        Каждый шаг вернет название этапа: чтение файлов БД и снимка в
+        кэш ОС, подготовка инструкций окна выбора и построение строк
+        для get_all страницами по size записей.
+
+        Между шагами транзакция не открыта, поэтому прогрев можно
+        бросить в любой момент (close()). Построенные строки запоминаются,
+        только если каталог за это время не изменился. Долгим может быть
+        только шаг снимка: если он старше базы, он записывается заново.
+        """
+        busy = 0.0
+        start = perf_counter()
+        for stage in self._warm_up_steps(size):
+            elapsed = perf_counter() - start
+            profiler.record('LogicDBWindow.warm_up.step', elapsed)
+            busy += elapsed
+            yield stage
+            start = perf_counter()
+        profiler.record('LogicDBWindow.warm_up', busy)
+
+    def _warm_up_steps(self, size: int) -> Iterator[str]:
+        """Шаги прогрева для warm_up."""
+        yield from _read_file(self.repository.connector.name_db, 'db')
+        self.get_favorites()
+        yield 'favorites'
+        if self.get_snapshot() is not None:
+            yield from _read_file(self.snapshot_path, 'snapshot')
+        if self.alerts is not None:
+            self.alerts.load()
+            yield 'alerts'
+        yield from self._warm_up_rows(size)
+
+    def _warm_up_rows(self, size: int) -> Iterator[str]:
+        """Построит строки для get_all страницами по size записей."""
+        repository = self.repository
+        if repository.pending:
+            return
+        version = repository.get_version()
+        rows: list[RowViewOnDBTable] = []
+        after = None
+        while True:
+            # Строки уже построены, например вызовом get_all, или
+            # каталог меняется: прогревать нечего.
+            if self._rows is not None and self._rows[0] >= version:
+                return
+            if repository.pending:
+                return
+            page = repository.get_page(after, size)
+            if not page:
+                break
+            rows.extend(self._build(page))
+            after = page[-1][1], page[-1][0]
+            yield 'rows'
+        if not repository.pending and repository.get_version() == version:
+            self._rows = (version, rows)
+
+    def _build(
+        self, items: list[tuple[int, str, str, str, str]]
+    ) -> list[RowViewOnDBTable]:
+        """Вернет объекты-строки для записей каталога."""
         return [
             self.row_view(id, name, description, dimension, price)
-            for id, name, description, dimension, price
-            in self.repository.get_all()
+            for id, name, description, dimension, price in items
         ]
 
+    @profiler.timed('LogicDBWindow.get')
     def get(self, id: int) -> RowViewOnDBTable | None:
         """Вернет строку по переданному id."""
         item = self.repository.get(id)
@@ -76,6 +570,36 @@ class LogicDBWindow:
             return None
         return self.row_view(*item)
 
+    @profiler.timed('LogicDBWindow.get_many')
+    def get_many(self, ids: list[int]) -> dict[int, RowViewOnDBTable]:
+        """Вернет строки по списку id одним запросом, в виде словаря по id."""
+        return {
+            item[0]: self.row_view(*item)
+            for item in self.repository.get_many(ids)
+        }
+
+    @profiler.timed('LogicDBWindow.search')
+    def search(self, text: str) -> list[RowViewOnDBTable]:
+        """Вернет строки, в названии которых встречается текст."""
+        return [self.row_view(*item) for item in self.repository.search(text)]
+
+    @profiler.timed('LogicDBWindow.find_duplicate')
+    def find_duplicate(self, name: str) -> RowViewOnDBTable | None:
+        """Вернет строку с тем же названием без учета регистра и пробелов."""
+        item = self.repository.find_duplicate(name)
+        if item is None:
+            return None
+        return self.row_view(*item)
+
+    @profiler.timed('LogicDBWindow.find_similar')
+    def find_similar(self, name: str) -> list[RowViewOnDBTable]:
+        """Вернет строки с похожими названиями, самые похожие первыми."""
+        return [
+            self.row_view(*item[:5])
+            for item in self.repository.find_similar(name)
+        ]
+
+    @profiler.timed('LogicDBWindow.add')
     def add(
         self,
         name: str,
@@ -85,7 +609,7 @@ class LogicDBWindow:
         description: str,
     ) -> None:
         """Подсчитает цену за размерность и добавит запись в базу данных."""
-        quoted_price = self._calculation(price, quantity)
+        quoted_price = self.unit_price(price, quantity)
 
         self.repository.create(
             name=name,
@@ -93,11 +617,76 @@ class LogicDBWindow:
             dimension=dimension,
             description=description,
         )
+        self.changed()
+
+    @profiler.timed('LogicDBWindow.delete')
+    def delete(self, id: int) -> bool:
+        """
+        Удалит запись из базы данных. Вернет False, если записи с таким id
+        нет.
+        """
+        if not self.repository.delete(id):
+            return False
+        self.changed([id])
+        return True
+
+    @profiler.timed('LogicDBWindow.delete_many')
+    def delete_many(self, ids: list[int]) -> None:
+        """Удалит несколько записей из базы данных за одну транзакцию."""
+        self.repository.delete_many(ids)
+        self.changed(ids)
+
+    @profiler.timed('LogicDBWindow.merge')
+    def merge(self, groups: list[tuple[int, list[int]]]) -> None:
+        """
+        Объединит записи-дубликаты за одну транзакцию, сложив частоту их
+        выбора.
+
+        Параметры:
+            groups список вида (id оставшейся записи, id удаляемых).
+        """
+        self.repository.flush()
+        with self.repository.connector:
+            if self.usage is not None:
+                self.usage.merge(groups)
+            self.repository.merge(groups)
+        if self.alerts is not None:
+            self.alerts.merged(groups)
+        self.changed()
+
+    def take_rejected(self) -> list[str]:
+        """
+        Запишет отложенные изменения и вернет описания тех, которым база
+        отказала, например из-за названия, уже внесенного другим.
+        """
+        self.repository.flush()
+        messages = []
+        for kind, params, error in self.repository.take_rejected():
+            if kind == write_behind.CREATE:
+                messages.append(f'{params[1]}: {error}')
+            elif kind == write_behind.UPDATE:
+                messages.append(f'{params[0]}: {error}')
+            else:
+                messages.append(f'{kind}: {error}')
+        return messages
 
-    def delete(self, id: int) -> None:
-        """Удалит запись из базы данных."""
-        self.repository.delete(id)
+    @profiler.timed('LogicDBWindow.register_usage')
+    def register_usage(self, id: int) -> None:
+        """Учтет выбор ингредиента для окна выбора."""
+        if self.usage is not None:
+            self.usage.register(id)
 
+    @profiler.timed('LogicDBWindow.get_favorites')
+    def get_favorites(self) -> list[RowViewOnDBTable]:
+        """
+        Вернет недавно и часто выбираемые ингредиенты, самые частые
+        первыми. Каталог целиком при этом не читается.
+        """
+        if self.usage is None:
+            return []
+        return [self.row_view(*item) for item in self.usage.get_favorites()]
+
+    @profiler.timed('LogicDBWindow.update')
     def update(
         self,
         id_item: int,
@@ -106,26 +695,217 @@ class LogicDBWindow:
         price: float,
         dimension: str,
         description: str,
-    ) -> None:
-        """Изменит запись из базы данных."""
-        quoted_price = self._calculation(price, quantity)
+    ) -> bool:
+        """
+        Изменит запись из базы данных. Вернет False, если записи с таким id
+        нет.
+        """
+        quoted_price = self.unit_price(price, quantity)
 
-        self.repository.update(
+        if not self.repository.update(
             id_item,
             name=name,
             price=quoted_price,
             dimension=dimension,
             description=description,
+        ):
+            return False
+        self.changed([id_item])
+        return True
+
+    @profiler.timed('LogicDBWindow.reprice')
+    def reprice(
+        self, rows: list[RowViewOnDBTable], percent: float
+    ) -> list[RowViewOnDBTable]:
+        """
+        Изменит цену у нескольких записей на процент за одну транзакцию.
+        Вернет измененные объекты-строки.
+        """
+        return self._update_many(self.repriced(rows, percent))
+
+    @profiler.timed('LogicDBWindow.change_dimension')
+    def change_dimension(
+        self, rows: list[RowViewOnDBTable], dimension: str
+    ) -> list[RowViewOnDBTable]:
+        """
+        Сменит размерность у нескольких записей за одну транзакцию.
+        Цена пересчитывается на новую единицу. Вернет измененные
+        объекты-строки; ValueError, если новая размерность из другой
+        категории, чем у какой-либо из записей.
+        """
+        return self._update_many(self.redimensioned(rows, dimension))
+
+    def repriced(
+        self, rows: list[RowViewOnDBTable], percent: float
+    ) -> list[RowViewOnDBTable]:
+        """Вернет объекты-строки с ценой, измененной на процент."""
+        factor = 1 + Decimal(str(percent)) / 100
+        return [
+            self.row_view(
+                row.id,
+                row.name,
+                row.description,
+                row.dimension,
+                self._round(Decimal(row.price) * factor),
+            )
+            for row in rows
+        ]
+
+    def redimensioned(
+        self, rows: list[RowViewOnDBTable], dimension: str
+    ) -> list[RowViewOnDBTable]:
+        """Вернет объекты-строки с новой размерностью и пересчитанной ценой."""
+        for row in rows:
+            self.check_dimension(row, dimension)
+        return [
+            self.row_view(
+                row.id,
+                row.name,
+                row.description,
+                dimension,
+                self._round(
+                    Decimal(row.price)
+                    * self.dimension.get_ratio(dimension, row.dimension)
+                ),
+            )
+            for row in rows
+        ]
+
+    def _update_many(
+        self, rows: list[RowViewOnDBTable]
+    ) -> list[RowViewOnDBTable]:
+        """Сохранит новые цены и размерности объектов-строк."""
+        self.repository.update_many(
+            [(row.id, row.price, row.dimension) for row in rows]
         )
+        self.changed([row.id for row in rows])
+        return rows
 
-    def _calculation(self, price: float, quantity: int) -> str:
-        """Вычислит стоимость одной единицы."""
-        result_price = Decimal(price) / Decimal(quantity)
-        rounded_result = result_price.quantize(
-            Decimal('0.01'), rounding=ROUND_HALF_UP
+    @profiler.timed('LogicDBWindow.reconcile_price_list')
+    def reconcile_price_list(self, path: str) -> PriceListReconciler:
+        """
+        Сверит каталог с прайс-листом из CSV. Вернет сверку для просмотра
+        изменений; её нужно закрыть после применения или отказа.
+        """
+        # Сверка пишет в базу напрямую, мимо очереди отложенной записи.
+        self.repository.flush()
+        reconciler = PriceListReconciler(
+            RepositoryDB(self.repository.connector), self.dimension
         )
-        return str(rounded_result)
+        try:
+            reconciler.load(read_price_list(path))
+            reconciler.diff()
+        except Exception:
+            reconciler.close()
+            raise
+        return reconciler
+
+    def apply_price_list(
+        self, reconciler: PriceListReconciler
+    ) -> dict[str, int]:
+        """Применит принятые изменения сверки одной транзакцией."""
+        self.repository.flush()
+        ids = reconciler.changed_ids()
+        applied = reconciler.apply()
+        self.changed(ids)
+        return applied
 
+    @profiler.timed('LogicDBWindow.watch_prices')
+    def watch_prices(self, ids: list[int], percent: float) -> None:
+        """
+        Начнет следить за ценой записей: оповещение появится, когда цена
+        отойдет от текущей больше чем на percent процентов.
+        """
+        if self.alerts is not None:
+            for id in ids:
+                self.alerts.add_price_rule(id, percent)
+
+    def take_alerts(self) -> list['Alert']:
+        """Вернет оповещения, которые сработали с прошлого вызова."""
+        if self.alerts is None:
+            return []
+        return self.alerts.take_fired()
+
+    def get_snapshot(self) -> CatalogSnapshot | None:
+        """
+        Вернет открытый снимок каталога той же версии, что и база данных,
+        при необходимости записав его заново.
+        """
+        if self.snapshot_path is None:
+            return None
+
+        version = self.repository.get_version()
+        if self._snapshot is not None and self._snapshot.version == version:
+            return self._snapshot
+
+        self._close_snapshot()
+        try:
+            snapshot = CatalogSnapshot(self.snapshot_path, self.row_view)
+        except (OSError, ValueError):
+            snapshot = None
+        if snapshot is not None and snapshot.version != version:
+            snapshot.close()
+            snapshot = None
+        if snapshot is None:
+            self.write_snapshot()
+            snapshot = CatalogSnapshot(self.snapshot_path, self.row_view)
+        self._snapshot = snapshot
+        return snapshot
+
+    @profiler.timed('LogicDBWindow.write_snapshot')
+    def write_snapshot(self) -> None:
+        """Запишет снимок каталога."""
+        if self.snapshot_path is None:
+            return
+        self._close_snapshot()
+        # Версия читается до строк: если каталог изменится между запросами,
+        # снимок окажется старше базы и будет переписан при открытии.
+        version = self.repository.get_version()
+        write_snapshot(self.snapshot_path, version, self.repository.get_all())
+
+    def close(self) -> None:
+        """Закроет снимок каталога, например при закрытии каталога."""
+        self._close_snapshot()
+        self.clear_cache()
+
+    def _close_snapshot(self) -> None:
+        """Закроет открытый снимок, чтобы его можно было заменить."""
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+    def changed(self, ids: Iterable[int] = ()) -> None:
+        """
+        Действия после изменения каталога: проверка правил оповещений,
+        которые зависят от измененных записей ids. Снимок здесь не
+        пишется: get_snapshot перепишет его по версии один раз, когда он
+        понадобится, а не после каждой записи.
+        """
+        if self.alerts is not None:
+            self.alerts.changed(ids)
+            self.alerts.synced()
+
+    def _round(self, price: Decimal) -> str:
+        """Округлит цену до копеек."""
+        return self.pricing.round_price(price)
+
+    def unit_price(self, price: float, quantity: int) -> str:
+        """Вычислит стоимость одной единицы."""
+        return self.pricing.unit_price(price, quantity)
+
+    def check_dimension(self, row: RowViewOnDBTable, dimension: str) -> None:
+        """
+        Проверит, что размерность dimension известна и той же категории,
+        что размерность записи row, иначе бросит ValueError.
+        """
+        category = self._categories.get(dimension)
+        if category is None or category != self._categories.get(row.dimension):
+            raise ValueError(
+                f'Размерность {row.dimension} записи {row.name} '
+                f'нельзя перевести в {dimension}'
+            )
+
+    @profiler.timed('LogicDBWindow.calculation')
     def calculation(
         self,
         price: int | float | str,
@@ -137,14 +917,52 @@ class LogicDBWindow:
         Вернет стоимость, исходя из цены за единицу измерения (например, м),
         количеств в единцах измерения (например, см).
         """
-        ratio = self.dimension.get_ratio(current_dimension, db_dimension)
-        result_price = Decimal(Decimal(price)) * Decimal(quantity) * ratio
-        rounded_result = result_price.quantize(
-            Decimal('0.01'), rounding=ROUND_HALF_UP
+        return self.pricing.price(
+            self.line(price, quantity, current_dimension, db_dimension)
         )
-        return float(rounded_result)
+
+    def line(
+        self,
+        price: int | float | str,
+        quantity: int | float | str,
+        current_dimension: str,
+        db_dimension: str,
+    ) -> int:
+        """
+        Вернет стоимость строки в долях копейки, как calculation. Итог
+        из таких стоимостей считается через pricing.total, как в смете.
+        """
+        key = (current_dimension, db_dimension)
+        ratio = self._ratios.get(key)
+        if ratio is None:
+            ratio = self._ratios[key] = self.pricing.exact(
+                self.dimension.get_ratio(*key)
+            )
+        return self.pricing.line(price, quantity, ratio)
+
+
+def _read_file(path: str | None, stage: str) -> Iterator[str]:
+    """
+    Прочитает файл блоками, чтобы он оказался в кэше ОС. Каждый блок -
+    шаг прогрева с названием stage. Файла может не быть.
+    """
+    if path is None:
+        return
+    try:
+        file = open(path, 'rb')
+    except OSError:
+        return
+    with file:
+        while file.read(WARM_UP_BLOCK):
+            yield stage
 
 
-logic_db_window = LogicDBWindow(
-    repository, DimensionConverter, RowViewOnDBTable
-)
+def _record(row: 'RowViewOnMainTable') -> 'Row':
+    """Вернет строку сметы в виде записи журнала."""
+    return (
+        row.id,
+        row.name,
+        float(row.quantity),
+        row.dimension,
+        float(row.price),
+    )
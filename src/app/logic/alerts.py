@@ -0,0 +1,488 @@
+from fractions import Fraction
+from typing import Iterable
+
+from app.db.repository import RepositoryDB, RepositoryEstimate, RepositoryRules
+from app.logic.dimension import DimensionConverter
+from app.logic.pricing import PricingEngine
+from app.profiler import profiler
+
+# Виды правил.
+PRICE = 'price'
+BUDGET = 'budget'
+
+# Строка сметы в индексе: количество, размерность, сохраненная стоимость.
+Line = tuple[str, str, str]
+
+
+class Alert:
+    """Сработавшее правило: вид, id ингредиента или сметы и текст."""
+
+    def __init__(self, kind: str, id: int, text: str) -> None:
+        self.kind = kind
+        self.id = id
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}{self.kind, self.id, self.text}'
+
+
+class AlertEngine:
+    """
+    Правила оповещений: порог изменения цены ингредиента и бюджет
+    сохраненной сметы.
+
+    После изменения каталога правила не проверяются заново целиком.
+    Обратный индекс ведет от id ингредиента к его правилу цены и к
+    строкам смет с бюджетом, где он встречается. Итог такой сметы
+    хранится вместе с вкладом каждого ингредиента: новая цена меняет
+    итог на разность вкладов. Работа на одно изменение пропорциональна
+    числу зависящих от ингредиента правил и строк, а не размеру
+    каталога или числу смет.
+
+    Стоимость строки считается по текущей цене каталога так же, как при
+    пересчете смет; строка удаленного ингредиента стоит, сколько
+    сохранено в смете.
+
+    Об изменениях сообщает LogicDBWindow, в которую передан этот объект.
+    Записи мимо неё (API-сервер, другой процесс, LogicDBWindow без
+    alerts) до индекса не доходят: их замечает load по разошедшейся
+    версии каталога и строит индекс заново. Пока собственные изменения
+    ждут в очереди отложенной записи, версия не читается, и чужая
+    запись за это время будет принята за свою до следующего reset.
+    """
+
+    def __init__(
+        self,
+        rules: RepositoryRules,
+        catalog: RepositoryDB,
+        estimates: RepositoryEstimate,
+        dimension: type[DimensionConverter],
+        pricing: PricingEngine | None = None,
+    ) -> None:
+        """
+        Правила оповещений.
+
+        Параметры:
+            rules репозиторий правил;
+            catalog репозиторий каталога, из него берутся текущие цены;
+            estimates репозиторий сохраненных смет;
+            dimension конвертер размерностей;
+            pricing расчет стоимости строк смет.
+        """
+        self.rules = rules
+        self.catalog = catalog
+        self.estimates = estimates
+        self.dimension = dimension
+        self.pricing = pricing or PricingEngine()
+        self._categories = dimension.get_categories()
+        self._ratios: dict[tuple[str, str], Fraction] = {}
+        self._loaded = False
+        # Версия каталога, с которой согласован индекс; None, пока
+        # собственные изменения ждут в очереди отложенной записи.
+        self._version: int | None = None
+        # Сработавшие правила и еще не показанные из них.
+        self.firing: dict[tuple[str, int], Alert] = {}
+        self._fired: dict[tuple[str, int], Alert] = {}
+
+    def load(self) -> None:
+        """
+        Прочитает правила и строки смет с бюджетом, построит обратный
+        индекс и проверит все правила. Новые сработавшие правила вернет
+        take_fired. Повторный вызов строит индекс заново, только если
+        каталог изменили мимо этого объекта.
+        """
+        if not self._loaded:
+            self._load()
+            return
+        # Версия не читается, пока в очереди есть записи: get_version
+        # сбросил бы её раньше срока.
+        if self.catalog.pending:
+            return
+        version = self.catalog.get_version()
+        if self._version is None:
+            self._version = version
+        elif version != self._version:
+            profiler.count('alerts.drift')
+            self._load()
+
+    @profiler.timed('AlertEngine.load')
+    def _load(self) -> None:
+        """Построит индекс для load."""
+        pricing = self.pricing
+        self._version = self._get_version()
+        # id ингредиента -> (порог, он же точной дробью, исходная цена,
+        # исходная размерность).
+        price_rules = self.rules.get_price_rules()
+        self._price_rules: dict[int, tuple[str, Fraction, str, str]] = {
+            id: (percent, pricing.exact(percent), base_price, base_dimension)
+            for id, percent, base_price, base_dimension in price_rules
+        }
+        # id сметы -> (бюджет в копейках, название сметы).
+        self._budgets: dict[int, tuple[int, str]] = {
+            id: (pricing.total(pricing.units(budget)), name)
+            for id, budget, name in self.rules.get_budget_rules()
+        }
+        # id ингредиента -> id сметы -> строки сметы с ним.
+        self._lines: dict[int, dict[int, list[Line]]] = {}
+        # (id сметы, id ингредиента) -> вклад в итог сметы.
+        self._contributions: dict[tuple[int, int], int] = {}
+        self._totals = dict.fromkeys(self._budgets, 0)
+        self._index(self.rules.get_budget_lines())
+        self._loaded = True
+
+        previous = self.firing
+        unseen = set(self._fired)
+        self.firing = {}
+        rows = self._get_rows(self._price_rules)
+        for id in self._price_rules:
+            self._update(PRICE, id, self._check_price(id, rows.get(id)))
+        for id in self._budgets:
+            self._update(BUDGET, id, self._check_budget(id))
+        # Новыми считаются только правила, которые не срабатывали до
+        # перестройки индекса или о которых еще не сообщено.
+        for key in previous.keys() - unseen:
+            self._fired.pop(key, None)
+
+    def reset(self) -> None:
+        """
+        Забудет индекс: его построит заново следующий вызов, например
+        после восстановления каталога из копии.
+        """
+        self._loaded = False
+
+    def synced(self) -> None:
+        """
+        Примет текущую версию каталога за согласованную с индексом после
+        изменений, о которых сообщено через changed или merged.
+        """
+        if self._loaded:
+            self._version = self._get_version()
+
+    @profiler.timed('AlertEngine.changed')
+    def changed(self, ids: Iterable[int]) -> list[Alert]:
+        """
+        Проверит правила, которые зависят от измененных ингредиентов.
+        Вернет правила, которые сработали из-за этого изменения.
+
+        Параметры:
+            ids id созданных, измененных или удаленных ингредиентов.
+        """
+        if not self._loaded:
+            return []
+        ids = [
+            id
+            for id in dict.fromkeys(ids)
+            if id in self._price_rules or id in self._lines
+        ]
+        profiler.count('alerts.dependents', len(ids))
+        if not ids:
+            return []
+        fired = []
+        rows = self._get_rows(ids)
+        estimates = set()
+        for id in ids:
+            row = rows.get(id)
+            if id in self._price_rules:
+                if row is None:
+                    # Правило удалено вместе с ингредиентом.
+                    del self._price_rules[id]
+                alert = self._check_price(id, row)
+                fired.append(self._update(PRICE, id, alert))
+            for estimate_id, lines in self._lines.get(id, {}).items():
+                key = (estimate_id, id)
+                cost = self._cost(lines, row)
+                self._totals[estimate_id] += cost - self._contributions.get(
+                    key, 0
+                )
+                self._contributions[key] = cost
+                estimates.add(estimate_id)
+        for estimate_id in estimates:
+            fired.append(
+                self._update(
+                    BUDGET, estimate_id, self._check_budget(estimate_id)
+                )
+            )
+        return [alert for alert in fired if alert is not None]
+
+    def merged(self, groups: list[tuple[int, list[int]]]) -> list[Alert]:
+        """
+        Учтет объединение записей каталога: строки смет удаленных записей
+        перешли к оставшимся. Вернет сработавшие правила.
+
+        Параметры:
+            groups список вида (id оставшейся записи, id удаленных).
+        """
+        if not self._loaded:
+            return []
+        ids = []
+        for target_id, source_ids in groups:
+            for source_id in source_ids:
+                for estimate_id, lines in self._lines.pop(
+                    source_id, {}
+                ).items():
+                    target = self._lines.setdefault(target_id, {})
+                    target.setdefault(estimate_id, []).extend(lines)
+                    self._totals[estimate_id] -= self._contributions.pop(
+                        (estimate_id, source_id)
+                    )
+            ids.append(target_id)
+            ids.extend(source_ids)
+        return self.changed(ids)
+
+    def add_price_rule(self, ingredient_id: int, percent: float | str) -> None:
+        """
+        Начнет следить за ценой ингредиента: правило сработает, когда
+        цена отойдет от текущей больше чем на percent процентов.
+        """
+        self.load()
+        threshold = self.pricing.exact(percent)
+        if threshold <= 0:
+            raise ValueError('Порог должен быть больше нуля')
+        row = self.catalog.get(ingredient_id)
+        if row is None:
+            raise ValueError(f'Нет ингредиента с id {ingredient_id}')
+        _, _, _, dimension, price = row
+        percent = str(percent)
+        self.rules.save_price_rule(ingredient_id, percent, price, dimension)
+        self._price_rules[ingredient_id] = (
+            percent,
+            threshold,
+            price,
+            dimension,
+        )
+        self._update(PRICE, ingredient_id, None)
+
+    def acknowledge(self, ingredient_id: int) -> None:
+        """Примет новую цену ингредиента за исходную для его правила."""
+        self.load()
+        row = self.catalog.get(ingredient_id)
+        if ingredient_id not in self._price_rules or row is None:
+            return
+        percent, threshold, _, _ = self._price_rules[ingredient_id]
+        _, _, _, dimension, price = row
+        self.rules.save_price_rule(ingredient_id, percent, price, dimension)
+        self._price_rules[ingredient_id] = (
+            percent,
+            threshold,
+            price,
+            dimension,
+        )
+        self._update(PRICE, ingredient_id, None)
+
+    def delete_price_rule(self, ingredient_id: int) -> None:
+        """Перестанет следить за ценой ингредиента."""
+        self.load()
+        self.rules.delete_price_rule(ingredient_id)
+        self._price_rules.pop(ingredient_id, None)
+        self._update(PRICE, ingredient_id, None)
+
+    def add_budget_rule(self, estimate_id: int, budget: float | str) -> None:
+        """
+        Задаст бюджет сохраненной сметы: правило сработает, когда ее
+        стоимость по текущим ценам каталога превысит бюджет.
+        """
+        self.load()
+        pricing = self.pricing
+        kopecks = pricing.total(pricing.units(budget))
+        if kopecks <= 0:
+            raise ValueError('Бюджет должен быть больше нуля')
+        self.rules.save_budget_rule(estimate_id, pricing.round_price(budget))
+        names = {id: name for id, _, name in self.rules.get_budget_rules()}
+        if estimate_id not in names:
+            self.rules.delete_budget_rule(estimate_id)
+            raise ValueError(f'Нет сметы с id {estimate_id}')
+        if estimate_id not in self._budgets:
+            self._totals[estimate_id] = 0
+            self._index(self.rules.get_budget_lines(estimate_id))
+        self._budgets[estimate_id] = (kopecks, names[estimate_id])
+        self._update(BUDGET, estimate_id, self._check_budget(estimate_id))
+
+    def delete_budget_rule(self, estimate_id: int) -> None:
+        """Удалит бюджет сметы."""
+        self.load()
+        for _, ingredient_id, *_ in self.rules.get_budget_lines(estimate_id):
+            estimates = self._lines.get(ingredient_id)
+            if estimates is not None:
+                estimates.pop(estimate_id, None)
+                if not estimates:
+                    del self._lines[ingredient_id]
+            self._contributions.pop((estimate_id, ingredient_id), None)
+        self.rules.delete_budget_rule(estimate_id)
+        self._budgets.pop(estimate_id, None)
+        self._totals.pop(estimate_id, None)
+        self._update(BUDGET, estimate_id, None)
+
+    def get_alerts(self) -> list[Alert]:
+        """Вернет сработавшие правила: сначала бюджеты, потом цены."""
+        self.load()
+        return [self.firing[key] for key in sorted(self.firing)]
+
+    def take_fired(self) -> list[Alert]:
+        """Вернет правила, сработавшие с прошлого вызова."""
+        self.load()
+        fired = list(self._fired.values())
+        self._fired = {}
+        return fired
+
+    def get_rules(self) -> list[tuple[str, int, str]]:
+        """Вернет правила для просмотра: вид, id и текст."""
+        self.load()
+        money = self.pricing.format_money
+        rows = self._get_rows(self._price_rules)
+        rules = [
+            (
+                PRICE,
+                id,
+                f'{rows[id][1] if id in rows else id}: цена '
+                f'{base_price} за {base_dimension} ± {percent}%',
+            )
+            for id, (
+                percent,
+                _,
+                base_price,
+                base_dimension,
+            ) in self._price_rules.items()
+        ]
+        rules.extend(
+            (
+                BUDGET,
+                id,
+                f'Смета "{name}": бюджет {money(budget)}, '
+                f'сейчас {money(self.pricing.total(self._totals[id]))}',
+            )
+            for id, (budget, name) in self._budgets.items()
+        )
+        return rules
+
+    def get_estimates(self) -> list[tuple[int, str]]:
+        """Вернет сохраненные сметы для выбора: id и название."""
+        return [(id, name) for id, name, _ in self.estimates.get_all()]
+
+    def _index(self, lines: list[tuple[int, int, str, str, str]]) -> None:
+        """Добавит строки смет в обратный индекс и посчитает их вклад."""
+        added = set()
+        for estimate_id, ingredient_id, quantity, dimension, price in lines:
+            self._lines.setdefault(ingredient_id, {}).setdefault(
+                estimate_id, []
+            ).append((quantity, dimension, price))
+            added.add((estimate_id, ingredient_id))
+        rows = self._get_rows({id for _, id in added})
+        for key in added:
+            estimate_id, ingredient_id = key
+            lines = self._lines[ingredient_id][estimate_id]
+            cost = self._cost(lines, rows.get(ingredient_id))
+            self._totals[estimate_id] += cost - self._contributions.get(key, 0)
+            self._contributions[key] = cost
+
+    def _get_version(self) -> int | None:
+        """
+        Вернет версию каталога или None, если записи ждут в очереди
+        отложенной записи.
+        """
+        if self.catalog.pending:
+            return None
+        return self.catalog.get_version()
+
+    def _get_rows(
+        self, ids: Iterable[int]
+    ) -> dict[int, tuple[int, str, str, str, str]]:
+        """Вернет текущие записи каталога по id одним запросом."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        return {row[0]: row for row in self.catalog.get_many(ids)}
+
+    def _cost(
+        self,
+        lines: list[Line],
+        row: tuple[int, str, str, str, str] | None,
+    ) -> int:
+        """
+        Вернет стоимость строк сметы одного ингредиента в долях копейки
+        по его текущей записи или по сохраненной стоимости без нее.
+        """
+        pricing = self.pricing
+        if row is None:
+            return sum(pricing.units(price) for _, _, price in lines)
+        _, _, _, db_dimension, db_price = row
+        return sum(
+            pricing.line(
+                db_price, quantity, self._ratio(dimension, db_dimension)
+            )
+            for quantity, dimension, _ in lines
+        )
+
+    def _check_price(
+        self, id: int, row: tuple[int, str, str, str, str] | None
+    ) -> Alert | None:
+        """Вернет оповещение, если цена ингредиента вышла за порог."""
+        rule = self._price_rules.get(id)
+        if rule is None or row is None:
+            return None
+        _, threshold, base_price, base_dimension = rule
+        _, name, _, dimension, price = row
+        if self._categories.get(dimension) != self._categories.get(
+            base_dimension
+        ):
+            return Alert(
+                PRICE,
+                id,
+                f'{name}: размерность {base_dimension} сменилась '
+                f'на {dimension}',
+            )
+        base = self.pricing.exact(base_price)
+        current = self.pricing.exact(price) * self._ratio(
+            base_dimension, dimension
+        )
+        change = current - base
+        if abs(change) * 100 < threshold * base or not change:
+            return None
+        text = (
+            f'{name}: цена {base_price} → '
+            f'{self.pricing.round_price(current)} за {base_dimension}'
+        )
+        if base:
+            text += f' ({float(change / base * 100):+.1f}%)'
+        return Alert(PRICE, id, text)
+
+    def _check_budget(self, id: int) -> Alert | None:
+        """Вернет оповещение, если смета дороже бюджета."""
+        budget, name = self._budgets[id]
+        total = self.pricing.total(self._totals[id])
+        if total <= budget:
+            return None
+        money = self.pricing.format_money
+        return Alert(
+            BUDGET,
+            id,
+            f'Смета "{name}": {money(total)} при бюджете {money(budget)}',
+        )
+
+    def _update(self, kind: str, id: int, alert: Alert | None) -> Alert | None:
+        """
+        Запомнит, сработало ли правило. Вернет оповещение, если правило
+        сработало только сейчас.
+        """
+        key = (kind, id)
+        if alert is None:
+            self.firing.pop(key, None)
+            self._fired.pop(key, None)
+            return None
+        new = key not in self.firing
+        if new or key in self._fired:
+            self._fired[key] = alert
+        self.firing[key] = alert
+        return alert if new else None
+
+    def _ratio(self, dimension: str, db_dimension: str) -> Fraction:
+        """Вернет коэффициент перевода размерностей точной дробью."""
+        key = (dimension, db_dimension)
+        ratio = self._ratios.get(key)
+        if ratio is None:
+            ratio = self._ratios[key] = self.pricing.exact(
+                self.dimension.get_ratio(*key)
+            )
+        return ratio
@@ -0,0 +1,186 @@
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from app.db.async_repository import AsyncRepositoryDB
+    from app.logic.adapter import LogicDBWindow
+    from app.models import RowViewOnDBTable
+
+
+class AsyncLogicDBWindow:
+    """
+    Асинхронная логика работы с базой данных.
+
+    Повторяет методы LogicDBWindow, вычисления берет у неё же, а запросы
+    выполняет через AsyncRepositoryDB. После каждой записи вызывает
+    LogicDBWindow.changed, как и синхронные методы, чтобы проверить
+    правила оповещений; оповещения читают базу, поэтому это делается в
+    потоке-писателе репозитория, а не в цикле событий. Снимок каталога
+    после записи не пишется: get_snapshot перепишет его по версии.
+    """
+
+    def __init__(
+        self, logic: 'LogicDBWindow', repository: 'AsyncRepositoryDB'
+    ) -> None:
+        """
+        Асинхронная логика работы с базой данных.
+
+        Параметры:
+            logic синхронная логика, у которой берутся вычисления;
+            repository асинхронный репозиторий.
+        """
+        self.logic = logic
+        self.repository = repository
+        self.dimension = logic.dimension
+        self.row_view = logic.row_view
+
+    async def get_all(self) -> list['RowViewOnDBTable']:
+        """Вернет список объектов-строк."""
+        rows = await self.repository.get_all()
+        return [
+            self.row_view(id, name, description, dimension, price)
+            for id, name, description, dimension, price in rows
+        ]
+
+    async def get(self, id: int) -> 'RowViewOnDBTable | None':
+        """Вернет строку по переданному id."""
+        item = await self.repository.get(id)
+        if item is None:
+            return None
+        return self.row_view(*item)
+
+    async def get_many(self, ids: list[int]) -> dict[int, 'RowViewOnDBTable']:
+        """Вернет строки по списку id, в виде словаря по id."""
+        return {
+            item[0]: self.row_view(*item)
+            for item in await self.repository.get_many(ids)
+        }
+
+    async def search(self, text: str) -> list['RowViewOnDBTable']:
+        """Вернет строки, в названии которых встречается текст."""
+        return [
+            self.row_view(*item) for item in await self.repository.search(text)
+        ]
+
+    async def find_duplicate(self, name: str) -> 'RowViewOnDBTable | None':
+        """Вернет строку с тем же названием без учета регистра и пробелов."""
+        item = await self.repository.find_duplicate(name)
+        if item is None:
+            return None
+        return self.row_view(*item)
+
+    async def find_similar(self, name: str) -> list['RowViewOnDBTable']:
+        """Вернет строки с похожими названиями, самые похожие первыми."""
+        return [
+            self.row_view(*item[:5])
+            for item in await self.repository.find_similar(name)
+        ]
+
+    async def add(
+        self,
+        name: str,
+        quantity: int,
+        price: float,
+        dimension: str,
+        description: str,
+    ) -> None:
+        """Подсчитает цену за размерность и добавит запись в базу данных."""
+        await self.repository.create(
+            name=name,
+            price=self.logic.unit_price(price, quantity),
+            dimension=dimension,
+            description=description,
+        )
+        await self._changed()
+
+    async def delete(self, id: int) -> bool:
+        """
+        Удалит запись из базы данных. Вернет False, если записи с таким id
+        нет.
+        """
+        if not await self.repository.delete(id):
+            return False
+        await self._changed([id])
+        return True
+
+    async def delete_many(self, ids: list[int]) -> None:
+        """Удалит несколько записей из базы данных за одну транзакцию."""
+        await self.repository.delete_many(ids)
+        await self._changed(ids)
+
+    async def merge(self, groups: list[tuple[int, list[int]]]) -> None:
+        """
+        Объединит записи-дубликаты за одну транзакцию, сложив частоту их
+        выбора.
+
+        Параметры:
+            groups список вида (id оставшейся записи, id удаляемых).
+        """
+        await self.repository.flush()
+        await self.repository.merge(groups, self.logic.usage)
+        if self.logic.alerts is not None:
+            await self.repository.call(self.logic.alerts.merged, groups)
+        await self._changed()
+
+    async def update(
+        self,
+        id_item: int,
+        name: str,
+        quantity: int,
+        price: float,
+        dimension: str,
+        description: str,
+    ) -> bool:
+        """
+        Изменит запись из базы данных. Вернет False, если записи с таким id
+        нет.
+        """
+        if not await self.repository.update(
+            id_item,
+            name=name,
+            price=self.logic.unit_price(price, quantity),
+            dimension=dimension,
+            description=description,
+        ):
+            return False
+        await self._changed([id_item])
+        return True
+
+    async def reprice(
+        self, rows: list['RowViewOnDBTable'], percent: float
+    ) -> list['RowViewOnDBTable']:
+        """Изменит цену у нескольких записей на процент."""
+        return await self._update_many(self.logic.repriced(rows, percent))
+
+    async def change_dimension(
+        self, rows: list['RowViewOnDBTable'], dimension: str
+    ) -> list['RowViewOnDBTable']:
+        """Сменит размерность у нескольких записей."""
+        return await self._update_many(
+            self.logic.redimensioned(rows, dimension)
+        )
+
+    async def _update_many(
+        self, rows: list['RowViewOnDBTable']
+    ) -> list['RowViewOnDBTable']:
+        """Сохранит новые цены и размерности объектов-строк."""
+        await self.repository.update_many(
+            [(row.id, row.price, row.dimension) for row in rows]
+        )
+        await self._changed([row.id for row in rows])
+        return rows
+
+    async def _changed(self, ids: Iterable[int] = ()) -> None:
+        """Вызовет LogicDBWindow.changed в потоке-писателе репозитория."""
+        await self.repository.call(self.logic.changed, list(ids))
+
+    def calculation(
+        self,
+        price: int | float | str,
+        quantity: int | float | str,
+        current_dimension: str,
+        db_dimension: str,
+    ) -> float:
+        """Вернет стоимость строки, как LogicDBWindow.calculation."""
+        return self.logic.calculation(
+            price, quantity, current_dimension, db_dimension
+        )
@@ -0,0 +1,399 @@
+import json
+import os
+from decimal import Decimal
+from functools import partial
+
+from app.db.backup import BackupTask, CatalogBackup, Progress
+from app.db.manager import Connector
+from app.db.repository import (
+    RepositoryCompare,
+    RepositoryEstimate,
+    RepositoryReport,
+    RepositoryRules,
+    RepositoryStart,
+    RepositoryUsage,
+)
+from app.db.trace import query_log
+from app.db.write_behind import WriteBehindRepositoryDB
+from app.logic.adapter import LogicDBWindow
+from app.logic.alerts import AlertEngine
+from app.logic.dimension import DimensionConverter
+from app.logic.pricing import PricingEngine
+from app.logic.reports import LogicReportWindow, Report
+from app.models import RowViewOnDBTable
+from app.profiler import profiler
+from app.settings import (
+    BACKUP_COMPRESSION,
+    BACKUP_KEEP,
+    BACKUP_PAGES,
+    BACKUPS,
+    CATALOGS,
+    DEFAULT_CATALOG,
+    NAME_DB,
+    SNAPSHOT,
+    WRITE_BEHIND_DELAY,
+    WRITE_BEHIND_SIZE,
+)
+
+
+class Catalog:
+    """
+    Открытый каталог: свой файл БД, постоянное подключение с кэшем
+    инструкций, репозитории и логика окон, работающие только с ним.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        dimension: type[DimensionConverter] = DimensionConverter,
+    ) -> None:
+        """
+        Открытый каталог.
+
+        Параметры:
+            name название каталога;
+            path файл с БД каталога;
+            dimension конвертер размерностей.
+        """
+        self.name = name
+        self.path = path
+        self.connector = Connector(path, query_log, persistent=True)
+        self.start = RepositoryStart(self.connector)
+        self.repository = WriteBehindRepositoryDB(
+            self.connector, WRITE_BEHIND_SIZE, WRITE_BEHIND_DELAY
+        )
+        self.alerts = AlertEngine(
+            RepositoryRules(self.connector),
+            self.repository,
+            RepositoryEstimate(self.connector),
+            dimension,
+        )
+        self.logic_db = LogicDBWindow(
+            self.repository,
+            dimension,
+            RowViewOnDBTable,
+            _snapshot_path(path),
+            RepositoryUsage(self.connector),
+            alerts=self.alerts,
+        )
+        self.logic_report = LogicReportWindow(
+            RepositoryReport(self.connector),
+            RepositoryEstimate(self.connector),
+            dimension,
+        )
+        self.backups = CatalogBackup(
+            path, BACKUPS, BACKUP_KEEP, BACKUP_PAGES, BACKUP_COMPRESSION
+        )
+        # Версия каталога до начатого в фоне восстановления.
+        self._restore_version: int | None = None
+
+    def open(self) -> None:
+        """Создаст таблицы каталога, если их еще нет."""
+        self.start.create_table()
+
+    def backup(self, progress: Progress | None = None) -> str:
+        """
+        Запишет очередь изменений и снимет резервную копию каталога.
+        Вернет файл копии.
+        """
+        self.repository.flush()
+        return self.backups.backup(progress)
+
+    def start_backup(self) -> BackupTask:
+        """
+        Запишет очередь изменений и начнет снимать копию в фоновом потоке.
+        В фоне работает только CatalogBackup со своими подключениями:
+        подключение и состояние каталога остаются в вызывающем потоке.
+        """
+        self.repository.flush()
+        return BackupTask(self.backups.backup)
+
+    def restore(self, backup: str, progress: Progress | None = None) -> None:
+        """
+        Восстановит каталог из резервной копии backup. Пока идет
+        восстановление, каталог нельзя менять.
+        """
+        version = self._before_restore()
+        self.backups.restore(backup, progress)
+        self._after_restore(version)
+
+    def start_restore(self, backup: str) -> BackupTask:
+        """
+        Начнет восстанавливать каталог из копии backup в фоновом потоке.
+        Когда задача закончится, в этом же потоке нужно вызвать
+        finish_restore. До тех пор каталог нельзя менять.
+        """
+        self._restore_version = self._before_restore()
+        return BackupTask(partial(self.backups.restore, backup))
+
+    def finish_restore(self, task: BackupTask) -> None:
+        """
+        Обновит версию, снимок и оповещения каталога после фонового
+        восстановления. Если оно прервано или не удалось, база осталась
+        прежней, и делать ничего не нужно.
+        """
+        version, self._restore_version = self._restore_version, None
+        if task.error is None and version is not None:
+            self._after_restore(version)
+
+    def _before_restore(self) -> int:
+        """Запишет очередь изменений и вернет версию каталога."""
+        self.repository.flush()
+        return self.repository.get_version()
+
+    def _after_restore(self, version: int) -> None:
+        """Приведет каталог в порядок после замены базы копией."""
+        # Копия могла быть снята старой версией программы.
+        self.open()
+        self.repository.advance_version(version + 1)
+        self.logic_db.write_snapshot()
+        self.alerts.reset()
+
+    def close(self) -> None:
+        """Запишет очередь изменений и закроет подключение и снимок."""
+        self.repository.close()
+        self.logic_db.close()
+        self.connector.close()
+
+
+class CatalogManager:
+    """
+    Открытые каталоги и активный из них.
+
+    У каждого каталога свое подключение, кэш и логика окон (см. Catalog),
+    поэтому переключение не требует перезапуска и не оставляет состояния
+    прежнего каталога. Цены сравниваются одним запросом: файлы всех
+    каталогов присоединяются через ATTACH DATABASE к отдельному
+    подключению.
+    """
+
+    def __init__(
+        self,
+        path: str | None = CATALOGS,
+        dimension: type[DimensionConverter] = DimensionConverter,
+        pricing: PricingEngine | None = None,
+    ) -> None:
+        """
+        Открытые каталоги.
+
+        Параметры:
+            path файл, в котором сохраняется список каталогов, None - не
+                сохранять;
+            dimension конвертер размерностей;
+            pricing расчет стоимости, им округляются сравниваемые цены.
+        """
+        self.path = path
+        self.dimension = dimension
+        self.pricing = pricing or PricingEngine()
+        self.catalogs: dict[str, Catalog] = {}
+        self.active: Catalog | None = None
+        self._compare: RepositoryCompare | None = None
+        # Название каталога -> схема в подключении для сравнения.
+        self._schemas: dict[str, str] = {}
+
+    def load(self) -> Catalog:
+        """
+        Откроет каталоги из сохраненного списка (каталог NAME_DB - всегда)
+        и вернет активный.
+        """
+        paths = {DEFAULT_CATALOG: NAME_DB}
+        active = DEFAULT_CATALOG
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                saved = json.load(file)
+            paths.update(saved['catalogs'])
+            active = saved.get('active', active)
+        for name, path in paths.items():
+            self.open(name, path, save=False)
+        return self.activate(active if active in self.catalogs else name)
+
+    def save(self) -> None:
+        """Сохранит список каталогов и активный каталог."""
+        if self.path is None:
+            return
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(
+                {
+                    'catalogs': {
+                        name: catalog.path
+                        for name, catalog in self.catalogs.items()
+                    },
+                    'active': self.active and self.active.name,
+                },
+                file,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    def get_names(self) -> list[str]:
+        """Вернет названия открытых каталогов."""
+        return list(self.catalogs)
+
+    def open(self, name: str, path: str, save: bool = True) -> Catalog:
+        """
+        Откроет каталог, создав файл БД, если его нет.
+
+        Параметры:
+            name название каталога;
+            path файл с БД каталога;
+            save сохранить список каталогов.
+        """
+        if name in self.catalogs:
+            raise ValueError(f'Каталог "{name}" уже открыт')
+        if any(
+            os.path.abspath(catalog.path) == os.path.abspath(path)
+            for catalog in self.catalogs.values()
+        ):
+            raise ValueError(f'Файл {path} уже открыт')
+        catalog = Catalog(name, path, self.dimension)
+        catalog.open()
+        self.catalogs[name] = catalog
+        self._reset_compare()
+        if save:
+            self.save()
+        return catalog
+
+    def close(self, name: str) -> None:
+        """Закроет каталог. Активный каталог закрыть нельзя."""
+        catalog = self.catalogs[name]
+        if catalog is self.active:
+            raise ValueError('Нельзя закрыть активный каталог')
+        catalog.close()
+        del self.catalogs[name]
+        self._reset_compare()
+        self.save()
+
+    def close_all(self) -> None:
+        """Закроет все каталоги, например при выходе из программы."""
+        for catalog in self.catalogs.values():
+            catalog.close()
+        self._reset_compare()
+
+    @profiler.timed('CatalogManager.activate')
+    def activate(self, name: str) -> Catalog:
+        """Сделает каталог активным и вернет его."""
+        catalog = self.catalogs[name]
+        if self.active is not None and self.active is not catalog:
+            # Прежний каталог больше не виден окнам: его очередь
+            # записывается сразу, а не при выходе.
+            self.active.repository.flush()
+        self.active = catalog
+        self.save()
+        return catalog
+
+    @profiler.timed('CatalogManager.compare_prices')
+    def compare_prices(
+        self, names: list[str] | None = None, only_common: bool = True
+    ) -> Report:
+        """
+        Вернет отчет о ценах записей первого каталога в остальных,
+        пересчитанных в размерность первого каталога.
+
+        Параметры:
+            names каталоги для сравнения, None - активный и все остальные;
+            only_common только записи, которые есть хотя бы в одном из
+                остальных каталогов.
+        """
+        if names is None:
+            names = [self.active.name] + [
+                name for name in self.catalogs if name != self.active.name
+            ]
+        for name in names:
+            self.catalogs[name].repository.flush()
+        compare = self._get_compare()
+        rows = compare.compare_prices(
+            [self._schemas[name] for name in names], only_common
+        )
+        categories = self.dimension.get_categories()
+        round_price = self.pricing.round_price
+        # Размерностей мало, а записей много: коэффициенты считаются
+        # один раз на пару размерностей.
+        ratios: dict[tuple[str, str], Decimal | None] = {}
+        result = []
+        for name, dimension, price, *others in rows:
+            prices = [Decimal(price)]
+            for other_dimension, other_price in zip(others[::2], others[1::2]):
+                if other_price is None:
+                    prices.append(None)
+                    continue
+                key = (dimension, other_dimension)
+                if key not in ratios:
+                    ratios[key] = self._ratio(categories, *key)
+                ratio = ratios[key]
+                prices.append(
+                    None if ratio is None else Decimal(other_price) * ratio
+                )
+            known = [
+                (value, number)
+                for number, value in enumerate(prices)
+                if value is not None
+            ]
+            cheapest, number = min(known)
+            difference = (
+                (prices[0] - cheapest) / prices[0] if prices[0] else Decimal(0)
+            )
+            result.append(
+                [
+                    name,
+                    dimension,
+                    *(
+                        '—' if value is None else round_price(value)
+                        for value in prices
+                    ),
+                    names[number],
+                    f'{difference * 100:.1f}%',
+                ]
+            )
+        return Report(
+            'Сравнение цен',
+            ['Название', 'Размерность', *names, 'Дешевле', 'Экономия'],
+            result,
+        )
+
+    def _ratio(
+        self, categories: dict[str, str], dimension: str, other: str
+    ) -> Decimal | None:
+        """
+        Вернет коэффициент перевода цены за единицу other в цену за единицу
+        dimension или None, если размерности разных категорий.
+        """
+        if categories.get(other) != categories.get(dimension):
+            return None
+        return self.dimension.get_ratio(dimension, other)
+
+    def _get_compare(self) -> RepositoryCompare:
+        """
+        Вернет репозиторий сравнения: отдельное подключение к временной БД,
+        к которому присоединены файлы всех открытых каталогов.
+        """
+        if self._compare is None:
+            self._schemas = {
+                name: f'catalog{number}'
+                for number, name in enumerate(self.catalogs)
+            }
+            self._compare = RepositoryCompare(
+                Connector(
+                    ':memory:',
+                    query_log,
+                    persistent=True,
+                    attached={
+                        self._schemas[name]: catalog.path
+                        for name, catalog in self.catalogs.items()
+                    },
+                )
+            )
+        return self._compare
+
+    def _reset_compare(self) -> None:
+        """Закроет подключение для сравнения после смены набора каталогов."""
+        if self._compare is not None:
+            self._compare.connector.close()
+            self._compare = None
+
+
+def _snapshot_path(path: str) -> str:
+    """Вернет файл снимка для каталога из файла path."""
+    if path == NAME_DB:
+        return SNAPSHOT
+    return f'{os.path.splitext(path)[0]}.catalog'
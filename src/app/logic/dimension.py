@@ -67,7 +67,19 @@ class DimensionConverter(Enum):
             if dim.value.category == category
         ]
 
+    @classmethod
+    def get_categories(cls) -> dict[str, str]:
+        """Вернет категории всех размерностей."""
+        return {dim.value.dimension: dim.value.category.value for dim in cls}
+
     @classmethod
     def get_all(cls) -> list[str]:
         """Вернет все размерности."""
         return [dim.value.dimension for dim in cls]
+
+
+# Наборы единиц, в которые можно перевести всю смету.
+UNIT_SETS = {
+    'Крупные (кг, л, м)': ['кг', 'л', 'м'],
+    'Мелкие (г, мл, см)': ['г', 'мл', 'см'],
+}
@@ -0,0 +1,394 @@
+import sqlite3
+from array import array
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+from app.models import RowViewOnMainTable
+from app.profiler import profiler
+from app.settings import ESTIMATE_CHUNK_SIZE, ESTIMATE_SPILL_ROWS
+
+# Типы столбцов части: id, номер названия, количество, номер размерности,
+# стоимость.
+TYPECODES = ('q', 'I', 'd', 'H', 'd')
+# Столбцы, в которых хранятся номера названий и размерностей.
+NAME_COLUMN = 1
+DIMENSION_COLUMN = 3
+
+
+class _Chunk:
+    """
+    Часть строк сметы в виде столбцов. Пока часть выгружена во временную
+    таблицу, столбцов в памяти нет, а известен только её размер.
+    """
+
+    __slots__ = ('columns', 'count', 'key', 'dirty')
+
+    def __init__(self, columns: list[array] | None = None) -> None:
+        self.columns = columns or [array(code) for code in TYPECODES]
+        self.count = len(self.columns[0])
+        # Ключ строки во временной таблице, None - часть ни разу не выгружена.
+        self.key: int | None = None
+        # Изменена ли часть после последней выгрузки.
+        self.dirty = True
+
+
+class EstimateRows:
+    """
+    Хранилище строк сметы ограниченного размера в памяти.
+
+    Строки лежат частями по chunk_size в столбцах array, названия и
+    размерности хранятся один раз, а в строках - их номера. Объекты-строки
+    создаются только при чтении. Размеры частей сведены в дерево Фенвика,
+    поэтому поиск строки по номеру, вставка и удаление стоят O(log n) плюс
+    сдвиг внутри одной части, а не всего списка.
+
+    Если строк больше spill_rows, давно не использованные части
+    выгружаются во временную таблицу SQLite (файл удаляется при закрытии
+    подключения) и читаются обратно при обращении.
+
+    Поддерживает операции списка, которыми пользуются логика главного окна
+    и модель таблицы: len, индексы и срезы, append, insert, del, итерацию.
+    """
+
+    def __init__(
+        self,
+        row_view: type[RowViewOnMainTable] = RowViewOnMainTable,
+        chunk_size: int = ESTIMATE_CHUNK_SIZE,
+        spill_rows: int | None = ESTIMATE_SPILL_ROWS,
+    ) -> None:
+        """
+        Хранилище строк сметы.
+
+        Параметры:
+            row_view класс объекта-строки;
+            chunk_size сколько строк в одной части;
+            spill_rows сколько строк держать в памяти, остальные части
+                выгружаются во временную таблицу, None - не выгружать.
+        """
+        self.row_view = row_view
+        self.chunk_size = chunk_size
+        self.max_resident = (
+            None if spill_rows is None else max(2, spill_rows // chunk_size)
+        )
+        self._connection: sqlite3.Connection | None = None
+        self._next_key = 0
+        self.clear()
+
+    def clear(self) -> None:
+        """Удалит все строки."""
+        self._chunks: list[_Chunk] = []
+        self._tree = [0]
+        self._length = 0
+        self._resident: OrderedDict[_Chunk, None] = OrderedDict()
+        self._names: list[str] = []
+        self._name_numbers: dict[str, int] = {}
+        self._dimensions: list[str] = []
+        self._dimension_numbers: dict[str, int] = {}
+        if self._connection is not None:
+            self._connection.execute('DELETE FROM chunk')
+
+    @property
+    def spilled(self) -> int:
+        """Количество частей, выгруженных во временную таблицу."""
+        return len(self._chunks) - len(self._resident)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[RowViewOnMainTable]:
+        for chunk in list(self._chunks):
+            columns = self._load(chunk)
+            for offset in range(len(columns[0])):
+                yield self._row(columns, offset)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                return [self[number] for number in range(start, stop, step)]
+            return list(self._iter_range(start, stop))
+        chunk, offset = self._locate(self._index(index))
+        return self._row(self._load(chunk), offset)
+
+    def value(self, index: int, column: int) -> int | float | str:
+        """
+        Вернет одно поле строки index, не создавая объект-строку. Поля
+        нумеруются как в RowViewOnMainTable.
+        """
+        chunk, offset = self._locate(self._index(index))
+        item = self._load(chunk)[column][offset]
+        if column == NAME_COLUMN:
+            return self._names[item]
+        if column == DIMENSION_COLUMN:
+            return self._dimensions[item]
+        return item
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                raise ValueError('Поддерживаются только срезы с шагом 1')
+            rows = list(value)
+            if start == 0 and stop == self._length:
+                self.clear()
+                self.extend(rows)
+                return
+            del self[start:stop]
+            for number, row in enumerate(rows, start):
+                self.insert(number, row)
+            return
+        chunk, offset = self._locate(self._index(index))
+        for column, item in zip(self._load(chunk), self._pack(value)):
+            column[offset] = item
+        chunk.dirty = True
+
+    def __delitem__(self, index) -> None:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                for number in sorted(range(start, stop, step), reverse=True):
+                    del self[number]
+            elif start < stop:
+                self._delete_range(start, stop)
+            return
+        position, offset = self._find(self._index(index))
+        chunk = self._chunks[position]
+        for column in self._load(chunk):
+            del column[offset]
+        chunk.count -= 1
+        chunk.dirty = True
+        self._length -= 1
+        if chunk.count:
+            self._add(position, -1)
+        else:
+            self._drop(chunk)
+            del self._chunks[position]
+            self._rebuild()
+
+    def append(self, row: RowViewOnMainTable) -> None:
+        """Добавит строку в конец."""
+        if not self._chunks or self._chunks[-1].count >= self.chunk_size:
+            chunk = _Chunk()
+            self._chunks.append(chunk)
+            self._touch(chunk)
+            self._rebuild()
+        chunk = self._chunks[-1]
+        for column, value in zip(self._load(chunk), self._pack(row)):
+            column.append(value)
+        chunk.count += 1
+        chunk.dirty = True
+        self._length += 1
+        self._add(len(self._chunks) - 1, 1)
+
+    def extend(self, rows: Iterable[RowViewOnMainTable]) -> None:
+        """Добавит строки в конец."""
+        for row in rows:
+            self.append(row)
+
+    def insert(self, index: int, row: RowViewOnMainTable) -> None:
+        """Вставит строку перед строкой с номером index."""
+        if index < 0:
+            index = max(0, index + self._length)
+        if index >= self._length:
+            self.append(row)
+            return
+        position, offset = self._find(index)
+        chunk = self._chunks[position]
+        columns = self._load(chunk)
+        for column, value in zip(columns, self._pack(row)):
+            column.insert(offset, value)
+        chunk.count += 1
+        chunk.dirty = True
+        self._length += 1
+        if chunk.count <= 2 * self.chunk_size:
+            self._add(position, 1)
+            return
+        # Часть разрослась: делим пополам, чтобы сдвиг оставался коротким.
+        half = chunk.count // 2
+        tail = _Chunk([column[half:] for column in columns])
+        for column in columns:
+            del column[half:]
+        chunk.count = half
+        self._chunks.insert(position + 1, tail)
+        self._touch(tail)
+        self._rebuild()
+
+    def _iter_range(
+        self, start: int, stop: int
+    ) -> Iterator[RowViewOnMainTable]:
+        """Вернет строки с start по stop, не включая stop, по частям."""
+        if start >= stop:
+            return
+        position, offset = self._find(start)
+        left = stop - start
+        while left:
+            columns = self._load(self._chunks[position])
+            end = min(len(columns[0]), offset + left)
+            for number in range(offset, end):
+                yield self._row(columns, number)
+            left -= end - offset
+            position += 1
+            offset = 0
+
+    @profiler.timed('EstimateRows.delete_range')
+    def _delete_range(self, start: int, stop: int) -> None:
+        """Удалит строки с start по stop, не включая stop."""
+        position, offset = self._find(start)
+        left = stop - start
+        self._length -= left
+        while left:
+            chunk = self._chunks[position]
+            take = min(chunk.count - offset, left)
+            left -= take
+            if take == chunk.count:
+                # Часть удаляется целиком, читать её не нужно.
+                self._drop(chunk)
+                del self._chunks[position]
+                continue
+            for column in self._load(chunk):
+                del column[offset : offset + take]
+            chunk.count -= take
+            chunk.dirty = True
+            position += 1
+            offset = 0
+        self._rebuild()
+
+    def _index(self, index: int) -> int:
+        """Вернет неотрицательный номер строки или вызовет IndexError."""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('Номер строки вне сметы')
+        return index
+
+    def _locate(self, index: int) -> tuple[_Chunk, int]:
+        """Вернет часть со строкой и номер строки в ней."""
+        position, offset = self._find(index)
+        return self._chunks[position], offset
+
+    def _find(self, index: int) -> tuple[int, int]:
+        """
+        Вернет номер части со строкой index и номер строки в части
+        спуском по дереву Фенвика.
+        """
+        tree = self._tree
+        size = len(tree) - 1
+        position = 0
+        step = 1 << size.bit_length()
+        while step:
+            next_position = position + step
+            if next_position <= size and tree[next_position] <= index:
+                position = next_position
+                index -= tree[position]
+            step >>= 1
+        return position, index
+
+    def _add(self, position: int, delta: int) -> None:
+        """Изменит размер части position в дереве Фенвика на delta."""
+        tree = self._tree
+        position += 1
+        while position < len(tree):
+            tree[position] += delta
+            position += position & -position
+
+    def _rebuild(self) -> None:
+        """Перестроит дерево Фенвика после добавления или удаления частей."""
+        tree = [0] + [chunk.count for chunk in self._chunks]
+        for position in range(1, len(tree)):
+            parent = position + (position & -position)
+            if parent < len(tree):
+                tree[parent] += tree[position]
+        self._tree = tree
+
+    def _pack(self, row: RowViewOnMainTable) -> tuple:
+        """Вернет значения столбцов для объекта-строки."""
+        number = self._name_numbers.get(row.name)
+        if number is None:
+            number = self._name_numbers[row.name] = len(self._names)
+            self._names.append(row.name)
+        dimension = self._dimension_numbers.get(row.dimension)
+        if dimension is None:
+            dimension = len(self._dimensions)
+            self._dimension_numbers[row.dimension] = dimension
+            self._dimensions.append(row.dimension)
+        return (
+            row.id,
+            number,
+            float(row.quantity),
+            dimension,
+            float(row.price),
+        )
+
+    def _row(self, columns: list[array], offset: int) -> RowViewOnMainTable:
+        """Создаст объект-строку по столбцам части."""
+        ids, names, quantities, dimensions, prices = columns
+        return self.row_view(
+            id=ids[offset],
+            name=self._names[names[offset]],
+            quantity=quantities[offset],
+            dimension=self._dimensions[dimensions[offset]],
+            price=prices[offset],
+        )
+
+    def _touch(self, chunk: _Chunk) -> None:
+        """
+        Отметит часть как недавно использованную и выгрузит самые старые
+        части, если в памяти их больше допустимого.
+        """
+        resident = self._resident
+        resident[chunk] = None
+        resident.move_to_end(chunk)
+        if self.max_resident is None:
+            return
+        while len(resident) > self.max_resident:
+            oldest = next(iter(resident))
+            del resident[oldest]
+            self._spill(oldest)
+
+    def _load(self, chunk: _Chunk) -> list[array]:
+        """Вернет столбцы части, при необходимости прочитав их с диска."""
+        if chunk.columns is None:
+            blobs = self._connection.execute(
+                'SELECT ids, names, quantities, dimensions, prices '
+                'FROM chunk WHERE key = ?',
+                (chunk.key,),
+            ).fetchone()
+            columns = []
+            for code, blob in zip(TYPECODES, blobs):
+                column = array(code)
+                column.frombytes(blob)
+                columns.append(column)
+            chunk.columns = columns
+            chunk.dirty = False
+            profiler.count('estimate_rows.loaded')
+        self._touch(chunk)
+        return chunk.columns
+
+    def _spill(self, chunk: _Chunk) -> None:
+        """Выгрузит столбцы части во временную таблицу."""
+        if chunk.dirty or chunk.key is None:
+            if self._connection is None:
+                # Пустое имя - временная БД SQLite на диске.
+                self._connection = sqlite3.connect('')
+                self._connection.execute(
+                    'CREATE TABLE chunk ('
+                    'key INTEGER PRIMARY KEY, ids BLOB, names BLOB, '
+                    'quantities BLOB, dimensions BLOB, prices BLOB)'
+                )
+            if chunk.key is None:
+                chunk.key = self._next_key
+                self._next_key += 1
+            self._connection.execute(
+                'INSERT OR REPLACE INTO chunk VALUES (?, ?, ?, ?, ?, ?)',
+                (chunk.key, *(column.tobytes() for column in chunk.columns)),
+            )
+            profiler.count('estimate_rows.spilled')
+        chunk.columns = None
+
+    def _drop(self, chunk: _Chunk) -> None:
+        """Забудет удаленную часть в памяти и во временной таблице."""
+        self._resident.pop(chunk, None)
+        if chunk.key is not None:
+            self._connection.execute(
+                'DELETE FROM chunk WHERE key = ?', (chunk.key,)
+            )
@@ -0,0 +1,455 @@
+"""
+Сверка каталога с прайс-листом поставщика.
+
+Запуск из папки src:
+    python -m app.logic.price_list prices.csv            показать изменения
+    python -m app.logic.price_list prices.csv --apply    применить их
+    python -m app.logic.price_list prices.csv --apply --kinds price unit
+
+Прайс-лист - CSV с заголовком и столбцами name, price, dimension и
+необязательным description; разделитель определяется автоматически.
+"""
+
+import csv
+import sqlite3
+from argparse import ArgumentParser
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Iterable, Iterator
+
+from app.db.manager import Connector
+from app.db.names import normalize_name
+from app.db.repository import RepositoryDB, RepositoryStart
+from app.logic.dimension import DimensionConverter
+from app.profiler import profiler
+from app.settings import NAME_DB
+
+ADDED = 'added'
+REMOVED = 'removed'
+PRICE = 'price'
+UNIT = 'unit'
+KINDS = (ADDED, REMOVED, PRICE, UNIT)
+# Удаление по умолчанию не принимается: в каталоге бывают ингредиенты
+# других поставщиков, которых нет в прайс-листе.
+ACCEPTED_BY_DEFAULT = (ADDED, PRICE, UNIT)
+
+# Строка изменения: (номер, вид, id записи или None, название, описание,
+# новая цена, новая размерность, старая цена, старая размерность,
+# принято ли).
+Change = tuple[
+    int, str, int | None, str, str, str, str, str | None, str | None, bool
+]
+
+
+def read_price_list(path: str) -> Iterator[tuple[str, str, str, str]]:
+    """
+    Прочитает прайс-лист из CSV построчно.
+    Вернет строки вида (название, цена, размерность, описание).
+    """
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        sample = file.read(4096)
+        file.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        for row in csv.DictReader(file, dialect=dialect):
+            yield (
+                row['name'],
+                row['price'],
+                row['dimension'],
+                row.get('description') or '',
+            )
+
+
+class PriceListReconciler:
+    """
+    Сверка каталога с прайс-листом.
+
+    Прайс-лист загружается во временную БД SQLite (файл удаляется при
+    закрытии), где индекс по нормализованному названию упорядочивает его
+    без сортировки в памяти. Каталог читается по своему индексу в том же
+    порядке, и обе стороны сливаются одним проходом: новые, пропавшие,
+    подорожавшие и сменившие размерность записи. Изменения тоже пишутся во
+    временную БД, поэтому объем памяти не зависит от размера списков.
+
+    Изменения можно просмотреть, принять или отклонить, после чего
+    принятые применяются к каталогу одной транзакцией.
+    """
+
+    def __init__(
+        self,
+        repository: RepositoryDB,
+        dimension: type[DimensionConverter] = DimensionConverter,
+        batch: int = 10_000,
+    ) -> None:
+        """
+        Сверка каталога с прайс-листом.
+
+        Параметры:
+            repository репозиторий каталога;
+            dimension конвертер размерностей, по которому проверяются
+                размерности прайс-листа;
+            batch сколько строк читать и писать за раз.
+        """
+        self.repository = repository
+        self.dimensions = set(dimension.get_all())
+        self.batch = batch
+        self.version: int | None = None
+        self.staging = sqlite3.connect('')
+        self.staging.executescript("""
+            CREATE TABLE price_list (
+            name_normalized TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            price TEXT NOT NULL,
+            dimension TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE change (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            ingredient_id INTEGER,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            price TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            old_price TEXT,
+            old_dimension TEXT,
+            accepted INTEGER NOT NULL
+            );
+            CREATE INDEX change_kind ON change (kind, accepted);
+            """)
+        self.sql_catalog = f"""
+            SELECT
+                id,
+                {repository.field_name_normalized},
+                {repository.field_name},
+                {repository.field_price},
+                {repository.field_dimension}
+            FROM {repository.name_table}
+            ORDER BY {repository.field_name_normalized}, id
+            """
+
+    def close(self) -> None:
+        """Закроет временную БД."""
+        self.staging.close()
+
+    @profiler.timed('PriceListReconciler.load')
+    def load(self, rows: Iterable[tuple[str, str, str, str]]) -> int:
+        """
+        Загрузит прайс-лист вместо загруженного ранее. Если название
+        повторяется, действует последняя строка. Вернет количество
+        различных названий.
+
+        Параметры:
+            rows строки вида (название, цена, размерность, описание).
+        """
+        with self.staging:
+            self.staging.execute('DELETE FROM price_list')
+            self.staging.execute('DELETE FROM change')
+            self.staging.executemany(
+                """
+                INSERT INTO price_list VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (name_normalized) DO UPDATE SET
+                name = excluded.name,
+                description = excluded.description,
+                price = excluded.price,
+                dimension = excluded.dimension
+                """,
+                (
+                    self._validate(number, *row)
+                    for number, row in enumerate(rows, 1)
+                ),
+            )
+        self.version = None
+        return self.staging.execute(
+            'SELECT count(*) FROM price_list'
+        ).fetchone()[0]
+
+    def _validate(
+        self,
+        number: int,
+        name: str,
+        price: str,
+        dimension: str,
+        description: str,
+    ) -> tuple[str, str, str, str, str]:
+        """Проверит строку прайс-листа и приведет цену к копейкам."""
+        normalized = normalize_name(name)
+        if not normalized:
+            raise ValueError(f'Строка {number}: пустое название')
+        if dimension not in self.dimensions:
+            raise ValueError(
+                f'Строка {number}: неизвестная размерность {dimension!r}'
+            )
+        try:
+            value = Decimal(price.strip().replace(',', '.'))
+        except InvalidOperation:
+            raise ValueError(f'Строка {number}: цена {price!r}') from None
+        if not value.is_finite() or value < 0:
+            raise ValueError(f'Строка {number}: цена {price!r}')
+        price = str(value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+        return normalized, name.strip(), description, price, dimension
+
+    @profiler.timed('PriceListReconciler.diff')
+    def diff(self) -> dict[str, int]:
+        """
+        Сравнит каталог с загруженным прайс-листом слиянием двух
+        упорядоченных потоков и запишет изменения. Вернет их количество
+        по видам.
+        """
+        self.repository.flush()
+        self.version = self.repository.get_version()
+        with self.staging:
+            self.staging.execute('DELETE FROM change')
+            incoming = self.staging.execute(
+                'SELECT * FROM price_list ORDER BY name_normalized'
+            )
+            with self.repository.connector as cursor:
+                self.staging.executemany(
+                    'INSERT INTO change VALUES '
+                    '(NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        (*change, change[0] in ACCEPTED_BY_DEFAULT)
+                        for change in self._merge(
+                            cursor.execute(self.sql_catalog), incoming
+                        )
+                    ),
+                )
+        return self.summary()
+
+    @staticmethod
+    def _merge(
+        catalog: Iterator[tuple[int, str, str, str, str]],
+        incoming: Iterator[tuple[str, str, str, str, str]],
+    ) -> Iterator[tuple]:
+        """
+        Сольет упорядоченные по нормализованному названию каталог и
+        прайс-лист. Вернет изменения без номера и отметки о принятии.
+        Повторные записи каталога с тем же названием пропускаются: их
+        объединяет python -m app.db.dedupe.
+        """
+        old = next(catalog, None)
+        new = next(incoming, None)
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[1] < new[0]):
+                id, normalized, name, price, dimension = old
+                yield (REMOVED, id, name, '', price, dimension, None, None)
+                old = _next_distinct(catalog, normalized)
+            elif old is None or new[0] < old[1]:
+                _, name, description, price, dimension = new
+                yield (
+                    ADDED,
+                    None,
+                    name,
+                    description,
+                    price,
+                    dimension,
+                    None,
+                    None,
+                )
+                new = next(incoming, None)
+            else:
+                id, normalized, _, old_price, old_dimension = old
+                _, name, description, price, dimension = new
+                if dimension != old_dimension:
+                    kind = UNIT
+                elif _differs(price, old_price):
+                    kind = PRICE
+                else:
+                    kind = None
+                if kind is not None:
+                    yield (
+                        kind,
+                        id,
+                        name,
+                        description,
+                        price,
+                        dimension,
+                        old_price,
+                        old_dimension,
+                    )
+                old = _next_distinct(catalog, normalized)
+                new = next(incoming, None)
+
+    def summary(self) -> dict[str, int]:
+        """Вернет количество изменений по видам."""
+        counts = dict.fromkeys(KINDS, 0)
+        counts.update(
+            self.staging.execute(
+                'SELECT kind, count(*) FROM change GROUP BY kind'
+            )
+        )
+        return counts
+
+    def changes(
+        self,
+        kind: str | None = None,
+        offset: int = 0,
+        limit: int = -1,
+    ) -> list[Change]:
+        """
+        Вернет изменения для просмотра по порядку номеров.
+
+        Параметры:
+            kind вид изменений, None - все;
+            offset сколько изменений пропустить;
+            limit сколько вернуть, -1 - все.
+        """
+        rows = self.staging.execute(
+            """
+            SELECT * FROM change
+            WHERE ?1 IS NULL OR kind = ?1
+            ORDER BY id
+            LIMIT ?2 OFFSET ?3
+            """,
+            (kind, limit, offset),
+        )
+        return [(*row[:-1], bool(row[-1])) for row in rows]
+
+    def accept(
+        self,
+        accepted: bool = True,
+        kind: str | None = None,
+        ids: list[int] | None = None,
+    ) -> None:
+        """
+        Примет или отклонит изменения.
+
+        Параметры:
+            accepted принять или отклонить;
+            kind только изменения этого вида;
+            ids только изменения с этими номерами.
+        """
+        with self.staging:
+            if ids is None:
+                self.staging.execute(
+                    'UPDATE change SET accepted = ? '
+                    'WHERE ? IS NULL OR kind = ?',
+                    (accepted, kind, kind),
+                )
+            else:
+                self.staging.executemany(
+                    'UPDATE change SET accepted = ? '
+                    'WHERE id = ? AND (? IS NULL OR kind = ?)',
+                    ((accepted, id, kind, kind) for id in ids),
+                )
+
+    def changed_ids(self) -> list[int]:
+        """Вернет id записей каталога, которые изменят принятые изменения."""
+        return [
+            id
+            for (id,) in self.staging.execute(
+                'SELECT ingredient_id FROM change '
+                'WHERE accepted AND kind IN (?, ?, ?)',
+                (PRICE, UNIT, REMOVED),
+            )
+        ]
+
+    @profiler.timed('PriceListReconciler.apply')
+    def apply(self) -> dict[str, int]:
+        """
+        Применит принятые изменения к каталогу одной транзакцией. Если
+        каталог изменился после сверки, вызовет RuntimeError: сверку
+        нужно повторить. Вернет количество примененных изменений по видам.
+        """
+        if self.version is None:
+            raise RuntimeError('Сначала нужно выполнить сверку')
+        repository = self.repository
+        applied = dict.fromkeys(KINDS, 0)
+        with repository.connector as cursor:
+            version = cursor.execute(repository.sql_get_version).fetchone()
+            if version[0] != self.version:
+                raise RuntimeError('Каталог изменился после сверки')
+            for rows in self._accepted(
+                ADDED, 'name, price, dimension, description'
+            ):
+                repository.create_many(rows)
+                applied[ADDED] += len(rows)
+            for kind in (PRICE, UNIT):
+                for rows in self._accepted(
+                    kind, 'ingredient_id, price, dimension'
+                ):
+                    repository.update_many(rows)
+                    applied[kind] += len(rows)
+            for rows in self._accepted(REMOVED, 'ingredient_id'):
+                repository.delete_many([id for (id,) in rows])
+                applied[REMOVED] += len(rows)
+            # Фиксация явная: Connector при выходе гасит ошибку фиксации.
+            cursor.connection.commit()
+        self.version = None
+        profiler.count('price_list.applied', sum(applied.values()))
+        return applied
+
+    def _accepted(self, kind: str, columns: str) -> Iterator[list[tuple]]:
+        """Вернет принятые изменения одного вида порциями по batch."""
+        cursor = self.staging.execute(
+            f'SELECT {columns} FROM change '
+            'WHERE kind = ? AND accepted ORDER BY id',
+            (kind,),
+        )
+        while rows := cursor.fetchmany(self.batch):
+            yield rows
+
+
+def _next_distinct(
+    catalog: Iterator[tuple[int, str, str, str, str]], normalized: str
+) -> tuple[int, str, str, str, str] | None:
+    """Вернет следующую запись каталога с другим названием."""
+    for row in catalog:
+        if row[1] != normalized:
+            return row
+    return None
+
+
+def _differs(price: str, old_price: str) -> bool:
+    """Проверит, отличаются ли цены как числа."""
+    if price == old_price:
+        return False
+    try:
+        return Decimal(price) != Decimal(old_price)
+    except InvalidOperation:
+        return True
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='python -m app.logic.price_list')
+    parser.add_argument('path', help='прайс-лист в CSV')
+    parser.add_argument('--db', default=NAME_DB, help='файл с БД')
+    parser.add_argument(
+        '--apply', action='store_true', help='применить изменения'
+    )
+    parser.add_argument(
+        '--kinds',
+        nargs='+',
+        choices=KINDS,
+        default=list(ACCEPTED_BY_DEFAULT),
+        help='какие изменения применять',
+    )
+    parser.add_argument(
+        '--show', type=int, default=20, help='сколько изменений показать'
+    )
+    args = parser.parse_args()
+
+    connector = Connector(args.db, persistent=True)
+    RepositoryStart(connector).create_table()
+    reconciler = PriceListReconciler(RepositoryDB(connector))
+    count = reconciler.load(read_price_list(args.path))
+    print(f'Названий в прайс-листе: {count}')
+    for kind, count in reconciler.diff().items():
+        print(f'{kind}: {count}')
+    for change in reconciler.changes(limit=args.show):
+        _, kind, id, name, _, price, dimension, old_price, old_dimension, _ = (
+            change
+        )
+        was = f'{old_price} за {old_dimension} -> ' if old_price else ''
+        print(f'{kind:<8} {name} (id {id}): {was}{price} за {dimension}')
+    if args.apply:
+        for kind in KINDS:
+            reconciler.accept(kind in args.kinds, kind)
+        applied = reconciler.apply()
+        print(
+            'Применено: '
+            + ', '.join(f'{kind} {count}' for kind, count in applied.items())
+        )
+    reconciler.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+
+from app.settings import PRICE_POLICY, PRICE_ROUNDING
+
+# Способы округления до копеек.
+HALF_UP = 'half_up'
+HALF_EVEN = 'half_even'
+ROUNDINGS = [HALF_UP, HALF_EVEN]
+# Когда округлять: каждую строку или только итог.
+PER_LINE = 'line'
+PER_TOTAL = 'total'
+POLICIES = [PER_LINE, PER_TOTAL]
+
+# Точная стоимость хранится целым числом долей копейки. Цена с копейками,
+# количество с 4 знаками и перевод единиц до 1/1000 дают не больше 9
+# знаков после запятой в рублях, то есть стоимость делится без остатка.
+UNITS_PER_KOPECK = 10**7
+UNITS_PER_RUBLE = 100 * UNITS_PER_KOPECK
+# Знаменатель быстрого пути для количества: 4 знака после запятой.
+QUANTITY_SCALE = 10_000
+
+
+class PricingEngine:
+    """
+    Расчет стоимости без ошибок двоичной арифметики.
+
+    Цены, количества и коэффициенты перевода приводятся к точным дробям
+    из целых чисел (float - через его десятичную запись, то есть так, как
+    его ввели), стоимость считается в целых долях копейки и округляется
+    выбранным способом: каждая строка до копеек или только итог. Если
+    знаменатели равны 1, деления нет вовсе.
+    """
+
+    def __init__(
+        self, rounding: str = PRICE_ROUNDING, policy: str = PRICE_POLICY
+    ) -> None:
+        """
+        Расчет стоимости.
+
+        Параметры:
+            rounding способ округления: HALF_UP - половина вверх,
+                HALF_EVEN - банковское, к четному;
+            policy PER_LINE - округлять стоимость каждой строки,
+                PER_TOTAL - хранить точную стоимость строк и округлять
+                только итог.
+        """
+        if rounding not in ROUNDINGS:
+            raise ValueError(f'Неизвестный способ округления: {rounding}')
+        if policy not in POLICIES:
+            raise ValueError(f'Неизвестное правило округления: {policy}')
+        self.rounding = rounding
+        self.policy = policy
+        self._half_even = rounding == HALF_EVEN
+        self._per_line = policy == PER_LINE
+
+    def line(
+        self,
+        price: int | float | str | Decimal | Fraction,
+        quantity: int | float | str | Decimal,
+        ratio: int | Decimal | Fraction = 1,
+    ) -> int:
+        """
+        Вернет стоимость строки в долях копейки: цена за единицу, умножить
+        на количество и коэффициент перевода единиц. По правилу PER_LINE
+        она уже округлена до копеек. Коэффициент быстрее всего передавать
+        дробью из exact: их немного, и переводить каждый раз незачем.
+        """
+        price_numerator, price_denominator = _fraction(price)
+        quantity_numerator, quantity_denominator = _fraction(quantity)
+        ratio_numerator, ratio_denominator = _fraction(ratio)
+        numerator = price_numerator * quantity_numerator * ratio_numerator
+        denominator = (
+            price_denominator * quantity_denominator * ratio_denominator
+        )
+        if denominator == 1:
+            # Быстрый путь: все множители целые, делить и округлять нечего.
+            return numerator * UNITS_PER_RUBLE
+        if self._per_line:
+            numerator *= 100
+            scale = UNITS_PER_KOPECK
+        else:
+            numerator *= UNITS_PER_RUBLE
+            scale = 1
+        if numerator < 0:
+            return self._divide(numerator, denominator) * scale
+        # То же, что _divide, для неотрицательной стоимости без вызова.
+        quotient, remainder = divmod(numerator, denominator)
+        twice = 2 * remainder
+        if twice > denominator or (
+            twice == denominator and (not self._half_even or quotient & 1)
+        ):
+            quotient += 1
+        return quotient * scale
+
+    def unit_price(
+        self,
+        price: int | float | str | Decimal,
+        quantity: int | float | str | Decimal,
+    ) -> str:
+        """Вернет цену одной единицы, округленную до копеек, строкой."""
+        price_numerator, price_denominator = _fraction(price)
+        quantity_numerator, quantity_denominator = _fraction(quantity)
+        kopecks = self._divide(
+            price_numerator * quantity_denominator * 100,
+            price_denominator * quantity_numerator,
+        )
+        return _format(kopecks)
+
+    def round_price(self, price: int | float | str | Decimal) -> str:
+        """Вернет цену, округленную до копеек, строкой."""
+        return _format(self.kopecks(price))
+
+    def kopecks(self, price: int | float | str | Decimal | Fraction) -> int:
+        """Вернет цену, округленную до копеек, в копейках."""
+        numerator, denominator = _fraction(price)
+        return self._divide(numerator * 100, denominator)
+
+    def units(self, price: int | float | str | Decimal) -> int:
+        """Вернет сумму в рублях, например стоимость строки, в долях копеек."""
+        if self._per_line and isinstance(price, float):
+            # Стоимость строки уже в копейках: умножение и round точны.
+            return round(price * 100) * UNITS_PER_KOPECK
+        numerator, denominator = _fraction(price)
+        return self._divide(numerator * UNITS_PER_RUBLE, denominator)
+
+    def exact(self, value: int | float | str | Decimal) -> Fraction:
+        """Вернет число точной дробью."""
+        return Fraction(*_fraction(value))
+
+    def price(self, units: int) -> float:
+        """Вернет сумму в долях копейки в рублях для строки сметы."""
+        return units / UNITS_PER_RUBLE
+
+    def total(self, units: int) -> int:
+        """Вернет итог в копейках, округлив сумму точных стоимостей."""
+        return self._divide(units, UNITS_PER_KOPECK)
+
+    def format_money(self, kopecks: int) -> str:
+        """Вернет сумму в копейках строкой в рублях, например -0.05."""
+        return _format(kopecks)
+
+    def format_total(self, units: int) -> str:
+        """Вернет строку для поля "Итого"."""
+        rubles, kopecks = divmod(self.total(units), 100)
+        return f'Итого: {rubles} руб. {kopecks} коп.'
+
+    def _divide(self, numerator: int, denominator: int) -> int:
+        """Разделит целые числа, округлив частное выбранным способом."""
+        negative = (numerator < 0) != (denominator < 0)
+        denominator = abs(denominator)
+        quotient, remainder = divmod(abs(numerator), denominator)
+        # Половина округляется от нуля или к четному, как в Decimal.
+        twice = 2 * remainder
+        if twice > denominator or (
+            twice == denominator and (not self._half_even or quotient % 2)
+        ):
+            quotient += 1
+        return -quotient if negative else quotient
+
+
+def _fraction(
+    value: int | float | str | Decimal | Fraction,
+) -> tuple[int, int]:
+    """
+    Вернет точную дробь (числитель, знаменатель) для числа. Число float
+    берется по его кратчайшей десятичной записи: 0.1 - это 1/10.
+    """
+    kind = type(value)
+    if kind is int:
+        return value, 1
+    if kind is float:
+        # Быстрый путь: количество из поля ввода с 4 знаками. Если
+        # десятичная дробь n/10000 дает то же число float, это и есть
+        # его десятичная запись.
+        numerator = round(value * QUANTITY_SCALE)
+        if numerator / QUANTITY_SCALE == value:
+            return numerator, QUANTITY_SCALE
+        return _decimal_fraction(repr(value))
+    if kind is Fraction:
+        return value.numerator, value.denominator
+    if kind is str:
+        # Быстрый путь: цена из базы вида "123.45". Знак и цифры целой
+        # части проверяет int, пробелы в конце не пройдут isdigit.
+        whole, point, fraction = value.partition('.')
+        if fraction.isdigit():
+            try:
+                return int(whole + fraction), 10 ** len(fraction)
+            except ValueError:
+                pass
+    return _decimal_fraction(value)
+
+
+@lru_cache(maxsize=4096)
+def _decimal_fraction(value: str | Decimal) -> tuple[int, int]:
+    """Вернет точную дробь для десятичной записи числа."""
+    return Decimal(value).as_integer_ratio()
+
+
+def _format(kopecks: int) -> str:
+    """Вернет сумму в копейках строкой в рублях с двумя знаками."""
+    sign = '-' if kopecks < 0 else ''
+    rubles, kopecks = divmod(abs(kopecks), 100)
+    return f'{sign}{rubles}.{kopecks:02d}'
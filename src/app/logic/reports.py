@@ -0,0 +1,126 @@
+from app.db.repository import RepositoryEstimate, RepositoryReport
+from app.logic.dimension import DimensionConverter
+from app.logic.pricing import PricingEngine
+from app.profiler import profiler
+
+COST_BY_CATEGORY = 'Стоимость по категориям'
+TOP_INGREDIENTS = 'Самые дорогие ингредиенты'
+UNIT_PRICE_STATS = 'Цена за единицу в каталоге'
+REPORTS = [COST_BY_CATEGORY, TOP_INGREDIENTS, UNIT_PRICE_STATS]
+
+
+class Report:
+    """Готовый отчет: заголовки столбцов и строки для таблицы."""
+
+    def __init__(
+        self, title: str, headers: list[str], rows: list[list[str]]
+    ) -> None:
+        self.title = title
+        self.headers = headers
+        self.rows = rows
+
+
+class LogicReportWindow:
+    """
+    Логика окна "Отчеты". Отчеты считает SQL (см. RepositoryReport),
+    здесь они только переводятся в строки таблицы.
+    """
+
+    def __init__(
+        self,
+        reports: RepositoryReport,
+        estimates: RepositoryEstimate,
+        dimension: type[DimensionConverter],
+        pricing: PricingEngine | None = None,
+    ) -> None:
+        """
+        Логика окна "Отчеты".
+
+        Параметры:
+            reports репозиторий отчетов;
+            estimates репозиторий сохраненных смет, для выбора сметы;
+            dimension конвертер размерностей, из него берутся категории;
+            pricing расчет стоимости, из него берется вид сумм.
+        """
+        self.reports = reports
+        self.estimates = estimates
+        self.categories = dimension.get_categories()
+        self.pricing = pricing or PricingEngine()
+
+    def get_estimates(self) -> list[tuple[int, str]]:
+        """Вернет сохраненные сметы: id и название."""
+        return [(id, name) for id, name, _ in self.estimates.get_all()]
+
+    def build(
+        self, title: str, estimate_id: int | None = None, limit: int = 10
+    ) -> Report:
+        """
+        Вернет отчет по названию.
+
+        Параметры:
+            title название отчета из REPORTS;
+            estimate_id только эта смета, None - все сохраненные сметы;
+            limit сколько ингредиентов показать в списке самых дорогих.
+        """
+        if title == COST_BY_CATEGORY:
+            return self.cost_by_category(estimate_id)
+        if title == TOP_INGREDIENTS:
+            return self.top_ingredients(limit, estimate_id)
+        if title == UNIT_PRICE_STATS:
+            return self.unit_price_stats()
+        raise ValueError(f'Неизвестный отчет: {title}')
+
+    @profiler.timed('LogicReportWindow.cost_by_category')
+    def cost_by_category(self, estimate_id: int | None = None) -> Report:
+        """Вернет отчет о стоимости строк смет по категориям."""
+        money = self.pricing.format_money
+        rows = self.reports.cost_by_category(self.categories, estimate_id)
+        return Report(
+            COST_BY_CATEGORY,
+            ['Категория', 'Стоимость', 'Строк', 'Доля'],
+            [
+                [category, money(cents), str(lines), _percent(share)]
+                for category, cents, lines, share in rows
+            ],
+        )
+
+    @profiler.timed('LogicReportWindow.top_ingredients')
+    def top_ingredients(
+        self, limit: int = 10, estimate_id: int | None = None
+    ) -> Report:
+        """Вернет отчет об ингредиентах, на которые ушло больше всего."""
+        money = self.pricing.format_money
+        rows = self.reports.top_ingredients(limit, estimate_id)
+        return Report(
+            TOP_INGREDIENTS,
+            ['Место', 'Название', 'Стоимость', 'Строк', 'Доля'],
+            [
+                [str(place), name, money(cents), str(lines), _percent(share)]
+                for place, _, name, cents, lines, share in rows
+            ],
+        )
+
+    @profiler.timed('LogicReportWindow.unit_price_stats')
+    def unit_price_stats(self) -> Report:
+        """Вернет отчет о цене за единицу в каталоге по размерностям."""
+        rows = self.reports.unit_price_stats()
+        return Report(
+            UNIT_PRICE_STATS,
+            [
+                'Размерность',
+                'Записей',
+                'Средняя',
+                'Медиана',
+                'Минимум',
+                'Максимум',
+            ],
+            [
+                [dimension, str(count), *(f'{value:.2f}' for value in values)]
+                for dimension, count, *values in rows
+            ],
+        )
+
+
+def _percent(share: float | None) -> str:
+    """Вернет долю в процентах."""
+    return f'{(share or 0) * 100:.1f}%'
@@ -0,0 +1,183 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlite3 import Connection, connect
+
+from app.db.manager import Connector
+from app.db.repository import NAME_TABLE, RepositoryDB, RepositoryEstimate
+from app.logic.adapter import LogicDBWindow
+from app.logic.dimension import DimensionConverter
+from app.logic.pricing import PricingEngine
+from app.models import RowViewOnDBTable
+
+# Состояние процесса-исполнителя, заполняется в _init_worker.
+_worker: 'RepricingWorker | None' = None
+
+
+class RepricingWorker:
+    """
+    Пересчет смет внутри одного процесса.
+
+    Держит свое подключение к БД только для чтения и заранее загруженные
+    цены ингредиентов, а стоимость строк и итоги считает через логику
+    окна БД по правилам округления pricing, как смета в главном окне.
+    """
+
+    def __init__(self, name_db: str, pricing: PricingEngine) -> None:
+        self.connection: Connection = connect(
+            f'file:{name_db}?mode=ro', uri=True
+        )
+        self.estimates = RepositoryEstimate(Connector(name_db))
+        self.logic = LogicDBWindow(
+            RepositoryDB(Connector(name_db)),
+            DimensionConverter,
+            RowViewOnDBTable,
+            pricing=pricing,
+        )
+        self.prices: dict[int, tuple[str, str]] = {
+            id: (price, dimension)
+            for id, price, dimension in self.connection.execute(
+                f'SELECT id, price, dimension FROM {NAME_TABLE}'
+            )
+        }
+
+    def reprice(
+        self, first_id: int, last_id: int
+    ) -> tuple[list[tuple[str, int]], list[tuple[str, int]], list[int]]:
+        """
+        Пересчитает сметы с id от first_id до last_id.
+        Вернет новые стоимости строк, итоги смет и id строк, чьих
+        ингредиентов уже нет в каталоге: их стоимость остается прежней.
+        """
+        pricing = self.logic.pricing
+        line_prices = []
+        stale = []
+        # id сметы -> сумма стоимостей строк в долях копейки.
+        totals: dict[int, int] = {}
+        lines = self.connection.execute(
+            self.estimates.sql_get_lines, (first_id, last_id)
+        )
+        for id, estimate_id, ingredient_id, *line in lines:
+            _, quantity, dimension, price = line
+            current = self.prices.get(ingredient_id)
+            if current is not None:
+                db_price, db_dimension = current
+                units = self.logic.line(
+                    db_price, quantity, dimension, db_dimension
+                )
+                line_prices.append(
+                    (pricing.format_money(pricing.total(units)), id)
+                )
+            else:
+                units = pricing.units(price)
+                stale.append(id)
+            totals[estimate_id] = totals.get(estimate_id, 0) + units
+        totals_list = [
+            (pricing.format_money(pricing.total(total)), estimate_id)
+            for estimate_id, total in totals.items()
+        ]
+        return line_prices, totals_list, stale
+
+
+def _init_worker(name_db: str, rounding: str, policy: str) -> None:
+    global _worker
+    _worker = RepricingWorker(name_db, PricingEngine(rounding, policy))
+
+
+def _reprice_shard(
+    first_id: int, last_id: int
+) -> tuple[list[tuple[str, int]], list[tuple[str, int]], list[int]]:
+    return _worker.reprice(first_id, last_id)  # type: ignore
+
+
+class RepricingEngine:
+    """
+    Параллельный пересчет всех сохраненных смет по текущим ценам каталога.
+
+    Диапазоны id смет раздаются процессам-исполнителям, а результаты
+    по мере готовности записываются родителем пакетами, каждый пакет
+    одной транзакцией.
+
+    Строки, чей ингредиент удален из каталога, пересчитать не по чему:
+    их стоимость остается прежней и входит в итог сметы, а id таких строк
+    после run() лежат в stale, чтобы их можно было показать отдельно.
+    """
+
+    def __init__(
+        self,
+        name_db: str,
+        workers: int = 4,
+        shard_size: int = 200,
+        batch_size: int = 50_000,
+        pricing: PricingEngine | None = None,
+    ) -> None:
+        """
+        Параллельный пересчет смет.
+
+        Параметры:
+            name_db имя файла с БД;
+            workers количество процессов;
+            shard_size сколько смет отдается процессу за раз;
+            batch_size сколько строк записывается одной транзакцией;
+            pricing правила расчета стоимости.
+        """
+        self.name_db = name_db
+        self.workers = workers
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.pricing = pricing or PricingEngine()
+        self.estimates = RepositoryEstimate(Connector(name_db))
+        self.stale: list[int] = []
+
+    def shards(self) -> list[tuple[int, int]]:
+        """Разобьет id смет на диапазоны."""
+        first, last = self.estimates.get_bounds()
+        if first is None or last is None:
+            return []
+        return [
+            (start, min(start + self.shard_size - 1, last))
+            for start in range(first, last + 1, self.shard_size)
+        ]
+
+    def run(self) -> int:
+        """
+        Пересчитает все сметы и вернет количество измененных строк.
+        id строк с удаленными ингредиентами сохранит в stale.
+        """
+        line_prices: list[tuple[str, int]] = []
+        totals: list[tuple[str, int]] = []
+        stale: list[int] = []
+        count = 0
+
+        with ProcessPoolExecutor(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(
+                self.name_db,
+                self.pricing.rounding,
+                self.pricing.policy,
+            ),
+        ) as executor:
+            futures = [
+                executor.submit(_reprice_shard, first, last)
+                for first, last in self.shards()
+            ]
+            for future in as_completed(futures):
+                shard_lines, shard_totals, shard_stale = future.result()
+                line_prices.extend(shard_lines)
+                totals.extend(shard_totals)
+                stale.extend(shard_stale)
+                if len(line_prices) >= self.batch_size:
+                    count += self._write(line_prices, totals)
+                    line_prices, totals = [], []
+
+        self.stale = sorted(stale)
+        return count + self._write(line_prices, totals)
+
+    def _write(
+        self,
+        line_prices: list[tuple[str, int]],
+        totals: list[tuple[str, int]],
+    ) -> int:
+        """Запишет пакет результатов одной транзакцией."""
+        if line_prices or totals:
+            self.estimates.update_prices(line_prices, totals)
+        return len(line_prices)
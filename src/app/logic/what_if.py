@@ -0,0 +1,602 @@
+"""
+Анализ "что если": сколько будут стоить все сохраненные сметы, если
+цены части ингредиентов изменятся на заданные проценты.
+
+Запуск из папки src, каждый сценарий - отдельный аргумент:
+    python -m app.logic.what_if "мука=15;сахар=10" "мука=-5"
+"""
+
+from argparse import ArgumentParser
+from decimal import Decimal
+from fractions import Fraction
+
+from app.db.manager import Connector
+from app.db.repository import RepositoryDB, RepositoryEstimate, RepositoryStart
+from app.logic.dimension import DimensionConverter
+from app.logic.pricing import (
+    HALF_EVEN,
+    PER_LINE,
+    UNITS_PER_KOPECK,
+    PricingEngine,
+)
+from app.profiler import profiler
+from app.settings import NAME_DB
+
+try:
+    import numpy
+except ImportError:  # Без NumPy считает запасной путь на Python.
+    numpy = None
+
+# Сценарий: id ингредиента -> изменение цены в процентах.
+Scenario = dict[int, int | float | str | Decimal]
+
+# Граница для произведений в int64 с запасом на удвоенный остаток.
+INT64_LIMIT = 2**62
+# Сколько строк смет пересчитывать за один векторный проход.
+BLOCK_LINES = 1 << 22
+
+
+class WhatIfEngine:
+    """
+    Стоимость всех сохраненных смет при многих сценариях цен сразу.
+
+    load один раз раскладывает данные по столбцам: точную цену каждого
+    ингредиента и для каждой строки сметы номер сметы, номер
+    ингредиента, точную дробь "количество на коэффициент перевода" и
+    стоимость по текущим ценам. Строки отсортированы по ингредиенту
+    отдельным индексом, поэтому сценарий пересчитывает только строки
+    ингредиентов, цены которых он меняет, и прибавляет разность к итогам
+    смет.
+
+    С NumPy строки всех сценариев пересчитываются векторно блоками до
+    BLOCK_LINES строк: выборка по индексу, деление с остатком в int64 и
+    сложение по ячейкам "сценарий, смета". Без NumPy то же считается
+    циклом через PricingEngine.line. Оба пути дают до копейки то же, что
+    пересчет каждой строки по новым ценам, округленным до копеек:
+    округление и правило PER_LINE или PER_TOTAL берутся из pricing.
+    Строка удаленного ингредиента стоит, сколько сохранено в смете.
+    """
+
+    def __init__(
+        self,
+        catalog: RepositoryDB,
+        estimates: RepositoryEstimate,
+        dimension: type[DimensionConverter],
+        pricing: PricingEngine | None = None,
+        vectorized: bool | None = None,
+    ) -> None:
+        """
+        Анализ "что если".
+
+        Параметры:
+            catalog репозиторий каталога с текущими ценами;
+            estimates репозиторий сохраненных смет;
+            dimension конвертер размерностей;
+            pricing расчет стоимости строк смет;
+            vectorized считать через NumPy; по умолчанию - если он
+                установлен.
+        """
+        if vectorized is None:
+            vectorized = numpy is not None
+        elif vectorized and numpy is None:
+            raise ValueError('Для векторного расчета нужен NumPy')
+        self.catalog = catalog
+        self.estimates = estimates
+        self.dimension = dimension
+        self.pricing = pricing or PricingEngine()
+        self.vectorized = vectorized
+        self.estimate_ids: list[int] = []
+        self.names: list[str] = []
+        self._loaded = False
+
+    @profiler.timed('WhatIfEngine.load')
+    def load(self) -> None:
+        """Прочитает каталог и строки смет и разложит их по столбцам."""
+        pricing = self.pricing
+        rows = self.catalog.get_all()
+        # id ингредиента -> его номер в столбцах каталога.
+        self._index = {row[0]: number for number, row in enumerate(rows)}
+        self._prices = [pricing.exact(row[4]) for row in rows]
+        dimensions = [row[3] for row in rows]
+
+        estimates = self.estimates.get_all()
+        self.estimate_ids = [id for id, _, _ in estimates]
+        self.names = [name for _, name, _ in estimates]
+        positions = {id: number for number, id in enumerate(self.estimate_ids)}
+        lines = self.estimates.get_lines(*self._bounds())
+
+        # Столбцы строк: смета, ингредиент (-1 - удаленный), количество
+        # и коэффициент перевода в размерность каталога точными дробями,
+        # стоимость в смете.
+        line_estimates = []
+        line_ingredients = []
+        quantities = []
+        line_ratios = []
+        stored = []
+        exact: dict[str, Fraction] = {}
+        ratios: dict[tuple[str, str], Fraction] = {}
+        for (
+            _,
+            estimate_id,
+            ingredient_id,
+            _,
+            quantity,
+            dimension,
+            price,
+        ) in lines:
+            number = self._index.get(ingredient_id, -1)
+            ratio = None
+            if number >= 0:
+                key = (dimension, dimensions[number])
+                ratio = ratios.get(key)
+                if ratio is None:
+                    ratio = ratios[key] = pricing.exact(
+                        self.dimension.get_ratio(*key)
+                    )
+            value = exact.get(quantity)
+            if value is None:
+                value = exact[quantity] = pricing.exact(quantity)
+            line_estimates.append(positions[estimate_id])
+            line_ingredients.append(number)
+            quantities.append(value)
+            line_ratios.append(ratio)
+            stored.append(price)
+        columns = (line_estimates, line_ingredients, quantities, line_ratios)
+
+        if self.vectorized:
+            try:
+                self._load_arrays(*columns, stored)
+            except OverflowError:
+                # Числа не помещаются в int64: считать будет Python.
+                self.vectorized = False
+        if not self.vectorized:
+            self._load_lists(*columns, stored)
+        profiler.count('what_if.lines', len(line_estimates))
+        self._loaded = True
+
+    def baseline(self) -> list[int]:
+        """Вернет итоги смет по текущим ценам в копейках."""
+        return self.run([{}])[0]
+
+    @profiler.timed('WhatIfEngine.run')
+    def run(self, scenarios: list[Scenario]) -> list[list[int]]:
+        """
+        Вернет итоги всех смет в копейках для каждого сценария: строки -
+        сценарии, столбцы - сметы в порядке estimate_ids. Новая цена
+        ингредиента - текущая, измененная на процент и округленная до
+        копеек, как при переоценке каталога.
+
+        Параметры:
+            scenarios сценарии вида {id ингредиента: процент}.
+        """
+        if not self._loaded:
+            self.load()
+        entries = self._entries(scenarios)
+        profiler.count('what_if.scenarios', len(scenarios))
+        if self.vectorized:
+            try:
+                return self._run_arrays(len(scenarios), entries)
+            except OverflowError:
+                # Итоги сценариев не помещаются в int64: столбцы
+                # читаются заново для расчета на Python.
+                self.vectorized = False
+                self.load()
+        return self._run_python(len(scenarios), entries)
+
+    def _bounds(self) -> tuple[int, int]:
+        """Вернет диапазон id смет для get_lines."""
+        first, last = self.estimates.get_bounds()
+        if first is None or last is None:
+            return 0, -1
+        return first, last
+
+    def _entries(
+        self, scenarios: list[Scenario]
+    ) -> list[tuple[int, int, int]]:
+        """
+        Вернет измененные цены сценариев: номер сценария, номер
+        ингредиента и новая цена в копейках.
+        """
+        pricing = self.pricing
+        factors: dict[object, Fraction] = {}
+        entries = []
+        for scenario_number, scenario in enumerate(scenarios):
+            for id, percent in scenario.items():
+                number = self._index.get(id)
+                if number is None:
+                    raise ValueError(f'Нет ингредиента с id {id}')
+                factor = factors.get(percent)
+                if factor is None:
+                    factor = factors[percent] = (
+                        1 + pricing.exact(percent) / 100
+                    )
+                entries.append(
+                    (
+                        scenario_number,
+                        number,
+                        pricing.kopecks(self._prices[number] * factor),
+                    )
+                )
+        return entries
+
+    def _load_lists(
+        self,
+        line_estimates: list[int],
+        line_ingredients: list[int],
+        quantities: list[Fraction],
+        line_ratios: list[Fraction | None],
+        stored: list[str],
+    ) -> None:
+        """Сохранит столбцы строк списками для расчета на Python."""
+        pricing = self.pricing
+        prices = self._prices
+        # Цена удаленного ингредиента в сценариях не меняется.
+        self._base = [
+            pricing.units(price)
+            if number < 0
+            else pricing.line(prices[number], quantity, ratio)
+            for number, quantity, ratio, price in zip(
+                line_ingredients, quantities, line_ratios, stored
+            )
+        ]
+        self._totals = [0] * len(self.estimate_ids)
+        for number, units in zip(line_estimates, self._base):
+            self._totals[number] += units
+        self._line_estimates = line_estimates
+        self._quantities = quantities
+        self._ratios = line_ratios
+        # Строки каждого ингредиента: номера строк, отсортированные по
+        # номеру ингредиента, и начало и число строк каждого.
+        self._order = sorted(
+            (
+                number
+                for number, ingredient in enumerate(line_ingredients)
+                if ingredient >= 0
+            ),
+            key=line_ingredients.__getitem__,
+        )
+        self._counts = [0] * len(prices)
+        for number in self._order:
+            self._counts[line_ingredients[number]] += 1
+        self._starts = [0] * len(prices)
+        for number in range(1, len(prices)):
+            self._starts[number] = (
+                self._starts[number - 1] + self._counts[number - 1]
+            )
+
+    def _run_python(
+        self, count: int, entries: list[tuple[int, int, int]]
+    ) -> list[list[int]]:
+        """Посчитает сценарии циклом по строкам."""
+        pricing = self.pricing
+        line_estimates = self._line_estimates
+        quantities = self._quantities
+        ratios = self._ratios
+        base = self._base
+        totals = [list(self._totals) for _ in range(count)]
+        for scenario_number, ingredient, kopecks in entries:
+            scenario = totals[scenario_number]
+            price = Fraction(kopecks, 100)
+            start = self._starts[ingredient]
+            for number in self._order[
+                start : start + self._counts[ingredient]
+            ]:
+                scenario[line_estimates[number]] += (
+                    pricing.line(price, quantities[number], ratios[number])
+                    - base[number]
+                )
+        return [[pricing.total(units) for units in row] for row in totals]
+
+    def _load_arrays(
+        self,
+        line_estimates: list[int],
+        line_ingredients: list[int],
+        quantities: list[Fraction],
+        line_ratios: list[Fraction | None],
+        stored: list[str],
+    ) -> None:
+        """
+        Переложит столбцы строк в массивы NumPy. Стоимости хранятся двумя
+        массивами int64: целые копейки и остаток в долях копейки от 0 до
+        UNITS_PER_KOPECK, так в int64 помещаются и очень дорогие строки.
+        """
+        pricing = self.pricing
+        numerators = []
+        denominators = []
+        for quantity, ratio in zip(quantities, line_ratios):
+            if ratio is None:
+                numerators.append(0)
+                denominators.append(1)
+                continue
+            # Дробь не сокращается: значение и округление те же.
+            numerators.append(quantity.numerator * ratio.numerator)
+            denominators.append(quantity.denominator * ratio.denominator)
+        self._numerators = numpy.array(numerators, dtype=numpy.int64)
+        self._denominators = numpy.array(denominators, dtype=numpy.int64)
+        if numpy.any(self._denominators >= INT64_LIMIT // UNITS_PER_KOPECK):
+            raise OverflowError('Количество строки сметы слишком точное')
+        self._line_estimates = numpy.array(line_estimates, dtype=numpy.int64)
+        ingredients = numpy.array(line_ingredients, dtype=numpy.int64)
+
+        # Стоимость по текущим ценам считается тем же расчетом, что и
+        # сценарии. Строки удаленных ингредиентов и цен с долями копейки
+        # считаются на Python. Номер -1 удаленного ингредиента попадает
+        # в последний, добавочный элемент столбцов цен.
+        kopecks = [price * 100 for price in self._prices]
+        whole = numpy.array(
+            [value.denominator == 1 for value in kopecks] + [False],
+            dtype=bool,
+        )
+        prices = numpy.array(
+            [int(value) if value.denominator == 1 else 0 for value in kopecks]
+            + [0],
+            dtype=numpy.int64,
+        )
+        base_kopecks, base_fractions = self._units(
+            prices[ingredients], self._numerators, self._denominators
+        )
+        (others,) = numpy.nonzero(~whole[ingredients])
+        if len(others):
+            base_kopecks[others], base_fractions[others] = _split(
+                pricing.units(stored[number])
+                if line_ingredients[number] < 0
+                else pricing.line(
+                    self._prices[line_ingredients[number]],
+                    quantities[number],
+                    line_ratios[number],
+                )
+                for number in others.tolist()
+            )
+        self._base = base_kopecks, base_fractions
+        self._totals = tuple(
+            numpy.zeros(len(self.estimate_ids), dtype=numpy.int64)
+            for _ in range(2)
+        )
+        for total, part in zip(self._totals, self._base):
+            numpy.add.at(total, self._line_estimates, part)
+
+        # Строки каждого ингредиента: номера строк, отсортированные по
+        # номеру ингредиента, и начало и число строк каждого.
+        (present,) = numpy.nonzero(ingredients >= 0)
+        self._order = present[
+            numpy.argsort(ingredients[present], kind='stable')
+        ]
+        self._counts = numpy.bincount(
+            ingredients[present], minlength=len(self._prices)
+        ).astype(numpy.int64)
+        self._starts = numpy.cumsum(self._counts) - self._counts
+
+    def _run_arrays(
+        self, count: int, entries: list[tuple[int, int, int]]
+    ) -> list[list[int]]:
+        """Посчитает сценарии векторно блоками строк."""
+        size = len(self.estimate_ids)
+        kopecks, fractions = (numpy.tile(part, count) for part in self._totals)
+        if entries:
+            scenario_numbers, ingredients, prices = (
+                numpy.array(column, dtype=numpy.int64)
+                for column in zip(*entries)
+            )
+            counts = self._counts[ingredients]
+            ends = numpy.cumsum(counts)
+            first = 0
+            while first < len(entries):
+                # Блок - записи, строк у которых вместе не больше
+                # BLOCK_LINES, но хотя бы одна запись.
+                last = max(
+                    first + 1,
+                    int(
+                        numpy.searchsorted(
+                            ends,
+                            ends[first] - counts[first] + BLOCK_LINES,
+                            side='right',
+                        )
+                    ),
+                )
+                block = slice(first, last)
+                self._add_block(
+                    kopecks,
+                    fractions,
+                    scenario_numbers[block] * size,
+                    ingredients[block],
+                    prices[block],
+                    counts[block],
+                )
+                first = last
+        totals = self._total(kopecks, fractions)
+        return totals.reshape(count, size).tolist()
+
+    def _add_block(
+        self,
+        kopecks,
+        fractions,
+        offsets,
+        ingredients,
+        prices,
+        counts,
+    ) -> None:
+        """
+        Прибавит к итогам смет разность стоимостей строк, которые
+        затрагивают записи блока.
+
+        Параметры:
+            kopecks, fractions итоги по сценариям подряд: копейки и доли;
+            offsets начало итогов сценария каждой записи;
+            ingredients номера ингредиентов записей;
+            prices новые цены записей в копейках;
+            counts сколько строк смет у ингредиента каждой записи.
+        """
+        total = int(counts.sum())
+        if not total:
+            return
+        # Номера строк всех записей подряд: начало строк ингредиента
+        # плюс номер строки внутри записи.
+        shifts = numpy.repeat(
+            self._starts[ingredients] - (numpy.cumsum(counts) - counts),
+            counts,
+        )
+        lines = self._order[numpy.arange(total, dtype=numpy.int64) + shifts]
+        line_kopecks, line_fractions = self._units(
+            numpy.repeat(prices, counts),
+            self._numerators[lines],
+            self._denominators[lines],
+        )
+        base_kopecks, base_fractions = self._base
+        differences = line_kopecks - base_kopecks[lines]
+        if (
+            float(abs(kopecks).max()) + float(abs(differences).sum())
+            >= INT64_LIMIT
+        ):
+            raise OverflowError('Итог сметы не помещается в int64')
+        cells = numpy.repeat(offsets, counts) + self._line_estimates[lines]
+        numpy.add.at(kopecks, cells, differences)
+        numpy.add.at(fractions, cells, line_fractions - base_fractions[lines])
+
+    def _units(self, prices, numerators, denominators):
+        """
+        Вернет стоимости строк, как PricingEngine.line для цены
+        prices / 100 и дроби numerators / denominators: копейки и доли.
+        """
+        negative = (prices < 0) != (numerators < 0)
+        products = abs(prices)
+        factors = abs(numerators)
+        # Произведение, которое не помещается в int64, считается точно
+        # целыми Python: такие строки на практике единичны.
+        large = products > INT64_LIMIT // numpy.maximum(factors, 1)
+        products *= factors
+        quotients, remainders = numpy.divmod(products, denominators)
+        if self.pricing.policy == PER_LINE:
+            quotients = self._rounded(quotients, remainders, denominators)
+            fractions = numpy.zeros_like(quotients)
+        else:
+            # Копейки точны, округляется только остаток в долях копейки.
+            # Четность частного от этого не меняется: UNITS_PER_KOPECK
+            # четное.
+            fractions, remainders = numpy.divmod(
+                remainders * UNITS_PER_KOPECK, denominators
+            )
+            fractions = self._rounded(fractions, remainders, denominators)
+            quotients += fractions // UNITS_PER_KOPECK
+            fractions %= UNITS_PER_KOPECK
+        # Отрицательная стоимость: -(q + f) = -(q + 1) + (1 - f).
+        borrow = negative & (fractions > 0)
+        quotients = numpy.where(negative, -quotients - borrow, quotients)
+        fractions = numpy.where(
+            borrow, UNITS_PER_KOPECK - fractions, fractions
+        )
+        if numpy.any(large):
+            (numbers,) = numpy.nonzero(large)
+            quotients[numbers], fractions[numbers] = _split(
+                self.pricing.line(
+                    Fraction(int(prices[number]), 100),
+                    1,
+                    Fraction(
+                        int(numerators[number]), int(denominators[number])
+                    ),
+                )
+                for number in numbers
+            )
+        return quotients, fractions
+
+    def _total(self, kopecks, fractions):
+        """
+        Вернет итоги в копейках, как PricingEngine.total для суммы
+        kopecks * UNITS_PER_KOPECK + fractions.
+        """
+        quotients = kopecks + fractions // UNITS_PER_KOPECK
+        remainders = fractions % UNITS_PER_KOPECK
+        # Отрицательный итог округляется по модулю, как в _divide.
+        negative = quotients < 0
+        borrow = negative & (remainders > 0)
+        quotients = numpy.where(negative, -quotients - borrow, quotients)
+        remainders = numpy.where(
+            borrow, UNITS_PER_KOPECK - remainders, remainders
+        )
+        quotients = self._rounded(quotients, remainders, UNITS_PER_KOPECK)
+        return numpy.where(negative, -quotients, quotients)
+
+    def _rounded(self, quotients, remainders, denominators):
+        """Округлит неотрицательные частные по остаткам."""
+        twice = 2 * remainders
+        half = twice == denominators
+        if self.pricing.rounding == HALF_EVEN:
+            half &= (quotients & 1) == 1
+        return quotients + ((twice > denominators) | half)
+
+
+def _split(units):
+    """
+    Вернет стоимости в долях копейки массивами int64 целых копеек и
+    остатков от 0 до UNITS_PER_KOPECK.
+    """
+    parts = [divmod(value, UNITS_PER_KOPECK) for value in units]
+    return (
+        numpy.array([kopecks for kopecks, _ in parts], dtype=numpy.int64),
+        numpy.array([fraction for _, fraction in parts], dtype=numpy.int64),
+    )
+
+
+def parse_scenario(catalog: RepositoryDB, text: str) -> Scenario:
+    """
+    Вернет сценарий из строки вида "мука=15;сахар=-10": названия
+    ингредиентов сравниваются без учета регистра и лишних пробелов.
+    """
+    scenario: Scenario = {}
+    for part in filter(None, map(str.strip, text.split(';'))):
+        name, _, percent = part.rpartition('=')
+        row = catalog.find_duplicate(name)
+        if row is None:
+            raise ValueError(f'Нет ингредиента "{name.strip()}"')
+        scenario[row[0]] = percent.strip()
+    return scenario
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='python -m app.logic.what_if')
+    parser.add_argument(
+        'scenarios', nargs='+', help='сценарии вида "мука=15;сахар=10"'
+    )
+    parser.add_argument('--db', default=NAME_DB, help='файл с БД')
+    parser.add_argument(
+        '--show', type=int, default=10, help='сколько смет показать'
+    )
+    parser.add_argument(
+        '--python', action='store_true', help='считать без NumPy'
+    )
+    args = parser.parse_args()
+
+    connector = Connector(args.db, persistent=True)
+    RepositoryStart(connector).create_table()
+    catalog = RepositoryDB(connector)
+    engine = WhatIfEngine(
+        catalog,
+        RepositoryEstimate(connector),
+        DimensionConverter,
+        vectorized=False if args.python else None,
+    )
+    try:
+        scenarios = [parse_scenario(catalog, text) for text in args.scenarios]
+    except ValueError as error:
+        parser.error(str(error))
+    baseline, *results = engine.run([{}, *scenarios])
+    money = engine.pricing.format_money
+    print(f'Смет: {len(baseline)}, всего {money(sum(baseline))}')
+    for text, totals in zip(args.scenarios, results):
+        print(f'{text}: всего {money(sum(totals))}')
+        changes = sorted(
+            (
+                (total - old, name, old, total)
+                for name, old, total in zip(engine.names, baseline, totals)
+                if total != old
+            ),
+            key=lambda change: abs(change[0]),
+            reverse=True,
+        )
+        for change, name, old, total in changes[: args.show]:
+            print(
+                f'    {name}: {money(old)} -> {money(total)} ({money(change)})'
+            )
+
+
+if __name__ == '__main__':
+    main()
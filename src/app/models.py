@@ -1,6 +1,14 @@
 from decimal import Decimal
+from typing import Callable
 
-from PyQt6.QtCore import QAbstractTableModel, Qt
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt6.QtGui import QColor
+
+from app.profiler import profiler
+
+# Фон четных строк: готовый QColor, а не Qt.GlobalColor, который
+# представление не может привести к цвету.
+EVEN_ROW_BACKGROUND = QColor(Qt.GlobalColor.lightGray)
 
 
 class RowViewOnMainTable:
@@ -102,10 +110,15 @@ class BasesViewTableModels(QAbstractTableModel):
         super().__init__()
         self._data = data or []
 
-    def rowCount(self, index):
+    def rowCount(self, index=None):
+        # У строк таблицы нет дочерних строк.
+        if index is not None and index.isValid():
+            return 0
         return len(self._data)
 
-    def columnCount(self, index):
+    def columnCount(self, index=None):
+        if index is not None and index.isValid():
+            return 0
         return len(self.row.headers)
 
     def headerData(self, section, orientation, role):
@@ -114,15 +127,79 @@ class BasesViewTableModels(QAbstractTableModel):
                 return self.row.headers[section]
         return None
 
+    @profiler.timed('model.data')
     def data(self, index, role):
         if role == Qt.ItemDataRole.DisplayRole:
-            return str(self._data[index.row()][index.column()])
+            return str(self._cell(index.row(), index.column()))
 
         if role == Qt.ItemDataRole.BackgroundRole:
             if index.row() % 2 == 0:
-                return Qt.GlobalColor.lightGray
+                return EVEN_ROW_BACKGROUND
         return None
 
+    def _cell(self, row: int, column: int):
+        """Вернет значение ячейки."""
+        return self._data[row][column]
+
+    def remove_rows(
+        self,
+        indexes: list[int],
+        delete: Callable[[int, int], None] | None = None,
+    ) -> None:
+        """
+        Удалит строки по индексам, уведомив представление только об
+        удаленных диапазонах, без пересоздания модели.
+
+        Параметры:
+            indexes индексы удаляемых строк;
+            delete функция удаления диапазона строк (first, last)
+                из хранилища, по умолчанию удаляет из списка модели.
+        """
+        if delete is None:
+            delete = self._delete_range
+        for first, last in reversed(self._ranges(indexes)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            delete(first, last)
+            self.endRemoveRows()
+
+    def replace_rows(self, indexes: list[int], rows: list) -> None:
+        """Заменит строки по индексам и уведомит представление."""
+        if not indexes:
+            return
+        for index, row in zip(indexes, rows):
+            self._data[index] = row
+        self.dataChanged.emit(
+            self.index(min(indexes), 0),
+            self.index(max(indexes), self.columnCount(None) - 1),
+        )
+
+    def refresh(self) -> None:
+        """
+        Уведомит представление, что изменились все строки, например когда
+        их заменили прямо в хранилище модели.
+        """
+        if not self._data:
+            return
+        self.dataChanged.emit(
+            self.index(0, 0),
+            self.index(len(self._data) - 1, self.columnCount(None) - 1),
+        )
+
+    def _delete_range(self, first: int, last: int) -> None:
+        """Удалит строки с first по last включительно из списка модели."""
+        del self._data[first : last + 1]
+
+    @staticmethod
+    def _ranges(indexes: list[int]) -> list[tuple[int, int]]:
+        """Сгруппирует индексы в непрерывные диапазоны."""
+        ranges: list[tuple[int, int]] = []
+        for index in sorted(set(indexes)):
+            if ranges and ranges[-1][1] == index - 1:
+                ranges[-1] = (ranges[-1][0], index)
+            else:
+                ranges.append((index, index))
+        return ranges
+
 
 class ViewOnMainTableModels(BasesViewTableModels):
     """Модель представления таблицы на главном окне."""
@@ -130,6 +207,15 @@ class ViewOnMainTableModels(BasesViewTableModels):
     def __init__(self, data=None):
         super().__init__(data)
         self.row = RowViewOnMainTable
+        # EstimateRows отдает отдельное поле, не собирая объект-строку
+        # из столбцов на каждый вызов data().
+        self._value = getattr(self._data, 'value', None)
+
+    def _cell(self, row: int, column: int):
+        """Вернет значение ячейки."""
+        if self._value is not None:
+            return self._value(row, column)
+        return self._data[row][column]
 
 
 class ViewOnDBTableModels(BasesViewTableModels):
@@ -144,3 +230,12 @@ class ViewOnDBTableModels(BasesViewTableModels):
         if 0 <= index_row < len(self._data):
             return self._data[index_row]
         return None
+
+
+class ViewOnReportTableModels(BasesViewTableModels):
+    """Модель представления таблицы окна отчетов."""
+
+    def __init__(self, report):
+        super().__init__(report.rows)
+        # Заголовки у каждого отчета свои, их дает сам отчет.
+        self.row = report
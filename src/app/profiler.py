@@ -0,0 +1,128 @@
+import json
+import statistics
+from collections import deque
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, TypeVar
+
+from app.settings import PROFILE, PROFILE_WINDOW
+
+Func = TypeVar('Func', bound=Callable)
+
+
+class Histogram:
+    """Скользящее окно последних замеров времени одного таймера."""
+
+    def __init__(self, window: int) -> None:
+        self.values: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        """Добавит замер."""
+        self.values.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self) -> dict[str, float]:
+        """Вернет сводку по замерам в миллисекундах."""
+        values = sorted(self.values)
+        if not values:
+            return {'count': self.count, 'total_ms': self.total * 1000}
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'p50_ms': statistics.median(values) * 1000,
+            'p95_ms': values[int((len(values) - 1) * 0.95)] * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+
+
+class Profiler:
+    """
+    Сборщик замеров времени и счетчиков горячих участков кода.
+
+    Включается один раз при запуске. Если профилировщик выключен,
+    декоратор timed возвращает функцию без обертки, а count и record
+    сразу выходят, поэтому накладные расходы практически нулевые.
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 1000) -> None:
+        self.enabled = enabled
+        self.window = window
+        self.timers: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+
+    def timed(self, name: str) -> Callable[[Func], Func]:
+        """Декоратор, замеряющий время выполнения функции."""
+
+        def decorator(func: Func) -> Func:
+            if not self.enabled:
+                return func
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, perf_counter() - start)
+
+            return wrapper  # type: ignore
+
+        return decorator
+
+    def record(self, name: str, seconds: float) -> None:
+        """Добавит замер времени в гистограмму таймера."""
+        if not self.enabled:
+            return
+        histogram = self.timers.get(name)
+        if histogram is None:
+            histogram = self.timers[name] = Histogram(self.window)
+        histogram.add(seconds)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Увеличит счетчик."""
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict[str, dict]:
+        """Вернет сводку по всем таймерам и счетчикам."""
+        return {
+            'timers': {
+                name: histogram.summary()
+                for name, histogram in sorted(self.timers.items())
+            },
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def status_line(self) -> str:
+        """Вернет короткую строку для строки состояния окна."""
+        parts = [
+            f'{name}: {self.counters[name]}' for name in sorted(self.counters)
+        ]
+        slowest = sorted(
+            self.timers.items(), key=lambda item: item[1].total, reverse=True
+        )[:3]
+        parts.extend(
+            f'{name}: {histogram.total * 1000:.1f} мс'
+            for name, histogram in slowest
+        )
+        return ' | '.join(parts)
+
+    def dump(self, path: str | Path) -> None:
+        """Сохранит сводку в JSON-файл."""
+        Path(path).write_text(
+            json.dumps(self.summary(), ensure_ascii=False, indent=2),
+            encoding='utf-8',
+        )
+
+    def reset(self) -> None:
+        """Сбросит все замеры."""
+        self.timers.clear()
+        self.counters.clear()
+
+
+profiler = Profiler(PROFILE, PROFILE_WINDOW)
@@ -0,0 +1,394 @@
+"""
+Локальный JSON API для каталога и расчета стоимости.
+
+Запуск из папки src:
+    python -m app.server --port 8080
+    python -m app.server --load 2000 --concurrency 8
+"""
+
+import http.client
+import json
+import re
+import sqlite3
+import threading
+from argparse import ArgumentParser
+from decimal import InvalidOperation
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+
+from app.db.manager import Connector
+from app.db.repository import RepositoryDB, RepositoryStart
+from app.logic.adapter import LogicDBWindow
+from app.logic.dimension import DimensionConverter
+from app.models import RowViewOnDBTable
+from app.settings import NAME_DB
+
+ITEM_PATH = re.compile(r'^/ingredients/(\d+)$')
+
+
+def row_to_dict(row: RowViewOnDBTable) -> dict:
+    """Вернет строку каталога в виде словаря для JSON."""
+    return {
+        'id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'dimension': row.dimension,
+        'price': row.price,
+    }
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик запросов API.
+
+    Соединения держатся открытыми (HTTP/1.1 keep-alive). Список каталога
+    отдается частями (chunked) и снабжается ETag по версии каталога,
+    поэтому неизмененный каталог повторно не передается.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело пишутся отдельно: без этого keep-alive соединение
+    # ждет подтверждения TCP на каждом ответе.
+    disable_nagle_algorithm = True
+    server: 'APIServer'
+
+    @property
+    def logic(self) -> LogicDBWindow:
+        return self.server.logic
+
+    def log_message(self, format, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == '/ingredients':
+            search = parse_qs(url.query).get('search')
+            if search:
+                self.send_json(
+                    [row_to_dict(row) for row in self.logic.search(search[0])]
+                )
+            else:
+                self.send_catalog()
+            return
+        match = ITEM_PATH.match(url.path)
+        if match:
+            row = self.logic.get(int(match[1]))
+            if row is None:
+                self.send_error_json(HTTPStatus.NOT_FOUND, 'Не найдено')
+            else:
+                self.send_json(row_to_dict(row))
+            return
+        self.send_error_json(HTTPStatus.NOT_FOUND, 'Неизвестный адрес')
+
+    def do_POST(self) -> None:
+        body = self.read_json()
+        if body is None:
+            return
+        try:
+            if self.path == '/ingredients':
+                self.logic.add(
+                    name=body['name'],
+                    quantity=body.get('quantity', 1),
+                    price=body['price'],
+                    dimension=body['dimension'],
+                    description=body.get('description', ''),
+                )
+                self.send_json({}, HTTPStatus.CREATED)
+            elif self.path == '/price':
+                self.send_json(self.price(body['lines']))
+            else:
+                self.send_error_json(HTTPStatus.NOT_FOUND, 'Неизвестный адрес')
+        except sqlite3.IntegrityError:
+            self.send_error_json(HTTPStatus.CONFLICT, 'Название уже есть')
+        except InvalidOperation:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, 'Ожидается число')
+        except (KeyError, TypeError, ValueError, ArithmeticError) as error:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+
+    def do_PUT(self) -> None:
+        match = ITEM_PATH.match(self.path)
+        if not match:
+            self.send_error_json(HTTPStatus.NOT_FOUND, 'Неизвестный адрес')
+            return
+        body = self.read_json()
+        if body is None:
+            return
+        try:
+            updated = self.logic.update(
+                id_item=int(match[1]),
+                name=body['name'],
+                quantity=body.get('quantity', 1),
+                price=body['price'],
+                dimension=body['dimension'],
+                description=body.get('description', ''),
+            )
+        except sqlite3.IntegrityError:
+            self.send_error_json(HTTPStatus.CONFLICT, 'Название уже есть')
+            return
+        except InvalidOperation:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, 'Ожидается число')
+            return
+        except (KeyError, TypeError, ValueError, ArithmeticError) as error:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+            return
+        if updated:
+            self.send_json({})
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, 'Не найдено')
+
+    def do_DELETE(self) -> None:
+        match = ITEM_PATH.match(self.path)
+        if not match:
+            self.send_error_json(HTTPStatus.NOT_FOUND, 'Неизвестный адрес')
+            return
+        if self.logic.delete(int(match[1])):
+            self.send_json({})
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, 'Не найдено')
+
+    def price(self, lines: list[dict]) -> dict:
+        """
+        Посчитает стоимость рецепта. Ингредиенты читаются одним запросом,
+        размерность строки должна быть той же категории, что у записи.
+
+        Параметры:
+            lines строки вида {"id": ..., "quantity": ..., "dimension": ...}.
+        """
+        pricing = self.logic.pricing
+        rows = self.logic.get_many([line['id'] for line in lines])
+        result = []
+        total = 0
+        for line in lines:
+            row = rows.get(line['id'])
+            if row is None:
+                raise ValueError(f'Нет ингредиента с id {line["id"]}')
+            dimension = line.get('dimension', row.dimension)
+            self.logic.check_dimension(row, dimension)
+            units = self.logic.line(
+                row.price, line['quantity'], dimension, row.dimension
+            )
+            total += units
+            result.append(
+                {
+                    'id': row.id,
+                    'name': row.name,
+                    'quantity': line['quantity'],
+                    'dimension': dimension,
+                    'price': pricing.format_money(pricing.total(units)),
+                }
+            )
+        return {
+            'lines': result,
+            'total': pricing.format_money(pricing.total(total)),
+        }
+
+    def send_catalog(self) -> None:
+        """Отдаст весь каталог частями, если у клиента нет актуальной копии."""
+        repository = self.logic.repository
+        with repository.connector as cursor:
+            # Версия и строки читаются в одной транзакции, иначе запись
+            # между запросами даст ETag, не совпадающий с телом.
+            cursor.execute('BEGIN')
+            etag = f'"{repository.get_version()}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('ETag', etag)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            separator = '['
+            chunks = repository.iter_all()
+            try:
+                for rows in chunks:
+                    chunk = separator + ','.join(
+                        json.dumps(
+                            row_to_dict(self.logic.row_view(*row)),
+                            ensure_ascii=False,
+                        )
+                        for row in rows
+                    )
+                    separator = ','
+                    self.write_chunk(chunk.encode('utf-8'))
+            finally:
+                # Клиент мог отключиться на середине: курсор закрывается
+                # сразу, а не когда сборщик мусора доберется до генератора.
+                chunks.close()
+            self.write_chunk(b'[]' if separator == '[' else b']')
+            self.write_chunk(b'')
+
+    def write_chunk(self, data: bytes) -> None:
+        """Запишет одну часть ответа."""
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def read_json(self) -> dict | None:
+        """Прочитает тело запроса как JSON, при ошибке ответит 400."""
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, 'Ожидается JSON')
+            return None
+
+    def send_json(self, data, status: HTTPStatus = HTTPStatus.OK) -> None:
+        """Отправит ответ в JSON."""
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: HTTPStatus, message: str) -> None:
+        """Отправит ошибку в JSON."""
+        self.send_json({'error': message}, status)
+
+
+class APIServer(ThreadingHTTPServer):
+    """HTTP-сервер API, каждое соединение обслуживается своим потоком."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        logic: LogicDBWindow,
+        verbose: bool = False,
+    ) -> None:
+        """
+        HTTP-сервер API.
+
+        Параметры:
+            address адрес и порт;
+            logic логика работы с базой данных;
+            verbose выводить ли журнал запросов.
+        """
+        super().__init__(address, APIHandler)
+        self.logic = logic
+        self.verbose = verbose
+
+    def process_request_thread(self, request, client_address) -> None:
+        """
+        Обслужит соединение в его потоке и закроет постоянное подключение
+        к базе данных, которое поток открыл.
+        """
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.logic.repository.connector.release()
+
+
+def make_logic(name_db: str = NAME_DB) -> LogicDBWindow:
+    """
+    Вернет логику для сервера, создав или обновив таблицы каталога.
+    Подключения постоянные, свои у каждого потока, и закрываются с
+    завершением потока. Снимок каталога сервер не пишет, правила
+    оповещений не проверяет: окно выбора обновит снимок, а оповещения -
+    индекс по версии каталога.
+    """
+    connector = Connector(name_db, persistent=True)
+    RepositoryStart(connector).create_table()
+    connector.release()
+    repository = RepositoryDB(connector)
+    return LogicDBWindow(repository, DimensionConverter, RowViewOnDBTable)
+
+
+def load(
+    host: str,
+    port: int,
+    requests: int,
+    concurrency: int,
+    lines: int = 100,
+) -> float:
+    """
+    Нагрузочный генератор: каждый поток по своему keep-alive соединению
+    запрашивает расчет рецепта из lines строк. Вернет запросов в секунду.
+    """
+    connection = http.client.HTTPConnection(host, port)
+    connection.request('GET', '/ingredients')
+    catalog = json.loads(connection.getresponse().read())
+    connection.close()
+    if not catalog:
+        raise RuntimeError('Каталог пуст, считать нечего')
+    recipe = json.dumps(
+        {
+            'lines': [
+                {
+                    'id': catalog[number % len(catalog)]['id'],
+                    'quantity': number % 10 + 1,
+                }
+                for number in range(lines)
+            ]
+        }
+    ).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+
+    def worker(count: int) -> None:
+        connection = http.client.HTTPConnection(host, port)
+        for _ in range(count):
+            connection.request('POST', '/price', recipe, headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != HTTPStatus.OK:
+                raise RuntimeError(f'Ответ {response.status}')
+        connection.close()
+
+    share, rest = divmod(requests, concurrency)
+    threads = [
+        threading.Thread(target=worker, args=(share + (number < rest),))
+        for number in range(concurrency)
+    ]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return requests / (perf_counter() - start)
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='python -m app.server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db', default=NAME_DB, help='файл с БД')
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument(
+        '--load',
+        type=int,
+        metavar='N',
+        help='не запускать сервер, а отправить N запросов расчета',
+    )
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--lines', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.load:
+        rate = load(
+            args.host, args.port, args.load, args.concurrency, args.lines
+        )
+        print(f'{rate:.0f} запросов/с (рецепт из {args.lines} строк)')
+        return
+
+    server = APIServer(
+        (args.host, args.port), make_logic(args.db), args.verbose
+    )
+    print(f'API на http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import os
+
+# Файл с базой данных.
+NAME_DB = os.environ.get('CALCULATOR_DB', 'save.db')
+# Снимок каталога для быстрого открытия окна выбора ингредиента.
+SNAPSHOT = os.environ.get(
+    'CALCULATOR_SNAPSHOT', f'{os.path.splitext(NAME_DB)[0]}.catalog'
+)
+# Список открытых каталогов (название, файл БД) и активный каталог.
+CATALOGS = os.environ.get(
+    'CALCULATOR_CATALOGS', f'{os.path.splitext(NAME_DB)[0]}.catalogs.json'
+)
+# Название каталога из NAME_DB, который открыт всегда.
+DEFAULT_CATALOG = 'Основной'
+# Папка резервных копий каталогов, сколько последних копий хранить,
+# сколько страниц БД копировать за шаг и уровень сжатия gzip.
+BACKUPS = os.environ.get(
+    'CALCULATOR_BACKUPS', f'{os.path.splitext(NAME_DB)[0]}.backups'
+)
+BACKUP_KEEP = int(os.environ.get('CALCULATOR_BACKUP_KEEP', '10'))
+BACKUP_PAGES = 1024
+BACKUP_COMPRESSION = 6
+# Журнал автосохранения рабочей сметы; сбрасывать ли каждую запись на
+# диск и сколько записей допускать без уплотнения.
+AUTOSAVE = os.environ.get(
+    'CALCULATOR_AUTOSAVE', f'{os.path.splitext(NAME_DB)[0]}.journal'
+)
+AUTOSAVE_SYNC = True
+AUTOSAVE_COMPACT_MIN = 1000
+# Округление стоимости: half_up или half_even (банковское), и что
+# округлять: каждую строку (line) или только итог сметы (total).
+PRICE_ROUNDING = os.environ.get('CALCULATOR_ROUNDING', 'half_up')
+PRICE_POLICY = os.environ.get('CALCULATOR_PRICE_POLICY', 'line')
+# Объединять строки сметы одного ингредиента при добавлении.
+CONSOLIDATE = bool(os.environ.get('CALCULATOR_CONSOLIDATE'))
+# Прогрев активного каталога после показа главного окна: включен ли он,
+# через сколько миллисекунд начинается и по сколько записей строит за
+# один шаг.
+WARM_UP = os.environ.get('CALCULATOR_WARM_UP', '1') != '0'
+WARM_UP_DELAY = 500
+WARM_UP_CHUNK = 1000
+# Размер кэша подготовленных инструкций постоянного подключения к БД.
+CACHED_STATEMENTS = 128
+# Отложенная запись каталога: после скольких изменений и через сколько
+# секунд после первого из них очередь записывается одной транзакцией.
+# Изменения, не успевшие попасть в базу, при падении программы теряются.
+WRITE_BEHIND_SIZE = 500
+WRITE_BEHIND_DELAY = 1.0
+# За сколько дней вес выбора ингредиента в окне выбора уменьшается вдвое.
+USAGE_HALF_LIFE_DAYS = 14
+# Строки сметы хранятся частями по ESTIMATE_CHUNK_SIZE; сверх
+# ESTIMATE_SPILL_ROWS строк давно не использованные части выгружаются
+# во временную таблицу SQLite.
+ESTIMATE_CHUNK_SIZE = 1024
+ESTIMATE_SPILL_ROWS = 200_000
+
+# Включает сбор замеров времени и счетчиков (см. app.profiler).
+PROFILE = bool(os.environ.get('CALCULATOR_PROFILE'))
+# Файл, в который сбрасываются собранные замеры.
+PROFILE_DUMP = os.environ.get('CALCULATOR_PROFILE_DUMP', 'profile.json')
+# Сколько последних замеров хранить для каждого таймера.
+PROFILE_WINDOW = int(os.environ.get('CALCULATOR_PROFILE_WINDOW', '1000'))
+
+# Порог медленной SQL-инструкции в миллисекундах, без него журнал выключен.
+SLOW_QUERY_MS = (
+    float(os.environ['CALCULATOR_SLOW_QUERY_MS'])
+    if os.environ.get('CALCULATOR_SLOW_QUERY_MS')
+    else None
+)
+# Файл журнала медленных инструкций и параметры его ротации.
+SLOW_QUERY_LOG = os.environ.get('CALCULATOR_SLOW_QUERY_LOG', 'slow_query.log')
+SLOW_QUERY_MAX_BYTES = 1_000_000
+SLOW_QUERY_BACKUPS = 3
@@ -151,6 +151,9 @@ class AddRowWindow(BaseRowWindow):
     def perform_action(self, item: 'RowViewOnMainTable') -> None:
         """Выполнить действие окна."""
         self.logic_for_main.add(item)
+        # Частота выбора учитывается только при добавлении строки:
+        # правка количества в уже добавленной строке - не выбор.
+        self.logic_for_db.register_usage(item.id)
 
 
 class UpdateRowWindow(BaseRowWindow):
@@ -237,6 +240,8 @@ class WindowChoiceItem(QDialog):
 
         layout_left.addRow('', self.table_view)
 
+        self.button_all = QPushButton('Весь каталог')
+        self.button_all.clicked.connect(self.load_all)
         buttons = [
             ('Добавить', self.get_item),
             ('Выйти', self.reject),
@@ -246,6 +251,7 @@ class WindowChoiceItem(QDialog):
             button = QPushButton(name)
             button.clicked.connect(func)
             layout_right.addRow('', button)
+        layout_right.addRow('', self.button_all)
 
         main_layout.addLayout(layout_left)
         main_layout.addLayout(layout_right)
@@ -255,8 +261,28 @@ class WindowChoiceItem(QDialog):
         self.exec()
 
     def load_data(self) -> None:
-        """Обновление данных в таблице окна."""
-        data = self.logic_for_db.get_all()
+        """
+        Покажет часто и недавно выбираемые ингредиенты, а если их еще нет,
+        весь каталог.
+        """
+        favorites = self.logic_for_db.get_favorites()
+        if not favorites:
+            self.load_all()
+            return
+        self.setWindowTitle('Выбор ингредиента: часто используемые')
+        self.set_data(favorites)
+
+    def load_all(self) -> None:
+        """Покажет весь каталог."""
+        data = self.logic_for_db.get_snapshot()
+        if data is None:
+            data = self.logic_for_db.get_all()
+        self.setWindowTitle('Выбор ингредиента')
+        self.button_all.setEnabled(False)
+        self.set_data(data)
+
+    def set_data(self, data) -> None:
+        """Заполнит таблицу окна."""
         model = self.model_for_db(data)
         self.table_view.setModel(model)
         self.table_view.hideColumn(0)
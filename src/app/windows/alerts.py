@@ -0,0 +1,125 @@
+from typing import TYPE_CHECKING
+
+from PyQt6.QtWidgets import (
+    QDialog,
+    QFormLayout,
+    QHBoxLayout,
+    QInputDialog,
+    QLabel,
+    QListWidget,
+    QMessageBox,
+    QPushButton,
+    QWidget,
+)
+
+from app.logic.alerts import BUDGET, PRICE
+
+if TYPE_CHECKING:
+    from app.logic.alerts import AlertEngine
+
+
+class AlertsWindow(QDialog):
+    """Окно оповещений и правил активного каталога."""
+
+    def __init__(self, parent: QWidget, alerts: 'AlertEngine'):
+        super().__init__(parent)
+        self.alerts = alerts
+        self.initUI()
+
+    def initUI(self):
+        """Инициация пользовательского интерфейса."""
+        self.setWindowTitle('Оповещения')
+        self.setGeometry(320, 420, 700, 500)
+
+        main_layout = QHBoxLayout()
+        layout_left = QFormLayout()
+        layout_right = QFormLayout()
+
+        self.list_alerts = QListWidget()
+        layout_left.addRow(QLabel('Сработали:'))
+        layout_left.addRow('', self.list_alerts)
+        self.list_rules = QListWidget()
+        layout_left.addRow(QLabel('Правила:'))
+        layout_left.addRow('', self.list_rules)
+
+        buttons = [
+            ('Принять цену', self.acknowledge),
+            ('Бюджет сметы', self.add_budget),
+            ('Удалить правило', self.delete_rule),
+            ('Выйти', self.reject),
+        ]
+
+        for name, func in buttons:
+            button = QPushButton(name)
+            button.clicked.connect(func)
+            layout_right.addRow('', button)
+
+        main_layout.addLayout(layout_left)
+        main_layout.addLayout(layout_right)
+        self.setLayout(main_layout)
+
+        self.load_data()
+        self.exec()
+
+    def load_data(self):
+        """Обновит списки оповещений и правил."""
+        self.current_alerts = self.alerts.get_alerts()
+        self.list_alerts.clear()
+        self.list_alerts.addItems(list(map(str, self.current_alerts)))
+        self.rules = self.alerts.get_rules()
+        self.list_rules.clear()
+        self.list_rules.addItems([text for _, _, text in self.rules])
+
+    def acknowledge(self):
+        """Примет новую цену выбранного оповещения за исходную."""
+        row = self.list_alerts.currentRow()
+        if row < 0:
+            return
+        alert = self.current_alerts[row]
+        if alert.kind != PRICE:
+            QMessageBox.information(
+                self,
+                'Оповещения',
+                'Оповещение о бюджете пропадет, когда смета станет '
+                'дешевле бюджета или бюджет будет изменен.',
+            )
+            return
+        self.alerts.acknowledge(alert.id)
+        self.load_data()
+
+    def add_budget(self):
+        """Задаст бюджет сохраненной сметы."""
+        estimates = self.alerts.get_estimates()
+        if not estimates:
+            QMessageBox.information(self, 'Оповещения', 'Нет сохраненных смет')
+            return
+        names = [f'{name} (№{id})' for id, name in estimates]
+        name, ok = QInputDialog.getItem(
+            self, 'Бюджет сметы', 'Смета:', names, editable=False
+        )
+        if not ok:
+            return
+        estimate_id = estimates[names.index(name)][0]
+        budget, ok = QInputDialog.getDouble(
+            self, 'Бюджет сметы', 'Бюджет, руб.:', 1000, 0.01, 1e9, 2
+        )
+        if not ok:
+            return
+        try:
+            self.alerts.add_budget_rule(estimate_id, f'{budget:.2f}')
+        except ValueError as error:
+            QMessageBox.warning(self, 'Оповещения', str(error))
+            return
+        self.load_data()
+
+    def delete_rule(self):
+        """Удалит выбранное правило."""
+        row = self.list_rules.currentRow()
+        if row < 0:
+            return
+        kind, id, _ = self.rules[row]
+        if kind == BUDGET:
+            self.alerts.delete_budget_rule(id)
+        else:
+            self.alerts.delete_price_rule(id)
+        self.load_data()
@@ -0,0 +1,172 @@
+import os
+from typing import TYPE_CHECKING
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import (
+    QDialog,
+    QFormLayout,
+    QHBoxLayout,
+    QLabel,
+    QListWidget,
+    QMessageBox,
+    QProgressBar,
+    QPushButton,
+    QWidget,
+)
+
+from app.db.backup import BackupTask
+
+if TYPE_CHECKING:
+    from app.logic.catalogs import Catalog
+
+
+class BackupWindow(QDialog):
+    """Окно резервных копий активного каталога."""
+
+    def __init__(self, parent: QWidget, catalog: 'Catalog'):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.task: BackupTask | None = None
+        self.finish = None
+        self.initUI()
+
+    def initUI(self):
+        """Инициация пользовательского интерфейса."""
+        self.setWindowTitle(f'Резервные копии: {self.catalog.name}')
+        self.setGeometry(320, 420, 600, 400)
+
+        main_layout = QHBoxLayout()
+        layout_left = QFormLayout()
+        layout_right = QFormLayout()
+
+        self.list_backups = QListWidget()
+        layout_left.addRow('', self.list_backups)
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 100)
+        layout_left.addRow('', self.progress)
+        self.label = QLabel()
+        layout_left.addRow('', self.label)
+
+        self.button_backup = QPushButton('Создать копию')
+        self.button_backup.clicked.connect(self.backup)
+        layout_right.addRow('', self.button_backup)
+
+        self.button_restore = QPushButton('Восстановить')
+        self.button_restore.clicked.connect(self.restore)
+        layout_right.addRow('', self.button_restore)
+
+        self.button_cancel = QPushButton('Прервать')
+        self.button_cancel.clicked.connect(self.cancel)
+        self.button_cancel.setEnabled(False)
+        layout_right.addRow('', self.button_cancel)
+
+        button_exit = QPushButton('Выйти')
+        button_exit.clicked.connect(self.reject)
+        layout_right.addRow('', button_exit)
+
+        main_layout.addLayout(layout_left)
+        main_layout.addLayout(layout_right)
+        self.setLayout(main_layout)
+
+        # Ход фоновой работы окно узнает опросом, а не из ее потока.
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_progress)
+
+        self.load_data()
+        self.exec()
+
+    def load_data(self):
+        """Обновит список копий каталога."""
+        self.list_backups.clear()
+        for path in self.catalog.backups.get_backups():
+            size = os.path.getsize(path) / (1 << 20)
+            self.list_backups.addItem(
+                f'{os.path.basename(path)} ({size:.1f} МБ)'
+            )
+        if self.list_backups.count():
+            self.list_backups.setCurrentRow(0)
+
+    def backup(self):
+        """Начнет снимать копию каталога в фоне."""
+        self.start(self.catalog.start_backup(), 'Копирование...')
+
+    def restore(self):
+        """Начнет восстанавливать каталог из выбранной копии в фоне."""
+        row = self.list_backups.currentRow()
+        if row < 0:
+            return
+        path = self.catalog.backups.get_backups()[row]
+        answer = QMessageBox.question(
+            self,
+            'Восстановление',
+            f'Заменить каталог "{self.catalog.name}" копией '
+            f'{os.path.basename(path)}?',
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+        )
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self.start(
+            self.catalog.start_restore(path),
+            'Восстановление...',
+            self.catalog.finish_restore,
+        )
+
+    def start(self, task: BackupTask, text: str, finish=None):
+        """
+        Будет показывать ход фоновой работы. finish вызывается в потоке
+        окна, когда работа закончится.
+        """
+        self.task = task
+        self.finish = finish
+        self.set_running(True)
+        self.label.setText(text)
+        self.timer.start(100)
+
+    def cancel(self):
+        """Прервет фоновую работу."""
+        if self.task is not None:
+            self.task.cancel()
+
+    def update_progress(self):
+        """Покажет ход фоновой работы и ее итог."""
+        task = self.task
+        self.progress.setValue(int(task.progress * 100))
+        if not task.done:
+            return
+        self.timer.stop()
+        self.end_task()
+        self.set_running(False)
+        if task.cancelled:
+            self.label.setText('Прервано')
+        elif task.error is not None:
+            self.label.setText('Ошибка')
+            QMessageBox.warning(self, 'Резервные копии', str(task.error))
+        else:
+            self.progress.setValue(100)
+            self.label.setText('Готово')
+        self.load_data()
+
+    def set_running(self, running: bool):
+        """Включит или выключит кнопки на время фоновой работы."""
+        self.button_backup.setEnabled(not running)
+        self.button_restore.setEnabled(not running)
+        self.button_cancel.setEnabled(running)
+
+    def reject(self):
+        """Закроет окно, прервав и дождавшись фоновой работы."""
+        if self.task is not None:
+            self.task.cancel()
+            self.timer.stop()
+            try:
+                self.task.wait()
+            except Exception:
+                pass
+            self.end_task()
+        super().reject()
+
+    def end_task(self):
+        """Завершит законченную фоновую работу."""
+        task, self.task = self.task, None
+        if self.finish is not None:
+            self.finish(task)
+            self.finish = None
@@ -0,0 +1,88 @@
+from typing import TYPE_CHECKING
+
+from PyQt6.QtWidgets import (
+    QCheckBox,
+    QComboBox,
+    QDialog,
+    QFormLayout,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QPushButton,
+    QTableView,
+    QWidget,
+)
+
+from app.models import ViewOnReportTableModels
+
+if TYPE_CHECKING:
+    from app.logic.catalogs import CatalogManager
+
+
+class CompareWindow(QDialog):
+    """Окно сравнения цен одного каталога с остальными."""
+
+    def __init__(
+        self,
+        parent: QWidget,
+        catalogs: 'CatalogManager',
+    ):
+        super().__init__(parent)
+        self.catalogs = catalogs
+        self.initUI()
+
+    def initUI(self):
+        """Инициация пользовательского интерфейса."""
+        self.setWindowTitle('Сравнение цен')
+        self.setGeometry(320, 420, 800, 500)
+
+        main_layout = QHBoxLayout()
+        layout_left = QFormLayout()
+        layout_right = QFormLayout()
+
+        self.table_view = QTableView()
+        self.table_view.setAlternatingRowColors(True)
+        header = self.table_view.horizontalHeader()
+        header.setFixedHeight(40)
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout_left.addRow('', self.table_view)
+
+        self.catalog_input = QComboBox()
+        self.catalog_input.addItems(self.catalogs.get_names())
+        self.catalog_input.setCurrentText(self.catalogs.active.name)
+        self.catalog_input.currentIndexChanged.connect(self.load_data)
+        layout_right.addRow('Каталог:', self.catalog_input)
+
+        self.common_input = QCheckBox('Только общие')
+        self.common_input.setChecked(True)
+        self.common_input.stateChanged.connect(self.load_data)
+        layout_right.addRow('', self.common_input)
+
+        self.label = QLabel()
+        layout_right.addRow('', self.label)
+
+        button_exit = QPushButton('Выйти')
+        button_exit.clicked.connect(self.reject)
+        layout_right.addRow('', button_exit)
+
+        main_layout.addLayout(layout_left)
+        main_layout.addLayout(layout_right)
+        self.setLayout(main_layout)
+
+        self.load_data()
+        self.exec()
+
+    def load_data(self):
+        """Сравнит выбранный каталог с остальными и покажет результат."""
+        base = self.catalog_input.currentText()
+        names = [base] + [
+            name for name in self.catalogs.get_names() if name != base
+        ]
+        report = self.catalogs.compare_prices(
+            names, self.common_input.isChecked()
+        )
+        self.table_view.setModel(ViewOnReportTableModels(report))
+        if len(names) < 2:
+            self.label.setText('Откройте еще один каталог')
+        else:
+            self.label.setText('' if report.rows else 'Нет общих записей')
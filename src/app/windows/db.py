@@ -1,3 +1,4 @@
+import csv
 from abc import abstractmethod
 from typing import TYPE_CHECKING, Union
 
@@ -7,9 +8,11 @@ from PyQt6.QtWidgets import (
     QDialog,
     QDialogButtonBox,
     QDoubleSpinBox,
+    QFileDialog,
     QFormLayout,
     QHBoxLayout,
     QHeaderView,
+    QInputDialog,
     QLineEdit,
     QMessageBox,
     QPushButton,
@@ -51,7 +54,7 @@ class DBWindow(QDialog):
             QTableView.SelectionBehavior.SelectRows
         )
         self.table_view.setSelectionMode(
-            QTableView.SelectionMode.SingleSelection
+            QTableView.SelectionMode.ExtendedSelection
         )
         self.table_view.setAlternatingRowColors(True)
         header = self.table_view.horizontalHeader()
@@ -65,6 +68,10 @@ class DBWindow(QDialog):
             ('Добавить', self.add_item),
             ('Изменить', self.update_item),
             ('Удалить', self.delete_item),
+            ('Цена, %', self.reprice_items),
+            ('Размерность', self.change_dimension_items),
+            ('Прайс-лист', self.reconcile_price_list),
+            ('Следить за ценой', self.watch_items),
             ('Выйти', self.reject),
         ]
 
@@ -101,12 +108,13 @@ class DBWindow(QDialog):
 
         self.db_add_window = DBUpdateWindow(self, self.logic_for_db, row)
         self.load_data()
+        self.show_alerts()
 
     def delete_item(self):
-        """Откроет окно для удаления строки из базы данных."""
-        row = self.get_selected_row()
+        """Откроет окно для удаления выделенных строк из базы данных."""
+        indexes, rows = self.get_selected_rows()
 
-        if row is None:
+        if not rows:
             return
 
         btn_accept = QPushButton('Да')
@@ -115,14 +123,166 @@ class DBWindow(QDialog):
         message_box = QMessageBox(self)
         message_box.setIcon(QMessageBox.Icon.Question)
         message_box.setWindowTitle('Подтверждение')
-        message_box.setText(f'Удалить {row}?')
+        if len(rows) == 1:
+            message_box.setText(f'Удалить {rows[0]}?')
+        else:
+            message_box.setText(f'Удалить выделенные записи ({len(rows)})?')
         message_box.addButton(btn_accept, QMessageBox.ButtonRole.AcceptRole)
         message_box.addButton(btn_reject, QMessageBox.ButtonRole.RejectRole)
         message_box.exec()
 
         if message_box.clickedButton() == btn_accept:
-            self.logic_for_db.delete(row.id)
-            self.load_data()
+            self.logic_for_db.delete_many([row.id for row in rows])
+            self.table_view.model().remove_rows(indexes)
+            self.show_alerts()
+
+    def reprice_items(self):
+        """Изменит цену выделенных строк на заданный процент."""
+        indexes, rows = self.get_selected_rows()
+
+        if not rows:
+            return
+
+        percent, ok = QInputDialog.getDouble(
+            self,
+            'Изменить цену',
+            f'Изменение цены выделенных записей ({len(rows)}), %:',
+            0,
+            -99.99,
+            10_000,
+            2,
+        )
+        if not ok or percent == 0:
+            return
+
+        new_rows = self.logic_for_db.reprice(rows, percent)
+        self.table_view.model().replace_rows(indexes, new_rows)
+        self.show_alerts()
+
+    def change_dimension_items(self):
+        """Сменит размерность выделенных строк."""
+        indexes, rows = self.get_selected_rows()
+
+        if not rows:
+            return
+
+        # Цену можно пересчитать только в единицу той же категории.
+        dimension_converter = self.logic_for_db.dimension
+        categories = dimension_converter.get_categories()
+        if len({categories.get(row.dimension) for row in rows}) > 1:
+            QMessageBox.warning(
+                self,
+                'Изменить размерность',
+                'Выделены записи с размерностями разных категорий.',
+            )
+            return
+
+        dimension, ok = QInputDialog.getItem(
+            self,
+            'Изменить размерность',
+            f'Размерность выделенных записей ({len(rows)}):',
+            dimension_converter.get_dimensions_same_category(rows[0].dimension)
+            or [rows[0].dimension],
+            editable=False,
+        )
+        if not ok:
+            return
+
+        new_rows = self.logic_for_db.change_dimension(rows, dimension)
+        self.table_view.model().replace_rows(indexes, new_rows)
+        self.show_alerts()
+
+    def reconcile_price_list(self):
+        """Сверит каталог с прайс-листом и применит изменения."""
+        path, _ = QFileDialog.getOpenFileName(
+            self, 'Прайс-лист', '', 'CSV (*.csv);;Все файлы (*)'
+        )
+        if not path:
+            return
+
+        try:
+            reconciler = self.logic_for_db.reconcile_price_list(path)
+        except (OSError, KeyError, ValueError, csv.Error) as error:
+            QMessageBox.warning(
+                self, 'Ошибка', f'Не удалось прочитать прайс-лист: {error}'
+            )
+            return
+
+        try:
+            summary = reconciler.summary()
+            if not any(summary.values()):
+                QMessageBox.information(
+                    self, 'Прайс-лист', 'Каталог совпадает с прайс-листом.'
+                )
+                return
+
+            btn_accept = QPushButton('Да')
+            btn_reject = QPushButton('Нет')
+
+            message_box = QMessageBox(self)
+            message_box.setIcon(QMessageBox.Icon.Question)
+            message_box.setWindowTitle('Прайс-лист')
+            message_box.setText(
+                f'Новых записей: {summary["added"]}\n'
+                f'Изменилась цена: {summary["price"]}\n'
+                f'Изменилась размерность: {summary["unit"]}\n'
+                f'Нет в прайс-листе (не удаляются): {summary["removed"]}\n'
+                'Применить изменения?'
+            )
+            lines = []
+            for change in reconciler.changes(limit=500):
+                _, _, _, name, _, price, dimension, *old, accepted = change
+                if accepted:
+                    was = f'{old[0]} {old[1]} -> ' if old[0] else ''
+                    lines.append(f'{name}: {was}{price} {dimension}')
+            message_box.setDetailedText('\n'.join(lines))
+            message_box.addButton(
+                btn_accept, QMessageBox.ButtonRole.AcceptRole
+            )
+            message_box.addButton(
+                btn_reject, QMessageBox.ButtonRole.RejectRole
+            )
+            message_box.exec()
+
+            if message_box.clickedButton() == btn_accept:
+                try:
+                    self.logic_for_db.apply_price_list(reconciler)
+                except RuntimeError as error:
+                    QMessageBox.warning(self, 'Ошибка', str(error))
+                self.load_data()
+                self.show_alerts()
+        finally:
+            reconciler.close()
+
+    def watch_items(self):
+        """Начнет следить за ценой выделенных строк."""
+        _, rows = self.get_selected_rows()
+
+        if not rows:
+            return
+
+        percent, ok = QInputDialog.getDouble(
+            self,
+            'Следить за ценой',
+            f'Оповестить, если цена выделенных записей ({len(rows)}) '
+            'изменится больше чем на, %:',
+            10,
+            0.01,
+            10_000,
+            2,
+        )
+        if not ok:
+            return
+
+        self.logic_for_db.watch_prices([row.id for row in rows], percent)
+
+    def show_alerts(self):
+        """Покажет оповещения, которые сработали после изменения."""
+        alerts = self.logic_for_db.take_alerts()
+        if alerts:
+            QMessageBox.warning(
+                self, 'Оповещения', '\n'.join(map(str, alerts))
+            )
 
     def get_selected_row(self) -> Union['RowViewOnDBTable', None]:
         """Вернет выделенную строку из таблицы (модель)."""
@@ -133,6 +293,17 @@ class DBWindow(QDialog):
             return model.get_row(index_row)
         return None
 
+    def get_selected_rows(
+        self,
+    ) -> tuple[list[int], list['RowViewOnDBTable']]:
+        """Вернет индексы и строки всех выделенных строк таблицы."""
+        model = self.table_view.model()
+        indexes = sorted(
+            index.row()
+            for index in self.table_view.selectionModel().selectedRows()
+        )
+        return indexes, [model.get_row(index) for index in indexes]
+
 
 class BaseDBDialogWindow(QDialog):
     """База для диалогового окна."""
@@ -218,6 +389,46 @@ class BaseDBDialogWindow(QDialog):
             return False
         return True
 
+    def validate_name(self, id: int | None = None) -> bool:
+        """
+        Проверит, что в базе нет такого же названия, и переспросит, если
+        есть похожие.
+
+        Параметры:
+            id id изменяемой записи, она сама дубликатом не считается.
+        """
+        name = self.name_input.text()
+        duplicate = self.logic_for_db.find_duplicate(name)
+        if duplicate is not None and duplicate.id != id:
+            QMessageBox.warning(
+                self,
+                'Ошибка',
+                f'{duplicate} уже есть в базе данных!',
+            )
+            return False
+
+        similar = [
+            row for row in self.logic_for_db.find_similar(name) if row.id != id
+        ]
+        if not similar:
+            return True
+
+        btn_accept = QPushButton('Да')
+        btn_reject = QPushButton('Нет')
+
+        message_box = QMessageBox(self)
+        message_box.setIcon(QMessageBox.Icon.Question)
+        message_box.setWindowTitle('Похожие названия')
+        message_box.setText(
+            'В базе данных есть похожие записи: '
+            + ', '.join(str(row) for row in similar)
+            + '. Всё равно сохранить?'
+        )
+        message_box.addButton(btn_accept, QMessageBox.ButtonRole.AcceptRole)
+        message_box.addButton(btn_reject, QMessageBox.ButtonRole.RejectRole)
+        message_box.exec()
+        return message_box.clickedButton() == btn_accept
+
 
 class DBAddWindow(BaseDBDialogWindow):
     """Окно добавления ингредиента в базу данных."""
@@ -234,7 +445,7 @@ class DBAddWindow(BaseDBDialogWindow):
 
     def create_item(self):
         """Добавит запись в базу данных."""
-        if not self.validate_form():
+        if not self.validate_form() or not self.validate_name():
             return
 
         self.logic_for_db.add(
@@ -287,6 +498,10 @@ class DBUpdateWindow(BaseDBDialogWindow):
         """Изменит запись в базе данных."""
         if not self.validate_form():
             return
+        if self.name_input.text() != self.row.name and not self.validate_name(
+            self.id_item
+        ):
+            return
 
         self.logic_for_db.update(
             id_item=self.id_item,
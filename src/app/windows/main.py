@@ -1,35 +1,66 @@
-from PyQt6.QtCore import Qt
+from sqlite3 import DatabaseError
+from typing import Iterator
+
+from PyQt6.QtCore import QEvent, Qt, QTimer
+from PyQt6.QtGui import QKeySequence, QShortcut
 from PyQt6.QtWidgets import (
+    QCheckBox,
+    QComboBox,
+    QFileDialog,
     QFormLayout,
     QHBoxLayout,
     QHeaderView,
+    QInputDialog,
     QLabel,
     QMainWindow,
+    QMessageBox,
     QPushButton,
     QTableView,
     QVBoxLayout,
     QWidget,
 )
 
-from app.logic.adapter import LogicMainWindow, logic_db_window
+from app.db.journal import EstimateJournal
+from app.logic.adapter import LogicMainWindow
+from app.logic.catalogs import CatalogManager
+from app.logic.dimension import UNIT_SETS
 from app.models import (
     RowViewOnDBTable,
     RowViewOnMainTable,
     ViewOnDBTableModels,
     ViewOnMainTableModels,
 )
+from app.profiler import profiler
+from app.settings import PROFILE_DUMP, WARM_UP, WARM_UP_DELAY
 
 from .add_or_update import AddRowWindow, UpdateRowWindow
+from .alerts import AlertsWindow
+from .backup import BackupWindow
+from .compare import CompareWindow
 from .db import DBWindow
+from .report import ReportWindow
 
 
 class MainWindow(QMainWindow):
     """Главное окно программы."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        catalogs: CatalogManager,
+        journal: EstimateJournal | None = None,
+    ):
+        """
+        Главное окно программы.
+
+        Параметры:
+            catalogs открытые каталоги, окна работают с активным;
+            journal журнал автосохранения, из него восстанавливается смета
+                прошлого сеанса.
+        """
         super(MainWindow, self).__init__()
-        self.logic_for_main = LogicMainWindow()
-        self.logic_for_db = logic_db_window
+        self.catalogs = catalogs
+        self.logic_for_main = LogicMainWindow(self.logic_for_db, journal)
+        self.logic_for_main.restore()
         self.model_for_main = ViewOnMainTableModels
         self.model_for_db = ViewOnDBTableModels
         self.row_for_main = RowViewOnMainTable
@@ -38,6 +69,18 @@ class MainWindow(QMainWindow):
         self.initUI()
         self.load_data()
 
+        # Прогрев каталога идет шагами, когда очередь событий пуста, и
+        # начинается после первой отрисовки окна.
+        self.warm_up: Iterator[str] | None = None
+        self.warm_up_timer = QTimer(self)
+        self.warm_up_timer.timeout.connect(self.warm_up_step)
+        QTimer.singleShot(WARM_UP_DELAY, self.start_warm_up)
+
+    @property
+    def logic_for_db(self):
+        """Логика базы данных активного каталога."""
+        return self.catalogs.active.logic_db
+
     def initUI(self):
         """Инициация пользовательского интерфейса."""
         self.setWindowTitle('Калькулятор для Мамы')
@@ -56,7 +99,7 @@ class MainWindow(QMainWindow):
             QTableView.SelectionBehavior.SelectRows
         )
         self.table_view.setSelectionMode(
-            QTableView.SelectionMode.SingleSelection
+            QTableView.SelectionMode.ExtendedSelection
         )
         self.table_view.setAlternatingRowColors(True)
         header = self.table_view.horizontalHeader()
@@ -72,6 +115,9 @@ class MainWindow(QMainWindow):
             ('Изменить', self.update_item),
             ('Удалить', self.delete_item),
             ('Очистить', self.remove_items),
+            ('Масштаб', self.scale_items),
+            ('Единицы', self.convert_units),
+            ('Объединить', self.consolidate_items),
         ]
 
         for name, func in buttons:
@@ -79,6 +125,14 @@ class MainWindow(QMainWindow):
             button.clicked.connect(func)
             layout_right_top.addRow('', button)
 
+        self.consolidate_input = QCheckBox('Объединять')
+        self.consolidate_input.setToolTip(
+            'Прибавлять ингредиент к его строке, а не добавлять новую'
+        )
+        self.consolidate_input.setChecked(self.logic_for_main.consolidate)
+        self.consolidate_input.toggled.connect(self.set_consolidate)
+        layout_right_top.addRow('', self.consolidate_input)
+
         self.label = QLabel()
         self.label.setAlignment(
             Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
@@ -88,17 +142,122 @@ class MainWindow(QMainWindow):
         top_layout.addLayout(layout_left_top)
         top_layout.addLayout(layout_right_top)
 
+        self.catalog_input = QComboBox()
+        self.catalog_input.addItems(self.catalogs.get_names())
+        self.catalog_input.setCurrentText(self.catalogs.active.name)
+        self.catalog_input.activated.connect(self.switch_catalog)
+        bot_layout.addWidget(QLabel('Каталог:'))
+        bot_layout.addWidget(self.catalog_input)
+
+        button_catalog = QPushButton('Открыть каталог')
+        button_catalog.clicked.connect(self.open_catalog)
+        bot_layout.addWidget(button_catalog)
+
+        button_compare = QPushButton('Сравнить цены')
+        button_compare.clicked.connect(self.open_window_compare)
+        bot_layout.addWidget(button_compare)
+
+        button_backup = QPushButton('Резервные копии')
+        button_backup.clicked.connect(self.open_window_backup)
+        bot_layout.addWidget(button_backup)
+
+        self.button_alerts = QPushButton('Оповещения')
+        self.button_alerts.clicked.connect(self.open_window_alerts)
+        bot_layout.addWidget(self.button_alerts)
+
+        bot_layout.addStretch()
+        button_report = QPushButton('Отчеты')
+        button_report.clicked.connect(self.open_window_report)
+        bot_layout.addWidget(button_report)
+
         button_db = QPushButton('База данных')
         button_db.clicked.connect(self.open_window_db)
-        bot_layout.addWidget(button_db, alignment=Qt.AlignmentFlag.AlignRight)
+        bot_layout.addWidget(button_db)
 
         main_layout.addLayout(top_layout)
         main_layout.addLayout(bot_layout)
 
         central_widget.setLayout(main_layout)
 
+        if profiler.enabled:
+            self.init_profiler_bar()
+
         self.show()
 
+    def init_profiler_bar(self):
+        """Инициация строки состояния с замерами профилировщика."""
+        self.table_view.viewport().installEventFilter(self)
+        self.profiler_timer = QTimer(self)
+        self.profiler_timer.timeout.connect(self.update_profiler_bar)
+        self.profiler_timer.start(1000)
+        shortcut = QShortcut(QKeySequence('Ctrl+Shift+D'), self)
+        shortcut.activated.connect(self.dump_profiler)
+
+    def update_profiler_bar(self):
+        """Обновит строку состояния с замерами профилировщика."""
+        self.statusBar().showMessage(profiler.status_line())
+
+    def dump_profiler(self):
+        """Сохранит замеры профилировщика в файл."""
+        profiler.dump(PROFILE_DUMP)
+        self.statusBar().showMessage(f'Замеры сохранены в {PROFILE_DUMP}')
+
+    def eventFilter(self, obj, event):
+        """Посчитает перерисовки таблицы окна."""
+        if event.type() == QEvent.Type.Paint:
+            profiler.count('qt.paint')
+        return super().eventFilter(obj, event)
+
+    def closeEvent(self, event):
+        """Прервет прогрев и сбросит отложенные записи при закрытии окна."""
+        self.stop_warm_up()
+        for catalog in self.catalogs.catalogs.values():
+            catalog.repository.flush()
+        super().closeEvent(event)
+
+    def start_warm_up(self):
+        """Начнет прогрев активного каталога заново."""
+        self.stop_warm_up()
+        if not WARM_UP:
+            self.update_alerts()
+            return
+        self.warm_up = self.logic_for_db.warm_up()
+        # Таймер с нулевым интервалом срабатывает, только когда нет
+        # других событий: ввод пользователя обрабатывается между шагами.
+        self.warm_up_timer.start(0)
+
+    def warm_up_step(self):
+        """Выполнит один шаг прогрева."""
+        try:
+            next(self.warm_up)
+        except StopIteration:
+            self.stop_warm_up()
+            self.update_alerts()
+        except (DatabaseError, OSError):
+            # Прогрев необязателен: база занята, например восстановлением.
+            self.stop_warm_up()
+
+    def stop_warm_up(self):
+        """Прервет прогрев каталога."""
+        self.warm_up_timer.stop()
+        if self.warm_up is not None:
+            self.warm_up.close()
+            self.warm_up = None
+
+    def update_alerts(self):
+        """
+        Покажет новые оповещения активного каталога и число сработавших
+        правил на кнопке.
+        """
+        alerts = self.catalogs.active.alerts
+        fired = alerts.take_fired()
+        count = len(alerts.get_alerts())
+        self.button_alerts.setText(
+            f'Оповещения ({count})' if count else 'Оповещения'
+        )
+        if fired:
+            QMessageBox.warning(self, 'Оповещения', '\n'.join(map(str, fired)))
+
     def load_data(self):
         """Обновление данных в таблице окна."""
         data = self.logic_for_main.get_all()
@@ -141,14 +300,58 @@ class MainWindow(QMainWindow):
         self.load_data()
 
     def delete_item(self):
-        """Удалит элемент из таблицы окна."""
-        index = self.get_index_selected_row()
+        """Удалит выделенные элементы из таблицы окна."""
+        indexes = self.get_indexes_selected_rows()
 
-        if index is None:
+        if not indexes:
             return
 
-        self.logic_for_main.delete(index)
-        self.load_data()
+        self.table_view.model().remove_rows(
+            indexes, self.logic_for_main.delete_range
+        )
+        self.label.setText(self.logic_for_main.calculation())
+
+    def scale_items(self):
+        """Умножит количество во всех строках сметы на множитель."""
+        if not self.logic_for_main.get_all():
+            return
+
+        factor, ok = QInputDialog.getDouble(
+            self, 'Масштаб', 'Умножить количество на:', 2, 0.0001, 10_000, 4
+        )
+        if ok:
+            self.logic_for_main.scale(factor)
+            self.refresh_all()
+
+    def convert_units(self):
+        """Переведет строки сметы в выбранный набор единиц."""
+        if not self.logic_for_main.get_all():
+            return
+
+        name, ok = QInputDialog.getItem(
+            self, 'Единицы', 'Перевести в:', list(UNIT_SETS), 0, False
+        )
+        if ok:
+            self.logic_for_main.convert_units(UNIT_SETS[name])
+            self.refresh_all()
+
+    def consolidate_items(self):
+        """Объединит строки сметы одного ингредиента."""
+        if self.logic_for_main.consolidate_all():
+            self.load_data()
+
+    def set_consolidate(self, checked: bool):
+        """Включит или выключит объединение строк при добавлении."""
+        self.logic_for_main.consolidate = checked
+
+    def refresh_all(self):
+        """
+        Обновит все строки таблицы окна без пересоздания модели. Строки
+        уже заменены логикой в общем с моделью хранилище, поэтому модель
+        только уведомляет представление.
+        """
+        self.table_view.model().refresh()
+        self.label.setText(self.logic_for_main.calculation())
 
     def get_index_selected_row(self) -> int | None:
         """Вернет индекс выделенной строки таблицы окна."""
@@ -157,6 +360,13 @@ class MainWindow(QMainWindow):
             return selected[0].row()
         return None
 
+    def get_indexes_selected_rows(self) -> list[int]:
+        """Вернет индексы всех выделенных строк таблицы окна."""
+        return sorted(
+            index.row()
+            for index in self.table_view.selectionModel().selectedRows()
+        )
+
     def open_window_db(self):
         """Откроет окно управления базой данных."""
         self.window_db = DBWindow(
@@ -164,3 +374,87 @@ class MainWindow(QMainWindow):
             logic_for_db=self.logic_for_db,
             model_for_db=self.model_for_db,
         )
+        rejected = self.logic_for_db.take_rejected()
+        if rejected:
+            QMessageBox.warning(self, 'Не сохранено', '\n'.join(rejected))
+        self.update_alerts()
+
+    def open_window_report(self):
+        """Откроет окно отчетов."""
+        self.logic_for_db.repository.flush()
+        self.window_report = ReportWindow(
+            parent=self, logic_for_report=self.catalogs.active.logic_report
+        )
+
+    def switch_catalog(self):
+        """Сделает активным каталог, выбранный в списке."""
+        name = self.catalog_input.currentText()
+        if name == self.catalogs.active.name:
+            return
+
+        if self.logic_for_main.get_all():
+            answer = QMessageBox.question(
+                self,
+                'Каталог',
+                'Смета составлена по другому каталогу и будет очищена. '
+                'Переключить каталог?',
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            )
+            if answer != QMessageBox.StandardButton.Yes:
+                self.catalog_input.setCurrentText(self.catalogs.active.name)
+                return
+
+        # Смета очищается до смены активного каталога: после сбоя между
+        # ними журнал не восстановит её поверх другого каталога.
+        self.logic_for_main.clear()
+        self.stop_warm_up()
+        self.logic_for_db.clear_cache()
+        catalog = self.catalogs.activate(name)
+        self.logic_for_main.set_logic_for_db(catalog.logic_db)
+        self.load_data()
+        self.start_warm_up()
+
+    def open_catalog(self):
+        """Откроет файл БД еще одного каталога или создаст новый."""
+        path, _ = QFileDialog.getSaveFileName(
+            self,
+            'Открыть каталог',
+            '',
+            'База данных (*.db)',
+            options=QFileDialog.Option.DontConfirmOverwrite,
+        )
+        if not path:
+            return
+
+        name, ok = QInputDialog.getText(self, 'Каталог', 'Название каталога:')
+        if not ok or not name:
+            return
+
+        try:
+            self.catalogs.open(name, path)
+        except ValueError as error:
+            QMessageBox.warning(self, 'Каталог', str(error))
+            return
+        self.catalog_input.addItem(name)
+
+    def open_window_compare(self):
+        """Откроет окно сравнения цен между каталогами."""
+        self.window_compare = CompareWindow(
+            parent=self, catalogs=self.catalogs
+        )
+
+    def open_window_alerts(self):
+        """Откроет окно оповещений активного каталога."""
+        self.window_alerts = AlertsWindow(
+            parent=self, alerts=self.catalogs.active.alerts
+        )
+        self.update_alerts()
+
+    def open_window_backup(self):
+        """Откроет окно резервных копий активного каталога."""
+        # Восстановление переписывает базу, прогрев продолжится после.
+        self.stop_warm_up()
+        self.window_backup = BackupWindow(
+            parent=self, catalog=self.catalogs.active
+        )
+        self.start_warm_up()
@@ -0,0 +1,93 @@
+from typing import TYPE_CHECKING
+
+from PyQt6.QtWidgets import (
+    QComboBox,
+    QDialog,
+    QFormLayout,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QPushButton,
+    QSpinBox,
+    QTableView,
+    QWidget,
+)
+
+from app.logic.reports import REPORTS, TOP_INGREDIENTS
+from app.models import ViewOnReportTableModels
+
+if TYPE_CHECKING:
+    from app.logic.reports import LogicReportWindow
+
+
+class ReportWindow(QDialog):
+    """Окно отчетов по сохраненным сметам и каталогу."""
+
+    def __init__(
+        self,
+        parent: QWidget,
+        logic_for_report: 'LogicReportWindow',
+    ):
+        super().__init__(parent)
+        self.logic_for_report = logic_for_report
+        self.initUI()
+
+    def initUI(self):
+        """Инициация пользовательского интерфейса."""
+        self.setWindowTitle('Отчеты')
+        self.setGeometry(320, 420, 700, 500)
+
+        main_layout = QHBoxLayout()
+        layout_left = QFormLayout()
+        layout_right = QFormLayout()
+
+        self.table_view = QTableView()
+        self.table_view.setAlternatingRowColors(True)
+        header = self.table_view.horizontalHeader()
+        header.setFixedHeight(40)
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout_left.addRow('', self.table_view)
+
+        self.report_input = QComboBox()
+        self.report_input.addItems(REPORTS)
+        self.report_input.currentIndexChanged.connect(self.load_data)
+        layout_right.addRow('Отчет:', self.report_input)
+
+        self.estimate_input = QComboBox()
+        self.estimate_input.addItem('Все сметы', None)
+        for id, name in self.logic_for_report.get_estimates():
+            self.estimate_input.addItem(name, id)
+        self.estimate_input.currentIndexChanged.connect(self.load_data)
+        layout_right.addRow('Смета:', self.estimate_input)
+
+        self.limit_input = QSpinBox()
+        self.limit_input.setRange(1, 1000)
+        self.limit_input.setValue(10)
+        self.limit_input.valueChanged.connect(self.load_data)
+        layout_right.addRow('Сколько:', self.limit_input)
+
+        self.label = QLabel()
+        layout_right.addRow('', self.label)
+
+        button_exit = QPushButton('Выйти')
+        button_exit.clicked.connect(self.reject)
+        layout_right.addRow('', button_exit)
+
+        main_layout.addLayout(layout_left)
+        main_layout.addLayout(layout_right)
+        self.setLayout(main_layout)
+
+        self.load_data()
+        self.exec()
+
+    def load_data(self):
+        """Построит выбранный отчет и покажет его в таблице."""
+        title = self.report_input.currentText()
+        self.limit_input.setEnabled(title == TOP_INGREDIENTS)
+        report = self.logic_for_report.build(
+            title,
+            self.estimate_input.currentData(),
+            self.limit_input.value(),
+        )
+        self.table_view.setModel(ViewOnReportTableModels(report))
+        self.label.setText('' if report.rows else 'Нет данных')
@@ -0,0 +1,127 @@
+"""
+Набор замеров производительности слоев репозитория, логики и моделей.
+
+Запуск из папки src:
+    python -m benchmarks --output results.json
+    python -m benchmarks --baseline baseline.json --threshold 0.2
+"""
+
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+
+# Qt должен работать без дисплея, задаем платформу до импорта PyQt6.
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from . import cases, checks  # noqa: E402, F401
+from .runner import (  # noqa: E402
+    CALLS,
+    CATALOG,
+    CLIENTS,
+    ESTIMATE,
+    SAVED,
+    WORKERS,
+    Context,
+    compare,
+    load,
+    run,
+    run_checks,
+    save,
+)
+
+
+def main() -> int:
+    parser = ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument(
+        '--catalog-sizes',
+        type=int,
+        nargs='+',
+        default=[1_000, 100_000, 1_000_000],
+        help='размеры синтетических каталогов',
+    )
+    parser.add_argument(
+        '--estimate-sizes',
+        type=int,
+        nargs='+',
+        default=[10, 1_000, 50_000],
+        help='количество строк в синтетических сметах',
+    )
+    parser.add_argument(
+        '--call-counts',
+        type=int,
+        nargs='+',
+        default=[100_000],
+        help='количество вызовов в замерах отдельных операций',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8],
+        help='количество процессов в замерах параллельного пересчета',
+    )
+    parser.add_argument(
+        '--clients',
+        type=int,
+        nargs='+',
+        default=[500],
+        help='количество одновременных клиентов в нагрузочных замерах',
+    )
+    parser.add_argument(
+        '--estimate-lines',
+        type=int,
+        default=1_000_000,
+        help='общее количество строк сохраненных смет',
+    )
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--only', default='', help='фильтр по имени замера')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', type=Path, help='папка для файлов БД')
+    parser.add_argument('--output', type=Path, help='куда сохранить JSON')
+    parser.add_argument('--baseline', type=Path, help='эталонный JSON')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.2,
+        help='допустимый рост медианы относительно эталона (0.2 = 20%%)',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        context = Context(
+            args.workdir or Path(tmp), args.seed, args.estimate_lines
+        )
+        results = run(
+            context,
+            {
+                CATALOG: args.catalog_sizes,
+                ESTIMATE: args.estimate_sizes,
+                CALLS: args.call_counts,
+                WORKERS: args.workers,
+                CLIENTS: args.clients,
+                SAVED: [args.estimate_lines],
+            },
+            args.rounds,
+            args.only,
+        )
+        failures = run_checks(context, args.only)
+
+    if args.output:
+        save(results, args.output)
+
+    for line in failures:
+        print(f'ПРОВЕРКА {line}')
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(results, load(args.baseline), args.threshold)
+        for line in regressions:
+            print(f'РЕГРЕССИЯ {line}')
+
+    return 1 if failures or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
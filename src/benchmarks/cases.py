@@ -0,0 +1,582 @@
+import asyncio
+import itertools
+import random
+import shutil
+from time import perf_counter
+
+from app.db.async_repository import AsyncRepositoryDB
+from app.db.backup import CatalogBackup
+from app.db.journal import EstimateJournal
+from app.db.manager import Connector
+from app.db.repository import (
+    RepositoryDB,
+    RepositoryEstimate,
+    RepositoryReport,
+    RepositoryStart,
+    RepositoryUsage,
+)
+from app.db.snapshot import CatalogSnapshot
+from app.db.write_behind import WriteBehindRepositoryDB
+from app.logic.adapter import LogicDBWindow, LogicMainWindow
+from app.logic.async_adapter import AsyncLogicDBWindow
+from app.logic.catalogs import Catalog, CatalogManager
+from app.logic.dimension import DimensionConverter
+from app.logic.estimate_store import EstimateRows
+from app.logic.price_list import PriceListReconciler
+from app.logic.repricing import RepricingEngine
+from app.logic.what_if import WhatIfEngine
+from app.models import RowViewOnDBTable, RowViewOnMainTable
+from app.settings import AUTOSAVE_SYNC
+
+from .data import make_estimate, make_price_list
+from .runner import (
+    CALLS,
+    CLIENTS,
+    ESTIMATE,
+    SAVED,
+    WORKERS,
+    Context,
+    benchmark,
+)
+
+# Каталог, из которого набираются синтетические сметы.
+ESTIMATE_CATALOG_SIZE = 1000
+# Сколько кадров прокрутки отрисовывать в замерах таблиц.
+SCROLL_FRAMES = 50
+# Сценарии "что если": сколько их и сколько цен меняет каждый.
+WHAT_IF_SCENARIOS = 100
+WHAT_IF_CHANGES = 100
+
+
+def make_logic_db(context: Context, size: int) -> LogicDBWindow:
+    """Вернет логику окна БД, работающую с каталогом нужного размера."""
+    repository = RepositoryDB(Connector(str(context.catalog(size))))
+    return LogicDBWindow(repository, DimensionConverter, RowViewOnDBTable)
+
+
+def make_main_rows(context: Context, size: int) -> list[RowViewOnMainTable]:
+    """Вернет строки сметы нужного размера с уже посчитанной стоимостью."""
+    logic_db = make_logic_db(context, ESTIMATE_CATALOG_SIZE)
+    catalog = logic_db.repository.get_all()
+    lines = make_estimate(catalog, size, context.seed)
+    return [
+        RowViewOnMainTable(
+            id=id,
+            name=name,
+            quantity=quantity,
+            dimension=dimension,
+            price=logic_db.calculation(
+                price, quantity, dimension, db_dimension
+            ),
+        )
+        for id, name, quantity, dimension, db_dimension, price in lines
+    ]
+
+
+def make_estimate_rows(context: Context, size: int) -> EstimateRows:
+    """
+    Вернет хранилище с size строками сметы: строки сметы на 1000 позиций,
+    повторенные по кругу с новыми ID.
+    """
+    rows = make_main_rows(context, ESTIMATE_CATALOG_SIZE)
+    store = EstimateRows()
+    store.extend(
+        RowViewOnMainTable(
+            number, row.name, row.quantity, row.dimension, row.price
+        )
+        for number, row in zip(range(size), itertools.cycle(rows))
+    )
+    return store
+
+
+@benchmark('RepositoryDB.get_all')
+def repository_get_all(context: Context, size: int):
+    repository = RepositoryDB(Connector(str(context.catalog(size))))
+    return repository.get_all
+
+
+@benchmark('LogicDBWindow.get_all')
+def logic_db_get_all(context: Context, size: int):
+    logic_db = make_logic_db(context, size)
+
+    def func():
+        # Первое открытие окна: строк, запомненных прогревом, нет.
+        logic_db.clear_cache()
+        return logic_db.get_all()
+
+    return func
+
+
+@benchmark('LogicDBWindow.get_all (warm)')
+def logic_db_get_all_warm(context: Context, size: int):
+    logic_db = make_logic_db(context, size)
+    for _ in logic_db.warm_up():
+        pass
+    return logic_db.get_all
+
+
+@benchmark('LogicDBWindow.warm_up')
+def logic_db_warm_up(context: Context, size: int):
+    logic_db = make_logic_db(context, size)
+
+    def func():
+        logic_db.clear_cache()
+        for _ in logic_db.warm_up():
+            pass
+
+    return func
+
+
+@benchmark('LogicDBWindow.calculation', ESTIMATE)
+def logic_db_calculation(context: Context, size: int):
+    logic_db = make_logic_db(context, ESTIMATE_CATALOG_SIZE)
+    lines = make_estimate(logic_db.repository.get_all(), size, context.seed)
+
+    def func():
+        for _, _, quantity, dimension, db_dimension, price in lines:
+            logic_db.calculation(price, quantity, dimension, db_dimension)
+
+    return func
+
+
+@benchmark('LogicMainWindow.calculation', ESTIMATE)
+def logic_main_calculation(context: Context, size: int):
+    logic_main = LogicMainWindow()
+    for row in make_main_rows(context, size):
+        logic_main.add(row)
+    return logic_main.calculation
+
+
+@benchmark('LogicMainWindow.scale', ESTIMATE)
+def logic_main_scale(context: Context, size: int):
+    logic_main = LogicMainWindow(make_logic_db(context, ESTIMATE_CATALOG_SIZE))
+    for row in make_main_rows(context, size):
+        logic_main.add(row)
+    factors = iter([3, 1 / 3] * 1_000_000)
+
+    def func():
+        logic_main.scale(next(factors))
+
+    return func
+
+
+@benchmark('LogicMainWindow.delete', ESTIMATE)
+def logic_main_delete(context: Context, size: int):
+    logic_main = LogicMainWindow()
+    rows = make_main_rows(context, size)
+    for row in rows:
+        logic_main.add(row)
+    generator = random.Random(context.seed)
+
+    def func():
+        # 100 удалений из случайных мест и столько же добавлений в конец,
+        # чтобы размер сметы не менялся от раунда к раунду.
+        for row in rows[:100]:
+            logic_main.delete(generator.randrange(len(logic_main.data)))
+            logic_main.add(row)
+
+    return func
+
+
+@benchmark('DimensionConverter.get_ratio', ESTIMATE)
+def dimension_get_ratio(context: Context, size: int):
+    pairs = [
+        (dimension, db_dimension)
+        for _, _, _, dimension, db_dimension, _ in make_estimate(
+            make_logic_db(context, ESTIMATE_CATALOG_SIZE).repository.get_all(),
+            size,
+            context.seed,
+        )
+    ]
+
+    def func():
+        for dimension, db_dimension in pairs:
+            DimensionConverter.get_ratio(dimension, db_dimension)
+
+    return func
+
+
+@benchmark('BasesViewTableModels.data', ESTIMATE)
+def model_data(context: Context, size: int):
+    from PyQt6.QtCore import Qt
+
+    from app.models import ViewOnMainTableModels
+
+    from .views import application
+
+    # Одно приложение на все замеры, в том числе с таблицами.
+    application()
+    model = ViewOnMainTableModels(make_main_rows(context, size))
+    indexes = [
+        model.index(row, column)
+        for row in range(model.rowCount(None))
+        for column in range(model.columnCount(None))
+    ]
+    roles = (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.BackgroundRole)
+
+    def func():
+        for index in indexes:
+            for role in roles:
+                model.data(index, role)
+
+    return func
+
+
+@benchmark('RepositoryDB.get', CALLS)
+def repository_get(context: Context, size: int):
+    repository = RepositoryDB(Connector(str(context.catalog(1000))))
+
+    def func():
+        for id in range(size):
+            repository.get(id % 1000 + 1)
+
+    return func
+
+
+@benchmark('RepositoryDB.get (persistent)', CALLS)
+def repository_get_persistent(context: Context, size: int):
+    connector = Connector(str(context.catalog(1000)), persistent=True)
+    repository = RepositoryDB(connector)
+
+    def func():
+        for id in range(size):
+            repository.get(id % 1000 + 1)
+        cache = connector.statement_cache
+        print(f'    попаданий в кэш инструкций: {cache.hit_rate:.1%}')
+
+    return func
+
+
+@benchmark('WriteBehindRepositoryDB.create', CALLS)
+def write_behind_create(context: Context, size: int):
+    path = context.workdir / 'write_behind.db'
+    shutil.copy(context.catalog(1000), path)
+    connector = Connector(str(path), persistent=True)
+    repository = WriteBehindRepositoryDB(connector, delay=None)
+    rounds = iter(range(1_000_000))
+
+    def func():
+        # Названия уникальны: повтор отклоняется уникальным индексом.
+        round = next(rounds)
+        for number in range(size):
+            repository.create(f'имя {round}.{number}', '10.00', 'кг')
+        repository.flush()
+
+    return func
+
+
+@benchmark('RepricingEngine.run', WORKERS)
+def repricing_engine(context: Context, size: int):
+    return RepricingEngine(str(context.estimates()), workers=size).run
+
+
+def make_alerts(context: Context, share: int = 10) -> Catalog:
+    """
+    Вернет каталог с сохраненными сметами, где у каждой share-й сметы
+    задан бюджет, а у каждого share-го ингредиента - правило цены.
+    """
+    path = context.workdir / 'alerts.db'
+    shutil.copy(context.estimates(), path)
+    catalog = Catalog('Оповещения', str(path))
+    catalog.open()
+    rules = catalog.alerts.rules
+    with catalog.connector:
+        for id, _, _ in catalog.logic_report.estimates.get_all():
+            if id % share == 0:
+                rules.save_budget_rule(id, '1000000.00')
+        for id, _, _, dimension, price in catalog.repository.get_all():
+            if id % share == 0:
+                rules.save_price_rule(id, '10', price, dimension)
+    return catalog
+
+
+@benchmark('AlertEngine.changed', SAVED)
+def alerts_changed(context: Context, size: int):
+    catalog = make_alerts(context)
+    catalog.alerts.load()
+    ids = random.Random(context.seed).sample(
+        [row[0] for row in catalog.repository.get_all()], 10
+    )
+    return lambda: catalog.alerts.changed(ids)
+
+
+@benchmark('AlertEngine.load', SAVED)
+def alerts_load(context: Context, size: int):
+    catalog = make_alerts(context)
+
+    def func():
+        catalog.alerts.reset()
+        catalog.alerts.load()
+
+    return func
+
+
+def make_what_if(
+    context: Context, vectorized: bool | None = None
+) -> tuple[WhatIfEngine, list[dict[int, str]]]:
+    """
+    Вернет анализ "что если" по сохраненным сметам и сценарии, каждый
+    из которых меняет цены WHAT_IF_CHANGES случайных ингредиентов.
+    """
+    connector = Connector(str(context.estimates()), persistent=True)
+    catalog = RepositoryDB(connector)
+    engine = WhatIfEngine(
+        catalog,
+        RepositoryEstimate(connector),
+        DimensionConverter,
+        vectorized=vectorized,
+    )
+    generator = random.Random(context.seed)
+    ids = [row[0] for row in catalog.get_all()]
+    scenarios = [
+        {
+            id: f'{generator.uniform(-30, 30):.2f}'
+            for id in generator.sample(ids, WHAT_IF_CHANGES)
+        }
+        for _ in range(WHAT_IF_SCENARIOS)
+    ]
+    return engine, scenarios
+
+
+@benchmark('WhatIfEngine.run', SAVED)
+def what_if_run(context: Context, size: int):
+    engine, scenarios = make_what_if(context)
+    engine.load()
+    return lambda: engine.run(scenarios)
+
+
+@benchmark('WhatIfEngine.run (Python)', SAVED)
+def what_if_run_python(context: Context, size: int):
+    engine, scenarios = make_what_if(context, vectorized=False)
+    engine.load()
+    return lambda: engine.run(scenarios)
+
+
+@benchmark('WhatIfEngine.load', SAVED)
+def what_if_load(context: Context, size: int):
+    engine, _ = make_what_if(context)
+    return engine.load
+
+
+@benchmark('CatalogSnapshot open')
+def snapshot_open(context: Context, size: int):
+    logic_db = make_logic_db(context, size)
+    logic_db.snapshot_path = str(context.workdir / f'catalog_{size}.catalog')
+    logic_db.write_snapshot()
+
+    def func():
+        # Открытие окна выбора: снимок и первая страница таблицы.
+        snapshot = CatalogSnapshot(logic_db.snapshot_path, RowViewOnDBTable)
+        for index in range(min(50, len(snapshot))):
+            snapshot[index]
+        snapshot.close()
+
+    return func
+
+
+@benchmark('LogicDBWindow.get_favorites')
+def favorites(context: Context, size: int):
+    # Открытие окна выбора с уже накопленной частотой выбора.
+    path = context.workdir / f'favorites_{size}.db'
+    shutil.copy(context.catalog(size), path)
+    logic_db = make_logic_db(context, size)
+    logic_db.repository = RepositoryDB(Connector(str(path), persistent=True))
+    logic_db.usage = RepositoryUsage(logic_db.repository.connector)
+    with logic_db.repository.connector:
+        for number in range(500):
+            logic_db.register_usage(number * 7 % 50 * (size // 50) + 1)
+    return logic_db.get_favorites
+
+
+@benchmark('AsyncRepositoryDB clients', CLIENTS)
+def async_repository_clients(context: Context, size: int):
+    path = context.workdir / 'async_clients.db'
+    shutil.copy(context.catalog(1000), path)
+    logic = make_logic_db(context, 1000)
+    logic.repository = RepositoryDB(Connector(str(path), persistent=True))
+    requests = 20
+
+    async def client(
+        number: int, async_logic: AsyncLogicDBWindow, latencies: list
+    ) -> None:
+        for step in range(requests):
+            id = (number * requests + step) % 1000 + 1
+            start = perf_counter()
+            if step % 5 == 4:
+                await async_logic.update(id, f'имя {id}', 1, 10, 'кг', '')
+            else:
+                await async_logic.get(id)
+            latencies.append(perf_counter() - start)
+
+    async def load() -> None:
+        latencies: list[float] = []
+        async with AsyncRepositoryDB(logic.repository) as repository:
+            async_logic = AsyncLogicDBWindow(logic, repository)
+            start = perf_counter()
+            await asyncio.gather(
+                *(
+                    client(number, async_logic, latencies)
+                    for number in range(size)
+                )
+            )
+            elapsed = perf_counter() - start
+        latencies.sort()
+        print(
+            f'    {len(latencies) / elapsed:.0f} запросов/с, '
+            f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс'
+        )
+
+    return lambda: asyncio.run(load())
+
+
+@benchmark('PriceListReconciler.diff')
+def price_list_diff(context: Context, size: int):
+    path = context.workdir / f'price_list_{size}.db'
+    shutil.copy(context.catalog(size), path)
+    connector = Connector(str(path), persistent=True)
+    RepositoryStart(connector).create_table()
+    repository = RepositoryDB(connector)
+    reconciler = PriceListReconciler(repository)
+    reconciler.load(
+        make_price_list(
+            (row for rows in repository.iter_all() for row in rows),
+            context.seed,
+        )
+    )
+    return reconciler.diff
+
+
+@benchmark('RepositoryReport.cost_by_category', SAVED)
+def report_cost_by_category(context: Context, size: int):
+    report = RepositoryReport(
+        Connector(str(context.estimates()), persistent=True)
+    )
+    categories = DimensionConverter.get_categories()
+    return lambda: report.cost_by_category(categories)
+
+
+@benchmark('RepositoryReport.top_ingredients', SAVED)
+def report_top_ingredients(context: Context, size: int):
+    report = RepositoryReport(
+        Connector(str(context.estimates()), persistent=True)
+    )
+    return report.top_ingredients
+
+
+@benchmark('RepositoryReport.unit_price_stats')
+def report_unit_price_stats(context: Context, size: int):
+    report = RepositoryReport(
+        Connector(str(context.catalog(size)), persistent=True)
+    )
+    return report.unit_price_stats
+
+
+@benchmark('CatalogManager.compare_prices')
+def catalog_compare_prices(context: Context, size: int):
+    catalogs = CatalogManager(None)
+    for name in ('home', 'supplier'):
+        path = context.workdir / f'compare_{name}_{size}.db'
+        shutil.copy(context.catalog(size), path)
+        catalogs.open(name, str(path))
+    catalogs.activate('home')
+    return catalogs.compare_prices
+
+
+@benchmark('LogicMainWindow.add (journal)', CALLS)
+def logic_main_add_journal(context: Context, size: int):
+    path = context.workdir / 'autosave.journal'
+    rows = make_main_rows(context, size)
+
+    def func():
+        # Каждый раунд - новая смета: журнал уплотняется очисткой.
+        logic_main = LogicMainWindow(
+            journal=EstimateJournal(str(path), AUTOSAVE_SYNC)
+        )
+        for row in rows:
+            logic_main.add(row)
+        logic_main.clear()
+        logic_main.journal.close()
+
+    return func
+
+
+@benchmark('PricingEngine.line', ESTIMATE)
+def pricing_line(context: Context, size: int):
+    logic_db = make_logic_db(context, ESTIMATE_CATALOG_SIZE)
+    pricing = logic_db.pricing
+    lines = [
+        (
+            price,
+            quantity,
+            pricing.exact(DimensionConverter.get_ratio(dimension, unit)),
+        )
+        for _, _, quantity, dimension, unit, price in make_estimate(
+            logic_db.repository.get_all(), size, context.seed
+        )
+    ]
+
+    def func():
+        for price, quantity, ratio in lines:
+            pricing.line(price, quantity, ratio)
+
+    return func
+
+
+@benchmark('LogicMainWindow.add (consolidate)', ESTIMATE)
+def logic_main_add_consolidate(context: Context, size: int):
+    # Как в программе: постоянное подключение, запись ищется по ключу.
+    repository = RepositoryDB(
+        Connector(str(context.catalog(ESTIMATE_CATALOG_SIZE)), persistent=True)
+    )
+    logic_db = LogicDBWindow(repository, DimensionConverter, RowViewOnDBTable)
+    rows = make_main_rows(context, size)
+
+    def func():
+        logic_main = LogicMainWindow(logic_db, consolidate=True)
+        for row in rows:
+            logic_main.add(row)
+
+    return func
+
+
+@benchmark('LogicMainWindow.consolidate_all', ESTIMATE)
+def logic_main_consolidate_all(context: Context, size: int):
+    logic_db = make_logic_db(context, ESTIMATE_CATALOG_SIZE)
+    rows = make_main_rows(context, size)
+
+    def func():
+        logic_main = LogicMainWindow(logic_db)
+        logic_main.get_all().extend(rows)
+        logic_main.consolidate_all()
+
+    return func
+
+
+@benchmark('CatalogBackup.backup')
+def catalog_backup(context: Context, size: int):
+    backups = CatalogBackup(
+        str(context.catalog(size)), str(context.workdir / 'backups'), keep=1
+    )
+    return backups.backup
+
+
+@benchmark('ViewOnMainTableModels scroll')
+def main_model_scroll(context: Context, size: int):
+    from app.models import ViewOnMainTableModels
+
+    from .views import counting, scroll
+
+    model = counting(ViewOnMainTableModels)(make_estimate_rows(context, size))
+    return lambda: scroll(model, SCROLL_FRAMES)
+
+
+@benchmark('ViewOnDBTableModels scroll')
+def db_model_scroll(context: Context, size: int):
+    from app.models import ViewOnDBTableModels
+
+    from .views import counting, scroll
+
+    model = counting(ViewOnDBTableModels)(
+        make_logic_db(context, size).get_all()
+    )
+    return lambda: scroll(model, SCROLL_FRAMES)
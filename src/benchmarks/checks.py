@@ -0,0 +1,1903 @@
+import asyncio
+import decimal
+import gzip
+import http.client
+import json
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import tracemalloc
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+from sqlite3 import IntegrityError
+from time import perf_counter, sleep
+from typing import Generator
+
+from app.db.async_repository import AsyncRepositoryDB
+from app.db.backup import BackupCancelled, CatalogBackup
+from app.db.journal import EstimateJournal
+from app.db.manager import Connector
+from app.db.names import normalize_name
+from app.db.repository import (
+    RepositoryDB,
+    RepositoryEstimate,
+    RepositoryReport,
+    RepositoryRules,
+    RepositoryStart,
+    RepositoryUsage,
+)
+from app.db.write_behind import WriteBehindRepositoryDB
+from app.logic import what_if
+from app.logic.adapter import LogicDBWindow, LogicMainWindow
+from app.logic.alerts import BUDGET, PRICE, AlertEngine
+from app.logic.async_adapter import AsyncLogicDBWindow
+from app.logic.catalogs import Catalog, CatalogManager
+from app.logic.dimension import DimensionConverter
+from app.logic.estimate_store import EstimateRows
+from app.logic.price_list import PriceListReconciler
+from app.logic.pricing import (
+    HALF_EVEN,
+    HALF_UP,
+    PER_LINE,
+    PER_TOTAL,
+    UNITS_PER_RUBLE,
+    PricingEngine,
+)
+from app.logic.reports import Report
+from app.logic.repricing import RepricingEngine
+from app.logic.what_if import WhatIfEngine, numpy
+from app.models import (
+    RowViewOnDBTable,
+    RowViewOnMainTable,
+    ViewOnDBTableModels,
+    ViewOnMainTableModels,
+    ViewOnReportTableModels,
+)
+from app.profiler import Profiler
+from app.server import APIServer, make_logic as make_server_logic
+
+from .cases import (
+    ESTIMATE_CATALOG_SIZE,
+    make_estimate_rows,
+    make_logic_db,
+    make_main_rows,
+)
+from .data import make_estimates, make_price_list
+from .runner import Context, check
+
+
+@check
+def profiler_disabled_overhead(context: Context) -> None:
+    """Выключенный профилировщик не должен замедлять горячие участки."""
+    disabled = Profiler(enabled=False)
+
+    def func():
+        return None
+
+    assert disabled.timed('func')(func) is func, 'функция обернута'
+
+    calls = 100_000
+    start = perf_counter()
+    for _ in range(calls):
+        disabled.count('counter')
+        disabled.record('timer', 0.0)
+    per_call = (perf_counter() - start) / calls / 2
+    assert not disabled.counters and not disabled.timers, 'замеры собраны'
+    assert per_call < 1e-6, f'{per_call * 1e9:.0f} нс на вызов'
+
+
+@check
+def async_logic_parity(context: Context) -> None:
+    """
+    Асинхронная логика должна давать те же результаты, что и синхронная,
+    и так же проверять правила оповещений, не занимая цикл событий, а
+    снимок каталога должен оставаться актуальным.
+    """
+    sync_path = context.workdir / 'parity_sync.db'
+    async_path = context.workdir / 'parity_async.db'
+    shutil.copy(context.catalog(1000), sync_path)
+    shutil.copy(context.catalog(1000), async_path)
+
+    def make_logic(path: Path) -> LogicDBWindow:
+        connector = Connector(str(path), persistent=True)
+        RepositoryStart(connector).create_table()
+        repository = RepositoryDB(connector)
+        alerts = AlertEngine(
+            RepositoryRules(connector),
+            repository,
+            RepositoryEstimate(connector),
+            DimensionConverter,
+        )
+        logic = LogicDBWindow(
+            repository,
+            DimensionConverter,
+            RowViewOnDBTable,
+            f'{path}.snapshot',
+            RepositoryUsage(connector),
+            alerts=alerts,
+        )
+        # Правила цены на записи, которые сценарий изменит, удалит и
+        # объединит.
+        logic.watch_prices([5, 7, 9, 11, 12, 13, 60], 5)
+        return logic
+
+    weights = DimensionConverter.get_dimensions_same_category('г')
+
+    def scenario(logic) -> Generator:
+        """Один и тот же сценарий для обеих логик."""
+        yield logic.add('мука', 2, 101.5, 'кг', 'пшеничная')
+        yield logic.add('сахар', 3, 100, 'г', None)
+        yield logic.update(5, 'изюм', 1.5, 33.33, 'кг', '')
+        yield logic.delete(7)
+        yield logic.delete_many([8, 9, 10])
+        yield logic.update(10**9, 'нет', 1, 1, 'кг', '')
+        yield logic.delete(10**9)
+        rows = yield logic.get_all()
+        yield logic.reprice(rows[:50], 7)
+        yield logic.change_dimension(
+            [row for row in rows[50:] if row.dimension in weights][:30], 'г'
+        )
+        yield logic.merge([(11, [12, 13])])
+        yield logic.get(5)
+        yield logic.get(7)
+        yield logic.get_many([5, 7, 11, 12])
+        yield logic.search('мука')
+        yield logic.get_all()
+
+    def side_effects(logic: LogicDBWindow) -> tuple:
+        """Сработавшие оповещения и снимок после изменений."""
+        snapshot = logic.get_snapshot()
+        assert snapshot is not None, 'снимок не открыт'
+        return (
+            sorted(alert.text for alert in logic.take_alerts()),
+            snapshot.version == logic.repository.get_version(),
+            [tuple(row) for row in snapshot]
+            == [tuple(row) for row in logic.get_all()],
+        )
+
+    sync_logic = make_logic(sync_path)
+    sync_results = []
+    steps = scenario(sync_logic)
+    result = None
+    while True:
+        try:
+            result = steps.send(result)
+        except StopIteration:
+            break
+        sync_results.append(result)
+    sync_effects = side_effects(sync_logic)
+
+    # Размерность другой категории не подменяет единицу без пересчета.
+    row = next(row for row in sync_results[-1] if row.dimension in weights)
+    try:
+        sync_logic.change_dimension([row], 'шт')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('вес переведен в штуки')
+    assert tuple(sync_logic.get(row.id)) == tuple(row), 'запись изменена'
+
+    async def run_async() -> tuple[list, tuple]:
+        logic = make_logic(async_path)
+        # Оповещения читают базу и не должны занимать цикл событий.
+        threads = set()
+        changed = logic.changed
+        logic.changed = lambda ids=(): (
+            threads.add(threading.current_thread()) or changed(ids)
+        )
+        async with AsyncRepositoryDB(logic.repository) as repository:
+            async_logic = AsyncLogicDBWindow(logic, repository)
+            results = []
+            steps = scenario(async_logic)
+            result = None
+            while True:
+                try:
+                    result = await steps.send(result)
+                except StopIteration:
+                    break
+                results.append(result)
+        assert threads and threading.main_thread() not in threads, (
+            'оповещения проверены в цикле событий'
+        )
+        return results, side_effects(logic)
+
+    def normalize(result) -> object:
+        if isinstance(result, list):
+            return [normalize(row) for row in result]
+        if isinstance(result, dict):
+            return {key: normalize(row) for key, row in result.items()}
+        if isinstance(result, RowViewOnDBTable):
+            return tuple(result)
+        return result
+
+    async_results, async_effects = asyncio.run(run_async())
+    assert normalize(sync_results) == normalize(async_results), (
+        'результаты разошлись'
+    )
+    assert sync_effects[0], 'оповещения не сработали'
+    assert sync_effects == async_effects, 'побочные действия разошлись'
+    assert async_effects[1:] == (True, True), 'снимок устарел'
+
+
+@check
+def api_server(context: Context) -> None:
+    """
+    API отвечает 404 на изменение и удаление несуществующей записи и 400
+    на размерность другой категории, ETag каталога совпадает с версией
+    его тела, а подключения к базе закрываются вместе с потоками
+    соединений. Таблицы новой или старой базы сервер создает сам.
+    """
+
+    def start(path: Path) -> APIServer:
+        server = APIServer(('127.0.0.1', 0), make_server_logic(str(path)))
+        # Обрыв соединения ниже ожидаем, его трассировка не нужна.
+        server.handle_error = lambda request, address: None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def stop(server: APIServer) -> None:
+        server.shutdown()
+        server.server_close()
+
+    def request(method: str, url: str, body=None, headers=None) -> tuple:
+        host, port = server.server_address[:2]
+        connection = http.client.HTTPConnection(host, port)
+        try:
+            connection.request(
+                method,
+                url,
+                None if body is None else json.dumps(body),
+                headers or {},
+            )
+            response = connection.getresponse()
+            data = response.read()
+            return response.status, response.getheader('ETag'), data
+        finally:
+            connection.close()
+
+    # База из одной таблицы ингредиентов, как до версий и индексов.
+    old = context.workdir / 'api_old.db'
+    old.unlink(missing_ok=True)
+    with sqlite3.connect(old) as connection:
+        connection.execute(
+            'CREATE TABLE ingredient (id INTEGER PRIMARY KEY, '
+            'name TEXT NOT NULL, description TEXT, price TEXT NOT NULL, '
+            'dimension TEXT NOT NULL)'
+        )
+        connection.execute(
+            "INSERT INTO ingredient VALUES (1, 'Мука', '', '50.00', 'кг')"
+        )
+    connection.close()
+    fresh = context.workdir / 'api_fresh.db'
+    fresh.unlink(missing_ok=True)
+    for path, count in [(old, 1), (fresh, 0)]:
+        server = start(path)
+        try:
+            status, etag, data = request('GET', '/ingredients')
+            assert status == 200, f'{path.name}: GET {status}'
+            assert len(json.loads(data)) == count, f'{path.name}: каталог'
+        finally:
+            stop(server)
+
+    path = context.workdir / 'api.db'
+    shutil.copy(context.catalog(1000), path)
+    server = start(path)
+    connector = server.logic.repository.connector
+    try:
+        item = {'name': 'изюм', 'price': 10, 'dimension': 'кг'}
+        status, _, _ = request('PUT', '/ingredients/999999', item)
+        assert status == 404, f'PUT несуществующей записи: {status}'
+        status, _, _ = request('DELETE', '/ingredients/999999')
+        assert status == 404, f'DELETE несуществующей записи: {status}'
+        status, _, _ = request('PUT', '/ingredients/5', item)
+        assert status == 200, f'PUT: {status}'
+        status, _, _ = request('DELETE', '/ingredients/6')
+        assert status == 200, f'DELETE: {status}'
+
+        line = {'id': 5, 'quantity': 500, 'dimension': 'г'}
+        status, _, data = request('POST', '/price', {'lines': [line]})
+        assert status == 200, f'расчет: {status}'
+        assert json.loads(data)['total'] == '5.00', data
+        for dimension in ['м', 'шт', 'л', 'xyz']:
+            line = {'id': 5, 'quantity': 2, 'dimension': dimension}
+            status, _, data = request('POST', '/price', {'lines': [line]})
+            assert status == 400, f'размерность {dimension}: {status}'
+        line = {'id': 5, 'quantity': 'два'}
+        status, _, data = request('POST', '/price', {'lines': [line]})
+        assert status == 400, f'количество: {status}'
+        assert json.loads(data) == {'error': 'Ожидается число'}, data
+
+        status, etag, data = request('GET', '/ingredients')
+        assert status == 200, f'GET: {status}'
+        repository = RepositoryDB(Connector(str(path)))
+        assert etag == f'"{repository.get_version()}"', 'ETag'
+        assert [tuple(row.values()) for row in json.loads(data)] == [
+            (id, name, description, dimension, price)
+            for id, name, description, dimension, price in repository.get_all()
+        ], 'тело каталога'
+        status, _, _ = request(
+            'GET', '/ingredients', headers={'If-None-Match': etag}
+        )
+        assert status == 304, f'неизмененный каталог: {status}'
+
+        # Соединение, закрытое на середине каталога, не держит
+        # транзакцию чтения: запись проходит.
+        connection = http.client.HTTPConnection(*server.server_address[:2])
+        connection.request('GET', '/ingredients')
+        connection.getresponse().read(100)
+        connection.close()
+        status, _, _ = request('PUT', '/ingredients/5', item | {'price': 11})
+        assert status == 200, f'PUT после обрыва: {status}'
+    finally:
+        stop(server)
+
+    # Потоки соединений демонические, их завершения приходится ждать.
+    deadline = perf_counter() + 5
+    while connector._connections and perf_counter() < deadline:
+        sleep(0.01)
+    assert not connector._connections, (
+        f'остались подключения: {len(connector._connections)}'
+    )
+    assert connector.statement_cache.misses, 'статистика кэша потеряна'
+
+
+@check
+def connector_threads(context: Context) -> None:
+    """
+    close() закрывает постоянные подключения всех потоков, а не только
+    своего, статистика кэша инструкций при этом сохраняется, и поток
+    после close() открывает новое подключение.
+    """
+    path = context.workdir / 'connector.db'
+    shutil.copy(context.catalog(1000), path)
+    connector = Connector(str(path), persistent=True)
+    repository = RepositoryDB(connector)
+    connections = []
+
+    def read() -> None:
+        repository.get(1)
+        repository.get(2)
+        connections.append(connector.connection)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    read()
+    assert len(connector._connections) == 5, len(connector._connections)
+    statistics_before = connector.statement_cache
+    connector.close()
+    assert not connector._connections, 'подключения остались'
+    for connection in connections:
+        try:
+            connection.execute('SELECT 1')
+        except sqlite3.ProgrammingError:
+            continue
+        raise AssertionError('подключение не закрыто')
+    statistics_after = connector.statement_cache
+    assert (statistics_after.hits, statistics_after.misses) == (
+        statistics_before.hits,
+        statistics_before.misses,
+    ), 'статистика кэша потеряна'
+    assert repository.get(1) is not None, 'нет нового подключения'
+    assert len(connector._connections) == 1, 'новое подключение не учтено'
+    connector.close()
+
+
+@check
+def catalog_version(context: Context) -> None:
+    """
+    Версия каталога растет на единицу за изменение, сколько бы строк оно
+    ни затронуло, а снимок переписывается не после каждой записи, а один
+    раз, когда он нужен.
+    """
+    path = context.workdir / 'version.db'
+    shutil.copy(context.catalog(1000), path)
+    connector = Connector(str(path), persistent=True)
+    RepositoryStart(connector).create_table()
+    repository = WriteBehindRepositoryDB(connector, size=10**6, delay=None)
+    rows = repository.get_all()
+    version = repository.get_version()
+
+    def bumped(step: str, expected: int) -> None:
+        nonlocal version
+        current = repository.get_version()
+        assert current == version + expected, (
+            f'{step}: версия {current} против {version + expected}'
+        )
+        version = current
+
+    RepositoryDB.update_many(
+        repository, [(row[0], '1.00', row[3]) for row in rows[:300]]
+    )
+    bumped('update_many', 1)
+    RepositoryDB.delete_many(repository, [row[0] for row in rows[:100]])
+    bumped('delete_many', 1)
+    RepositoryDB.delete(repository, rows[0][0])
+    bumped('удаление несуществующей записи', 0)
+    for number in range(50):
+        repository.create(f'новая {number}', '1.00', 'кг')
+    repository.update_many([(row[0], '2.00', row[3]) for row in rows[100:]])
+    bumped('сброс очереди', 1)
+
+    logic = LogicDBWindow(
+        repository,
+        DimensionConverter,
+        RowViewOnDBTable,
+        f'{path}.snapshot',
+    )
+    logic.get_snapshot()
+    writes = []
+    write = logic.write_snapshot
+    logic.write_snapshot = lambda: writes.append(1) or write()
+    for row in logic.get_all()[:20]:
+        logic.update(row.id, row.name, 1, 3, row.dimension, '')
+    repository.flush()
+    assert not writes, f'снимок переписан {len(writes)} раз до чтения'
+    snapshot = logic.get_snapshot()
+    assert len(writes) == 1, f'снимок переписан {len(writes)} раз'
+    assert snapshot.version == repository.get_version(), 'версия снимка'
+    assert [tuple(row) for row in snapshot] == [
+        tuple(row) for row in repository.get_all()
+    ], 'строки снимка'
+    logic.close()
+    connector.close()
+
+
+# Процесс, который пишет каталог пакетами через отложенную запись и
+# сообщает номер каждого пакета, после которого flush() вернулся.
+WRITE_BEHIND_WRITER = """
+import sys
+from app.db.manager import Connector
+from app.db.write_behind import WriteBehindRepositoryDB
+
+repository = WriteBehindRepositoryDB(
+    Connector(sys.argv[1], persistent=True), size=10_000, delay=None
+)
+batch = 0
+while True:
+    for number in range(100):
+        repository.create(f'{batch}:{number}', '1.00', 'кг')
+    repository.flush()
+    print(batch, flush=True)
+    batch += 1
+"""
+
+
+@check
+def write_behind_crash_consistency(context: Context) -> None:
+    """
+    Изменение, для которого flush() вернулся, не теряется при аварийном
+    завершении процесса, а пакет записывается целиком или не записывается.
+    """
+    path = context.workdir / 'write_behind_crash.db'
+    shutil.copy(context.catalog(1000), path)
+    process = subprocess.Popen(
+        [sys.executable, '-c', WRITE_BEHIND_WRITER, str(path)],
+        cwd=Path(__file__).parent.parent,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    acknowledged = -1
+    for line in process.stdout:
+        acknowledged = int(line)
+        if acknowledged == 30:
+            break
+    process.kill()
+    process.wait()
+    process.stdout.close()
+    assert acknowledged == 30, 'процесс записи упал'
+
+    batches: dict[int, int] = {}
+    repository = RepositoryDB(Connector(str(path)))
+    for _, name, *_ in repository.get_all():
+        if ':' in name:
+            batch = int(name.split(':')[0])
+            batches[batch] = batches.get(batch, 0) + 1
+    for batch in range(acknowledged + 1):
+        assert batches.get(batch) == 100, f'пакет {batch} потерян'
+    assert all(count == 100 for count in batches.values()), (
+        'пакет записан частично'
+    )
+
+    overlay = WriteBehindRepositoryDB(
+        Connector(str(path), persistent=True), delay=None
+    )
+    overlay.create('новый', '1.00', 'кг')
+    overlay.delete(1)
+    assert overlay.get(1) is None, 'удаление не видно до записи'
+    assert repository.get(1) is not None, 'запись прошла до flush()'
+    assert any(row[1] == 'новый' for row in overlay.get_all()), (
+        'создание не видно до записи'
+    )
+    overlay.flush()
+    assert repository.get(1) is None, 'удаление не записано'
+
+
+@check
+def write_behind_other_writer(context: Context) -> None:
+    """
+    Записи, которые другой писатель добавил раньше сброса очереди, не
+    ломают его: новые записи получают свободные id, а изменение с занятым
+    названием отказывается отдельно. Вложенный flush не фиксирует чужую
+    транзакцию, а close() останавливает сброс по времени.
+    """
+    path = context.workdir / 'write_behind_other.db'
+    shutil.copy(context.catalog(1000), path)
+    connector = Connector(str(path), persistent=True)
+    RepositoryStart(connector).create_table()
+    repository = WriteBehindRepositoryDB(connector, size=10**6, delay=None)
+    other = RepositoryDB(Connector(str(path)))
+
+    repository.create('изюм', '1.00', 'кг')
+    repository.create('курага', '1.00', 'кг')
+    raisin = next(row for row in repository.get_all() if row[1] == 'изюм')
+    repository.update(raisin[0], 'изюм без косточек', '2.00', 'кг', '')
+    other.create('финик', '1.00', 'кг')
+    other.create('Курага', '3.00', 'кг')
+    repository.flush()
+
+    rejected = repository.take_rejected()
+    assert [(kind, params[1]) for kind, params, _ in rejected] == [
+        ('create', 'курага')
+    ], f'отказанные изменения: {rejected}'
+    assert not repository.take_rejected(), 'отказ не забыт'
+    row = other.find_duplicate('изюм без косточек')
+    assert row is not None and row[4] == '2.00', 'изменение новой записи'
+    assert other.find_duplicate('изюм') is None, 'старое название осталось'
+    assert other.find_duplicate('финик') is not None, 'чужая запись'
+    assert other.find_duplicate('курага')[4] == '3.00', 'чужая запись'
+    assert repository.find_similar('изюм'), 'поиск после сброса'
+
+    try:
+        with connector:
+            repository.create('чернослив', '1.00', 'кг')
+            repository.flush()
+            raise RuntimeError('откат')
+    except RuntimeError:
+        pass
+    assert other.find_duplicate('чернослив') is None, (
+        'вложенный flush зафиксировал внешнюю транзакцию'
+    )
+
+    timed = WriteBehindRepositoryDB(connector, delay=0.01)
+    timed.create('инжир', '1.00', 'кг')
+    sleep(0.1)
+    assert timed.pending == 0, 'очередь не сброшена по времени'
+    timed.close()
+    timed._flusher.join(1)
+    assert not timed._flusher.is_alive(), 'сброс по времени не остановлен'
+    connector.close()
+
+
+@check
+def duplicate_names(context: Context) -> None:
+    """
+    Названия, различающиеся регистром, пробелами и "ё", считаются одним;
+    объединение дубликатов переводит на оставшуюся запись строки смет.
+    """
+    path = context.workdir / 'duplicates.db'
+    shutil.copy(context.catalog(1000), path)
+    connector = Connector(str(path), persistent=True)
+    RepositoryStart(connector).create_table()
+    repository = RepositoryDB(connector)
+    estimates = RepositoryEstimate(connector)
+
+    repository.create('Ёжевика', '1.00', 'кг')
+    try:
+        repository.create(' ежевика  ', '1.00', 'кг')
+    except IntegrityError:
+        pass
+    else:
+        raise AssertionError('дубликат добавлен')
+    duplicate = repository.find_duplicate('ЕЖЕВИКА')
+    assert duplicate is not None, 'дубликат не найден'
+    similar = repository.find_similar('ежевика садовая')
+    assert similar and similar[0][0] == duplicate[0], 'похожее не найдено'
+
+    # Дубликаты из старой базы, где индекса еще не было.
+    with connector as cursor:
+        cursor.execute('DROP INDEX ingredient_name_normalized')
+        cursor.execute(
+            'UPDATE ingredient SET name_normalized = NULL WHERE id <= 2'
+        )
+        cursor.execute("UPDATE ingredient SET name = 'Соль' WHERE id <= 2")
+    start = RepositoryStart(connector)
+    start.create_table()
+    assert not start.create_name_index(), 'индекс создан при дубликатах'
+    estimate_id = estimates.create(
+        'смета', '2.00', [(2, 'Соль', '1', 'кг', '2.00')]
+    )
+    assert repository.get_duplicate_groups() == [[1, 2]], 'группы'
+    repository.merge([(1, [2])])
+    assert start.create_name_index(), 'нет уникального индекса'
+    assert repository.get(2) is None, 'дубликат не удален'
+    line = estimates.get_lines(estimate_id)[0]
+    assert line[2] == 1, 'строка сметы не переведена'
+
+
+@check
+def estimate_scaling(context: Context) -> None:
+    """
+    Масштабирование сметы дает ту же стоимость строк, что и изменение
+    каждой строки отдельно, а итог совпадает с пересчетом по всем строкам.
+    """
+    logic_db = make_logic_db(context, ESTIMATE_CATALOG_SIZE)
+    logic_main = LogicMainWindow(logic_db)
+    for row in make_main_rows(context, 1000):
+        logic_main.add(row)
+    logic_main.delete_range(10, 19)
+    logic_main.delete(0)
+    logic_main.update(0, logic_main.get(1))
+
+    def assert_total() -> None:
+        expected = round(sum(logic_main.get_all()), 2)
+        assert logic_main.calculation() == (
+            f'Итого: {int(expected // 1)} руб. '
+            f'{int(expected * 100 % 100)} коп.'
+        ), 'итог разошелся с пересчетом'
+
+    assert_total()
+    for rows in (
+        logic_main.scale(2.5),
+        logic_main.convert_units(['г', 'мл', 'см']),
+    ):
+        assert_total()
+        catalog = logic_db.get_many([row.id for row in rows])
+        for row in rows:
+            item = catalog[row.id]
+            price = logic_db.calculation(
+                item.price, row.quantity, row.dimension, item.dimension
+            )
+            assert row.price == price, f'{row}: {price}'
+
+
+@check
+def estimate_rows_parity(context: Context) -> None:
+    """
+    Хранилище строк сметы ведет себя как список при вставках, удалениях и
+    заменах, в том числе когда части выгружаются во временную таблицу.
+    """
+    generator = random.Random(context.seed)
+    rows = [
+        RowViewOnMainTable(
+            id=number,
+            name=f'ингредиент {number % 50}',
+            quantity=number % 7 + 0.5,
+            dimension=('кг', 'г', 'шт')[number % 3],
+            price=number / 4,
+        )
+        for number in range(3000)
+    ]
+    store = EstimateRows(chunk_size=16, spill_rows=64)
+    expected: list[RowViewOnMainTable] = []
+    store.extend(rows[:1000])
+    expected.extend(rows[:1000])
+    for row in rows[1000:]:
+        action = generator.random()
+        index = generator.randrange(len(expected) + 1)
+        if action < 0.45:
+            store.insert(index, row)
+            expected.insert(index, row)
+        elif action < 0.65 and index < len(expected):
+            del store[index]
+            del expected[index]
+        elif action < 0.9 and index < len(expected):
+            store[index] = row
+            expected[index] = row
+        else:
+            stop = index + generator.randrange(5)
+            del store[index:stop]
+            del expected[index:stop]
+    assert store.spilled, 'части не выгружались'
+    assert len(store) == len(expected), 'размер разошелся со списком'
+
+    def as_tuples(items) -> list[tuple]:
+        return [tuple(row) for row in items]
+
+    assert as_tuples(store) == as_tuples(expected), 'строки разошлись'
+    assert as_tuples(store[10:200]) == as_tuples(expected[10:200]), 'срез'
+    assert tuple(store[-1]) == tuple(expected[-1]), 'отрицательный индекс'
+    store[:] = expected[::-1]
+    assert as_tuples(store) == as_tuples(expected[::-1]), 'замена целиком'
+
+
+@check
+def estimate_rows_memory(context: Context) -> None:
+    """
+    Смета на миллион строк укладывается в заданный объем памяти, а
+    случайные удаления из неё не замедляются с ростом сметы.
+    """
+    lines = 1_000_000
+    row = RowViewOnMainTable(1, 'ингредиент', 1.5, 'кг', 10.25)
+    tracemalloc.start()
+    try:
+        store = EstimateRows(spill_rows=100_000)
+        for number in range(lines):
+            row.id = number
+            store.append(row)
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(store) == lines
+    assert current < 16 * 2**20, f'в памяти {current / 2**20:.1f} МБ'
+
+    generator = random.Random(context.seed)
+    start = perf_counter()
+    for _ in range(1000):
+        del store[generator.randrange(len(store))]
+    elapsed = perf_counter() - start
+    assert len(store) == lines - 1000
+    assert elapsed < 1.0, f'1000 удалений заняли {elapsed:.2f} с'
+
+
+@check
+def price_list_reconciliation(context: Context) -> None:
+    """
+    Сверка с прайс-листом находит новые, пропавшие и измененные записи,
+    применяет только принятые и не применяется к изменившемуся каталогу.
+    """
+    path = context.workdir / 'price_list.db'
+    shutil.copy(context.catalog(1000), path)
+    connector = Connector(str(path), persistent=True)
+    RepositoryStart(connector).create_table()
+    repository = RepositoryDB(connector)
+    catalog = repository.get_all()
+    prices = list(make_price_list(catalog, context.seed))
+    # Тот же товар с другим написанием и ценой в другом формате.
+    id, name, _, dimension, price = catalog[5]
+    prices.append(
+        (f'  {name.upper()} ', price.replace('.', ','), dimension, '')
+    )
+
+    reconciler = PriceListReconciler(repository, batch=7)
+    reconciler.load(prices)
+    summary = reconciler.diff()
+    assert summary == {
+        'added': 50,
+        'removed': 50,
+        'price': 100,
+        'unit': 50,
+    }, summary
+
+    rejected = reconciler.changes('price', limit=1)[0]
+    reconciler.accept(False, ids=[rejected[0]])
+    reconciler.accept(True, 'removed')
+    applied = reconciler.apply()
+    assert applied == {
+        'added': 50,
+        'removed': 50,
+        'price': 99,
+        'unit': 50,
+    }, applied
+    assert repository.get(rejected[2])[4] == rejected[7], 'отклонено'
+    assert repository.get(id)[1] == name, 'название переписано'
+
+    # Осталось только отклоненное изменение.
+    reconciler.load(prices)
+    assert reconciler.diff() == {
+        'added': 0,
+        'removed': 0,
+        'price': 1,
+        'unit': 0,
+    }, 'повторная сверка'
+    repository.update(id, name, '0.01', dimension, '')
+    try:
+        reconciler.apply()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError('применено к изменившемуся каталогу')
+    reconciler.close()
+
+
+@check
+def repricing_stale(context: Context) -> None:
+    """
+    Строки смет с удаленными ингредиентами пересчет не трогает и
+    возвращает отдельно, остальные считаются по текущим ценам, а итоги -
+    по правилам округления PricingEngine.
+    """
+    path = context.workdir / 'repricing.db'
+    shutil.copy(context.catalog(200), path)
+    make_estimates(path, 2000, seed=context.seed)
+    connector = Connector(str(path), persistent=True)
+    RepositoryStart(connector).create_table()
+    repository = RepositoryDB(connector)
+    estimates = RepositoryEstimate(connector)
+    deleted = [1, 2, 3]
+    repository.delete_many(deleted)
+    before = {line[0]: line for line in estimates.get_lines(1, 10**9)}
+    connector.close()
+
+    engine = RepricingEngine(str(path), workers=2, shard_size=3)
+    count = engine.run()
+    expected = sorted(id for id, line in before.items() if line[2] in deleted)
+    assert expected, 'нет строк с удаленными ингредиентами'
+    assert engine.stale == expected, 'строки не отмечены'
+    assert count == len(before) - len(expected), 'количество строк'
+    estimates = RepositoryEstimate(Connector(str(path)))
+    after = {line[0]: line for line in estimates.get_lines(1, 10**9)}
+    for id in expected:
+        assert after[id][6] == before[id][6], 'стоимость строки изменена'
+    totals: dict[int, Decimal] = {}
+    for line in after.values():
+        totals[line[1]] = totals.get(line[1], Decimal(0)) + Decimal(line[6])
+    for estimate_id, _, total in estimates.get_all():
+        assert Decimal(total) == totals[estimate_id], 'итог сметы'
+
+    # Итоги считаются по правилам округления, как смета в главном окне.
+    catalog = {
+        row[0]: row for row in RepositoryDB(Connector(str(path))).get_all()
+    }
+    for rounding in (HALF_UP, HALF_EVEN):
+        pricing = PricingEngine(rounding, PER_TOTAL)
+        RepricingEngine(str(path), workers=2, pricing=pricing).run()
+        expected_totals: dict[int, int] = {}
+        for _, estimate_id, ingredient_id, *line in before.values():
+            _, quantity, dimension, price = line
+            if ingredient_id in catalog:
+                _, _, _, db_dimension, db_price = catalog[ingredient_id]
+                ratio = pricing.exact(
+                    DimensionConverter.get_ratio(dimension, db_dimension)
+                )
+                units = pricing.line(db_price, quantity, ratio)
+            else:
+                units = pricing.units(price)
+            expected_totals[estimate_id] = (
+                expected_totals.get(estimate_id, 0) + units
+            )
+        for estimate_id, _, total in estimates.get_all():
+            assert total == pricing.format_money(
+                pricing.total(expected_totals[estimate_id])
+            ), f'{rounding}: итог сметы {estimate_id}'
+
+
+@check
+def report_parity(context: Context) -> None:
+    """
+    Отчеты SQL совпадают с расчетом по строкам в Python: суммы по
+    категориям и ингредиентам до копейки, медиана цены по размерностям.
+    """
+    path = context.workdir / 'reports.db'
+    shutil.copy(context.catalog(1000), path)
+    make_estimates(path, 5000, seed=context.seed)
+    connector = Connector(str(path), persistent=True)
+    RepositoryStart(connector).create_table()
+    estimates = RepositoryEstimate(connector)
+    reports = RepositoryReport(connector)
+    categories = DimensionConverter.get_categories()
+    lines = estimates.get_lines(1, 10**9)
+
+    def expected_costs(key, estimate_id=None) -> dict:
+        costs: dict = {}
+        for _, line_estimate, ingredient_id, _, _, dimension, price in lines:
+            if estimate_id is None or line_estimate == estimate_id:
+                group = key(ingredient_id, dimension)
+                costs[group] = costs.get(group, 0) + round(
+                    Decimal(price) * 100
+                )
+        return costs
+
+    for estimate_id in (None, 7):
+        costs = expected_costs(
+            lambda _, dimension: categories[dimension], estimate_id
+        )
+        report = reports.cost_by_category(categories, estimate_id)
+        assert {row[0]: row[1] for row in report} == costs, 'категории'
+        assert abs(sum(row[3] for row in report) - 1) < 1e-9, 'доли'
+
+        costs = expected_costs(lambda id, _: id, estimate_id)
+        top = reports.top_ingredients(5, estimate_id)
+        expensive = sorted(costs.values(), reverse=True)[:5]
+        assert [row[3] for row in top] == expensive, 'самые дорогие'
+        assert all(costs[row[1]] == row[3] for row in top), 'суммы'
+        assert top[0][0] == 1, 'место'
+
+    catalog = RepositoryDB(connector).get_all()
+    stats = reports.unit_price_stats()
+    for dimension, count, average, median, low, high in stats:
+        prices = [float(row[4]) for row in catalog if row[3] == dimension]
+        assert count == len(prices), dimension
+        assert abs(median - statistics.median(prices)) < 1e-9, dimension
+        assert abs(average - statistics.fmean(prices)) < 1e-6, dimension
+        assert (low, high) == (min(prices), max(prices)), dimension
+
+
+@check
+def catalog_comparison(context: Context) -> None:
+    """
+    Каталоги не делят состояния, переключение очищает смету, а сравнение
+    цен одним запросом по присоединенным БД совпадает с расчетом в Python.
+    """
+    paths = []
+    for name in ('home', 'supplier'):
+        path = context.workdir / f'catalog_{name}.db'
+        shutil.copy(context.catalog(1000), path)
+        paths.append(str(path))
+    with sqlite3.connect(paths[1]) as connection:
+        connection.execute(
+            "UPDATE ingredient SET price = printf('%.2f', price * 2) "
+            'WHERE id % 3 = 0'
+        )
+        connection.execute('DELETE FROM ingredient WHERE id % 5 = 0')
+    catalogs = CatalogManager(None)
+    home = catalogs.open('Дом', paths[0])
+    supplier = catalogs.open('Поставщик', paths[1])
+    catalogs.activate('Дом')
+    assert home.connector is not supplier.connector, 'подключения'
+    assert home.logic_db.repository is not supplier.logic_db.repository
+
+    # Изменение в очереди отложенной записи видно сравнению.
+    home.logic_db.add('новая запись', 1, 5, 'кг', '')
+    supplier.logic_db.add('новая запись', 1, 4, 'кг', '')
+    report = catalogs.compare_prices()
+    rows = {row[0]: row for row in report.rows}
+    assert rows['новая запись'][2:5] == ['5.00', '4.00', 'Поставщик']
+
+    others = {
+        normalize_name(row[1]): row
+        for row in supplier.logic_db.repository.get_all()
+    }
+    expected = 0
+    for id, name, _, dimension, price in home.logic_db.repository.get_all():
+        other = others.get(normalize_name(name))
+        if other is None:
+            assert name not in rows, name
+            continue
+        expected += 1
+        assert rows[name][2] == f'{Decimal(price):.2f}', name
+        assert rows[name][3] == f'{Decimal(other[4]):.2f}', name
+        cheaper = 'Поставщик' if Decimal(other[4]) < Decimal(price) else 'Дом'
+        assert rows[name][4] == cheaper, name
+    assert len(report.rows) == expected, 'только общие'
+    everything = catalogs.compare_prices(only_common=False)
+    assert len(everything.rows) == len(home.logic_db.repository.get_all())
+
+    logic_main = LogicMainWindow(catalogs.active.logic_db)
+    for row in make_main_rows(context, 10):
+        logic_main.add(row)
+    logic_main.set_logic_for_db(catalogs.activate('Поставщик').logic_db)
+    assert not logic_main.get_all(), 'смета прежнего каталога'
+    assert logic_main.calculation() == 'Итого: 0 руб. 0 коп.'
+    assert logic_main.logic_for_db is supplier.logic_db
+    catalogs.close_all()
+
+
+JOURNAL_WRITER = """
+import sys
+from app.db.journal import EstimateJournal
+from app.logic.adapter import LogicMainWindow
+from benchmarks.checks import journal_operations
+
+logic = LogicMainWindow(journal=EstimateJournal(sys.argv[1], compact_min=50))
+logic.restore()
+for number, (method, args) in enumerate(journal_operations(int(sys.argv[2]))):
+    getattr(logic, method)(*args)
+    print(number, flush=True)
+"""
+
+
+def journal_operations(seed: int) -> Generator[tuple[str, tuple], None, None]:
+    """
+    Бесконечная последовательность изменений сметы: метод LogicMainWindow
+    и его аргументы. Размер сметы держится в пределах нескольких сотен.
+    """
+    generator = random.Random(seed)
+    length = 0
+    number = 0
+    while True:
+        number += 1
+        row = RowViewOnMainTable(
+            id=number,
+            name=f'строка {number}',
+            quantity=generator.randint(1, 1000),
+            dimension=generator.choice(['кг', 'г', 'шт']),
+            price=round(generator.uniform(0, 500), 2),
+        )
+        choice = generator.random()
+        if length < 20 or choice < 0.5:
+            length += 1
+            yield 'add', (row,)
+        elif choice < 0.7:
+            yield 'update', (generator.randrange(length), row)
+        elif choice < 0.85:
+            length -= 1
+            yield 'delete', (generator.randrange(length + 1),)
+        elif choice < 0.97:
+            first = generator.randrange(length)
+            last = min(length - 1, first + generator.randint(0, 9))
+            length -= last - first + 1
+            yield 'delete_range', (first, last)
+        elif choice < 0.995:
+            yield 'scale', (generator.choice([2, 0.5]),)
+        else:
+            length = 0
+            yield 'clear', ()
+
+
+def journal_states(seed: int) -> Generator[list[tuple], None, None]:
+    """Состояния сметы после каждого изменения journal_operations."""
+    logic = LogicMainWindow()
+    for method, args in journal_operations(seed):
+        getattr(logic, method)(*args)
+        yield [tuple(row) for row in logic.data]
+
+
+@check
+def journal_recovery(context: Context) -> None:
+    """
+    Смета восстанавливается из журнала после убийства процесса в любой
+    момент, в том числе во время записи и уплотнения: со всеми
+    подтвержденными изменениями и без частично записанных.
+    """
+    generator = random.Random(context.seed)
+    for round in range(5):
+        path = context.workdir / f'journal_{round}.journal'
+        seed = context.seed + round
+        process = subprocess.Popen(
+            [sys.executable, '-c', JOURNAL_WRITER, str(path), str(seed)],
+            cwd=Path(__file__).parent.parent,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        target = generator.randint(100, 1500)
+        acknowledged = -1
+        for line in process.stdout:
+            acknowledged = int(line)
+            if acknowledged >= target:
+                break
+        process.kill()
+        process.wait()
+        process.stdout.close()
+        assert acknowledged >= target, 'процесс записи упал'
+
+        logic = LogicMainWindow(journal=EstimateJournal(str(path)))
+        logic.restore()
+        restored = [tuple(row) for row in logic.data]
+        for number, state in enumerate(journal_states(seed)):
+            if number >= acknowledged and state == restored:
+                break
+            assert number < acknowledged + 100_000, 'состояние не найдено'
+        total = sum(logic.pricing.units(row[4]) for row in restored)
+        assert logic._total == total, 'итог'
+        logic.journal.close()
+
+    # Запись оборвана на любом байте: восстанавливается предыдущее
+    # состояние, а журнал после этого снова пишется.
+    path = context.workdir / 'journal_torn.journal'
+    journal = EstimateJournal(str(path), sync=False, compact_min=10**9)
+    logic = LogicMainWindow(journal=journal)
+    operations = journal_operations(context.seed)
+    states = [[]]
+    sizes = [path.stat().st_size if path.exists() else 0]
+    for _ in range(300):
+        method, args = next(operations)
+        getattr(logic, method)(*args)
+        if method in ('clear', 'scale'):
+            # Уплотнение переписывает журнал, обрывы проверяются после.
+            states = [[tuple(row) for row in logic.data]]
+            sizes = [path.stat().st_size]
+            continue
+        states.append([tuple(row) for row in logic.data])
+        sizes.append(path.stat().st_size)
+    journal.close()
+    data = path.read_bytes()
+    torn = context.workdir / 'journal_torn_copy.journal'
+    for cut in generator.sample(range(sizes[0], len(data)), 200):
+        torn.write_bytes(data[:cut])
+        restored = LogicMainWindow(journal=EstimateJournal(str(torn)))
+        restored.restore()
+        expected = max(
+            number for number, size in enumerate(sizes) if size <= cut
+        )
+        rows = [tuple(row) for row in restored.data]
+        assert rows == states[expected], f'обрыв на байте {cut}'
+        restored.add(RowViewOnMainTable(0, 'после сбоя', 1, 'кг', 1))
+        restored.journal.close()
+        again = LogicMainWindow(journal=EstimateJournal(str(torn)))
+        again.restore()
+        assert len(again.data) == len(rows) + 1, 'запись после обрыва'
+        again.journal.close()
+
+    corrupted = bytearray(data)
+    corrupted[sizes[-2] + 12] ^= 0xFF
+    torn.write_bytes(corrupted)
+    restored = LogicMainWindow(journal=EstimateJournal(str(torn)))
+    restored.restore()
+    assert [tuple(row) for row in restored.data] == states[-2], 'CRC'
+    restored.journal.close()
+
+    # Название длиннее двух байт длины журнал обрезает, а не падает.
+    path = context.workdir / 'journal_long.journal'
+    path.unlink(missing_ok=True)
+    logic = LogicMainWindow(journal=EstimateJournal(str(path), sync=False))
+    name = 'я' * 40_000
+    logic.add(RowViewOnMainTable(1, name, 1, 'кг', 1))
+    logic.add(RowViewOnMainTable(2, 'после', 1, 'кг', 1))
+    logic.journal.close()
+    restored = LogicMainWindow(journal=EstimateJournal(str(path)))
+    restored.restore()
+    rows = [tuple(row) for row in restored.data]
+    assert len(rows) == 2 and rows[1][1] == 'после', 'длинное название'
+    assert name.startswith(rows[0][1]), 'название искажено'
+    assert len(rows[0][1].encode('utf-8')) > 65_000, 'название потеряно'
+    restored.journal.close()
+
+
+@check
+def pricing_exactness(context: Context) -> None:
+    """
+    Стоимость строк совпадает с точным десятичным расчетом при обоих
+    способах и правилах округления, итог 100 тыс. строк не уплывает при
+    добавлениях, заменах и удалениях, а расчет не медленнее Decimal.
+    """
+    money = PricingEngine().format_money
+    for kopecks in (0, 5, -5, 195, -195, 10**12 + 7, -(10**12) - 7):
+        assert Decimal(money(kopecks)) == Decimal(kopecks) / 100, kopecks
+
+    generator = random.Random(context.seed)
+    categories = DimensionConverter.get_categories()
+    ratios = {
+        (current, db): DimensionConverter.get_ratio(current, db)
+        for current in categories
+        for db in categories
+        if categories[current] == categories[db]
+    }
+    # Перевод точен до 1/1000 (см. UNITS_PER_KOPECK).
+    pairs = [
+        pair
+        for pair, ratio in ratios.items()
+        if ratio.as_integer_ratio()[1] <= 1000
+    ]
+    lines = [
+        (
+            f'{generator.randint(0, 999_999) / 100:.2f}',
+            round(generator.uniform(0, 1000), generator.randint(0, 4)),
+            *generator.choice(pairs),
+        )
+        for _ in range(100_000)
+    ]
+    exact_context = decimal.Context(prec=60)
+    cent = Decimal('0.01')
+    for rounding, mode in (
+        (HALF_UP, decimal.ROUND_HALF_UP),
+        (HALF_EVEN, decimal.ROUND_HALF_EVEN),
+    ):
+        for policy in (PER_LINE, PER_TOTAL):
+            engine = PricingEngine(rounding, policy)
+            fractions = {pair: engine.exact(ratios[pair]) for pair in pairs}
+            total = 0
+            expected = Decimal(0)
+            for price, quantity, current, db in lines:
+                exact = exact_context.multiply(
+                    exact_context.multiply(
+                        Decimal(price), Decimal(repr(quantity))
+                    ),
+                    ratios[current, db],
+                )
+                units = engine.line(price, quantity, fractions[current, db])
+                if policy == PER_LINE:
+                    exact = exact.quantize(cent, rounding=mode)
+                assert units == exact * UNITS_PER_RUBLE, (
+                    f'{rounding} {policy}: {price} x {quantity}'
+                )
+                total += units
+                expected += exact
+            kopecks = expected.quantize(cent, rounding=mode) * 100
+            assert engine.total(total) == kopecks, f'{rounding} {policy}'
+            # 0.05 * 0.5 = 2.5 копейки: ровно половина.
+            tie = engine.total(engine.line('0.05', 0.5))
+            assert tie == (2 if rounding == HALF_EVEN else 3), 'половина'
+
+    # Итог не уплывает: после случайных изменений он равен точной сумме
+    # оставшихся строк.
+    for policy in (PER_LINE, PER_TOTAL):
+        engine = PricingEngine(HALF_UP, policy)
+        logic = LogicMainWindow()
+        logic.pricing = engine
+        rows = [
+            RowViewOnMainTable(
+                number,
+                f'строка {number}',
+                quantity,
+                current,
+                engine.price(
+                    engine.line(
+                        price, quantity, engine.exact(ratios[current, db])
+                    )
+                ),
+            )
+            for number, (price, quantity, current, db) in enumerate(lines)
+        ]
+        for row in rows:
+            logic.add(row)
+        for _ in range(20_000):
+            choice = generator.random()
+            index = generator.randrange(len(logic.data))
+            if choice < 0.4:
+                logic.delete(index)
+            elif choice < 0.8:
+                logic.update(index, generator.choice(rows))
+            else:
+                last = min(len(logic.data) - 1, index + 5)
+                logic.delete_range(index, last)
+                logic.add(generator.choice(rows))
+        exact = sum(Decimal(repr(row.price)) for row in logic.data)
+        rubles, kopecks = divmod(
+            int(exact.quantize(cent, rounding=decimal.ROUND_HALF_UP) * 100),
+            100,
+        )
+        assert logic.calculation() == (
+            f'Итого: {rubles} руб. {kopecks} коп.'
+        ), f'итог {policy}'
+
+    engine = PricingEngine()
+    fractions = {pair: engine.exact(ratios[pair]) for pair in pairs}
+
+    def priced():
+        for price, quantity, current, db in lines:
+            engine.line(price, quantity, fractions[current, db])
+
+    def decimal_priced():
+        for price, quantity, current, db in lines:
+            ratio = ratios[current, db]
+            (Decimal(price) * Decimal(quantity) * ratio).quantize(
+                cent, rounding=decimal.ROUND_HALF_UP
+            )
+
+    timings = {}
+    for func in (priced, decimal_priced):
+        timings[func] = min(_elapsed(func) for _ in range(5))
+    assert timings[priced] <= 1.2 * timings[decimal_priced], (
+        f'{timings[priced]:.3f} с против {timings[decimal_priced]:.3f} с'
+    )
+
+
+@check
+def estimate_consolidation(context: Context) -> None:
+    """
+    Объединение строк одного ингредиента при добавлении и одним проходом
+    по смете дает одинаковые строки: количество в размерности первой
+    строки, стоимость как у LogicDBWindow.calculation, верный итог.
+    """
+    logic_db = make_logic_db(context, ESTIMATE_CATALOG_SIZE)
+    rows = make_main_rows(context, 5000)
+    journal = EstimateJournal(
+        str(context.workdir / 'consolidate.journal'), sync=False
+    )
+    merged = LogicMainWindow(logic_db, journal, consolidate=True)
+    separate = LogicMainWindow(logic_db)
+    for row in rows:
+        merged.add(row)
+        separate.add(row)
+    first: dict[int, RowViewOnMainTable] = {}
+    quantities: dict[int, Decimal] = {}
+    for row in rows:
+        line = first.setdefault(row.id, row)
+        quantities[row.id] = quantities.get(row.id, 0) + Decimal(
+            str(row.quantity)
+        ) * DimensionConverter.get_ratio(row.dimension, line.dimension)
+
+    assert separate.consolidate_all() == len(rows) - len(first), 'убрано'
+    assert [tuple(row) for row in separate.get_all()] == [
+        tuple(row) for row in merged.get_all()
+    ], 'объединение при добавлении и проходом разошлись'
+    catalog = logic_db.get_many(list(first))
+    for row in merged.get_all():
+        line = first[row.id]
+        assert (row.name, row.dimension) == (line.name, line.dimension)
+        assert row.quantity == float(quantities[row.id]), row
+        assert row.price == logic_db.calculation(
+            catalog[row.id].price,
+            row.quantity,
+            row.dimension,
+            catalog[row.id].dimension,
+        ), row
+    pricing = merged.pricing
+    for logic in (merged, separate):
+        assert logic.calculation() == pricing.format_total(
+            sum(pricing.units(row.price) for row in logic.get_all())
+        ), 'итог'
+
+    # Размерность другой категории - отдельная строка.
+    row = next(row for row in merged.get_all() if row.dimension != 'шт')
+    piece = RowViewOnMainTable(row.id, row.name, 2, 'шт', 10.0)
+    index = merged.add(piece)
+    assert index == len(merged.get_all()) - 1, 'шт прибавлены к массе'
+    assert merged.consolidate_all() == 0, 'разные категории объединены'
+
+    # Первая строка ингредиента в шт не мешает объединить г и кг: при
+    # добавлении, как и проходом, остаются две строки.
+    row = next(row for row in rows if row.dimension in ('г', 'кг'))
+    lines = [
+        RowViewOnMainTable(row.id, row.name, 2, 'шт', 10.0),
+        RowViewOnMainTable(row.id, row.name, 500, 'г', 0),
+        RowViewOnMainTable(row.id, row.name, 1, 'кг', 0),
+    ]
+    added = LogicMainWindow(logic_db, consolidate=True)
+    passed = LogicMainWindow(logic_db)
+    for line in lines:
+        added.add(line)
+        passed.add(line)
+    assert passed.consolidate_all() == 1, 'г и кг не объединены проходом'
+    assert [tuple(line) for line in added.get_all()] == [
+        tuple(line) for line in passed.get_all()
+    ], 'шт, г и кг: объединение при добавлении и проходом разошлись'
+    assert added.get(1).quantity == 1500, 'г и кг не объединены'
+
+    # После удаления номера строк сдвигаются, индекс строится заново.
+    merged.delete(0)
+    target = merged.get(0)
+    addition = RowViewOnMainTable(
+        target.id, target.name, 1, target.dimension, 0
+    )
+    assert merged.add(addition) == 0, 'строка после удаления'
+    assert merged.get(0).quantity == target.quantity + 1, 'количество'
+
+    restored = LogicMainWindow(logic_db, journal)
+    restored.restore()
+    assert [tuple(row) for row in restored.get_all()] == [
+        tuple(row) for row in merged.get_all()
+    ], 'журнал'
+    journal.close()
+
+
+@check
+def model_contract(context: Context) -> None:
+    """
+    Модели таблиц соблюдают контракт QAbstractItemModel (проверяет
+    QAbstractItemModelTester), в том числе при удалении и замене строк,
+    а ячейки совпадают с полями объектов-строк.
+    """
+    from PyQt6.QtCore import Qt
+
+    from .views import application, contract_failures
+
+    application()
+    DISPLAY = Qt.ItemDataRole.DisplayRole
+    main_rows = make_main_rows(context, 200)
+    db_rows = make_logic_db(context, ESTIMATE_CATALOG_SIZE).get_all()[:200]
+    report = Report(
+        'Отчет',
+        ['Название', 'Сумма'],
+        [[row.name, str(row.price)] for row in main_rows],
+    )
+    estimate_rows = make_estimate_rows(context, 200)
+    models = {
+        'главное окно': (ViewOnMainTableModels(list(main_rows)), main_rows),
+        'главное окно (EstimateRows)': (
+            ViewOnMainTableModels(estimate_rows),
+            main_rows,
+        ),
+        'окно БД': (ViewOnDBTableModels(db_rows), db_rows),
+        'отчет': (ViewOnReportTableModels(report), report.rows),
+    }
+    for name, (model, rows) in models.items():
+        assert [
+            [
+                model.data(model.index(row, column), DISPLAY)
+                for column in range(model.columnCount())
+            ]
+            for row in range(model.rowCount())
+        ] == [[str(value) for value in row] for row in model._data], (
+            f'{name}: ячейки'
+        )
+
+        def actions():
+            model.remove_rows([0, 1, 2, 10, 11, 50])
+            model.replace_rows([3, 4, 20], rows[100:103])
+            model.refresh()
+            size = model.rowCount()
+            model.remove_rows(list(range(size - 5, size)))
+
+        failures = contract_failures(model, actions)
+        assert not failures, f'{name}: {failures[0]}'
+        assert model.rowCount() == 200 - 6 - 5, f'{name}: строки не удалены'
+
+
+@check
+def model_scroll_scaling(context: Context) -> None:
+    """
+    Прокрутка таблицы на 100 тыс. и 1 млн строк запрашивает у модели
+    столько же data(), сколько на 1000 строк (только видимые ячейки), и
+    кадр рисуется не дольше, чем втрое медленнее.
+    """
+    from .views import counting, scroll
+
+    def db_rows(size: int) -> list[RowViewOnDBTable]:
+        return [
+            RowViewOnDBTable(number, f'запись {number}', None, 'кг', '12.30')
+            for number in range(size)
+        ]
+
+    for model_class, make_rows in (
+        (ViewOnMainTableModels, partial(make_estimate_rows, context)),
+        (ViewOnDBTableModels, db_rows),
+    ):
+        counting_class = counting(model_class)
+        reference = scroll(counting_class(make_rows(1000)))
+        assert reference['calls_max'] > 0, 'таблица не отрисована'
+        for size in (100_000, 1_000_000):
+            stats = scroll(counting_class(make_rows(size)))
+            name = f'{model_class.__name__}[{size}]'
+            for key in ('load_calls', 'calls_max'):
+                assert stats[key] <= reference[key], (
+                    f'{name}: {key} {stats[key]} против {reference[key]}'
+                )
+            assert stats['frame_median'] <= 3 * reference['frame_median'], (
+                f'{name}: кадр {stats["frame_median"] * 1000:.1f} мс против '
+                f'{reference["frame_median"] * 1000:.1f} мс'
+            )
+
+
+@check
+def catalog_backup(context: Context) -> None:
+    """
+    Копия каталога через backup API восстанавливается как была, старые
+    копии удаляются, поврежденная или прерванная копия не трогает базу,
+    запись во время копирования попадает в копию, а чтения не ждут.
+    """
+    path = context.workdir / 'backup_catalog.db'
+    shutil.copy(context.catalog(100_000), path)
+    catalog = Catalog('Копии', str(path))
+    catalog.open()
+    catalog.backups = CatalogBackup(
+        str(path), str(context.workdir / 'backups'), keep=3, pages=64
+    )
+    repository = catalog.repository
+    # Копия записывает очередь отложенной записи.
+    repository.create('запись из очереди', '10.00', 'кг')
+    assert repository.pending, 'запись не в очереди'
+    task = catalog.start_backup()
+    task.wait()
+    saved = RepositoryDB(Connector(str(path))).get_all()
+
+    # Чтения другим подключением во время копирования.
+    reader = RepositoryDB(Connector(str(path), persistent=True))
+    latencies = []
+    task = catalog.start_backup()
+    while not task.done:
+        start = perf_counter()
+        reader.get(1)
+        latencies.append(perf_counter() - start)
+    first = task.wait()
+    assert 0 < task.progress <= 1, task.progress
+    assert max(latencies) < 0.05, f'чтение ждало {max(latencies):.3f} с'
+
+    ids = [row[0] for row in saved[:100]]
+    catalog.logic_db.delete_many(ids)
+    catalog.logic_db.add('после копии', 1, 1, 'кг', '')
+    catalog.logic_db.get_snapshot()
+    version = repository.get_version()
+    task = catalog.start_restore(first)
+    task.wait()
+    catalog.finish_restore(task)
+    # Фоновый поток не открывал подключений каталога.
+    assert len(catalog.connector._connections) == 1, (
+        'подключения фонового потока'
+    )
+    restored = RepositoryDB(Connector(str(path))).get_all()
+    assert restored == saved, 'каталог не восстановлен'
+    assert repository.get_version() > version, 'версия не выросла'
+    snapshot = catalog.logic_db.get_snapshot()
+    assert [tuple(snapshot[index]) for index in range(len(snapshot))] == [
+        tuple(row) for row in saved
+    ], 'снимок прежней базы'
+
+    # Запись другим подключением между шагами: SQLite начинает копию
+    # заново, и запись в нее попадает.
+    writer = RepositoryDB(Connector(str(path)))
+    written = []
+
+    def write(fraction: float) -> None:
+        if not written:
+            writer.create('запись во время копии', '1.00', 'кг')
+            written.append(fraction)
+
+    with_write = catalog.backups.backup(write)
+    catalog.restore(with_write)
+    assert catalog.logic_db.find_duplicate('запись во время копии'), 'копия'
+
+    for _ in range(3):
+        catalog.backup()
+    backups = catalog.backups.get_backups()
+    assert len(backups) == 3 and first not in backups, 'лишние копии'
+    assert backups == sorted(backups, reverse=True), 'порядок копий'
+
+    current = RepositoryDB(Connector(str(path))).get_all()
+    broken = context.workdir / 'backups' / 'Копии-broken.db.gz'
+    data = Path(backups[0]).read_bytes()
+    for content in (data[: len(data) // 2], b'not a gzip file'):
+        broken.write_bytes(content)
+        try:
+            catalog.restore(str(broken))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('поврежденная копия восстановлена')
+    with gzip.open(broken, 'wb') as file:
+        file.write(b'SQLite format 3\x00' + bytes(4096))
+    try:
+        catalog.restore(str(broken))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('копия не прошла integrity_check')
+
+    # Прерванное восстановление откатывается целиком.
+    def cancel(fraction: float) -> None:
+        if fraction > 0.75:
+            raise BackupCancelled('Отменено')
+
+    try:
+        catalog.backups.restore(backups[-1], cancel)
+    except BackupCancelled:
+        pass
+    else:
+        raise AssertionError('восстановление не прервано')
+    after = RepositoryDB(Connector(str(path))).get_all()
+    assert after == current, 'база изменилась после ошибки или отмены'
+    catalog.close()
+    reader.connector.close()
+
+
+@check
+def catalog_warm_up(context: Context) -> None:
+    """
+    Прогрев каталога строит те же строки, что и get_all, после него
+    первый get_all быстрый, шаги короткие и не держат транзакцию, а
+    изменение каталога во время прогрева или после него не оставляет
+    устаревших строк.
+    """
+    path = context.workdir / 'warm_up_catalog.db'
+    shutil.copy(context.catalog(100_000), path)
+    cold_catalog = Catalog('Холодный', str(path))
+    cold_catalog.open()
+    start = perf_counter()
+    cold = cold_catalog.logic_db.get_all()
+    cold_time = perf_counter() - start
+    # Снимок обычно уже записан последним изменением каталога.
+    cold_catalog.logic_db.get_snapshot()
+    cold_catalog.close()
+
+    catalog = Catalog('Прогрев', str(path))
+    catalog.open()
+    logic = catalog.logic_db
+    stages = []
+    steps = []
+    warm_up = logic.warm_up(2000)
+    while True:
+        start = perf_counter()
+        stage = next(warm_up, None)
+        steps.append(perf_counter() - start)
+        if stage is None:
+            break
+        stages.append(stage)
+        assert not catalog.connector.connection.in_transaction, stage
+    assert set(stages) == {
+        'db',
+        'favorites',
+        'snapshot',
+        'alerts',
+        'rows',
+    }, stages
+    assert stages.count('rows') == 50, stages.count('rows')
+    assert max(steps) < 0.1, f'шаг {max(steps) * 1000:.0f} мс'
+
+    start = perf_counter()
+    warm = logic.get_all()
+    warm_time = perf_counter() - start
+    assert [tuple(row) for row in warm] == [tuple(row) for row in cold], (
+        'строки прогрева отличаются'
+    )
+    assert warm_time * 5 < cold_time, (
+        f'после прогрева {warm_time * 1000:.1f} мс, '
+        f'без него {cold_time * 1000:.1f} мс'
+    )
+    # Окно меняет свой список строк, а не запомненный.
+    del warm[:10]
+    assert len(logic.get_all()) == len(cold), 'запомненные строки изменены'
+
+    logic.add('после прогрева', 1, 1, 'кг', '')
+    assert catalog.repository.pending, 'запись не в очереди'
+    assert logic.find_duplicate('после прогрева') is not None
+    names = [row.name for row in logic.get_all()]
+    assert 'после прогрева' in names, 'строка из очереди не видна'
+    catalog.repository.flush()
+    assert len(logic.get_all()) == len(cold) + 1, 'строки не перечитаны'
+
+    # Запись другим подключением посреди прогрева: строки не запоминаются.
+    logic.clear_cache()
+    writer = RepositoryDB(Connector(str(path)))
+    warm_up = logic.warm_up(2000)
+    while next(warm_up) != 'rows':
+        pass
+    writer.create('во время прогрева', '1.00', 'кг')
+    for _ in warm_up:
+        pass
+    assert logic._rows is None, 'запомнены строки старой версии'
+    assert len(logic.get_all()) == len(cold) + 2, 'строки не перечитаны'
+
+    # Брошенный прогрев не держит транзакцию и не мешает записи.
+    logic.clear_cache()
+    warm_up = logic.warm_up(2000)
+    while next(warm_up) != 'rows':
+        pass
+    warm_up.close()
+    assert not catalog.connector.connection.in_transaction, 'транзакция'
+    writer.create('после отмены', '1.00', 'кг')
+    assert logic._rows is None, 'строки запомнены после отмены'
+    catalog.close()
+
+
+@check
+def alert_rules(context: Context) -> None:
+    """
+    Правила оповещений, которые проверяются только по зависящим от
+    изменения записям, совпадают с проверкой всех правил заново после
+    любых изменений каталога, итоги смет с бюджетом - до копейки, а
+    изменение записи без правил не читает базу.
+    """
+    path = context.workdir / 'alerts.db'
+    shutil.copy(context.catalog(10_000), path)
+    make_estimates(path, 20_000, per_estimate=100, seed=context.seed)
+    catalog = Catalog('Оповещения', str(path))
+    catalog.open()
+    logic = catalog.logic_db
+    alerts = catalog.alerts
+    repository = catalog.repository
+    pricing = alerts.pricing
+    generator = random.Random(context.seed)
+    rows = repository.get_all()
+    estimates = RepositoryEstimate(catalog.connector)
+    estimate_lines = estimates.get_lines(1, 10**9)
+
+    def expected_total(estimate_id: int) -> int:
+        # Объединение записей переносит строки смет, поэтому строки
+        # читаются заново.
+        repository.flush()
+        units = 0
+        for line in estimates.get_lines(estimate_id):
+            _, _, ingredient_id, _, quantity, dimension, price = line
+            row = repository.get(ingredient_id)
+            if row is None:
+                units += pricing.units(price)
+            else:
+                ratio = pricing.exact(
+                    DimensionConverter.get_ratio(dimension, row[3])
+                )
+                units += pricing.line(row[4], quantity, ratio)
+        return pricing.total(units)
+
+    budgets = generator.sample(range(1, 201), 40)
+    for estimate_id in budgets:
+        alerts.add_budget_rule(
+            estimate_id, f'{expected_total(estimate_id) / 100:.2f}'
+        )
+    # Строки смет с бюджетом ссылаются на эти записи.
+    used = sorted(
+        {line[2] for line in estimate_lines if line[1] in set(budgets)}
+    )
+    watched = generator.sample(used, 30) + generator.sample(
+        [row[0] for row in rows], 30
+    )
+    logic.watch_prices(watched, 10)
+    assert not alerts.get_alerts(), 'правила сработали сразу'
+
+    # Записи без правил и смет с бюджетом: базу читать незачем.
+    unrelated = [
+        row[0]
+        for row in rows
+        if row[0] not in set(used) and row[0] not in set(watched)
+    ]
+    catalog_repository, alerts.catalog = alerts.catalog, None
+    assert alerts.changed(unrelated) == [], 'сработало без правил'
+    alerts.catalog = catalog_repository
+
+    def check_state(step: str) -> None:
+        fresh = AlertEngine(
+            RepositoryRules(catalog.connector),
+            repository,
+            RepositoryEstimate(catalog.connector),
+            DimensionConverter,
+        )
+        fresh.load()
+        assert set(alerts.firing) == set(fresh.firing), (
+            f'{step}: {sorted(set(alerts.firing) ^ set(fresh.firing))}'
+        )
+        for estimate_id in budgets:
+            total = pricing.total(alerts._totals[estimate_id])
+            assert total == expected_total(estimate_id), (
+                f'{step}: итог сметы {estimate_id}'
+            )
+
+    fired = []
+    for step in range(60):
+        ids = generator.sample(used, 5) + generator.sample(watched, 2)
+        current = [logic.get(id) for id in ids]
+        current = [row for row in current if row is not None]
+        action = step % 6
+        if action == 0:
+            row = current[0]
+            logic.update(
+                row.id,
+                row.name,
+                1,
+                float(row.price) * generator.uniform(0.5, 1.6),
+                row.dimension,
+                row.description,
+            )
+        elif action == 1:
+            logic.reprice(current, generator.choice([-20, 5, 12, 35]))
+        elif action == 2:
+            same = DimensionConverter.get_dimensions_same_category(
+                current[0].dimension
+            )
+            logic.change_dimension(current[:1], generator.choice(same))
+        elif action == 3:
+            logic.delete_many([current[0].id])
+        elif action == 4:
+            logic.merge([(current[0].id, [row.id for row in current[1:3]])])
+        else:
+            repository.flush()
+        fired.extend(logic.take_alerts())
+        check_state(f'шаг {step}')
+    kinds = {alert.kind for alert in fired}
+    assert kinds == {PRICE, BUDGET}, f'сработали только {kinds}'
+
+    # Новая цена, принятая за исходную, снимает оповещение.
+    key = next(key for key in alerts.firing if key[0] == PRICE)
+    alerts.acknowledge(key[1])
+    assert key not in alerts.firing, 'оповещение осталось'
+    check_state('принятие цены')
+
+    # После перестройки индекса уже показанные оповещения не новые.
+    repository.flush()
+    alerts.reset()
+    assert alerts.take_fired() == [], 'показанные оповещения повторились'
+    check_state('перестройка')
+
+    estimate_id = next(key[1] for key in alerts.firing if key[0] == BUDGET)
+    alerts.delete_budget_rule(estimate_id)
+    budgets.remove(estimate_id)
+    check_state('удаление бюджета')
+
+    # Собственные записи не заставляют строить индекс заново.
+    loads = []
+    load = alerts._load
+    alerts._load = lambda: loads.append(1) or load()
+    id = next(
+        id for id in alerts._price_rules if (PRICE, id) not in alerts.firing
+    )
+    row = logic.get(id)
+    logic.update(id, row.name, 1, row.price, row.dimension, row.description)
+    repository.flush()
+    logic.update(id, row.name, 1, row.price, row.dimension, row.description)
+    alerts.get_alerts()
+    assert not loads, 'индекс построен заново после своей записи'
+
+    # Запись мимо движка, как у API-сервера, замечается по версии.
+    repository.flush()
+    alerts.get_alerts()
+    server = LogicDBWindow(
+        RepositoryDB(Connector(str(path))),
+        DimensionConverter,
+        RowViewOnDBTable,
+    )
+    server.update(
+        id, row.name, 1, float(row.price) * 3, row.dimension, row.description
+    )
+    assert (PRICE, id) in {
+        (alert.kind, alert.id) for alert in alerts.get_alerts()
+    }, 'запись мимо движка не замечена'
+    assert loads, 'индекс не построен заново'
+    alerts._load = load
+    check_state('запись мимо движка')
+    catalog.close()
+
+
+@check
+def what_if_parity(context: Context) -> None:
+    """
+    Итоги смет по сценариям "что если" через NumPy и через запасной путь
+    совпадают до копейки с пересчетом каждой строки по новым ценам при
+    обоих способах и правилах округления, в том числе для цен с долями
+    копейки, отрицательных процентов и строк удаленных ингредиентов.
+    """
+    path = context.workdir / 'what_if.db'
+    shutil.copy(context.catalog(1000), path)
+    make_estimates(path, 20_000, per_estimate=50, seed=context.seed)
+    connector = Connector(str(path), persistent=True)
+    repository = RepositoryDB(connector)
+    estimates = RepositoryEstimate(connector)
+    generator = random.Random(context.seed)
+    ids = [row[0] for row in repository.get_all()]
+    for id in generator.sample(ids, 20):
+        repository.delete(id)
+    ids = [row[0] for row in repository.get_all()]
+    for id in generator.sample(ids, 20):
+        _, name, description, dimension, _ = repository.get(id)
+        price = f'{generator.randint(0, 99_999) / 1000:.3f}'
+        repository.update(id, name, price, dimension, description)
+    lines = estimates.get_lines(1, 10**9)
+    estimate_ids = [id for id, _, _ in estimates.get_all()]
+    percents = ['15', '-10', '0.01', 7.77, -100, '33.333', Decimal('2.5')]
+    scenarios = [{}, dict.fromkeys(ids, '12.5')] + [
+        {
+            id: generator.choice(percents)
+            for id in generator.sample(ids, generator.randint(1, 50))
+        }
+        for _ in range(8)
+    ]
+    vectorized = [False] if numpy is None else [False, True]
+
+    for rounding in (HALF_UP, HALF_EVEN):
+        for policy in (PER_LINE, PER_TOTAL):
+            pricing = PricingEngine(rounding, policy)
+            expected = []
+            for scenario in scenarios:
+                prices = {}
+                for row in repository.get_all():
+                    id, _, _, dimension, price = row
+                    if id in scenario:
+                        price = pricing.round_price(
+                            pricing.exact(price)
+                            * (1 + pricing.exact(scenario[id]) / 100)
+                        )
+                    prices[id] = (price, dimension)
+                totals = dict.fromkeys(estimate_ids, 0)
+                for line in lines:
+                    _, estimate_id, id, _, quantity, dimension, price = line
+                    if id not in prices:
+                        totals[estimate_id] += pricing.units(price)
+                        continue
+                    price, db_dimension = prices[id]
+                    ratio = pricing.exact(
+                        DimensionConverter.get_ratio(dimension, db_dimension)
+                    )
+                    totals[estimate_id] += pricing.line(price, quantity, ratio)
+                expected.append(
+                    [pricing.total(totals[id]) for id in estimate_ids]
+                )
+            for mode in vectorized:
+                engine = WhatIfEngine(
+                    repository,
+                    estimates,
+                    DimensionConverter,
+                    pricing,
+                    vectorized=mode,
+                )
+                assert engine.run(scenarios) == expected, (
+                    f'{rounding}, {policy}, NumPy {mode}: итоги разошлись'
+                )
+                assert engine.estimate_ids == estimate_ids
+                assert engine.baseline() == expected[0]
+
+    if numpy is not None:
+        # Блоки меньше строк одного ингредиента и одного сценария.
+        block_lines = what_if.BLOCK_LINES
+        what_if.BLOCK_LINES = 7
+        try:
+            assert engine.run(scenarios) == expected, 'блоки разошлись'
+        finally:
+            what_if.BLOCK_LINES = block_lines
+    try:
+        engine.run([{-1: '10'}])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('неизвестный ингредиент принят')
+
+
+def _elapsed(func) -> float:
+    """Вернет время выполнения func в секундах."""
+    start = perf_counter()
+    func()
+    return perf_counter() - start
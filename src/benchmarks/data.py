@@ -0,0 +1,174 @@
+import random
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from app.db.manager import Connector
+from app.db.repository import (
+    NAME_TABLE,
+    NAME_TABLE_ESTIMATE,
+    NAME_TABLE_LINE,
+    RepositoryStart,
+)
+from app.logic.dimension import DimensionConverter
+
+WORDS = [
+    'мука',
+    'сахар',
+    'масло',
+    'молоко',
+    'яйцо',
+    'соль',
+    'дрожжи',
+    'какао',
+    'ваниль',
+    'сливки',
+    'творог',
+    'изюм',
+    'орех',
+    'мед',
+    'крахмал',
+    'лента',
+]
+
+
+def make_catalog(path: Path, size: int, seed: int = 0) -> None:
+    """
+    Создаст файл базы данных с синтетическим каталогом ингредиентов.
+
+    Параметры:
+        path путь к файлу с БД;
+        size количество ингредиентов;
+        seed зерно генератора случайных чисел.
+    """
+    rnd = random.Random(seed)
+    dimensions = DimensionConverter.get_all()
+    connector = Connector(str(path))
+    RepositoryStart(connector).create_table()
+    rows = (
+        (
+            f'{rnd.choice(WORDS)} {number}',
+            f'описание {number}',
+            f'{rnd.randint(1, 100_000) / 100:.2f}',
+            rnd.choice(dimensions),
+        )
+        for number in range(size)
+    )
+    with connector as cursor:
+        cursor.executemany(
+            f"""
+            INSERT INTO {NAME_TABLE} (name, description, price, dimension)
+            VALUES (?, ?, ?, ?)
+            """,
+            rows,
+        )
+
+
+def make_estimate(
+    catalog: list[tuple[int, str, str, str, str]],
+    size: int,
+    seed: int = 0,
+) -> list[tuple[int, str, float, str, str, str]]:
+    """
+    Вернет синтетическую смету: строки вида
+    (id, название, количество, размерность строки, размерность в БД, цена).
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(size):
+        id, name, _, db_dimension, price = rnd.choice(catalog)
+        dimension = rnd.choice(
+            DimensionConverter.get_dimensions_same_category(db_dimension)
+            or [db_dimension]
+        )
+        quantity = rnd.randint(1, 50_000) / 100
+        lines.append((id, name, quantity, dimension, db_dimension, price))
+    return lines
+
+
+def make_price_list(
+    catalog: Iterable[tuple[int, str, str, str, str]],
+    seed: int = 0,
+) -> Iterator[tuple[str, str, str, str]]:
+    """
+    Вернет синтетический прайс-лист по каталогу: строки вида
+    (название, цена, размерность, описание). Из каждых 20 записей одна
+    пропадает, две дорожают, одна меняет размерность и одна добавляется.
+    """
+    rnd = random.Random(seed)
+    dimensions = DimensionConverter.get_all()
+    for number, (_, name, description, dimension, price) in enumerate(catalog):
+        kind = number % 20
+        if kind == 0:
+            continue
+        if kind in (1, 2):
+            price = f'{float(price) * rnd.uniform(1.01, 1.5):.2f}'
+        elif kind == 3:
+            dimension = rnd.choice(
+                [other for other in dimensions if other != dimension]
+            )
+        elif kind == 4:
+            yield (f'новинка {number}', '9.99', dimension, '')
+        yield (name, price, dimension, description or '')
+
+
+def make_estimates(
+    path: Path, lines: int, per_estimate: int = 100, seed: int = 0
+) -> None:
+    """
+    Добавит в БД с каталогом сохраненные сметы. Стоимость строк
+    посчитана по цене каталога на момент создания.
+
+    Параметры:
+        path путь к файлу с БД, где уже есть каталог;
+        lines общее количество строк во всех сметах;
+        per_estimate количество строк в одной смете;
+        seed зерно генератора случайных чисел.
+    """
+    connector = Connector(str(path))
+    with connector as cursor:
+        catalog = cursor.execute(
+            f'SELECT id, name, description, dimension, price FROM {NAME_TABLE}'
+        ).fetchall()
+    estimate = make_estimate(catalog, lines, seed)
+    ratios: dict[tuple[str, str], float] = {}
+
+    def cost(quantity: float, dimension: str, db_dimension: str, price: str):
+        ratio = ratios.get((dimension, db_dimension))
+        if ratio is None:
+            ratio = ratios[dimension, db_dimension] = float(
+                DimensionConverter.get_ratio(dimension, db_dimension)
+            )
+        return f'{float(price) * quantity * ratio:.2f}'
+
+    count = (lines + per_estimate - 1) // per_estimate
+    with connector as cursor:
+        cursor.executemany(
+            f'INSERT INTO {NAME_TABLE_ESTIMATE} (id, name) VALUES (?, ?)',
+            ((number + 1, f'смета {number}') for number in range(count)),
+        )
+        cursor.executemany(
+            f"""
+            INSERT INTO {NAME_TABLE_LINE} (
+                estimate_id, ingredient_id, name, quantity, dimension, price
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                (
+                    number // per_estimate + 1,
+                    id,
+                    name,
+                    str(quantity),
+                    dimension,
+                    cost(quantity, dimension, db_dimension, price),
+                )
+                for number, (
+                    id,
+                    name,
+                    quantity,
+                    dimension,
+                    db_dimension,
+                    price,
+                ) in enumerate(estimate)
+            ),
+        )
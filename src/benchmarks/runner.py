@@ -0,0 +1,185 @@
+import json
+import shutil
+import statistics
+import time
+from pathlib import Path
+from typing import Callable
+
+from .data import make_catalog, make_estimates
+
+CATALOG = 'catalog'
+ESTIMATE = 'estimate'
+CALLS = 'calls'
+WORKERS = 'workers'
+CLIENTS = 'clients'
+SAVED = 'saved'
+
+Setup = Callable[['Context', int], Callable[[], object]]
+
+
+class Case:
+    """Описание одного замера."""
+
+    def __init__(self, name: str, kind: str, setup: Setup) -> None:
+        """
+        Описание одного замера.
+
+        Параметры:
+            name имя замера;
+            kind по каким размерам прогонять замер: каталог, смета,
+                число вызовов, процессов, клиентов или строк
+                сохраненных смет;
+            setup функция подготовки, возвращающая замеряемую функцию.
+        """
+        self.name = name
+        self.kind = kind
+        self.setup = setup
+
+
+cases: list[Case] = []
+checks: list[Callable[['Context'], None]] = []
+
+
+def benchmark(name: str, kind: str = CATALOG) -> Callable[[Setup], Setup]:
+    """Зарегистрирует функцию подготовки замера."""
+
+    def decorator(setup: Setup) -> Setup:
+        cases.append(Case(name, kind, setup))
+        return setup
+
+    return decorator
+
+
+def check(func: Callable[['Context'], None]) -> Callable[['Context'], None]:
+    """
+    Зарегистрирует проверку: функцию, которая падает с AssertionError,
+    если нарушено ожидаемое поведение.
+    """
+    checks.append(func)
+    return func
+
+
+class Context:
+    """Общие для замеров ресурсы: рабочая папка и готовые каталоги."""
+
+    def __init__(
+        self, workdir: Path, seed: int = 0, estimate_lines: int = 1_000_000
+    ) -> None:
+        self.workdir = workdir
+        self.seed = seed
+        self.estimate_lines = estimate_lines
+        self._catalogs: dict[int, Path] = {}
+        self._estimates: Path | None = None
+
+    def catalog(self, size: int) -> Path:
+        """Вернет путь к БД с каталогом нужного размера, создав его."""
+        if size not in self._catalogs:
+            path = self.workdir / f'catalog_{size}.db'
+            if path.exists():
+                path.unlink()
+            make_catalog(path, size, self.seed)
+            self._catalogs[size] = path
+        return self._catalogs[size]
+
+    def estimates(self) -> Path:
+        """Вернет путь к БД с каталогом и сохраненными сметами."""
+        if self._estimates is None:
+            path = self.workdir / f'estimates_{self.estimate_lines}.db'
+            shutil.copy(self.catalog(1000), path)
+            make_estimates(path, self.estimate_lines, seed=self.seed)
+            self._estimates = path
+        return self._estimates
+
+
+def measure(func: Callable[[], object], rounds: int) -> dict[str, float]:
+    """Прогонит функцию rounds раз и вернет статистику времени в секундах."""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'max': max(timings),
+        'rounds': rounds,
+    }
+
+
+def run(
+    context: Context,
+    sizes: dict[str, list[int]],
+    rounds: int,
+    only: str = '',
+) -> dict[str, dict[str, float]]:
+    """
+    Выполнит все зарегистрированные замеры.
+
+    Параметры:
+        context общие ресурсы замеров;
+        sizes размеры для каждого вида замеров;
+        rounds сколько раз повторять каждый замер;
+        only фильтр по имени замера.
+    """
+    results = {}
+    for case in cases:
+        if only and only not in case.name:
+            continue
+        for size in sizes[case.kind]:
+            key = f'{case.name}[{size}]'
+            func = case.setup(context, size)
+            results[key] = measure(func, rounds)
+            print(f'{key:<50} {results[key]["median"] * 1000:>12.3f} мс')
+    return results
+
+
+def run_checks(context: Context, only: str = '') -> list[str]:
+    """Выполнит все зарегистрированные проверки и вернет список ошибок."""
+    failures = []
+    for func in checks:
+        if only and only not in func.__name__:
+            continue
+        try:
+            func(context)
+        except AssertionError as error:
+            failures.append(f'{func.__name__}: {error}')
+            print(f'{func.__name__:<50} ОШИБКА')
+        else:
+            print(f'{func.__name__:<50} OK')
+    return failures
+
+
+def save(results: dict, path: Path) -> None:
+    """Сохранит результаты в JSON."""
+    path.write_text(
+        json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8'
+    )
+
+
+def load(path: Path) -> dict:
+    """Загрузит результаты из JSON."""
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+) -> list[str]:
+    """
+    Сравнит результаты с эталоном и вернет описания регрессий.
+
+    Регрессией считается рост медианы больше чем в (1 + threshold) раз.
+    """
+    regressions = []
+    for key, current in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]['median']
+        new = current['median']
+        if old > 0 and new > old * (1 + threshold):
+            regressions.append(
+                f'{key}: {old * 1000:.3f} мс -> {new * 1000:.3f} мс '
+                f'(+{(new / old - 1) * 100:.0f}%)'
+            )
+    return regressions
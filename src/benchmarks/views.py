@@ -0,0 +1,165 @@
+"""
+Проверка моделей таблиц без дисплея: контракт модели Qt и прокрутка
+представления с подсчетом вызовов data() и времени кадра.
+
+Работает с QT_QPA_PLATFORM=offscreen (его задает python -m benchmarks).
+"""
+
+import statistics
+from time import perf_counter
+from typing import Callable
+
+from PyQt6.QtCore import QtMsgType, qInstallMessageHandler
+from PyQt6.QtTest import QAbstractItemModelTester
+from PyQt6.QtWidgets import QApplication, QHeaderView, QTableView
+
+from app.models import BasesViewTableModels
+
+# Размер окна таблицы, как у главного окна и окна БД.
+VIEW_WIDTH = 800
+VIEW_HEIGHT = 600
+
+_application: QApplication | None = None
+
+
+def application() -> QApplication:
+    """
+    Вернет приложение Qt, создав его при первом вызове. Ссылка на него
+    хранится здесь: собранное сборщиком мусора приложение удаляет и
+    созданные при нем объекты Qt.
+    """
+    global _application
+    if _application is None:
+        _application = QApplication.instance() or QApplication([])
+    return _application
+
+
+def counting(
+    model_class: type[BasesViewTableModels],
+) -> type[BasesViewTableModels]:
+    """
+    Вернет наследника модели, который считает вызовы data() в атрибуте
+    calls. Считается каждый вызов из представления, с любой ролью.
+    """
+
+    def data(self, index, role):
+        self.calls += 1
+        return model_class.data(self, index, role)
+
+    return type(
+        f'Counting{model_class.__name__}',
+        (model_class,),
+        {'calls': 0, 'data': data},
+    )
+
+
+def contract_failures(
+    model: BasesViewTableModels, actions: Callable[[], None] | None = None
+) -> list[str]:
+    """
+    Вернет нарушения контракта модели, найденные QAbstractItemModelTester:
+    сразу после подключения и во время actions, которые меняют модель
+    (удаление и замена строк).
+    """
+    failures: list[str] = []
+
+    def handler(kind, context, message):
+        if kind != QtMsgType.QtDebugMsg:
+            failures.append(message)
+
+    previous = qInstallMessageHandler(handler)
+    try:
+        tester = QAbstractItemModelTester(
+            model, QAbstractItemModelTester.FailureReportingMode.Warning
+        )
+        if actions is not None:
+            actions()
+        del tester
+    finally:
+        qInstallMessageHandler(previous)
+    return failures
+
+
+def make_view(model: BasesViewTableModels) -> QTableView:
+    """
+    Вернет показанную таблицу с моделью, настроенную как таблицы окон:
+    выделение строк, чередование цвета, растянутые столбцы, скрытый ID.
+    """
+    application()
+    view = QTableView()
+    view.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+    view.setSelectionMode(QTableView.SelectionMode.ExtendedSelection)
+    view.setAlternatingRowColors(True)
+    header = view.horizontalHeader()
+    header.setFixedHeight(40)
+    header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+    view.resize(VIEW_WIDTH, VIEW_HEIGHT)
+    view.setModel(model)
+    view.hideColumn(0)
+    view.show()
+    return view
+
+
+def scroll_positions(maximum: int, step: int, frames: int) -> list[int]:
+    """
+    Вернет положения полосы прокрутки для кадров: половина - прокрутка
+    колесом по step строк от середины таблицы, половина - переходы через
+    всю таблицу от начала до конца.
+    """
+    wheel = frames // 2
+    jumps = frames - wheel
+    middle = maximum // 2
+    positions = [
+        min(maximum, middle + step * number) for number in range(wheel)
+    ]
+    positions += [
+        maximum * number // max(1, jumps - 1) for number in range(jumps)
+    ]
+    return positions
+
+
+def scroll(model: BasesViewTableModels, frames: int = 100) -> dict[str, float]:
+    """
+    Прокрутит таблицу с моделью и перерисует ее после каждого шага.
+
+    Модель должна быть создана классом из counting. Вернет вызовы data()
+    и время (в секундах) первой отрисовки и кадров прокрутки.
+
+    Параметры:
+        model модель с подсчетом вызовов data();
+        frames сколько кадров прокрутки отрисовать.
+    """
+    app = application()
+    model.calls = 0
+    start = perf_counter()
+    view = make_view(model)
+    # Первая отрисовка: компоновка и кадр показанной таблицы.
+    app.processEvents()
+    load_time = perf_counter() - start
+    load_calls = model.calls
+
+    scrollbar = view.verticalScrollBar()
+    times = []
+    calls = []
+    for position in scroll_positions(
+        scrollbar.maximum(), 3 * scrollbar.singleStep(), frames
+    ):
+        start = perf_counter()
+        scrollbar.setValue(position)
+        model.calls = 0
+        view.viewport().repaint()
+        times.append(perf_counter() - start)
+        calls.append(model.calls)
+        # Обновления, запрошенные прокруткой, не копятся между кадрами.
+        app.processEvents()
+    view.close()
+    return {
+        'rows': model.rowCount(),
+        'frames': len(times),
+        'load_calls': load_calls,
+        'load_time': load_time,
+        'calls_mean': statistics.mean(calls),
+        'calls_max': max(calls),
+        'frame_median': statistics.median(times),
+        'frame_max': max(times),
+    }
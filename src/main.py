@@ -1,12 +1,29 @@
 from PyQt6.QtWidgets import QApplication
 
-from app.db.repository import start
+from app.db.journal import EstimateJournal
+from app.db.trace import query_log
+from app.logic.catalogs import CatalogManager
+from app.profiler import profiler
+from app.settings import (
+    AUTOSAVE,
+    AUTOSAVE_COMPACT_MIN,
+    AUTOSAVE_SYNC,
+    PROFILE_DUMP,
+)
 from app.windows.main import MainWindow
 
 app = QApplication([])
-window = MainWindow()
+catalogs = CatalogManager()
+catalogs.load()
+journal = EstimateJournal(AUTOSAVE, AUTOSAVE_SYNC, AUTOSAVE_COMPACT_MIN)
+window = MainWindow(catalogs, journal)
 
 
 if __name__ == '__main__':
-    start.create_table()
     app.exec()
+    journal.close()
+    catalogs.close_all()
+    if profiler.enabled:
+        profiler.dump(PROFILE_DUMP)
+    if query_log is not None:
+        query_log.write_report()